@@ -2,13 +2,20 @@ from abc import ABC, abstractmethod
 import uuid
 import asyncio
 import time
-from typing import Dict, List, Any, Optional, Union, Callable
+from typing import Dict, List, Any, Optional, Union, Callable, Set, Coroutine
 from datetime import datetime
 import json
 
 from config.logging_config import get_logger
-from database.models import AgentLog, AgentState, Task, TaskStatus
+from database.models import Task, TaskStatus
 from config.settings import settings
+from .state_store import agent_state_store
+from .log_sink import agent_log_sink
+from .rpc import RpcEndpoint
+from .mailbox import Mailbox
+from core.metrics import (
+    DbCallScope, current_db_scope, agent_cycle_seconds, agent_cycle_db_calls, agent_message_seconds
+)
 
 logger = get_logger("agents")
 
@@ -24,11 +31,23 @@ class BaseAgent(ABC):
         self.capabilities = {}
         self.metrics = {}
         self.logger = get_logger(f"agent.{self.agent_type.lower()}")
-        self.message_queue = asyncio.Queue()
+        self.message_queue = Mailbox()
         self.event_listeners = {}
         self.last_active = datetime.utcnow()
         self._stop_event = asyncio.Event()
         self._initialized = False
+        # 事件驱动唤醒：消息、任务/事件变化或定时器触发 wake()，周期循环只作为兜底巡检
+        self._wakeup = asyncio.Event()
+        self.sweep_interval = settings.AGENT_SWEEP_INTERVAL
+        self.wakeup_counts: Dict[str, int] = {}
+        self.rpc = RpcEndpoint(self)
+        # 数据库调用计数范围，在 start() 中设置到智能体的协程上下文
+        self.db_scope = DbCallScope(self.agent_type)
+        self._cycle_count = 0
+        self._cycle_seconds = 0.0
+        self._max_cycle_seconds = 0.0
+        # 后台协程（例如计划生成、任务监控）统一登记，停止时一并取消
+        self._background_tasks: Set[asyncio.Task] = set()
         
     async def initialize(self):
         """初始化智能体，在子类中可以重写此方法以添加特定初始化逻辑"""
@@ -42,48 +61,30 @@ class BaseAgent(ABC):
         return self
     
     async def _update_agent_state(self):
-        """更新智能体状态到数据库"""
-        try:
-            # 尝试找到现有的状态
-            agent_state = await AgentState.find_one({"agent_id": self.agent_id})
-            
-            if agent_state:
-                # 更新现有状态
-                agent_state.status = self.status
-                agent_state.current_task_id = self.current_task_id
-                agent_state.last_active = datetime.utcnow()
-                agent_state.capability_scores = self.capabilities
-                agent_state.performance_metrics = self.metrics
-                await agent_state.save()
-            else:
-                # 创建新状态
-                agent_state = AgentState(
-                    agent_id=self.agent_id,
-                    agent_type=self.agent_type,
-                    status=self.status,
-                    current_task_id=self.current_task_id,
-                    capability_scores=self.capabilities,
-                    performance_metrics=self.metrics,
-                    last_active=datetime.utcnow()
-                )
-                await agent_state.insert()
-        except Exception as e:
-            self.logger.error(f"更新智能体状态失败: {str(e)}")
+        """更新智能体状态，变更由状态存储合并后批量写入数据库"""
+        agent_state_store.update(
+            self.agent_id,
+            self.agent_type,
+            status=self.status,
+            current_task_id=self.current_task_id,
+            last_active=datetime.utcnow(),
+            capability_scores=self.capabilities,
+            performance_metrics=self.metrics
+        )
     
     async def log(self, level: str, message: str, task_id: Optional[str] = None, 
                  event_id: Optional[str] = None, context: Optional[Dict[str, Any]] = None):
-        """记录智能体日志到数据库"""
+        """记录智能体日志，数据库写入由日志缓冲区在后台批量完成"""
         try:
-            agent_log = AgentLog(
-                agent_id=self.agent_id,
-                agent_type=self.agent_type,
-                level=level,
-                message=message,
-                related_task_id=task_id or self.current_task_id,
-                related_event_id=event_id,
-                context=context or {}
+            agent_log_sink.emit(
+                self.agent_id,
+                self.agent_type,
+                level,
+                message,
+                task_id=task_id or self.current_task_id,
+                event_id=event_id,
+                context=context
             )
-            await agent_log.insert()
             
             # 同时使用Python日志库记录
             log_method = getattr(self.logger, level.lower(), self.logger.info)
@@ -96,13 +97,16 @@ class BaseAgent(ABC):
         if not self._initialized:
             await self.initialize()
         
+        # 此后在本协程及其派生协程中发起的数据库命令都计入本智能体
+        current_db_scope.set(self.db_scope)
+        
         self.logger.info(f"启动智能体: {self.agent_id}")
         self.status = "active"
         await self._update_agent_state()
         
         try:
             # 启动消息处理循环
-            asyncio.create_task(self._process_messages())
+            self.spawn(self._process_messages(), name="process_messages")
             
             # 启动智能体主循环
             await self._main_loop()
@@ -115,28 +119,115 @@ class BaseAgent(ABC):
         """停止智能体"""
         self.logger.info(f"停止智能体: {self.agent_id}")
         self._stop_event.set()
+        self._wakeup.set()
+        self.rpc.close()
+        for task in list(self._background_tasks):
+            task.cancel()
         self.status = "stopped"
         await self._update_agent_state()
+        await agent_state_store.flush()
     
     async def _main_loop(self):
         """智能体主循环，可在子类中重写"""
         while not self._stop_event.is_set():
             try:
-                # 执行智能体的主要逻辑
-                await self.run_cycle()
+                # 在执行周期前清除唤醒标记，周期执行期间到达的唤醒会触发下一个周期
+                self._wakeup.clear()
+                
+                # 执行智能体的主要逻辑，周期内的数据库调用单独计数
+                # （消息处理和后台协程在智能体范围内，不计入周期）
+                cycle_scope = self.db_scope.child()
+                token = current_db_scope.set(cycle_scope)
+                started = time.perf_counter()
+                try:
+                    await self.run_cycle()
+                finally:
+                    current_db_scope.reset(token)
+                self._record_cycle(time.perf_counter() - started, cycle_scope.calls)
                 
                 # 更新状态
                 self.last_active = datetime.utcnow()
                 await self._update_agent_state()
                 
-                # 避免过于频繁的循环
-                await asyncio.sleep(settings.AGENT_COMMUNICATION_INTERVAL)
+                # 等待唤醒，超时则执行兜底巡检
+                await self._wait_for_wakeup()
             except Exception as e:
                 import traceback
                 error_trace = traceback.format_exc()
                 self.logger.error(f"智能体循环出错: {str(e)}\n{error_trace}")
                 await asyncio.sleep(5)  # 出错后等待一段时间再继续
     
+    def _record_cycle(self, elapsed: float, db_calls: int):
+        """记录工作周期耗时和数据库调用次数"""
+        agent_cycle_seconds.observe(elapsed, self.agent_type, self.agent_id)
+        agent_cycle_db_calls.observe(db_calls, self.agent_type)
+        self._cycle_count += 1
+        self._cycle_seconds += elapsed
+        self._max_cycle_seconds = max(self._max_cycle_seconds, elapsed)
+        self.metrics.update({
+            "cycles": self._cycle_count,
+            "avg_cycle_ms": round(self._cycle_seconds / self._cycle_count * 1000, 2),
+            "max_cycle_ms": round(self._max_cycle_seconds * 1000, 2),
+            "last_cycle_ms": round(elapsed * 1000, 2),
+            "last_cycle_db_calls": db_calls,
+        })
+    
+    async def _wait_for_wakeup(self):
+        """等待下一次唤醒或兜底巡检时间到达"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.sweep_interval)
+        except asyncio.TimeoutError:
+            self._count_wakeup("sweep")
+            return
+        
+        # 短暂合并突发的连续唤醒，避免每条消息都执行一次完整周期
+        if settings.AGENT_WAKEUP_DEBOUNCE > 0:
+            await asyncio.sleep(settings.AGENT_WAKEUP_DEBOUNCE)
+    
+    def _count_wakeup(self, reason: str):
+        self.wakeup_counts[reason] = self.wakeup_counts.get(reason, 0) + 1
+    
+    def wake(self, reason: str = "manual"):
+        """唤醒智能体，尽快执行下一个工作周期"""
+        self._count_wakeup(reason)
+        self._wakeup.set()
+    
+    def schedule_wakeup(self, delay: float, reason: str = "timer") -> asyncio.TimerHandle:
+        """
+        在指定延迟后唤醒智能体
+        
+        Args:
+            delay: 延迟（秒）
+            reason: 唤醒原因，用于统计
+        
+        Returns:
+            定时器句柄，可调用 cancel() 取消
+        """
+        return asyncio.get_running_loop().call_later(delay, self.wake, reason)
+    
+    def spawn(self, coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+        """
+        启动受智能体管理的后台协程
+        
+        协程结束后自动移出登记表，未处理的异常会记录到日志；智能体停止时取消仍在运行的协程。
+        """
+        task = asyncio.get_running_loop().create_task(
+            self._in_agent_scope(coro), name=f"{self.agent_id}:{name}" if name else None
+        )
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_done)
+        return task
+    
+    async def _in_agent_scope(self, coro: Coroutine):
+        # 后台协程可能在工作周期内派生，其数据库调用计入智能体而不是该周期
+        current_db_scope.set(self.db_scope)
+        return await coro
+    
+    def _on_background_done(self, task: asyncio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f"后台任务 {task.get_name()} 出错: {task.exception()}")
+    
     @abstractmethod
     async def run_cycle(self):
         """智能体的一个工作周期，必须在子类中实现"""
@@ -147,8 +238,16 @@ class BaseAgent(ABC):
         while not self._stop_event.is_set():
             try:
                 message = await self.message_queue.get()
+                started = time.perf_counter()
                 await self.process_message(message)
+                agent_message_seconds.observe(
+                    time.perf_counter() - started, self.agent_type, message.get("type") or "unknown"
+                )
                 self.message_queue.task_done()
+                
+                # 查询类消息已在处理时应答，不需要额外的工作周期
+                if message.get("type") not in ("agent_query", "query_response"):
+                    self.wake("message")
             except Exception as e:
                 self.logger.error(f"处理消息出错: {str(e)}")
                 await asyncio.sleep(1)
@@ -189,8 +288,17 @@ class BaseAgent(ABC):
             self.logger.warning(f"找不到目标智能体: {target_agent_id}")
             return False
     
-    async def query_agent(self, target_agent_id: str, query: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
-        """向另一个智能体发送查询并等待响应"""
+    async def query_agent(self, target_agent_id: str, query: str, data: Dict[str, Any] = None,
+                          timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        向另一个智能体发送查询并等待响应
+        
+        查询通过RPC端点直接交给目标智能体处理，不在其消息队列中排队；
+        超时后目标端的处理同步取消。
+        
+        Returns:
+            目标智能体 handle_query 的返回值
+        """
         from agents.coordinator import get_agent_by_id
         
         target_agent = get_agent_by_id(target_agent_id)
@@ -198,27 +306,7 @@ class BaseAgent(ABC):
             self.logger.warning(f"找不到目标智能体: {target_agent_id}")
             return {"success": False, "error": "Agent not found"}
         
-        # 创建回调队列和查询ID
-        callback_queue = asyncio.Queue()
-        query_id = str(uuid.uuid4())
-        
-        # 发送查询
-        await target_agent.message_queue.put({
-            "type": "agent_query",
-            "query": query,
-            "data": data or {},
-            "query_id": query_id,
-            "callback_queue": callback_queue,
-            "source_agent_id": self.agent_id
-        })
-        
-        # 等待响应，设置超时
-        try:
-            response = await asyncio.wait_for(callback_queue.get(), timeout=30)
-            return response
-        except asyncio.TimeoutError:
-            self.logger.warning(f"查询智能体 {target_agent_id} 超时")
-            return {"success": False, "error": "Query timeout"}
+        return await self.rpc.call(target_agent, query, data or {}, timeout=timeout)
     
     async def broadcast_message(self, message: Dict[str, Any], agent_type: Optional[str] = None):
         """广播消息给所有智能体或特定类型的智能体"""
@@ -264,6 +352,10 @@ class BaseAgent(ABC):
             "agent_id": self.agent_id,
             "agent_type": self.agent_type,
             "status": self.status,
+            "wakeups": dict(self.wakeup_counts),
+            "rpc": self.rpc.get_metrics(),
+            "background_tasks": len(self._background_tasks),
+            "mailbox": self.message_queue.get_metrics(),
             "timestamp": datetime.utcnow().isoformat()
         }
     
@@ -0,0 +1,458 @@
+"""
+智能体消息总线
+
+智能体之间的 send_message / broadcast_message / query_agent 都通过全局注册表找到目标，
+再调用目标的 message_queue.put 或 rpc 端点。总线把其他进程中的智能体以代理对象
+（RemoteAgent）注册进同一个注册表，代理的 message_queue 和 rpc 把调用转成帧发给
+目标所在进程，因此现有代码不需要区分本地和远程智能体。
+
+传输方式：
+- InProcessBus：所有智能体在同一个事件循环中，不需要转发（默认）
+- UnixSocketBus：本机多进程。主进程（hub）监听 Unix socket 并维护智能体目录，
+  工作进程（worker）连接主进程；跨进程的帧都经主进程转发。
+  帧格式为 4 字节大端长度 + UTF-8 JSON。查询回复走高优先级发送队列。
+  工作进程随心跳把本进程的运行指标发给主进程，由主进程的 /metrics 接口一并导出。
+"""
+import asyncio
+import json
+import os
+import struct
+import time
+from collections import deque
+from typing import Dict, List, Any, Optional, Set
+
+from config.logging_config import get_logger
+from config.settings import settings
+from core.metrics import Family, metrics_registry, with_labels
+from .coordinator import (
+    get_local_agent, get_local_agents, register_remote_agent, unregister_remote_agent
+)
+
+logger = get_logger("agents.bus")
+
+_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # 16MB
+
+# 不能跨进程传递的消息字段
+_LOCAL_ONLY_KEYS = ("callback_queue",)
+
+
+def encode_frame(frame: Dict[str, Any]) -> bytes:
+    payload = json.dumps(frame, ensure_ascii=False, default=str).encode("utf-8")
+    return _HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    header = await reader.readexactly(_HEADER.size)
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"帧过大: {length} 字节")
+    return json.loads(await reader.readexactly(length))
+
+
+class RemoteMailbox:
+    """远程智能体的消息队列代理，put 即转发"""
+
+    def __init__(self, bus: "UnixSocketBus", agent_id: str):
+        self.bus = bus
+        self.agent_id = agent_id
+
+    async def put(self, message: Dict[str, Any]):
+        self.put_nowait(message)
+
+    def put_nowait(self, message: Dict[str, Any]):
+        message = {k: v for k, v in message.items() if k not in _LOCAL_ONLY_KEYS}
+        self.bus.send_frame(self.agent_id, {"op": "send", "target": self.agent_id, "message": message})
+
+    def qsize(self) -> int:
+        return 0
+
+    def empty(self) -> bool:
+        return True
+
+
+class RemoteRpc:
+    """远程智能体的RPC端点代理，与 RpcEndpoint 的服务方接口一致"""
+
+    def __init__(self, bus: "UnixSocketBus", agent_id: str):
+        self.bus = bus
+        self.agent_id = agent_id
+
+    def serve(self, query_id: str, query: str, data: Dict[str, Any], deadline: float, reply_to: Any):
+        self.bus.send_frame(self.agent_id, {
+            "op": "query",
+            "target": self.agent_id,
+            "source": reply_to.agent.agent_id,
+            "query_id": query_id,
+            "query": query,
+            "data": data,
+            # 各进程的单调时钟不保证一致，传递剩余时间
+            "timeout": max(0.0, deadline - time.monotonic())
+        })
+
+    def cancel(self, query_id: str) -> bool:
+        self.bus.send_frame(self.agent_id, {"op": "cancel", "target": self.agent_id, "query_id": query_id})
+        return True
+
+
+class RemoteReply:
+    """把本地查询处理结果回复给远程调用方"""
+
+    def __init__(self, bus: "UnixSocketBus", source_agent_id: str):
+        self.bus = bus
+        self.source_agent_id = source_agent_id
+
+    def resolve(self, query_id: str, response: Dict[str, Any]):
+        self.bus.send_frame(self.source_agent_id, {
+            "op": "reply",
+            "target": self.source_agent_id,
+            "query_id": query_id,
+            "response": response
+        }, high_priority=True)
+
+
+class RemoteAgent:
+    """其他进程中智能体的代理"""
+
+    def __init__(self, bus: "UnixSocketBus", agent_id: str, agent_type: str,
+                 name: Optional[str] = None, status: str = "active"):
+        self.agent_id = agent_id
+        self.agent_type = agent_type
+        self.name = name or agent_type
+        self.status = status
+        self.remote = True
+        self.message_queue = RemoteMailbox(bus, agent_id)
+        self.rpc = RemoteRpc(bus, agent_id)
+
+
+class _Peer:
+    """一条总线连接，查询回复优先发送"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, name: str):
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.agent_ids: Set[str] = set()
+        self._high: deque = deque()
+        self._normal: deque = deque()
+        self._ready = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.metrics: List[Family] = []  # hub: 对端进程最近一次上报的运行指标
+
+    def start(self):
+        self._writer_task = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def send(self, frame: Dict[str, Any], high_priority: bool = False):
+        (self._high if high_priority else self._normal).append(encode_frame(frame))
+        self._ready.set()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._high or self._normal:
+                    data = self._high.popleft() if self._high else self._normal.popleft()
+                    self.writer.write(data)
+                    self.frames_sent += 1
+                    await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    async def close(self):
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+        try:
+            self.writer.close()
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+class MessageBus:
+    """消息总线接口"""
+
+    transport = "base"
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def announce(self):
+        """本进程中的智能体有变化时通知其他进程"""
+        pass
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {"transport": self.transport}
+
+    def remote_metrics(self) -> List[Family]:
+        """其他进程上报的运行指标"""
+        return []
+
+
+class InProcessBus(MessageBus):
+    """单进程：所有智能体都在本地注册表中，无需转发"""
+
+    transport = "inprocess"
+
+
+class UnixSocketBus(MessageBus):
+    """本机多进程总线，主进程作为hub转发各工作进程之间的帧"""
+
+    transport = "unix"
+
+    def __init__(self, path: Optional[str] = None, role: str = "hub"):
+        self.path = path or settings.AGENT_BUS_SOCKET
+        self.role = role
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: List[_Peer] = []
+        self._hub: Optional[_Peer] = None  # worker 到 hub 的连接
+        self._routes: Dict[str, _Peer] = {}  # hub: 远程智能体 -> 所在连接
+        self._directory: Dict[str, Dict[str, Any]] = {}  # 远程智能体目录
+        self._remote: Dict[str, RemoteAgent] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._directory_ready = asyncio.Event()
+        self._last_local: List[Dict[str, Any]] = []
+        self._closing = False
+        self.frames_routed = 0
+        self.frames_dropped = 0
+
+    # ---------- 连接管理 ----------
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self.role == "hub":
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self._server = await asyncio.start_unix_server(self._on_connect, path=self.path)
+            logger.info(f"智能体消息总线已监听: {self.path}")
+        else:
+            reader, writer = await self._connect()
+            self._hub = _Peer(reader, writer, "hub")
+            self._hub.start()
+            self._tasks.append(loop.create_task(self._read_loop(self._hub)))
+            await self.announce()
+            await asyncio.wait_for(self._directory_ready.wait(), timeout=10)
+            logger.info(f"已连接智能体消息总线: {self.path}")
+        self._tasks.append(loop.create_task(self._heartbeat_loop()))
+
+    async def _connect(self):
+        last_error = None
+        for _ in range(50):
+            try:
+                return await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                last_error = e
+                await asyncio.sleep(0.2)
+        raise ConnectionError(f"无法连接智能体消息总线 {self.path}: {last_error}")
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = _Peer(reader, writer, f"peer-{len(self._peers) + 1}")
+        peer.start()
+        self._peers.append(peer)
+        # 新连接先收到当前目录
+        peer.send({"op": "directory", "agents": self._full_directory()}, high_priority=True)
+        await self._read_loop(peer)
+
+    async def _read_loop(self, peer: _Peer):
+        try:
+            while True:
+                frame = await read_frame(peer.reader)
+                peer.frames_received += 1
+                try:
+                    self._handle_frame(peer, frame)
+                except Exception as e:
+                    logger.error(f"处理总线帧出错: {str(e)}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            raise
+        finally:
+            await self._on_disconnect(peer)
+
+    async def _on_disconnect(self, peer: _Peer):
+        await peer.close()
+        if self.role == "hub":
+            if peer in self._peers:
+                self._peers.remove(peer)
+            for agent_id in peer.agent_ids:
+                self._routes.pop(agent_id, None)
+                self._directory.pop(agent_id, None)
+                self._drop_remote(agent_id)
+            if peer.agent_ids:
+                logger.warning(f"总线连接 {peer.name} 断开，移除 {len(peer.agent_ids)} 个智能体")
+                self._broadcast_directory()
+        elif not self._closing:
+            logger.error("与智能体消息总线的连接已断开")
+
+    async def stop(self):
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        for peer in list(self._peers) + ([self._hub] if self._hub else []):
+            await peer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    # ---------- 目录 ----------
+
+    @staticmethod
+    def _local_directory() -> List[Dict[str, Any]]:
+        return [
+            {"agent_id": agent.agent_id, "agent_type": agent.agent_type,
+             "name": agent.name, "status": agent.status}
+            for agent in get_local_agents()
+        ]
+
+    def _full_directory(self) -> List[Dict[str, Any]]:
+        return self._local_directory() + list(self._directory.values())
+
+    async def announce(self):
+        local = self._local_directory()
+        self._last_local = local
+        if self.role == "hub":
+            self._broadcast_directory()
+        elif self._hub is not None:
+            self._hub.send({"op": "register", "agents": local}, high_priority=True)
+
+    async def _heartbeat_loop(self):
+        """定期同步本进程智能体的状态（只在变化时发送），工作进程同时上报运行指标"""
+        while True:
+            await asyncio.sleep(settings.AGENT_BUS_HEARTBEAT_INTERVAL)
+            if self._local_directory() != self._last_local:
+                await self.announce()
+            if self.role == "worker" and self._hub is not None:
+                families = with_labels(metrics_registry.collect(), process=f"worker-{os.getpid()}")
+                self._hub.send({"op": "metrics", "families": families})
+
+    def _broadcast_directory(self):
+        directory = self._full_directory()
+        for peer in self._peers:
+            peer.send({"op": "directory", "agents": directory}, high_priority=True)
+
+    def _sync_remote(self, entries: List[Dict[str, Any]]):
+        """根据目录更新远程智能体代理"""
+        seen = set()
+        for entry in entries:
+            agent_id = entry["agent_id"]
+            if get_local_agent(agent_id) is not None:
+                continue
+            seen.add(agent_id)
+            proxy = self._remote.get(agent_id)
+            if proxy is None:
+                proxy = RemoteAgent(self, agent_id, entry["agent_type"], entry.get("name"))
+                self._remote[agent_id] = proxy
+                register_remote_agent(proxy)
+            proxy.status = entry.get("status", "active")
+        return seen
+
+    def _drop_remote(self, agent_id: str):
+        self._remote.pop(agent_id, None)
+        unregister_remote_agent(agent_id)
+
+    # ---------- 帧收发 ----------
+
+    def send_frame(self, target_agent_id: str, frame: Dict[str, Any], high_priority: bool = False):
+        """把帧发往目标智能体所在进程"""
+        peer = self._hub if self.role == "worker" else self._routes.get(target_agent_id)
+        if peer is None:
+            self.frames_dropped += 1
+            logger.warning(f"总线上找不到目标智能体: {target_agent_id}")
+            return
+        peer.send(frame, high_priority=high_priority)
+
+    def _handle_frame(self, peer: _Peer, frame: Dict[str, Any]):
+        op = frame.get("op")
+
+        if op == "register" and self.role == "hub":
+            for entry in frame.get("agents", []):
+                peer.agent_ids.add(entry["agent_id"])
+                self._routes[entry["agent_id"]] = peer
+                self._directory[entry["agent_id"]] = entry
+            self._sync_remote(frame.get("agents", []))
+            self._broadcast_directory()
+            return
+
+        if op == "metrics" and self.role == "hub":
+            peer.metrics = frame.get("families", [])
+            return
+
+        if op == "directory" and self.role == "worker":
+            seen = self._sync_remote(frame.get("agents", []))
+            for agent_id in list(self._remote):
+                if agent_id not in seen:
+                    self._drop_remote(agent_id)
+            self._directory_ready.set()
+            return
+
+        target_id = frame.get("target")
+        agent = get_local_agent(target_id) if target_id else None
+        if agent is None:
+            # 目标不在本进程：hub 转发给目标所在连接
+            if self.role == "hub" and target_id in self._routes:
+                self.frames_routed += 1
+                self._routes[target_id].send(frame, high_priority=op == "reply")
+            else:
+                self.frames_dropped += 1
+            return
+
+        if op == "send":
+            try:
+                agent.message_queue.put_nowait(frame["message"])
+            except asyncio.QueueFull:
+                # 邮箱通道已满时等待空位，不阻塞帧读取
+                asyncio.get_running_loop().create_task(agent.message_queue.put(frame["message"]))
+        elif op == "query":
+            agent.rpc.serve(
+                frame["query_id"], frame["query"], frame.get("data", {}),
+                time.monotonic() + frame.get("timeout", settings.AGENT_RPC_TIMEOUT),
+                reply_to=RemoteReply(self, frame["source"])
+            )
+        elif op == "reply":
+            agent.rpc.resolve(frame["query_id"], frame.get("response", {}))
+        elif op == "cancel":
+            agent.rpc.cancel(frame["query_id"])
+
+    def get_metrics(self) -> Dict[str, Any]:
+        peers = list(self._peers) + ([self._hub] if self._hub else [])
+        return {
+            "transport": self.transport,
+            "role": self.role,
+            "path": self.path,
+            "remote_agents": len(self._remote),
+            "connections": len(peers),
+            "frames_sent": sum(peer.frames_sent for peer in peers),
+            "frames_received": sum(peer.frames_received for peer in peers),
+            "frames_routed": self.frames_routed,
+            "frames_dropped": self.frames_dropped
+        }
+
+    def remote_metrics(self) -> List[Family]:
+        return [family for peer in self._peers for family in peer.metrics]
+
+
+def create_message_bus(role: str = "hub") -> MessageBus:
+    """按 AGENT_RUNTIME 配置创建消息总线"""
+    if settings.AGENT_RUNTIME == "multiprocess":
+        return UnixSocketBus(settings.AGENT_BUS_SOCKET, role=role)
+    return InProcessBus()
+
+
+# 创建全局消息总线实例（启动时按运行模式替换）
+message_bus: MessageBus = InProcessBus()
+
+
+def get_message_bus() -> MessageBus:
+    return message_bus
+
+
+def set_message_bus(bus: MessageBus):
+    global message_bus
+    message_bus = bus
@@ -13,10 +13,30 @@ import beanie
 from config.logging_config import get_logger
 from database.models import Task, Event, Drone, AgentState, EventLevel, EventType, TaskType, TaskStatus, DroneStatus
 from config.settings import settings
+from services.fleet_state import fleet_state
+from core.metrics import metrics_registry
 from .base import BaseAgent
+from .scheduler import TaskScheduler
+from .task_tracker import task_tracker, is_finished
 
 logger = get_logger("agents.coordinator")
 
+# 事件类型 -> 响应任务类型
+EVENT_TASK_TYPES = {
+    EventType.ANOMALY: TaskType.INSPECTION,
+    EventType.EMERGENCY: TaskType.EMERGENCY,
+    EventType.LOGISTICS: TaskType.DELIVERY,
+    EventType.SECURITY: TaskType.SURVEILLANCE,
+    EventType.SYSTEM: TaskType.OTHER
+}
+
+# 事件级别 -> 任务优先级
+EVENT_LEVEL_PRIORITIES = {
+    EventLevel.LOW: 3,
+    EventLevel.MEDIUM: 6,
+    EventLevel.HIGH: 10
+}
+
 # 全局智能体注册表
 _REGISTERED_AGENTS: Dict[str, BaseAgent] = {}
 
@@ -34,17 +54,64 @@ def unregister_agent(agent_id: str):
         return True
     return False
 
+# 运行在其他进程中的智能体代理，由消息总线根据目录维护
+_REMOTE_AGENTS: Dict[str, Any] = {}
+
+def register_remote_agent(agent: Any):
+    """注册其他进程中智能体的代理"""
+    _REMOTE_AGENTS[agent.agent_id] = agent
+    return agent
+
+def unregister_remote_agent(agent_id: str) -> bool:
+    """注销其他进程中智能体的代理"""
+    return _REMOTE_AGENTS.pop(agent_id, None) is not None
+
+def get_local_agent(agent_id: str) -> Optional[BaseAgent]:
+    """获取运行在本进程中的智能体（包括协调器）"""
+    agent = _REGISTERED_AGENTS.get(agent_id)
+    if agent is None and _COORDINATOR_INSTANCE is not None and _COORDINATOR_INSTANCE.agent_id == agent_id:
+        agent = _COORDINATOR_INSTANCE
+    return agent
+
+def get_local_agents() -> List[BaseAgent]:
+    """获取运行在本进程中的所有智能体（包括协调器）"""
+    agents = list(_REGISTERED_AGENTS.values())
+    if _COORDINATOR_INSTANCE is not None:
+        agents.append(_COORDINATOR_INSTANCE)
+    return agents
+
+def collect_agent_metrics() -> List[Dict[str, Any]]:
+    """抓取时采集本进程智能体的邮箱积压、丢弃消息数和后台协程数"""
+    depth, dropped, background = [], [], []
+    for agent in get_local_agents():
+        labels = {"agent_type": agent.agent_type, "agent_id": agent.agent_id}
+        mailbox = agent.message_queue.get_metrics()
+        for lane, lane_depth in mailbox["depth"].items():
+            depth.append(("skymind_agent_mailbox_depth", {**labels, "lane": lane}, lane_depth))
+        dropped.append(("skymind_agent_mailbox_dropped_total", labels, mailbox["dropped_total"]))
+        background.append(("skymind_agent_background_tasks", labels, len(agent._background_tasks)))
+    return [
+        {"name": "skymind_agent_mailbox_depth", "type": "gauge", "help": "智能体邮箱各通道积压的消息数",
+         "samples": depth},
+        {"name": "skymind_agent_mailbox_dropped_total", "type": "counter", "help": "邮箱满时丢弃的消息数",
+         "samples": dropped},
+        {"name": "skymind_agent_background_tasks", "type": "gauge", "help": "智能体正在运行的后台协程数",
+         "samples": background},
+    ]
+
 def get_agent_by_id(agent_id: str) -> Optional[BaseAgent]:
     """根据ID获取智能体"""
-    return _REGISTERED_AGENTS.get(agent_id)
+    return _REGISTERED_AGENTS.get(agent_id) or _REMOTE_AGENTS.get(agent_id)
 
 def get_agents_by_type(agent_type: str) -> List[BaseAgent]:
     """获取特定类型的所有智能体"""
-    return [agent for agent in _REGISTERED_AGENTS.values() if agent.agent_type == agent_type]
+    return [agent for agent in get_all_agents() if agent.agent_type == agent_type]
 
 def get_all_agents() -> List[BaseAgent]:
-    """获取所有注册的智能体"""
-    return list(_REGISTERED_AGENTS.values())
+    """获取所有注册的智能体（包括其他进程中智能体的代理）"""
+    return list(_REGISTERED_AGENTS.values()) + [
+        agent for agent in _REMOTE_AGENTS.values() if agent.agent_type != "CoordinatorAgent"
+    ]
 
 
 class CoordinatorAgent(BaseAgent):
@@ -59,7 +126,8 @@ class CoordinatorAgent(BaseAgent):
         self.active_tasks: Dict[str, Task] = {}
         self.active_events: Dict[str, Event] = {}
         self.agent_capabilities: Dict[str, Dict[str, float]] = {}
-        self.task_queues: Dict[str, asyncio.Queue] = {}  # 按任务类型的队列
+        self.task_scheduler = TaskScheduler()  # 待分配任务的优先级调度器
+        self._retry_timer: Optional[asyncio.TimerHandle] = None
         self.coordination_lock = asyncio.Lock()
         
         # 事件处理器
@@ -68,10 +136,6 @@ class CoordinatorAgent(BaseAgent):
             "event": [],
             "drone": []
         }
-        
-        # 为不同任务类型创建队列
-        for task_type in TaskType:
-            self.task_queues[task_type] = asyncio.Queue()
     
     async def initialize(self):
         """初始化协调智能体"""
@@ -109,9 +173,9 @@ class CoordinatorAgent(BaseAgent):
             
             for task in active_tasks:
                 self.active_tasks[task.task_id] = task
-                # 将任务添加到相应的队列
+                # 将待分配任务加入调度器
                 if task.status == TaskStatus.PENDING:
-                    await self.task_queues[task.type].put(task)
+                    self.task_scheduler.push(task)
             
             logger.info(f"加载了 {len(active_tasks)} 个活动任务")
         except Exception as e:
@@ -150,31 +214,30 @@ class CoordinatorAgent(BaseAgent):
         await self._process_pending_events()
     
     async def _process_pending_tasks(self):
-        """处理待处理的任务"""
+        """处理待处理的任务：按调度顺序尝试分配全部就绪任务"""
         async with self.coordination_lock:
-            # 按任务类型处理队列
-            for task_type, queue in self.task_queues.items():
-                if queue.empty():
-                    continue
-                
-                # 获取任务但不从队列中移除
-                task = await queue.get()
-                
-                # 尝试为任务分配智能体
-                assigned = await self._assign_agents_to_task(task)
+            for entry in self.task_scheduler.drain():
+                try:
+                    assigned = await self._assign_agents_to_task(entry.task)
+                except Exception as e:
+                    logger.error(f"分配任务 {entry.task_id} 时出错: {str(e)}")
+                    assigned = False
                 
                 if assigned:
-                    # 任务已分配，将其标记为已完成
-                    queue.task_done()
-                    logger.info(f"成功分配任务: {task.task_id} ({task_type})")
+                    self.task_scheduler.complete(entry)
+                    logger.info(f"成功分配任务: {entry.task_id} ({entry.task_type})")
                 else:
-                    # 未能分配任务，将其放回队列
-                    await queue.put(task)
-                    queue.task_done()
-                    logger.warning(f"未能分配任务: {task.task_id} ({task_type})")
-                    
-                    # 为了避免重复处理相同的任务，每次只处理一个任务
-                    break
+                    # 未能分配任务，退避后重试，不影响其他任务
+                    delay = self.task_scheduler.backoff(entry)
+                    logger.warning(f"未能分配任务: {entry.task_id} ({entry.task_type})，{delay:.1f} 秒后重试")
+            
+            # 在最近一个退避任务到期时唤醒
+            if self._retry_timer is not None:
+                self._retry_timer.cancel()
+                self._retry_timer = None
+            delay = self.task_scheduler.next_due_in()
+            if delay is not None:
+                self._retry_timer = self.schedule_wakeup(delay, "task_retry")
     
     async def _assign_agents_to_task(self, task: Task) -> bool:
         """为任务分配合适的智能体"""
@@ -252,15 +315,39 @@ class CoordinatorAgent(BaseAgent):
             await agent.message_queue.put({
                 "type": "task_assigned",
                 "task_id": task.task_id,
+                "task_type": task.type,
+                "priority": task.priority,
                 "source_agent_id": self.agent_id
             })
         
         # 更新活动任务列表
         self.active_tasks[task.task_id] = task
         
+        # 事件触发的任务记录从检测到派遣的延迟，只在首次分配时记录（重新分配不重复计入）
+        detected_at = (task.task_data or {}).get("detected_at")
+        if detected_at and await self._claim_dispatch_latency(task):
+            from .emergency_dispatch import emergency_dispatcher
+            emergency_dispatcher.record_latency(
+                task.task_data.get("event_type"), task.task_data.get("event_level"),
+                datetime.fromisoformat(detected_at), "coordinator"
+            )
+        
         logger.info(f"为任务 {task.task_id} 分配了 {len(best_agents)} 个智能体")
         return True
     
+    async def _claim_dispatch_latency(self, task: Task) -> bool:
+        """标记任务的派遣延迟已记录，任务已标记过（之前分配过）时返回 False"""
+        try:
+            result = await Task.find_one({
+                "task_id": task.task_id,
+                "task_data.dispatch_recorded": {"$ne": True}
+            }).update({"$set": {"task_data.dispatch_recorded": True}})
+        except Exception as e:
+            logger.error(f"标记任务 {task.task_id} 的派遣延迟失败: {str(e)}")
+            return False
+        task.task_data["dispatch_recorded"] = True
+        return bool(getattr(result, "matched_count", 0))
+    
     async def _reason_best_agents(self, task: Task, available_agents: List[BaseAgent], 
                                 required_capabilities: Dict[str, float]) -> List[BaseAgent]:
         """使用推理来确定最佳的智能体组合"""
@@ -400,6 +487,10 @@ class CoordinatorAgent(BaseAgent):
         }
         return mapping.get(task_type, "emergency")
     
+    def _get_agents_by_type(self, agent_type: str) -> List[BaseAgent]:
+        """获取特定类型的所有智能体（供API查询使用）"""
+        return get_agents_by_type(agent_type)
+    
     def _get_available_agents(self) -> List[BaseAgent]:
         """获取所有可用的智能体"""
         return [
@@ -408,25 +499,33 @@ class CoordinatorAgent(BaseAgent):
         ]
     
     async def _check_active_tasks(self):
-        """检查活动任务的状态"""
-        for task_id, task in list(self.active_tasks.items()):
-            # 重新从数据库加载任务以获取最新状态
-            updated_task = await Task.find_one({"task_id": task_id})
+        """检查活动任务的状态（一次批量查询，见 task_tracker）"""
+        if not self.active_tasks:
+            return
+        statuses = await task_tracker.refresh(self.active_tasks)
+        removed = []
+        for task_id, status in statuses.items():
+            task = self.active_tasks.get(task_id)
+            if task is None:
+                continue
             
-            if not updated_task:
+            if status is None:
                 # 任务已被删除
                 logger.warning(f"任务已不存在: {task_id}")
                 self.active_tasks.pop(task_id)
+                removed.append(task_id)
                 continue
             
-            if updated_task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
+            if is_finished(status):
                 # 任务已完成或失败或取消
-                logger.info(f"任务已结束: {task_id} (状态: {updated_task.status})")
+                logger.info(f"任务已结束: {task_id} (状态: {status})")
                 self.active_tasks.pop(task_id)
+                removed.append(task_id)
                 continue
             
             # 更新内部任务记录
-            self.active_tasks[task_id] = updated_task
+            task.status = TaskStatus(status)
+        task_tracker.forget(removed)
     
     async def _process_pending_events(self):
         """处理待处理的事件"""
@@ -444,17 +543,20 @@ class CoordinatorAgent(BaseAgent):
                 self.active_events.pop(event_id)
                 continue
             
-            # 对于新事件，创建相应的任务
+            # 对于新事件，创建相应的任务（认领失败说明事件已被快速派遣认领）
             if updated_event.status == "new":
                 await self._create_task_for_event(updated_event)
-                updated_event.status = "processing"
-                await updated_event.save()
             
             # 更新内部事件记录
             self.active_events[event_id] = updated_event
     
-    async def _create_task_for_event(self, event: Event):
-        """根据事件创建任务"""
+    async def _create_task_for_event(self, event: Event) -> Optional[Task]:
+        """
+        根据事件创建任务
+        
+        先以条件更新认领新事件并同时记录任务ID，认领成功后才写入任务；
+        事件已被监控智能体快速派遣认领时返回 None
+        """
         task_type = self._map_event_to_task_type(event.type)
         
         # 为事件创建任务
@@ -474,41 +576,48 @@ class CoordinatorAgent(BaseAgent):
                 "event_data": event.detection_data,
                 "video_source": event.video_source,
                 "image_evidence": event.image_evidence,
-                "bounding_boxes": [box.dict() for box in (event.bounding_boxes or [])]
+                "bounding_boxes": [box.dict() for box in (event.bounding_boxes or [])],
+                "event_type": event.type,
+                "event_level": event.level,
+                "detected_at": event.detected_at.isoformat()
             }
         )
         
-        await task.insert()
-        logger.info(f"为事件 {event.event_id} 创建了任务: {task.task_id}")
+        # 认领与记录任务ID在同一次写入中完成，监控智能体不会看到处理中却没有任务的事件
+        claimed = await Event.find_one({"event_id": event.event_id, "status": "new"}).update({
+            "$set": {"status": "processing"},
+            "$addToSet": {"related_tasks": task.task_id}
+        })
+        if not claimed.matched_count:
+            logger.info(f"事件 {event.event_id} 已被认领，跳过创建任务")
+            return None
         
-        # 将任务添加到队列
-        await self.task_queues[task_type].put(task)
+        try:
+            await task.insert()
+        except Exception:
+            # 撤销认领，下一轮重新创建任务
+            await Event.find_one({"event_id": event.event_id}).update({
+                "$set": {"status": "new"},
+                "$pull": {"related_tasks": task.task_id}
+            })
+            raise
+        logger.info(f"为事件 {event.event_id} 创建了任务: {task.task_id}")
         
-        # 更新事件
+        event.status = "processing"
         event.related_tasks.append(task.task_id)
-        await event.save()
+        
+        # 将任务加入调度器
+        self.task_scheduler.push(task)
         
         return task
     
     def _map_event_to_task_type(self, event_type: EventType) -> TaskType:
         """将事件类型映射到任务类型"""
-        mapping = {
-            EventType.ANOMALY: TaskType.INSPECTION,
-            EventType.EMERGENCY: TaskType.EMERGENCY,
-            EventType.LOGISTICS: TaskType.DELIVERY,
-            EventType.SECURITY: TaskType.SURVEILLANCE,
-            EventType.SYSTEM: TaskType.OTHER
-        }
-        return mapping.get(event_type, TaskType.OTHER)
+        return EVENT_TASK_TYPES.get(event_type, TaskType.OTHER)
     
     def _map_event_level_to_priority(self, event_level: EventLevel) -> int:
         """将事件级别映射到任务优先级"""
-        mapping = {
-            EventLevel.LOW: 3,
-            EventLevel.MEDIUM: 6,
-            EventLevel.HIGH: 10
-        }
-        return mapping.get(event_level, 5)
+        return EVENT_LEVEL_PRIORITIES.get(event_level, 5)
     
     async def process_message(self, message: Dict[str, Any]):
         """处理来自其他智能体或系统的消息"""
@@ -528,7 +637,7 @@ class CoordinatorAgent(BaseAgent):
                     
                 task = Task(**task_data) # Assuming Task model can be instantiated from dict
                 self.active_tasks[task.task_id] = task
-                await self.task_queues[task.type].put(task)
+                self.task_scheduler.push(task)
                 logger.info(f"收到新任务: {task.task_id}")
             except Exception as e:
                 logger.error(f"处理 new_task 消息时出错: {e}, Data: {data}")
@@ -548,19 +657,38 @@ class CoordinatorAgent(BaseAgent):
             except Exception as e:
                 logger.error(f"处理 new_event 消息时出错: {e}, Data: {data}")
 
+        elif message_type == "task_dispatched":
+            # 快速派遣的任务已分配，只需跟踪其状态
+            try:
+                task = await Task.find_one({"task_id": message.get("task_id")})
+                if task:
+                    self.active_tasks[task.task_id] = task
+                event = await Event.find_one({"event_id": message.get("event_id")})
+                if event:
+                    self.active_events[event.event_id] = event
+            except Exception as e:
+                logger.error(f"处理 task_dispatched 消息时出错: {e}, Message: {message}")
+
         elif message_type == "task_update":
             try:
                 task_id = data.get("task_id")
                 update_data = data.get("update_data")
-                if task_id and update_data and task_id in self.active_tasks:
-                    task = self.active_tasks[task_id]
+                # 任务可能已分配（活动任务）或仍在调度队列中等待分配
+                task = self.active_tasks.get(task_id) or self.task_scheduler.get(task_id)
+                if task_id and update_data and task is not None:
                     for key, value in update_data.items():
                         setattr(task, key, value)
-                    await task.save() # Save changes to DB
+                    # 只写入更新的字段：缓存的任务文档只同步状态，整体保存会覆盖其他智能体的修改
+                    await Task.find_one({"task_id": task_id}).update({"$set": update_data})
+                    if "status" in update_data:
+                        task_tracker.note(task_id, task.status)
+                    if "priority" in update_data:
+                        self.task_scheduler.reprioritize(task_id, task.priority)
                     logger.info(f"任务更新: {task_id}, Status: {task.status}")
                     # If task is completed or failed, remove from active list?
                     if task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
-                         del self.active_tasks[task_id]
+                         self.active_tasks.pop(task_id, None)
+                         self.task_scheduler.remove(task_id)
                          logger.info(f"任务 {task_id} 已结束，从活动列表中移除。")
                 else:
                     logger.warning(f"无法更新任务，无效数据: {data}")
@@ -625,7 +753,7 @@ class CoordinatorAgent(BaseAgent):
             if not drone_id:
                 return {"success": False, "error": "Missing drone_id"}
             
-            drone = await Drone.find_one({"drone_id": drone_id})
+            drone = await fleet_state.get_drone(drone_id)
             if not drone:
                 return {"success": False, "error": f"Drone not found: {drone_id}"}
             
@@ -634,8 +762,21 @@ class CoordinatorAgent(BaseAgent):
                 "drone": drone.dict()
             }
         
+        elif query == "get_scheduler_metrics":
+            return {
+                "success": True,
+                "metrics": self.task_scheduler.get_metrics()
+            }
+        
+        elif query == "get_dispatch_metrics":
+            from .emergency_dispatch import emergency_dispatcher
+            return {
+                "success": True,
+                "metrics": emergency_dispatcher.get_metrics()
+            }
+        
         elif query == "get_available_drones":
-            drones = await Drone.find({"status": "idle"}).to_list()
+            drones = fleet_state.by_status(DroneStatus.IDLE)
             return {
                 "success": True,
                 "drones": [drone.dict() for drone in drones]
@@ -889,6 +1030,12 @@ async def get_coordinator() -> CoordinatorAgent:
     """获取或创建协调器实例"""
     global _COORDINATOR_INSTANCE
     if _COORDINATOR_INSTANCE is None:
+        # 智能体工作进程中，协调器运行在主进程，使用消息总线上的代理
+        for agent in _REMOTE_AGENTS.values():
+            if agent.agent_type == "CoordinatorAgent":
+                return agent
         _COORDINATOR_INSTANCE = CoordinatorAgent()
         await _COORDINATOR_INSTANCE.initialize()
-    return _COORDINATOR_INSTANCE
\ No newline at end of file
+    return _COORDINATOR_INSTANCE
+
+metrics_registry.register_collector(collect_agent_metrics)
@@ -0,0 +1,253 @@
+"""
+高级别事件快速派遣
+
+常规链路中事件要依次经过协调者邮箱、下一个周期的 _process_pending_events、
+任务调度器和 _assign_agents_to_task，每一跳都可能等待一个工作周期。
+EMERGENCY_FAST_PATH_LEVELS 级别的事件改走快速派遣：
+- 选出事件附近最近的可用无人机，以数据库条件更新预留，并发派遣（包括其他进程）不会选中同一架
+- 直接创建已分配的任务（应急响应 + 路径规划智能体），写入一次数据库
+- 本进程内的智能体直接接手任务并立即开始规划，其他进程中的智能体通过应急通道消息接手
+- 记录从检测到派遣的延迟，作为 SLO 指标（skymind_emergency_dispatch_seconds）
+
+没有可用的智能体或创建任务失败时返回 None，调用方退回常规链路。
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from config.logging_config import get_logger
+from config.settings import settings
+from database.models import Event, Task, Drone, TaskStatus, TaskType, Location
+from core.metrics import emergency_dispatch_seconds, emergency_dispatch_slo_violations_total
+from services.fleet_state import fleet_state
+from .coordinator import (
+    EVENT_TASK_TYPES, EVENT_LEVEL_PRIORITIES, get_agents_by_type, get_local_agent, get_coordinator
+)
+from .scheduler import Histogram
+
+logger = get_logger("agents.emergency_dispatch")
+
+DISPATCHER_ID = "emergency-dispatch"
+
+# 快速派遣交给的智能体类型
+DISPATCH_AGENT_TYPES = ("ResponseAgent", "PathPlanningAgent")
+
+DISPATCH_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)  # 秒
+
+
+def _enum_value(value: Any) -> str:
+    return getattr(value, "value", value)
+
+
+def fast_path_levels() -> set:
+    return {item.strip() for item in settings.EMERGENCY_FAST_PATH_LEVELS.split(",") if item.strip()}
+
+
+class EmergencyDispatcher:
+    """高级别事件快速派遣器"""
+
+    def __init__(self, slo: Optional[float] = None):
+        self.slo = slo or settings.EMERGENCY_DISPATCH_SLO
+        self.latency: Dict[str, Histogram] = {}  # 派遣路径 -> 检测到派遣的延迟
+        self.dispatched = 0
+        self.without_drone = 0
+        self.fallbacks = 0
+        self.slo_violations = 0
+        self.max_latency = 0.0
+
+    def applies(self, event: Event) -> bool:
+        """事件级别是否走快速派遣"""
+        return _enum_value(event.level) in fast_path_levels()
+
+    def record_latency(self, event_type: Any, level: Any, detected_at: datetime, path: str) -> float:
+        """
+        记录从检测到派遣的延迟
+
+        Args:
+            path: 派遣路径，fast（快速派遣）或 coordinator（协调者调度）
+
+        Returns:
+            延迟（秒）
+        """
+        latency = max(0.0, (datetime.utcnow() - detected_at).total_seconds())
+        histogram = self.latency.get(path)
+        if histogram is None:
+            histogram = self.latency[path] = Histogram(DISPATCH_LATENCY_BUCKETS)
+        histogram.observe(latency)
+        emergency_dispatch_seconds.observe(latency, _enum_value(event_type), path)
+        if _enum_value(level) in fast_path_levels():
+            self.max_latency = max(self.max_latency, latency)
+            if latency > self.slo:
+                self.slo_violations += 1
+                emergency_dispatch_slo_violations_total.inc(_enum_value(event_type))
+        return latency
+
+    async def _reserve_drone(self, event: Event) -> Optional[Drone]:
+        """
+        预留事件附近最近的可用无人机
+
+        按距离依次尝试候选无人机，在数据库中以条件更新（仍为空闲时）改为飞行，
+        机队状态过期或被其他进程抢先预留的无人机跳过
+        """
+        if event.location is None:
+            return None
+        lon, lat = event.location.position.coordinates[:2]
+        nearest = fleet_state.nearest_available(
+            lon, lat, k=settings.RESPONSE_CANDIDATE_DRONES, min_battery=settings.RESPONSE_MIN_BATTERY
+        )
+        for _, candidate in nearest:
+            drone = await fleet_state.reserve(candidate.drone_id)
+            if drone is not None:
+                return drone
+        return None
+
+    def _select_agents(self) -> List[Any]:
+        """每种类型选一个智能体：优先本进程内的（可以直接交接），其次是负载最低的"""
+        selected = []
+        for agent_type in DISPATCH_AGENT_TYPES:
+            candidates = [
+                agent for agent in get_agents_by_type(agent_type)
+                if agent.status not in ("error", "stopped")
+            ]
+            if not candidates:
+                continue
+            selected.append(min(candidates, key=lambda agent: (
+                get_local_agent(agent.agent_id) is None, len(getattr(agent, "active_tasks", None) or {})
+            )))
+        return selected
+
+    def _build_task(self, event: Event, drone: Optional[Drone], agents: List[Any]) -> Task:
+        # 路径从无人机当前位置规划到事件地点
+        start_location = event.location
+        if drone is not None and drone.current_location:
+            start_location = Location(position=drone.current_location, name=drone.name)
+        return Task(
+            title=f"应急响应：{event.title}",
+            description=f"快速派遣的应急任务，用于响应事件 {event.event_id}\n\n{event.description}",
+            type=EVENT_TASK_TYPES.get(event.type, TaskType.EMERGENCY),
+            status=TaskStatus.ASSIGNED,
+            priority=EVENT_LEVEL_PRIORITIES.get(event.level, 10),
+            created_by=DISPATCHER_ID,
+            assigned_agents=[agent.agent_id for agent in agents],
+            assigned_drones=[drone.drone_id] if drone is not None else [],
+            start_location=start_location,
+            end_location=event.location,
+            related_events=[event.event_id],
+            completion_criteria={"event_resolved": True},
+            start_time=datetime.utcnow(),
+            task_data={
+                "event_data": event.detection_data,
+                "video_source": event.video_source,
+                "image_evidence": event.image_evidence,
+                "bounding_boxes": [box.dict() for box in (event.bounding_boxes or [])],
+                "dispatch": {"path": "fast", "detected_at": event.detected_at.isoformat()}
+            }
+        )
+
+    def _hand_off(self, agent: Any, task: Task, event: Event):
+        """本进程内的智能体直接接手任务，其他进程中的智能体通过应急通道消息接手"""
+        accept = getattr(agent, "accept_dispatched_task", None)
+        if accept is not None:
+            accept(task, event)
+            return
+        agent.message_queue.put_nowait({
+            "type": "task_assigned",
+            "task_id": task.task_id,
+            "task_type": task.type,
+            "priority": task.priority,
+            "lane": "emergency",
+            "source_agent_id": DISPATCHER_ID
+        })
+
+    async def dispatch(self, event: Event, detected_at: Optional[datetime] = None) -> Optional[Task]:
+        """
+        快速派遣事件
+
+        Args:
+            event: 已保存的事件
+            detected_at: 检测时间，默认为事件的 detected_at
+
+        Returns:
+            创建的任务；没有可用的智能体或创建失败时为 None，调用方应退回常规链路
+        """
+        agents = self._select_agents()
+        if not agents:
+            self.fallbacks += 1
+            logger.warning(f"没有可接手应急任务的智能体，事件 {event.event_id} 退回协调者调度")
+            return None
+
+        drone = await self._reserve_drone(event)
+        task = self._build_task(event, drone, agents)
+        try:
+            await task.insert()
+        except Exception as e:
+            if drone is not None:
+                try:
+                    await fleet_state.release(drone.drone_id)
+                except Exception as release_error:
+                    logger.error(f"释放无人机 {drone.drone_id} 失败: {str(release_error)}")
+            self.fallbacks += 1
+            logger.error(f"快速派遣创建任务失败，事件 {event.event_id} 退回协调者调度: {str(e)}")
+            return None
+
+        for agent in agents:
+            try:
+                self._hand_off(agent, task, event)
+            except Exception as e:
+                logger.error(f"向 {agent.agent_id} 交接任务 {task.task_id} 失败: {str(e)}")
+
+        latency = self.record_latency(event.type, event.level, detected_at or event.detected_at, "fast")
+        self.dispatched += 1
+        if drone is None:
+            self.without_drone += 1
+        logger.info(
+            f"快速派遣事件 {event.event_id} -> 任务 {task.task_id}，"
+            f"无人机 {drone.drone_id if drone else '无'}，检测到派遣 {latency * 1000:.0f}ms"
+        )
+
+        # 派遣之后再持久化事件和无人机状态、通知协调者跟踪任务
+        event.status = "processing"
+        event.related_tasks.append(task.task_id)
+        writes = [Event.find_one({"event_id": event.event_id}).update({
+            "$set": {"status": "processing"},
+            "$addToSet": {"related_tasks": task.task_id}
+        })]
+        if drone is not None:
+            drone.assigned_tasks.append(task.task_id)
+            # 无人机状态已在预留时写入
+            writes.append(Drone.find_one({"drone_id": drone.drone_id}).update({
+                "$addToSet": {"assigned_tasks": task.task_id}
+            }))
+        results = await asyncio.gather(*writes, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"保存快速派遣状态失败: {str(result)}")
+
+        try:
+            coordinator = await get_coordinator()
+            await coordinator.message_queue.put({
+                "type": "task_dispatched",
+                "task_id": task.task_id,
+                "event_id": event.event_id,
+                "priority": task.priority,
+                "source_agent_id": DISPATCHER_ID
+            })
+        except Exception as e:
+            logger.error(f"通知协调者快速派遣的任务失败: {str(e)}")
+
+        return task
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "slo_seconds": self.slo,
+            "dispatched": self.dispatched,
+            "without_drone": self.without_drone,
+            "fallbacks": self.fallbacks,
+            "slo_violations": self.slo_violations,
+            "max_latency_seconds": self.max_latency,
+            "latency": {path: histogram.to_dict() for path, histogram in self.latency.items()}
+        }
+
+
+# 创建全局快速派遣器实例
+emergency_dispatcher = EmergencyDispatcher()
@@ -0,0 +1,166 @@
+"""
+事件时空聚类
+
+监控智能体的每个异常检测（通过各视频源的冷却时间之后）原本都会成为一个新事件，
+协调者再为每个事件创建任务。视野重叠的摄像头、同一事件的重复检测会成倍放大
+后续的路径规划和LLM调用。这里在创建事件之前做在线聚类：
+- 未结束的事件按位置放入网格索引（网格宽度等于聚类半径，查询只访问附近几个网格），
+  按最近一次检测时间排成时间窗口队列
+- 新检测与同类型、EVENT_CLUSTER_RADIUS 米以内、最近 EVENT_CLUSTER_WINDOW 秒内
+  仍有检测的事件合并（取最近的一个），不再创建新事件和任务
+- 超出时间窗口的事件从索引中移除，之后的检测重新创建事件
+
+没有位置的事件按 (类型, 视频源) 聚类。
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Any, Optional, Set, Tuple
+
+from config.logging_config import get_logger
+from config.settings import settings
+from database.models import Event, Location
+from services.spatial_index import GridIndex, METERS_PER_DEGREE
+
+logger = get_logger("agents.event_clustering")
+
+# 事件级别的高低顺序，合并时事件级别只升不降
+LEVEL_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+
+def _enum_value(value: Any) -> str:
+    return getattr(value, "value", value)
+
+
+def level_rank(level: Any) -> int:
+    return LEVEL_ORDER.get(_enum_value(level), 0)
+
+
+@dataclass(eq=False)
+class EventCluster:
+    """一个未结束事件及其合并的检测"""
+    event: Event
+    event_type: str
+    first_seen: datetime
+    last_seen: datetime
+    position: Optional[Tuple[float, float]] = None  # (lon, lat)，取事件首次检测的位置，不随合并漂移
+    detections: int = 1
+    sources: Set[str] = field(default_factory=set)
+
+    @property
+    def event_id(self) -> str:
+        return self.event.event_id
+
+
+class EventClusterIndex:
+    """按网格和时间窗口索引的未结束事件"""
+
+    def __init__(self, radius: Optional[float] = None, window: Optional[float] = None):
+        self.radius = radius or settings.EVENT_CLUSTER_RADIUS  # 米
+        self.window = window or settings.EVENT_CLUSTER_WINDOW  # 秒
+        self._clusters: "OrderedDict[str, EventCluster]" = OrderedDict()  # 按最近一次检测时间排序
+        self._grid = GridIndex(self.radius / METERS_PER_DEGREE)
+        self._by_source: Dict[Tuple[str, str], str] = {}  # 没有位置的事件：(类型, 视频源) -> event_id
+
+        self.created = 0
+        self.merged = 0
+        self.expired = 0
+
+    @staticmethod
+    def _position(location: Optional[Location]) -> Optional[Tuple[float, float]]:
+        if location is None or not location.position.coordinates:
+            return None
+        lon, lat = location.position.coordinates[:2]
+        return lon, lat
+
+    def expire(self, now: datetime):
+        """移除超出时间窗口的事件"""
+        while self._clusters:
+            event_id, cluster = next(iter(self._clusters.items()))
+            if (now - cluster.last_seen).total_seconds() <= self.window:
+                break
+            self.remove(event_id)
+            self.expired += 1
+
+    def match(self, event_type: Any, location: Optional[Location], source_id: Optional[str],
+              detected_at: datetime) -> Optional[EventCluster]:
+        """
+        查找可以合并新检测的事件
+
+        Args:
+            event_type: 检测的事件类型
+            location: 检测位置
+            source_id: 视频源ID
+            detected_at: 检测时间
+
+        Returns:
+            最近的同类型未结束事件，没有时为 None
+        """
+        self.expire(detected_at)
+        event_type = _enum_value(event_type)
+        position = self._position(location)
+        if position is None:
+            event_id = self._by_source.get((event_type, source_id))
+            return self._clusters.get(event_id) if event_id else None
+
+        def same_type(event_id: str) -> bool:
+            return self._clusters[event_id].event_type == event_type
+
+        nearest = self._grid.nearest(position[0], position[1], k=1, predicate=same_type, max_distance=self.radius)
+        return self._clusters[nearest[0][1]] if nearest else None
+
+    def add(self, event: Event) -> EventCluster:
+        """登记新创建的事件"""
+        source_id = event.video_source
+        cluster = EventCluster(
+            event=event,
+            event_type=_enum_value(event.type),
+            first_seen=event.detected_at,
+            last_seen=event.detected_at,
+            position=self._position(event.location),
+            sources={source_id} if source_id else set()
+        )
+        self._clusters[cluster.event_id] = cluster
+        if cluster.position is not None:
+            self._grid.insert(cluster.event_id, *cluster.position)
+        else:
+            self._by_source[(cluster.event_type, source_id)] = cluster.event_id
+        self.created += 1
+        return cluster
+
+    def touch(self, cluster: EventCluster, detected_at: datetime, source_id: Optional[str] = None):
+        """记录合并到事件中的一次检测"""
+        cluster.detections += 1
+        cluster.last_seen = max(cluster.last_seen, detected_at)
+        if source_id:
+            cluster.sources.add(source_id)
+        self._clusters.move_to_end(cluster.event_id)
+        self.merged += 1
+
+    def remove(self, event_id: str) -> Optional[EventCluster]:
+        """移除事件（超出时间窗口、已解决或已删除）"""
+        cluster = self._clusters.pop(event_id, None)
+        if cluster is None:
+            return None
+        if cluster.position is not None:
+            self._grid.remove(event_id)
+        else:
+            key = (cluster.event_type, cluster.event.video_source)
+            if self._by_source.get(key) == event_id:
+                del self._by_source[key]
+        return cluster
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        detections = self.created + self.merged
+        return {
+            "open_clusters": len(self._clusters),
+            "radius_meters": self.radius,
+            "window_seconds": self.window,
+            "events_created": self.created,
+            "detections_merged": self.merged,
+            "clusters_expired": self.expired,
+            "merge_ratio": self.merged / detections if detections else 0.0
+        }
@@ -0,0 +1,174 @@
+"""
+智能体日志批量写入
+
+BaseAgent.log 只把记录放入内存缓冲区，后台任务在缓冲区达到批量大小或
+到达刷新间隔时用 insert_many 写入 agent_logs 集合，智能体不会等待日志落库。
+
+缓冲区有上限，积压时按级别降级：
+- 超过高水位：DEBUG/INFO 按 AGENT_LOG_SAMPLE_RATE 采样保留
+- 缓冲区已满：DEBUG/INFO 直接丢弃；WARNING 及以上优先挤掉最旧的低级别记录
+"""
+import asyncio
+import random
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+from beanie.odm.utils.encoder import Encoder
+
+from config.logging_config import get_logger
+from config.settings import settings
+from database.models import AgentLog
+from database.mongodb import get_collection
+
+logger = get_logger("agents.log_sink")
+
+# 可以被采样和丢弃的低级别日志
+LOW_PRIORITY_LEVELS = {"DEBUG", "INFO"}
+
+
+class AgentLogSink:
+    """有界的智能体日志缓冲区，由后台任务批量写入数据库"""
+
+    def __init__(self, max_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, sample_rate: Optional[float] = None,
+                 high_watermark: float = 0.5):
+        self.max_size = max_size or settings.AGENT_LOG_BUFFER_SIZE
+        self.batch_size = batch_size or settings.AGENT_LOG_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else settings.AGENT_LOG_FLUSH_INTERVAL
+        self.sample_rate = sample_rate if sample_rate is not None else settings.AGENT_LOG_SAMPLE_RATE
+        self.high_watermark = int(self.max_size * high_watermark)
+
+        self._buffer: deque = deque()
+        self._batch_ready = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._drainer: Optional[asyncio.Task] = None
+        self._encoder = Encoder()
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.sampled_out = 0
+        self.failed = 0
+        self.dropped: Dict[str, int] = {}
+
+    def emit(self, agent_id: str, agent_type: str, level: str, message: str,
+             task_id: Optional[str] = None, event_id: Optional[str] = None,
+             context: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        添加一条日志记录，不等待写入
+
+        Returns:
+            记录是否进入缓冲区
+        """
+        level = level.upper()
+        low_priority = level in LOW_PRIORITY_LEVELS
+        size = len(self._buffer)
+
+        if low_priority and size >= self.max_size:
+            self._drop(level)
+            return False
+        if low_priority and size >= self.high_watermark and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return False
+        if size >= self.max_size:
+            self._evict()
+
+        self._buffer.append({
+            "log_id": str(uuid.uuid4()),
+            "agent_id": agent_id,
+            "agent_type": agent_type,
+            "level": level,
+            "message": message,
+            "timestamp": datetime.utcnow(),
+            "related_task_id": task_id,
+            "related_event_id": event_id,
+            "context": context or {}
+        })
+        self.enqueued += 1
+
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+        self._ensure_drainer()
+        return True
+
+    def _drop(self, level: str):
+        self.dropped[level] = self.dropped.get(level, 0) + 1
+
+    def _evict(self):
+        """为高级别日志腾出位置：优先挤掉最旧的低级别记录，没有时挤掉最旧的记录"""
+        for index, record in enumerate(self._buffer):
+            if record["level"] in LOW_PRIORITY_LEVELS:
+                del self._buffer[index]
+                self._drop(record["level"])
+                return
+        self._drop(self._buffer.popleft()["level"])
+
+    def _ensure_drainer(self):
+        if self._drainer is not None and not self._drainer.done():
+            return
+        try:
+            self._drainer = asyncio.get_running_loop().create_task(self._drain_loop())
+        except RuntimeError:
+            # 没有运行中的事件循环，等待显式 flush
+            pass
+
+    async def _drain_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        写入缓冲区中的全部记录
+
+        Returns:
+            写入的记录数
+        """
+        written = 0
+        async with self._flush_lock:
+            while self._buffer:
+                count = min(self.batch_size, len(self._buffer))
+                batch: List[Dict[str, Any]] = [self._buffer.popleft() for _ in range(count)]
+                try:
+                    await get_collection(AgentLog).insert_many(
+                        [self._encoder.encode(record) for record in batch], ordered=False
+                    )
+                except Exception as e:
+                    # 日志写入失败不重试，避免数据库故障时缓冲区持续积压
+                    self.failed += len(batch)
+                    logger.error(f"批量写入智能体日志失败，丢弃 {len(batch)} 条: {str(e)}")
+                    break
+                written += len(batch)
+                self.flushed += len(batch)
+        return written
+
+    async def stop(self):
+        """停止后台任务并写入剩余记录"""
+        if self._drainer is not None:
+            self._drainer.cancel()
+            try:
+                await self._drainer
+            except asyncio.CancelledError:
+                pass
+            self._drainer = None
+        await self.flush()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._buffer),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "sampled_out": self.sampled_out,
+            "dropped": dict(self.dropped),
+            "dropped_total": sum(self.dropped.values()),
+            "failed": self.failed
+        }
+
+
+# 创建全局智能体日志缓冲实例
+agent_log_sink = AgentLogSink()
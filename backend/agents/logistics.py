@@ -13,10 +13,13 @@ import random
 
 from config.logging_config import get_logger
 from database.models import (
-    Task, FlightPath, GeoPoint, Location, Drone,
+    Task, FlightPath, GeoPoint, Location, Drone, DroneStatus,
     TaskStatus, TaskType, TimeWindow
 )
 from config.settings import settings
+from services.vrp import DeliveryStop, DeliveryRoute, solve_routes, distance_matrix_cache
+from services.assignment import solve_assignment
+from services.fleet_state import fleet_state
 from .base import BaseAgent
 from .coordinator import register_agent, get_coordinator
 
@@ -29,6 +32,8 @@ class PrioritizedTask:
     priority: int
     task_id: str = field(compare=False)
     task: Task = field(compare=False)
+    attempts: int = field(default=0, compare=False)  # 无法规划回路的次数
+    not_before: float = field(default=0.0, compare=False)  # 退避到期的单调时钟时间
 
 
 class LogisticsAgent(BaseAgent):
@@ -78,7 +83,8 @@ class LogisticsAgent(BaseAgent):
     async def _load_drone_status(self):
         """加载无人机状态"""
         try:
-            drones = await Drone.find_all().to_list()
+            await fleet_state.ensure_loaded()
+            drones = fleet_state.all()
             
             for drone in drones:
                 self.drone_status[drone.drone_id] = {
@@ -138,19 +144,20 @@ class LogisticsAgent(BaseAgent):
     async def _update_drone_status(self):
         """更新无人机状态信息"""
         try:
-            # 获取所有无人机的最新状态
-            drones = await Drone.find_all().to_list()
+            # 从内存中的机队状态获取无人机的最新状态
+            drones = fleet_state.all()
             
             for drone in drones:
                 if drone.drone_id in self.drone_status:
                     # 更新现有无人机的状态
                     drone_info = self.drone_status[drone.drone_id]
                     
-                    # 保存之前的状态
-                    prev_status = drone_info["drone"].status
+                    # 保存之前的状态（无人机对象与机队状态共享，之前的状态单独记录）
+                    prev_status = drone_info.get("last_status", drone_info["drone"].status)
                     
                     # 更新无人机对象
                     drone_info["drone"] = drone
+                    drone_info["last_status"] = drone.status
                     
                     # 如果状态发生变化，记录历史
                     if prev_status != drone.status:
@@ -174,6 +181,13 @@ class LogisticsAgent(BaseAgent):
                         "status_history": []
                     }
             
+            # 一次查询所有忙碌无人机的当前任务
+            busy_task_ids = [info["current_task"] for info in self.drone_status.values() if info["current_task"]]
+            tasks_by_id = {}
+            if busy_task_ids:
+                tasks = await Task.find({"task_id": {"$in": busy_task_ids}}).to_list()
+                tasks_by_id = {task.task_id: task for task in tasks}
+            
             # 检查分配任务的无人机
             for drone_id, drone_info in self.drone_status.items():
                 drone = drone_info["drone"]
@@ -181,7 +195,7 @@ class LogisticsAgent(BaseAgent):
                 
                 # 检查无人机当前任务是否已完成
                 if current_task_id:
-                    task = await Task.find_one({"task_id": current_task_id})
+                    task = tasks_by_id.get(current_task_id)
                     
                     if not task or task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
                         # 任务已完成或取消，标记无人机为空闲
@@ -207,6 +221,13 @@ class LogisticsAgent(BaseAgent):
     
     async def _process_task_queue(self):
         """处理任务队列"""
+        if settings.LOGISTICS_DISPATCH_MODE == "multi_stop":
+            await self._process_task_queue_batched()
+            return
+        if settings.LOGISTICS_DISPATCH_MODE == "matching":
+            await self._process_task_queue_matching()
+            return
+        
         async with self.scheduling_lock:
             # 获取可用的无人机
             available_drones = self._get_available_drones()
@@ -237,11 +258,15 @@ class LogisticsAgent(BaseAgent):
                 best_drone = self._select_best_drone(task, available_drones)
                 
                 if best_drone:
-                    # 分配任务给无人机
-                    await self._assign_task_to_drone(task, best_drone)
-                    
                     # 从可用无人机列表中移除
                     available_drones.remove(best_drone)
+                    
+                    # 分配任务给无人机，无人机已被其他进程预留时任务放回队列，换一架重试
+                    if not await self._assign_task_to_drone(task, best_drone):
+                        heapq.heappush(
+                            self.task_queue,
+                            PrioritizedTask(priority=prioritized_task.priority, task_id=task_id, task=task)
+                        )
                 else:
                     # 没有合适的无人机，将任务放回队列
                     heapq.heappush(
@@ -250,16 +275,333 @@ class LogisticsAgent(BaseAgent):
                     )
                     break
     
+    async def _process_task_queue_matching(self):
+        """批量指派模式：待分配任务与可用无人机构成代价矩阵，每次唤醒用匈牙利算法求解一次"""
+        async with self.scheduling_lock:
+            available_drones = [d for d in self._get_available_drones() if d.current_location]
+            if not available_drones or not self.task_queue:
+                return
+            
+            candidates = await self._refresh_queue()
+            if not candidates:
+                return
+            
+            solution = await asyncio.to_thread(
+                solve_assignment,
+                [item.task.start_location.position.coordinates[:2] for item in candidates],
+                [item.task.end_location.position.coordinates[:2] for item in candidates],
+                [self._task_payload(item.task) for item in candidates],
+                [item.priority for item in candidates],
+                [drone.current_location.coordinates[:2] for drone in available_drones],
+                [self._drone_range(drone) for drone in available_drones],
+                [drone.payload_capacity for drone in available_drones]
+            )
+            
+            for task_index, drone_index, _ in solution["pairs"]:
+                if not await self._assign_task_to_drone(candidates[task_index].task, available_drones[drone_index]):
+                    heapq.heappush(self.task_queue, candidates[task_index])
+            
+            # 未分配的任务放回队列，等待下一轮
+            for task_index in solution["unassigned"]:
+                heapq.heappush(self.task_queue, candidates[task_index])
+            
+            if solution["pairs"]:
+                logger.info(
+                    f"批量指派 {len(candidates)} 个任务 × {len(available_drones)} 架无人机，"
+                    f"分配 {len(solution['pairs'])} 个，空驶 {solution['empty_distance']:.0f} 米，"
+                    f"耗时 {solution['solve_ms']:.1f} ms"
+                )
+    
+    async def _process_task_queue_batched(self):
+        """多点配送模式：按取货点分组求解多点回路，每条回路整趟派给一架无人机"""
+        async with self.scheduling_lock:
+            available_drones = [d for d in self._get_available_drones() if d.current_location]
+            if not available_drones or not self.task_queue:
+                return
+            
+            queued = await self._refresh_queue()
+            
+            # 按取货点（约10米精度）分组，每组共用一个仓库
+            groups: Dict[Tuple[float, float], List[PrioritizedTask]] = {}
+            for item in queued:
+                pickup = item.task.start_location.position.coordinates
+                groups.setdefault((round(pickup[0], 4), round(pickup[1], 4)), []).append(item)
+            
+            handled: Set[str] = set()  # 已分配、已退避或已标记失败的任务
+            # 含最高优先级任务的分组先求解
+            for items in sorted(groups.values(), key=lambda group: min(item.priority for item in group)):
+                if not available_drones:
+                    break
+                
+                depot = tuple(items[0].task.start_location.position.coordinates[:2])
+                stops = [
+                    DeliveryStop(
+                        stop_id=item.task_id,
+                        location=tuple(item.task.end_location.position.coordinates[:2]),
+                        demand=self._task_payload(item.task)
+                    )
+                    for item in items
+                ]
+                capacity = max(drone.payload_capacity for drone in available_drones)
+                max_distance = max(self._drone_range(drone) for drone in available_drones)
+                
+                solution = await asyncio.to_thread(
+                    solve_routes, depot, stops, capacity, max_distance,
+                    settings.LOGISTICS_BATCH_MAX_STOPS, None, distance_matrix_cache
+                )
+                
+                # 超出可用无人机载重或续航的投递点退避重试，多次仍无法规划时任务标记为失败
+                unserved_ids = {stop.stop_id for stop in solution["unserved"]}
+                for item in items:
+                    if item.task_id in unserved_ids:
+                        handled.add(item.task_id)
+                        await self._defer_unroutable(item)
+                
+                tasks_by_id = {item.task_id: item.task for item in items}
+                for route in solution["routes"]:
+                    drone = self._select_route_drone(depot, route, available_drones)
+                    if not drone:
+                        continue
+                    
+                    available_drones.remove(drone)
+                    if await self._assign_route_to_drone(
+                        [tasks_by_id[stop.stop_id] for stop in route.stops], drone, route, depot
+                    ):
+                        handled.update(stop.stop_id for stop in route.stops)
+                    if not available_drones:
+                        break
+                
+                logger.info(
+                    f"取货点 {depot} 的 {len(stops)} 个任务规划为 {len(solution['routes'])} 条回路，"
+                    f"总航程 {solution['total_distance']:.0f} 米，耗时 {solution['solve_ms']:.1f} ms"
+                )
+            
+            # 未分配的任务放回队列，等待下一轮
+            for item in queued:
+                if item.task_id not in handled:
+                    heapq.heappush(self.task_queue, item)
+    
+    async def _refresh_queue(self) -> List[PrioritizedTask]:
+        """
+        取出队列中全部到期的任务，一次查询刷新任务状态
+        
+        已结束的任务移出队列，缺少起点或终点的任务标记为失败，退避未到期的任务留在队列中。
+        
+        Returns:
+            可以参与分配的任务
+        """
+        now = time.monotonic()
+        queued: List[PrioritizedTask] = []
+        waiting: List[PrioritizedTask] = []
+        while self.task_queue:
+            item = heapq.heappop(self.task_queue)
+            (queued if item.not_before <= now else waiting).append(item)
+        for item in waiting:
+            heapq.heappush(self.task_queue, item)
+        if not queued:
+            return []
+        
+        # 查询失败时任务放回队列
+        try:
+            tasks = await Task.find({"task_id": {"$in": [item.task_id for item in queued]}}).to_list()
+        except Exception:
+            for item in queued:
+                heapq.heappush(self.task_queue, item)
+            raise
+        tasks_by_id = {task.task_id: task for task in tasks}
+        
+        refreshed: List[PrioritizedTask] = []
+        for item in queued:
+            task = tasks_by_id.get(item.task_id)
+            if not task or task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
+                self.pending_tasks.pop(item.task_id, None)
+                continue
+            self.pending_tasks[item.task_id] = task
+            item.task = task
+            if not task.start_location or not task.end_location:
+                if not await self._fail_task(task, "任务缺少起点或终点"):
+                    heapq.heappush(self.task_queue, item)
+                continue
+            refreshed.append(item)
+        return refreshed
+    
+    async def _defer_unroutable(self, item: PrioritizedTask):
+        """当前无法规划回路的任务按次数加倍退避，超过最大尝试次数时标记为失败"""
+        item.attempts += 1
+        if item.attempts >= settings.LOGISTICS_MAX_ROUTING_ATTEMPTS and await self._fail_task(
+            item.task, f"{item.attempts} 次尝试均超出可用无人机的载重或续航"
+        ):
+            return
+        delay = settings.LOGISTICS_ROUTING_BACKOFF * 2 ** (item.attempts - 1)
+        item.not_before = time.monotonic() + delay
+        heapq.heappush(self.task_queue, item)
+        logger.warning(f"任务 {item.task_id} 超出可用无人机的载重或续航，{delay:.0f} 秒后重试")
+    
+    async def _fail_task(self, task: Task, reason: str) -> bool:
+        """将无法分配的任务标记为失败并通知其他智能体，返回是否已写入数据库"""
+        logger.warning(f"任务 {task.task_id} 无法分配: {reason}")
+        try:
+            await Task.find_one({"task_id": task.task_id}).update({"$set": {
+                "status": TaskStatus.FAILED,
+                "task_data.failure_reason": reason
+            }})
+        except Exception as e:
+            logger.error(f"标记任务 {task.task_id} 失败时出错: {str(e)}")
+            return False
+        self.pending_tasks.pop(task.task_id, None)
+        task.status = TaskStatus.FAILED
+        task.task_data = task.task_data or {}
+        task.task_data["failure_reason"] = reason
+        await self.broadcast_message({
+            "type": "task_failed",
+            "task_id": task.task_id,
+            "reason": reason,
+            "source_agent_id": self.agent_id
+        })
+        return True
+    
+    def _task_payload(self, task: Task) -> float:
+        """任务载重（千克）"""
+        return task.task_data.get("payload_weight", 0) if task.task_data else 0
+    
+    def _drone_range(self, drone: Drone) -> float:
+        """按当前电量扣除安全余量后的可飞行距离（米）"""
+        max_range = drone.max_flight_time * 60 * settings.DRONE_MAX_SPEED
+        return (drone.battery_level / 100) * max_range / (1 + settings.LOGISTICS_BATTERY_RESERVE)
+    
+    def _select_route_drone(self, depot: Tuple[float, float], route: DeliveryRoute,
+                            available_drones: List[Drone]) -> Optional[Drone]:
+        """为多点回路选择无人机：满足载重和续航（含飞往取货点的航程），离取货点最近者优先"""
+        best_drone = None
+        best_distance = float('inf')
+        
+        for drone in available_drones:
+            if route.load > 0 and route.load > drone.payload_capacity:
+                continue
+            
+            drone_point = drone.current_location.coordinates
+            approach = self._calculate_distance(drone_point[0], drone_point[1], depot[0], depot[1])
+            if approach + route.distance > self._drone_range(drone):
+                continue
+            
+            if approach < best_distance:
+                best_distance = approach
+                best_drone = drone
+        
+        return best_drone
+    
+    async def _assign_route_to_drone(self, tasks: List[Task], drone: Drone, route: DeliveryRoute,
+                                     depot: Tuple[float, float]) -> bool:
+        """把一条多点配送回路分配给无人机，返回是否分配成功"""
+        try:
+            drone_id = drone.drone_id
+            route_id = str(uuid.uuid4())
+            task_ids = [task.task_id for task in tasks]
+            now = datetime.utcnow()
+            
+            # 先在数据库中预留无人机，已被其他进程预留时放弃
+            if not await fleet_state.reserve(drone_id, task_ids):
+                logger.warning(f"无人机 {drone_id} 已被预留，回路 {route_id} 留待下一轮分配")
+                return False
+            
+            logger.info(f"将回路 {route_id}（{len(tasks)} 个投递点）分配给无人机 {drone_id}")
+            
+            # 各投递点的预计到达时间：起飞准备 + 飞往取货点 + 逐段飞行 + 装卸
+            drone_point = drone.current_location.coordinates
+            elapsed = 10 + self._calculate_distance(
+                drone_point[0], drone_point[1], depot[0], depot[1]
+            ) / settings.DRONE_MAX_SPEED / 60
+            
+            for task, leg_distance in zip(tasks, route.legs):
+                task.status = TaskStatus.ASSIGNED
+                task.assigned_drones = [drone_id]
+                await task.save()
+                
+                elapsed += leg_distance / settings.DRONE_MAX_SPEED / 60 + settings.LOGISTICS_STOP_SERVICE_TIME
+                self.scheduled_tasks[task.task_id] = {
+                    "task": task,
+                    "drone_id": drone_id,
+                    "route_id": route_id,
+                    "leg_distance": leg_distance,
+                    "assigned_time": now,
+                    "estimated_completion_time": now + timedelta(minutes=elapsed),
+                    "status": "assigned"
+                }
+                self.pending_tasks.pop(task.task_id, None)
+            
+            drone_info = self.drone_status.get(drone_id)
+            if drone_info:
+                drone_info["current_task"] = task_ids[0]
+                drone_info["current_route"] = route_id
+                drone_info["estimated_available_time"] = now + timedelta(
+                    minutes=elapsed + route.legs[-1] / settings.DRONE_MAX_SPEED / 60
+                )
+                drone_info["total_distance"] += route.distance
+                drone_info["total_tasks"] += len(tasks)
+                drone_info["status_history"].append({
+                    "timestamp": now.isoformat(),
+                    "from_status": "idle",
+                    "to_status": "flying",
+                    "route_id": route_id,
+                    "task_ids": task_ids
+                })
+            
+            # 通知任务已分配
+            for task_id in task_ids:
+                await self.broadcast_message({
+                    "type": "task_assigned",
+                    "task_id": task_id,
+                    "drone_id": drone_id,
+                    "route_id": route_id,
+                    "source_agent_id": self.agent_id
+                })
+            
+            # 启动回路监控
+            self.spawn(self._monitor_route(route_id, task_ids, drone_id), name=f"route:{route_id}")
+            return True
+        
+        except Exception as e:
+            logger.error(f"分配多点配送回路给无人机失败: {str(e)}")
+            await self._release_drone(drone.drone_id, [task.task_id for task in tasks])
+            return False
+    
+    async def _monitor_route(self, route_id: str, task_ids: List[str], drone_id: str):
+        """按顺序模拟执行多点配送回路，最后一个投递点完成后释放无人机"""
+        try:
+            # 模拟飞行到取货点并装载货物
+            await asyncio.sleep(random.uniform(3, 7))
+            await asyncio.sleep(2)
+            
+            for index, task_id in enumerate(task_ids):
+                task_info = self.scheduled_tasks.get(task_id)
+                if not task_info:
+                    continue
+                
+                drone_info = self.drone_status.get(drone_id)
+                if drone_info:
+                    drone_info["current_task"] = task_id
+                task_info["status"] = "in_progress"
+                
+                # 模拟飞行到投递点并卸货
+                leg_time = task_info["leg_distance"] / settings.DRONE_MAX_SPEED / 60
+                await asyncio.sleep(max(3, min(15, leg_time)))
+                await asyncio.sleep(1)
+                
+                await self._complete_task(task_id, release_drone=index == len(task_ids) - 1)
+            
+            logger.info(f"多点配送回路 {route_id} 已完成")
+        
+        except Exception as e:
+            logger.error(f"监控多点配送回路 {route_id} 失败: {str(e)}")
+    
     def _get_available_drones(self) -> List[Drone]:
         """获取当前可用的无人机"""
         available_drones = []
         
-        for drone_id, drone_info in self.drone_status.items():
-            drone = drone_info["drone"]
-            current_task = drone_info["current_task"]
-            
-            # 只选择空闲且电池电量足够的无人机
-            if drone.status == "idle" and not current_task and drone.battery_level >= 30:
+        # 只选择空闲且电池电量足够的无人机，由机队状态的索引直接给出
+        for drone in fleet_state.with_battery(30, status=DroneStatus.IDLE):
+            drone_info = self.drone_status.get(drone.drone_id)
+            if drone_info and not drone_info["current_task"]:
                 available_drones.append(drone)
         
         return available_drones
@@ -304,10 +646,22 @@ class LogisticsAgent(BaseAgent):
         start_point = task.start_location.position.coordinates  # [lon, lat]
         end_point = task.end_location.position.coordinates  # [lon, lat]
         
+        # 只对离起点最近的若干架满足载重要求的无人机评分
+        task_payload = self._task_payload(task)
+        candidates = [
+            drone for _, drone in fleet_state.nearest_available(
+                start_point[0], start_point[1],
+                k=settings.LOGISTICS_CANDIDATE_DRONES,
+                min_battery=30,
+                min_payload=task_payload,
+                among={drone.drone_id for drone in available_drones}
+            )
+        ]
+        
         best_drone = None
         best_score = float('-inf')
         
-        for drone in available_drones:
+        for drone in candidates:
             # 如果无人机没有当前位置，跳过
             if not drone.current_location:
                 continue
@@ -355,12 +709,17 @@ class LogisticsAgent(BaseAgent):
         
         return best_drone
     
-    async def _assign_task_to_drone(self, task: Task, drone: Drone):
-        """分配任务给无人机"""
+    async def _assign_task_to_drone(self, task: Task, drone: Drone) -> bool:
+        """分配任务给无人机，返回是否分配成功"""
         try:
             task_id = task.task_id
             drone_id = drone.drone_id
             
+            # 先在数据库中预留无人机，已被其他进程预留时放弃
+            if not await fleet_state.reserve(drone_id, [task_id]):
+                logger.warning(f"无人机 {drone_id} 已被预留，任务 {task_id} 留待重新分配")
+                return False
+            
             logger.info(f"将任务 {task_id} 分配给无人机 {drone_id}")
             
             # 更新任务状态
@@ -368,11 +727,6 @@ class LogisticsAgent(BaseAgent):
             task.assigned_drones = [drone_id]
             await task.save()
             
-            # 更新无人机状态
-            drone.status = "flying"
-            drone.assigned_tasks.append(task_id)
-            await drone.save()
-            
             # 更新内部状态
             drone_info = self.drone_status.get(drone_id)
             if drone_info:
@@ -416,12 +770,22 @@ class LogisticsAgent(BaseAgent):
             })
             
             # 启动任务监控
-            asyncio.create_task(self._monitor_task(task_id, drone_id))
+            self.spawn(self._monitor_task(task_id, drone_id), name=f"task:{task_id}")
             
             logger.info(f"成功将任务 {task_id} 分配给无人机 {drone_id}，预计完成时间: {completion_time}")
+            return True
         
         except Exception as e:
             logger.error(f"分配任务给无人机失败: {str(e)}")
+            await self._release_drone(drone.drone_id, [task.task_id])
+            return False
+    
+    async def _release_drone(self, drone_id: str, task_ids: List[str]):
+        """分配中途出错时撤销无人机预留"""
+        try:
+            await fleet_state.release(drone_id, task_ids)
+        except Exception as e:
+            logger.error(f"撤销无人机 {drone_id} 的预留失败: {str(e)}")
     
     def _estimate_task_completion_time(self, task: Task, drone: Drone) -> datetime:
         """估算任务完成时间"""
@@ -493,8 +857,14 @@ class LogisticsAgent(BaseAgent):
         except Exception as e:
             logger.error(f"监控任务 {task_id} 失败: {str(e)}")
     
-    async def _complete_task(self, task_id: str):
-        """完成任务"""
+    async def _complete_task(self, task_id: str, release_drone: bool = True):
+        """
+        完成任务
+
+        Args:
+            task_id: 任务ID
+            release_drone: 是否释放无人机；多点配送回路的中间投递点为False
+        """
         try:
             # 获取任务信息
             task_info = self.scheduled_tasks.get(task_id)
@@ -512,11 +882,16 @@ class LogisticsAgent(BaseAgent):
             # 更新无人机状态
             drone = await Drone.find_one({"drone_id": drone_id})
             if drone:
-                drone.status = "idle"
+                if release_drone:
+                    drone.status = "idle"
                 drone.assigned_tasks = [t for t in drone.assigned_tasks if t != task_id]
                 
                 # 减少电池电量（根据任务距离）
-                if task.planned_path:
+                if task_info.get("leg_distance") is not None:
+                    # 多点配送按本段航程计算，每公里消耗2%电量
+                    battery_consumption = min(30, int(task_info["leg_distance"] / 1000 * 2))
+                    drone.battery_level = max(0, drone.battery_level - battery_consumption)
+                elif task.planned_path:
                     distance_km = task.planned_path.distance / 1000
                     battery_consumption = min(30, max(5, int(distance_km * 2)))  # 每公里消耗2%电量，至少5%，最多30%
                     drone.battery_level = max(0, drone.battery_level - battery_consumption)
@@ -528,8 +903,9 @@ class LogisticsAgent(BaseAgent):
             
             # 更新内部状态
             drone_info = self.drone_status.get(drone_id)
-            if drone_info:
+            if drone_info and release_drone:
                 drone_info["current_task"] = None
+                drone_info["current_route"] = None
                 drone_info["estimated_available_time"] = datetime.utcnow()
                 
                 # 记录状态变化
@@ -561,6 +937,10 @@ class LogisticsAgent(BaseAgent):
             self.delivery_statistics["deliveries_by_drone"][drone_id] = \
                 self.delivery_statistics["deliveries_by_drone"].get(drone_id, 0) + 1
             
+            # 无人机释放后立即尝试分配排队的任务
+            if release_drone:
+                self.wake("drone_released")
+            
             # 通知任务完成
             await self.broadcast_message({
                 "type": "task_completed",
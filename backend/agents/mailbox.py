@@ -0,0 +1,213 @@
+"""
+智能体邮箱
+
+替代无界的 asyncio.Queue，接口与之兼容（put/put_nowait/get/get_nowait/task_done/join/qsize/empty/full）。
+消息按类型分入三个通道，get 总是先取高优先级通道：
+
+- emergency：应急任务的分配/取消（task_type 为 emergency 或优先级不低于 AGENT_MAILBOX_EMERGENCY_PRIORITY）
+- assignment：任务分配、更新、完成等任务流转消息
+- info：事件检测广播、任务已更新通知、能力更新、查询响应等通知类消息
+
+emergency 和 assignment 通道满时 put 等待（put_nowait 抛出 QueueFull），不丢消息；
+info 通道有界，同一对象的重复通知合并为最新一条，满时优先丢弃最旧的非高级别通知，
+因此检测风暴只会挤占 info 通道，不会延迟应急任务分配。
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+from config.settings import settings
+
+EMERGENCY = "emergency"
+ASSIGNMENT = "assignment"
+INFO = "info"
+LANES = (EMERGENCY, ASSIGNMENT, INFO)
+
+# 任务流转类消息，不合并、不丢弃
+ASSIGNMENT_TYPES = {
+    "task_assigned", "task_cancelled", "task_update", "task_completed",
+    "task_failed", "new_task", "task_dispatched"
+}
+# 只关心最新状态的通知，走 info 通道，同一对象的旧消息被新消息替换：
+# task_updated 只是提示接收方重新读取任务（例如已规划路径），能力更新只有最新一次有效
+COALESCE_TYPES = {"event_detected", "task_updated", "agent_capability_update"}
+# 可以合并/丢弃的消息中，高级别事件最后才被丢弃
+HIGH_LEVELS = {"high", "critical"}
+
+
+def classify(message: Dict[str, Any]) -> str:
+    """确定消息所属通道，消息可以用 lane 字段显式指定"""
+    lane = message.get("lane")
+    if lane in LANES:
+        return lane
+    message_type = message.get("type")
+    if message_type not in ASSIGNMENT_TYPES:
+        return INFO
+    task_type = message.get("task_type")
+    priority = message.get("priority")
+    if getattr(task_type, "value", task_type) == "emergency" or (
+        isinstance(priority, (int, float)) and priority >= settings.AGENT_MAILBOX_EMERGENCY_PRIORITY
+    ):
+        return EMERGENCY
+    return ASSIGNMENT
+
+
+def _coalesce_key(message: Dict[str, Any]) -> Optional[Tuple]:
+    message_type = message.get("type")
+    if message_type not in COALESCE_TYPES:
+        return None
+    data = message.get("data") or {}
+    subject = message.get("task_id") or message.get("event_id") or message.get("agent_id") or data.get("agent_id")
+    if subject is None:
+        return None
+    return (message_type, subject)
+
+
+def _is_high(message: Dict[str, Any]) -> bool:
+    level = message.get("event_level")
+    return getattr(level, "value", level) in HIGH_LEVELS
+
+
+class Mailbox:
+    """带优先级通道和容量上限的智能体邮箱"""
+
+    def __init__(self, capacity: Optional[int] = None, info_capacity: Optional[int] = None):
+        self.capacity = capacity or settings.AGENT_MAILBOX_CAPACITY
+        self.info_capacity = info_capacity or settings.AGENT_MAILBOX_INFO_CAPACITY
+        self._lanes: Dict[str, deque] = {lane: deque() for lane in LANES}
+        self._limits = {EMERGENCY: self.capacity, ASSIGNMENT: self.capacity, INFO: self.info_capacity}
+        self._coalesce_index: Dict[Tuple, list] = {}  # 合并键 -> info 通道中的消息条目
+        self._not_empty = asyncio.Event()
+        self._not_full = {lane: asyncio.Event() for lane in LANES}
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+        self.enqueued = {lane: 0 for lane in LANES}
+        self.max_depth = {lane: 0 for lane in LANES}
+        self.max_wait_ms = {lane: 0.0 for lane in LANES}
+        self.coalesced = 0
+        self.dropped: Dict[str, int] = {}
+
+    # ---------- asyncio.Queue 兼容接口 ----------
+
+    def qsize(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def full(self) -> bool:
+        return any(len(self._lanes[lane]) >= self._limits[lane] for lane in (EMERGENCY, ASSIGNMENT))
+
+    async def put(self, message: Dict[str, Any]):
+        lane = classify(message)
+        if lane != INFO:
+            while len(self._lanes[lane]) >= self._limits[lane]:
+                self._not_full[lane].clear()
+                await self._not_full[lane].wait()
+        self._put(lane, message)
+
+    def put_nowait(self, message: Dict[str, Any]):
+        lane = classify(message)
+        if lane != INFO and len(self._lanes[lane]) >= self._limits[lane]:
+            raise asyncio.QueueFull
+        self._put(lane, message)
+
+    async def get(self) -> Dict[str, Any]:
+        while self.empty():
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def get_nowait(self) -> Dict[str, Any]:
+        for lane in LANES:
+            queue = self._lanes[lane]
+            if queue:
+                entry = queue.popleft()
+                if lane == INFO:
+                    key = _coalesce_key(entry[1])
+                    if key is not None and self._coalesce_index.get(key) is entry:
+                        del self._coalesce_index[key]
+                wait_ms = (time.monotonic() - entry[0]) * 1000
+                self.max_wait_ms[lane] = max(self.max_wait_ms[lane], wait_ms)
+                self._not_full[lane].set()
+                return entry[1]
+        raise asyncio.QueueEmpty
+
+    def task_done(self):
+        if self._unfinished <= 0:
+            raise ValueError("task_done() called too many times")
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self):
+        if self._unfinished > 0:
+            await self._finished.wait()
+
+    # ---------- 入队与降级 ----------
+
+    def _put(self, lane: str, message: Dict[str, Any]):
+        if lane == INFO and not self._put_info(message):
+            return
+        if lane != INFO:
+            self._lanes[lane].append([time.monotonic(), message])
+        self.enqueued[lane] += 1
+        self.max_depth[lane] = max(self.max_depth[lane], len(self._lanes[lane]))
+        self._unfinished += 1
+        self._finished.clear()
+        self._not_empty.set()
+
+    def _put_info(self, message: Dict[str, Any]) -> bool:
+        """
+        放入 info 通道
+
+        Returns:
+            是否新增了一条消息（合并或丢弃时为 False）
+        """
+        queue = self._lanes[INFO]
+        key = _coalesce_key(message)
+        if key is not None:
+            entry = self._coalesce_index.get(key)
+            if entry is not None:
+                # 保留原位置和入队时间，只更新为最新内容
+                entry[1] = message
+                self.coalesced += 1
+                return False
+
+        if len(queue) >= self.info_capacity:
+            victim = next((entry for entry in queue if not _is_high(entry[1])), None)
+            if victim is None and not _is_high(message):
+                self._drop(message)
+                return False
+            victim = victim or queue[0]
+            queue.remove(victim)
+            victim_key = _coalesce_key(victim[1])
+            if victim_key is not None and self._coalesce_index.get(victim_key) is victim:
+                del self._coalesce_index[victim_key]
+            self._drop(victim[1])
+            # 被挤掉的消息已计入未完成数，这里抵消
+            self.task_done()
+
+        entry = [time.monotonic(), message]
+        queue.append(entry)
+        if key is not None:
+            self._coalesce_index[key] = entry
+        return True
+
+    def _drop(self, message: Dict[str, Any]):
+        message_type = str(message.get("type"))
+        self.dropped[message_type] = self.dropped.get(message_type, 0) + 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "depth": {lane: len(queue) for lane, queue in self._lanes.items()},
+            "max_depth": dict(self.max_depth),
+            "enqueued": dict(self.enqueued),
+            "max_wait_ms": dict(self.max_wait_ms),
+            "coalesced": self.coalesced,
+            "dropped": dict(self.dropped),
+            "dropped_total": sum(self.dropped.values())
+        }
@@ -13,15 +13,20 @@ import base64
 from pathlib import Path
 from collections import defaultdict
 import queue
+from beanie import UpdateResponse
 
 from config.logging_config import get_logger
 from database.models import (
-    Event, VideoSource, DetectionConfig, BoundingBox, 
+    Event, Task, VideoSource, DetectionConfig, BoundingBox, 
     EventType, EventLevel, Location, GeoPoint
 )
 from config.settings import settings
+from core.metrics import event_detections_total
 from .base import BaseAgent
-from .coordinator import register_agent, get_coordinator
+from .coordinator import register_agent, get_coordinator, EVENT_LEVEL_PRIORITIES
+from .emergency_dispatch import emergency_dispatcher
+from .event_clustering import EventClusterIndex, EventCluster, level_rank
+from .task_tracker import TaskStatusView, FINISHED_STATUSES
 
 logger = get_logger("agents.monitor")
 
@@ -33,6 +38,8 @@ class MonitorAgent(BaseAgent):
     def __init__(self, agent_id: Optional[str] = None, name: str = "监控智能体"):
         super().__init__(agent_id, name)
         self.agent_type = "MonitorAgent"
+        # 视频源和检测结果需要持续轮询，保持固定周期
+        self.sweep_interval = settings.AGENT_COMMUNICATION_INTERVAL
         self.yolo_model = None
         self.detection_configs: Dict[str, DetectionConfig] = {}
         self.video_sources: Dict[str, Dict[str, Any]] = {}
@@ -41,6 +48,7 @@ class MonitorAgent(BaseAgent):
         self.result_queues: Dict[str, asyncio.Queue] = {}
         self.detection_stats: Dict[str, Dict[str, Any]] = {}
         self.event_cooldowns: Dict[str, Dict[str, float]] = {}  # 事件冷却时间
+        self.event_clusters = EventClusterIndex()  # 未结束事件的时空索引，重复检测合并到已有事件
         self.saved_images_dir = Path("./data/detected_images")
         self.saved_images_dir.mkdir(parents=True, exist_ok=True)
         self.capabilities = {
@@ -405,7 +413,8 @@ class MonitorAgent(BaseAgent):
                     "location": source.location,
                     "source_id": source_id,
                     "boxes": person_boxes,
-                    "image_path": detection.get("image_path")
+                    "image_path": detection.get("image_path"),
+                    "detected_at": timestamp
                 })
         
         # 2. 异常物体检测
@@ -424,7 +433,8 @@ class MonitorAgent(BaseAgent):
                     "location": source.location,
                     "source_id": source_id,
                     "boxes": [box],
-                    "image_path": detection.get("image_path")
+                    "image_path": detection.get("image_path"),
+                    "detected_at": timestamp
                 })
         
         # 3. 车辆异常停放检测
@@ -445,7 +455,8 @@ class MonitorAgent(BaseAgent):
                         "location": source.location,
                         "source_id": source_id,
                         "boxes": [box],
-                        "image_path": detection.get("image_path")
+                        "image_path": detection.get("image_path"),
+                        "detected_at": timestamp
                     })
         
         return events
@@ -469,8 +480,15 @@ class MonitorAgent(BaseAgent):
         return True
     
     async def _create_event(self, event_data: Dict[str, Any]):
-        """创建事件并通知协调者"""
+        """创建事件并通知协调者（附近同类型的未结束事件存在时合并到该事件）"""
         try:
+            detected_at = event_data.get("detected_at") or datetime.utcnow()
+            cluster = self.event_clusters.match(
+                event_data["type"], event_data["location"], event_data["source_id"], detected_at
+            )
+            if cluster is not None and await self._merge_into_event(cluster, event_data, detected_at):
+                return
+            
             # 创建边界框对象
             bounding_boxes = []
             for box in event_data.get("boxes", []):
@@ -493,10 +511,14 @@ class MonitorAgent(BaseAgent):
                 location=event_data["location"],
                 detected_by=self.agent_id,
                 detection_data={
-                    "source_id": event_data["source_id"]
+                    "source_id": event_data["source_id"],
+                    "sources": [event_data["source_id"]],
+                    "merged_detections": 0,
+                    "last_seen": detected_at
                 },
                 video_source=event_data["source_id"],
-                bounding_boxes=bounding_boxes
+                bounding_boxes=bounding_boxes,
+                detected_at=detected_at
             )
             
             # 如果有图像证据，添加到事件中
@@ -505,15 +527,18 @@ class MonitorAgent(BaseAgent):
             
             # 保存事件
             await event.insert()
+            self.event_clusters.add(event)
+            event_detections_total.inc(event.type.value, "created")
             self.logger.info(f"创建了新事件: {event.event_id} - {event.title}")
             
-            # 通知协调者
-            coordinator = await get_coordinator()
-            await coordinator.message_queue.put({
-                "type": "new_event",
-                "event_id": event.event_id,
-                "source_agent_id": self.agent_id
-            })
+            # 高级别事件直接派遣，其他事件（或派遣失败时）交给协调者
+            if not (emergency_dispatcher.applies(event) and await emergency_dispatcher.dispatch(event)):
+                coordinator = await get_coordinator()
+                await coordinator.message_queue.put({
+                    "type": "new_event",
+                    "event_id": event.event_id,
+                    "source_agent_id": self.agent_id
+                })
             
             # 广播事件
             await self.broadcast_message({
@@ -527,6 +552,113 @@ class MonitorAgent(BaseAgent):
         except Exception as e:
             self.logger.error(f"创建事件出错: {str(e)}")
     
+    async def _merge_into_event(self, cluster: EventCluster, event_data: Dict[str, Any],
+                                detected_at: datetime) -> bool:
+        """
+        将检测合并到已有事件：追加证据、记录来源，级别只升不降
+        
+        Returns:
+            是否已合并；事件已解决或已删除时为 False，调用方应创建新事件
+        """
+        event = cluster.event
+        max_evidence = settings.EVENT_CLUSTER_MAX_EVIDENCE
+        boxes = [BoundingBox(**box) for box in event_data.get("boxes", [])]
+        image_path = event_data.get("image_path")
+        escalated = level_rank(event_data["level"]) > level_rank(event.level)
+        
+        update: Dict[str, Any] = {
+            "$set": {"detection_data.last_seen": detected_at},
+            "$inc": {"detection_data.merged_detections": 1},
+            "$addToSet": {"detection_data.sources": event_data["source_id"]}
+        }
+        push: Dict[str, Any] = {}
+        if boxes:
+            push["bounding_boxes"] = {"$each": [box.dict() for box in boxes], "$slice": -max_evidence}
+        if image_path:
+            push["image_evidence"] = {"$each": [image_path], "$slice": -max_evidence}
+        if push:
+            update["$push"] = push
+        if escalated:
+            update["$set"]["level"] = event_data["level"]
+        
+        # 只合并到未解决的事件，一次写入同时确认事件状态并取回最新的事件（关联任务可能已由协调者更新）
+        updated = await Event.find_one(
+            {"event_id": event.event_id, "status": {"$ne": "resolved"}}
+        ).update(update, response_type=UpdateResponse.NEW_DOCUMENT)
+        if updated is None:
+            self.event_clusters.remove(event.event_id)
+            return False
+        
+        cluster.event = updated
+        self.event_clusters.touch(cluster, detected_at, event_data["source_id"])
+        event_detections_total.inc(cluster.event_type, "merged")
+        self.logger.debug(
+            f"检测合并到事件 {updated.event_id}（第 {cluster.detections} 次检测，来源 {len(cluster.sources)} 个）"
+        )
+        
+        if escalated:
+            self.logger.info(f"事件 {updated.event_id} 级别升为 {updated.level}")
+            await self._escalate_event(updated, detected_at)
+        return True
+    
+    async def _escalate_event(self, event: Event, detected_at: datetime):
+        """
+        事件级别升高后的处理
+        
+        - 事件已有未结束的任务：通知协调者提高这些任务的优先级，不再创建任务
+        - 没有未结束的任务且达到快速派遣级别：以条件更新认领事件后快速派遣
+        - 其他情况协调者创建任务时读取的已是升级后的级别，不需要处理
+        """
+        active_tasks = []
+        pending = False
+        if event.related_tasks:
+            views = await Task.find(
+                {"task_id": {"$in": event.related_tasks}},
+                projection_model=TaskStatusView
+            ).to_list()
+            active_tasks = [view for view in views if view.status not in FINISHED_STATUSES]
+            # 协调者认领事件时先记录任务ID再写入任务，尚未写入的任务视为未结束
+            pending = len(views) < len(set(event.related_tasks))
+        
+        if active_tasks or pending:
+            priority = EVENT_LEVEL_PRIORITIES.get(event.level, 10)
+            coordinator = await get_coordinator()
+            for view in active_tasks:
+                await coordinator.message_queue.put({
+                    "type": "task_update",
+                    "data": {"task_id": view.task_id, "update_data": {"priority": priority}},
+                    "source_agent_id": self.agent_id
+                })
+            self.logger.info(f"事件 {event.event_id} 升级，{len(active_tasks)} 个任务的优先级提高到 {priority}")
+            return
+        
+        if not emergency_dispatcher.applies(event):
+            return
+        if event.status == "new":
+            # 协调者尚未处理的事件以条件更新认领，避免与协调者同时为事件创建任务
+            claimed = await Event.find_one(
+                {"event_id": event.event_id, "status": "new"}
+            ).update({"$set": {"status": "processing"}})
+            if not claimed.matched_count:
+                return
+            if await emergency_dispatcher.dispatch(event, detected_at) is None:
+                # 派遣失败，交还给协调者创建任务
+                await Event.find_one({"event_id": event.event_id}).update({"$set": {"status": "new"}})
+            return
+        
+        # 处理中的事件任务均已结束：认领条件是关联任务未变且没有其他派遣已认领，
+        # 期间有任务加入或并发的升级先认领时放弃派遣
+        detection_data = event.detection_data or {}
+        claimed = await Event.find_one({
+            "event_id": event.event_id,
+            "status": "processing",
+            "related_tasks": event.related_tasks,
+            "detection_data.dispatch_claim": detection_data.get("dispatch_claim")
+        }).update({"$set": {"detection_data.dispatch_claim": str(uuid.uuid4())}})
+        if not claimed.matched_count:
+            return
+        await emergency_dispatcher.dispatch(event, detected_at)
+    
     async def _update_statistics(self):
         """更新智能体统计信息"""
         total_frames = 0
@@ -560,6 +692,7 @@ class MonitorAgent(BaseAgent):
                 "success": True,
                 "active_sources": sum(1 for info in self.video_sources.values() if info["active"]),
                 "total_sources": len(self.video_sources),
+                "clustering": self.event_clusters.get_metrics(),
                 "metrics": self.metrics
             }
         
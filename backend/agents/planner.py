@@ -1,12 +1,9 @@
-from typing import Dict, List, Any, Optional, Union, Tuple, Set
+from typing import Dict, List, Any, Optional, Union, Set
 import asyncio
-import uuid
 import time
-from datetime import datetime
 import json
-import numpy as np
 import networkx as nx
-from shapely.geometry import Point, Polygon, LineString
+from shapely.geometry import Point, LineString
 import osmnx as ox
 import gymnasium as gym
 from stable_baselines3 import PPO
@@ -14,17 +11,19 @@ from stable_baselines3.common.vec_env import DummyVecEnv
 import torch
 import pickle
 from pathlib import Path
-import math
-import heapq
 
 from config.logging_config import get_logger
 from database.models import (
-    Task, FlightPath, GeoPoint, Location, NoFlyZone, Drone,
-    TaskStatus, TaskType
+    Task, FlightPath, GeoPoint, NoFlyZone, Drone,
+    TaskStatus
 )
 from config.settings import settings
+from database.mongodb import get_active_no_fly_zones
+from services.path_planning import path_planning_service
+from services.planning_engine import path_distance
 from .base import BaseAgent
 from .coordinator import register_agent, get_coordinator
+from .task_tracker import task_tracker, is_finished
 
 logger = get_logger("agents.planner")
 
@@ -48,11 +47,15 @@ class PathPlanningAgent(BaseAgent):
         self.active_tasks: Dict[str, Task] = {}
         self.no_fly_zones: List[NoFlyZone] = []
         self.city_graph = None
+        # 与 PathPlanningService 共用同一个规划引擎（禁飞区索引、路网、缓存、指标）
+        self.engine = path_planning_service.engine
         self.rl_model = None
         self.cache_dir = Path("./data/path_cache")
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.path_cache: Dict[str, Any] = {}
         self.planning_lock = asyncio.Lock()
+        self._planning: Set[str] = set()  # 已开始规划的任务，避免快速派遣和周期巡检重复规划
+        self._last_zone_refresh = time.monotonic()
+        self._last_cache_save = time.monotonic()
         self.capabilities = {
             "path_planning": 0.95,
             "obstacle_avoidance": 0.9,
@@ -85,18 +88,11 @@ class PathPlanningAgent(BaseAgent):
     async def _load_no_fly_zones(self):
         """从数据库加载禁飞区"""
         try:
-            # 加载永久禁飞区
-            permanent_zones = await NoFlyZone.find({"permanent": True}).to_list()
-            self.no_fly_zones.extend(permanent_zones)
-            
-            # 加载当前有效的临时禁飞区
-            now = datetime.utcnow()
-            temp_zones = await NoFlyZone.find({
-                "permanent": False,
-                "start_time": {"$lte": now},
-                "end_time": {"$gte": now}
-            }).to_list()
-            self.no_fly_zones.extend(temp_zones)
+            # 加载永久禁飞区和当前有效的临时禁飞区
+            self.no_fly_zones = await get_active_no_fly_zones()
+            
+            # 更新规划引擎的禁飞区索引（内容未变化时不会清空缓存）
+            self.engine.set_no_fly_zones(self.no_fly_zones)
             
             self.logger.info(f"加载了 {len(self.no_fly_zones)} 个禁飞区")
         except Exception as e:
@@ -136,9 +132,12 @@ class PathPlanningAgent(BaseAgent):
                     pickle.dump(self.city_graph, f)
             
             self.logger.info(f"城市图初始化成功，节点数: {len(self.city_graph.nodes)}, 边数: {len(self.city_graph.edges)}")
+            
+            # 构建规划引擎的路网数组
+            self.engine.set_graph(self.city_graph)
         except Exception as e:
             self.logger.error(f"初始化城市图失败: {str(e)}")
-            # 创建一个简单的后备图
+            # 创建一个简单的后备图（没有经纬度属性，引擎将使用网格规划）
             self.city_graph = nx.grid_2d_graph(100, 100)
             self.logger.warning("使用简单网格图作为后备")
     
@@ -168,21 +167,21 @@ class PathPlanningAgent(BaseAgent):
             
             if cache_file.exists():
                 with open(cache_file, "r") as f:
-                    self.path_cache = json.load(f)
-                self.logger.info(f"加载了 {len(self.path_cache)} 条路径缓存")
+                    loaded = self.engine.load_cache(json.load(f))
+                self.logger.info(f"加载了 {loaded} 条路径缓存")
         except Exception as e:
             self.logger.error(f"加载路径缓存失败: {str(e)}")
-            self.path_cache = {}
     
     async def _save_path_cache(self):
         """保存路径缓存"""
         try:
             cache_file = self.cache_dir / "path_cache.json"
             
+            data = self.engine.export_cache()
             with open(cache_file, "w") as f:
-                json.dump(self.path_cache, f)
+                json.dump(data, f)
             
-            self.logger.info(f"保存了 {len(self.path_cache)} 条路径缓存")
+            self.logger.info(f"保存了 {len(data['entries'])} 条路径缓存")
         except Exception as e:
             self.logger.error(f"保存路径缓存失败: {str(e)}")
     
@@ -206,31 +205,45 @@ class PathPlanningAgent(BaseAgent):
         # 处理活动任务
         await self._process_active_tasks()
         
-        # 更新禁飞区（定期检查新的禁飞区）
-        if time.time() % 60 < 1:  # 大约每分钟检查一次
+        # 周期由唤醒驱动、间隔不固定，按上次执行时间判断
+        now = time.monotonic()
+        
+        # 更新禁飞区（每分钟检查一次新的禁飞区）
+        if now - self._last_zone_refresh >= 60:
+            self._last_zone_refresh = now
             await self._load_no_fly_zones()
         
         # 每小时保存一次路径缓存
-        if time.time() % 3600 < 1:  # 大约每小时保存一次
+        if now - self._last_cache_save >= 3600:
+            self._last_cache_save = now
             await self._save_path_cache()
     
     async def _process_active_tasks(self):
         """处理需要路径规划的活动任务"""
-        for task_id, task in list(self.active_tasks.items()):
-            # 检查任务是否已完成或取消
-            updated_task = await Task.find_one({"task_id": task_id})
-            if not updated_task or updated_task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
+        if not self.active_tasks:
+            return
+        # 一次批量查询确认所有任务的状态，而不是逐个重新加载
+        statuses = await task_tracker.refresh(self.active_tasks)
+        for task_id, status in statuses.items():
+            task = self.active_tasks.get(task_id)
+            if task is None:
+                continue
+            # 检查任务是否已删除、完成或取消
+            if status is None or is_finished(status):
                 self.active_tasks.pop(task_id, None)
+                self._planning.discard(task_id)
+                task_tracker.forget([task_id])
                 continue
             
             # 更新任务
-            self.active_tasks[task_id] = updated_task
+            task.status = TaskStatus(status)
             
             # 如果任务需要路径规划且尚未规划
-            if not updated_task.planned_path:
+            if not task.planned_path and task_id not in self._planning:
+                self._planning.add(task_id)
                 async with self.planning_lock:
                     # 规划路径
-                    await self._plan_path_for_task(updated_task)
+                    await self._plan_path_for_task(task)
     
     async def _plan_path_for_task(self, task: Task):
         """为任务规划路径"""
@@ -246,34 +259,23 @@ class PathPlanningAgent(BaseAgent):
             start_point = task.start_location.position.coordinates  # [lon, lat]
             end_point = task.end_location.position.coordinates  # [lon, lat]
             
-            # 检查是否有缓存的路径
-            cache_key = f"{start_point[0]:.5f},{start_point[1]:.5f}_{end_point[0]:.5f},{end_point[1]:.5f}"
+            # 根据设置选择算法（结果缓存由规划引擎统一维护）
+            algorithm = settings.PATH_PLANNING_ALGORITHM
             
-            if cache_key in self.path_cache:
-                self.logger.info(f"使用缓存的路径: {cache_key}")
-                planned_path = self._restore_path_from_cache(self.path_cache[cache_key])
+            if algorithm == PlanningAlgorithm.RRT:
+                planned_path = await self._plan_path_rrt(start_point, end_point, task)
+            elif algorithm == PlanningAlgorithm.RL and self.rl_model:
+                planned_path = await self._plan_path_rl(start_point, end_point, task)
             else:
-                # 根据设置选择算法
-                algorithm = settings.PATH_PLANNING_ALGORITHM
-                
-                if algorithm == PlanningAlgorithm.A_STAR:
-                    planned_path = await self._plan_path_astar(start_point, end_point, task)
-                elif algorithm == PlanningAlgorithm.RRT:
-                    planned_path = await self._plan_path_rrt(start_point, end_point, task)
-                elif algorithm == PlanningAlgorithm.RL and self.rl_model:
-                    planned_path = await self._plan_path_rl(start_point, end_point, task)
-                else:
-                    # 默认使用A*
-                    planned_path = await self._plan_path_astar(start_point, end_point, task)
-                
-                # 缓存路径
-                if planned_path:
-                    self.path_cache[cache_key] = self._cache_path(planned_path)
+                # 默认使用A*
+                planned_path = await self._plan_path_astar(start_point, end_point, task)
             
             if planned_path:
                 # 更新任务的规划路径
                 task.planned_path = planned_path
-                await task.save()
+                await Task.find_one({"task_id": task.task_id}).update(
+                    {"$set": {"planned_path": planned_path.dict()}}
+                )
                 
                 self.logger.info(f"成功为任务 {task.task_id} 规划路径，航点数: {len(planned_path.waypoints)}")
                 
@@ -290,7 +292,11 @@ class PathPlanningAgent(BaseAgent):
                 task.status = TaskStatus.FAILED
                 task.task_data = task.task_data or {}
                 task.task_data["failure_reason"] = "无法规划有效路径"
-                await task.save()
+                await Task.find_one({"task_id": task.task_id}).update({"$set": {
+                    "status": TaskStatus.FAILED,
+                    "task_data.failure_reason": "无法规划有效路径"
+                }})
+                task_tracker.note(task.task_id, TaskStatus.FAILED)
                 
                 # 通知任务失败
                 await self.broadcast_message({
@@ -300,218 +306,89 @@ class PathPlanningAgent(BaseAgent):
                     "source_agent_id": self.agent_id
                 })
         except Exception as e:
+            # 出错的任务在下一个周期重试
+            self._planning.discard(task.task_id)
             self.logger.error(f"规划路径出错: {str(e)}")
     
+    def accept_dispatched_task(self, task: Task, event: Any = None):
+        """接手快速派遣的任务（由 EmergencyDispatcher 在本进程内直接调用），立即在后台开始规划"""
+        self.active_tasks[task.task_id] = task
+        if task.planned_path or task.task_id in self._planning:
+            return
+        self._planning.add(task.task_id)
+        self.spawn(self._plan_dispatched(task), name=f"plan:{task.task_id}")
+    
+    async def _plan_dispatched(self, task: Task):
+        async with self.planning_lock:
+            await self._plan_path_for_task(task)
+    
+    async def handle_task_assigned(self, task_id: str):
+        """处理分配的任务：加入活动任务，由下一个周期规划路径"""
+        await super().handle_task_assigned(task_id)
+        
+        if task_id in self.active_tasks:
+            return
+        task = await Task.find_one({"task_id": task_id})
+        if not task:
+            self.logger.warning(f"找不到任务: {task_id}")
+            return
+        self.active_tasks[task_id] = task
+    
     async def _plan_path_astar(self, start_point: List[float], end_point: List[float], task: Task) -> Optional[FlightPath]:
-        """使用A*算法规划路径"""
+        """使用A*算法规划路径（加载了路网时为路网A*，否则为网格A*）"""
+        algorithm = "graph_astar" if self.engine.graph is not None else "astar"
+        return await self._plan_with_engine(start_point, end_point, algorithm, task.task_id)
+    
+    async def _plan_path_rrt(self, start_point: List[float], end_point: List[float], task: Task) -> Optional[FlightPath]:
+        """使用RRT(Rapidly-exploring Random Tree)算法规划路径"""
+        return await self._plan_with_engine(start_point, end_point, "rrt", task.task_id)
+    
+    async def _plan_with_engine(self, start_point: List[float], end_point: List[float],
+                                algorithm: str, label: str) -> Optional[FlightPath]:
+        """
+        通过规划引擎规划路径
+        
+        Args:
+            start_point: 起点坐标 [lon, lat]
+            end_point: 终点坐标 [lon, lat]
+            algorithm: 引擎中注册的算法名称
+            label: 日志中标识本次规划的名称（任务ID等）
+        """
         try:
-            # 将经纬度转换为图中的节点
-            start_node = await self._get_nearest_node(start_point)
-            end_node = await self._get_nearest_node(end_point)
+            self.logger.info(f"使用 {algorithm} 算法规划路径: {start_point} -> {end_point}")
+            
+            # 规划是CPU密集操作，在后台线程中运行
+            result = await asyncio.to_thread(
+                self.engine.plan,
+                start_point,
+                end_point,
+                algorithm,
+                settings.DRONE_MAX_ALTITUDE / 2  # 默认飞行高度
+            )
             
-            if not start_node or not end_node:
-                self.logger.warning(f"无法找到起点或终点对应的节点: {task.task_id}")
+            if not result.get("success"):
+                self.logger.warning(f"{algorithm} 算法未找到路径: {label}, {result.get('error', '')}")
                 return None
             
-            # 使用A*算法寻找路径
-            self.logger.info(f"使用A*算法规划路径: {start_node} -> {end_node}")
-            
-            # 定义启发式函数
-            def heuristic(n1, n2):
-                # 使用大圆距离（Haversine公式）作为启发式
-                n1_lat, n1_lon = self.city_graph.nodes[n1]['y'], self.city_graph.nodes[n1]['x']
-                n2_lat, n2_lon = self.city_graph.nodes[n2]['y'], self.city_graph.nodes[n2]['x']
-                return self._haversine(n1_lat, n1_lon, n2_lat, n2_lon)
-            
-            # 在后台线程中运行A*算法
-            try:
-                path_nodes = await asyncio.to_thread(
-                    nx.astar_path,
-                    self.city_graph,
-                    start_node,
-                    end_node,
-                    heuristic=heuristic,
-                    weight='length'
-                )
-                
-                # 检查禁飞区
-                valid_path = await self._validate_path_with_no_fly_zones(path_nodes)
-                if not valid_path:
-                    self.logger.warning(f"路径穿过禁飞区，尝试重新规划: {task.task_id}")
-                    # 实现绕过禁飞区的逻辑
-                    path_nodes = await self._plan_path_avoiding_no_fly_zones(start_node, end_node)
-                
-                # 将路径转换为航点列表
-                waypoints = await self._nodes_to_waypoints(path_nodes)
-                
-                # 计算路径信息
-                distance = sum(self._haversine(
-                    waypoints[i].coordinates[1], waypoints[i].coordinates[0],
-                    waypoints[i+1].coordinates[1], waypoints[i+1].coordinates[0]
-                ) for i in range(len(waypoints) - 1))
-                
-                estimated_duration = distance / settings.DRONE_MAX_SPEED / 1000 * 60  # 分钟
-                
-                return FlightPath(
-                    waypoints=waypoints,
-                    estimated_duration=estimated_duration,
-                    distance=distance,
-                    created_by=self.agent_id
-                )
-            
-            except nx.NetworkXNoPath:
-                self.logger.warning(f"A*算法未找到路径: {task.task_id}")
+            # 网格/RRT算法搜索失败时会回退为直线，直线穿过禁飞区则视为规划失败
+            waypoints = result["waypoints"]
+            if result.get("algorithm") == "direct" and self.engine.geofences.intersects_segment(waypoints[0], waypoints[-1]):
+                self.logger.warning(f"{algorithm} 算法未找到绕开禁飞区的路径: {label}")
                 return None
-        
-        except Exception as e:
-            self.logger.error(f"A*路径规划出错: {str(e)}")
-            return None
-    
-    async def _plan_path_rrt(self, start_point: List[float], end_point: List[float], task: Task) -> Optional[FlightPath]:
-        """使用RRT(Rapidly-exploring Random Tree)算法规划路径"""
-        try:
-            self.logger.info(f"使用RRT算法规划路径: {start_point} -> {end_point}")
-            
-            # 定义地图边界
-            bounds = self._get_map_bounds(start_point, end_point)
-            
-            # 创建RRT参数
-            max_iterations = 1000
-            goal_sample_rate = 0.1
-            step_size = 0.001  # 大约100米
-            
-            class RRTNode:
-                def __init__(self, x, y):
-                    self.x = x
-                    self.y = y
-                    self.parent = None
-            
-            # 初始化起点和终点节点
-            start_node = RRTNode(start_point[1], start_point[0])  # lat, lon
-            goal_node = RRTNode(end_point[1], end_point[0])       # lat, lon
-            
-            # 节点列表
-            nodes = [start_node]
-            
-            # RRT主循环
-            for i in range(max_iterations):
-                # 随机采样
-                if np.random.random() < goal_sample_rate:
-                    random_node = goal_node
-                else:
-                    random_point = self._get_random_point(bounds)
-                    random_node = RRTNode(random_point[0], random_point[1])
-                
-                # 找到最近的节点
-                nearest_node_idx = self._find_nearest_node_idx(nodes, random_node)
-                nearest_node = nodes[nearest_node_idx]
-                
-                # 生成新节点
-                new_node = self._steer(nearest_node, random_node, step_size)
-                
-                # 检查新节点是否有效
-                if not new_node or await self._is_in_no_fly_zone(new_node.x, new_node.y):
-                    continue
-                
-                # 检查新节点与最近节点之间的路径是否穿过禁飞区
-                if await self._is_path_in_no_fly_zone(nearest_node.x, nearest_node.y, new_node.x, new_node.y):
-                    continue
-                
-                # 添加新节点
-                new_node.parent = nearest_node
-                nodes.append(new_node)
-                
-                # 检查是否接近目标
-                dist_to_goal = self._euclidean_distance(new_node.x, new_node.y, goal_node.x, goal_node.y)
-                if dist_to_goal < step_size:
-                    # 连接到目标
-                    goal_node.parent = new_node
-                    nodes.append(goal_node)
-                    
-                    # 生成路径
-                    path = self._extract_path(goal_node)
-                    
-                    # 转换为航点
-                    waypoints = [GeoPoint(
-                        type="Point",
-                        coordinates=[node.y, node.x],  # lon, lat
-                        altitude=settings.DRONE_MAX_ALTITUDE / 2
-                    ) for node in path]
-                    
-                    # 计算路径信息
-                    distance = sum(self._haversine(
-                        waypoints[i].coordinates[1], waypoints[i].coordinates[0],
-                        waypoints[i+1].coordinates[1], waypoints[i+1].coordinates[0]
-                    ) for i in range(len(waypoints) - 1))
-                    
-                    estimated_duration = distance / settings.DRONE_MAX_SPEED / 1000 * 60  # 分钟
-                    
-                    return FlightPath(
-                        waypoints=waypoints,
-                        estimated_duration=estimated_duration,
-                        distance=distance,
-                        created_by=self.agent_id
-                    )
-            
-            self.logger.warning(f"RRT算法未找到路径 (已达到最大迭代次数): {task.task_id}")
-            return None
             
+            return FlightPath(
+                waypoints=[
+                    GeoPoint(type="Point", coordinates=[wp[0], wp[1]], altitude=wp[2])
+                    for wp in waypoints
+                ],
+                estimated_duration=result["duration"],
+                distance=result["distance"],
+                created_by=self.agent_id
+            )
         except Exception as e:
-            self.logger.error(f"RRT路径规划出错: {str(e)}")
+            self.logger.error(f"{algorithm} 路径规划出错: {str(e)}")
             return None
     
-    def _get_map_bounds(self, start_point: List[float], end_point: List[float]) -> Tuple[float, float, float, float]:
-        """获取地图边界"""
-        min_lon = min(start_point[0], end_point[0]) - 0.05
-        max_lon = max(start_point[0], end_point[0]) + 0.05
-        min_lat = min(start_point[1], end_point[1]) - 0.05
-        max_lat = max(start_point[1], end_point[1]) + 0.05
-        return (min_lat, max_lat, min_lon, max_lon)
-    
-    def _get_random_point(self, bounds: Tuple[float, float, float, float]) -> Tuple[float, float]:
-        """获取随机点"""
-        min_lat, max_lat, min_lon, max_lon = bounds
-        lat = min_lat + (max_lat - min_lat) * np.random.random()
-        lon = min_lon + (max_lon - min_lon) * np.random.random()
-        return (lat, lon)
-    
-    def _find_nearest_node_idx(self, nodes: List[Any], target: Any) -> int:
-        """找到最近的节点索引"""
-        distances = [self._euclidean_distance(node.x, node.y, target.x, target.y) for node in nodes]
-        return distances.index(min(distances))
-    
-    def _euclidean_distance(self, x1: float, y1: float, x2: float, y2: float) -> float:
-        """欧几里得距离（简化版，不考虑地球曲率）"""
-        return ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
-    
-    def _steer(self, from_node: Any, to_node: Any, step_size: float) -> Optional[Any]:
-        """从一个节点向另一个节点移动一个步长"""
-        dist = self._euclidean_distance(from_node.x, from_node.y, to_node.x, to_node.y)
-        
-        if dist < step_size:
-            return to_node
-        
-        # 计算方向
-        theta = math.atan2(to_node.y - from_node.y, to_node.x - from_node.x)
-        
-        # 计算新节点坐标
-        new_x = from_node.x + step_size * math.cos(theta)
-        new_y = from_node.y + step_size * math.sin(theta)
-        
-        new_node = type(from_node)(new_x, new_y)
-        return new_node
-    
-    def _extract_path(self, goal_node: Any) -> List[Any]:
-        """从目标节点回溯提取路径"""
-        path = []
-        current = goal_node
-        
-        while current:
-            path.append(current)
-            current = current.parent
-        
-        return path[::-1]  # 反转路径
-    
     async def _plan_path_rl(self, start_point: List[float], end_point: List[float], task: Task) -> Optional[FlightPath]:
         """使用强化学习模型规划路径"""
         try:
@@ -533,10 +410,7 @@ class PathPlanningAgent(BaseAgent):
             simplified_waypoints = self._simplify_path(base_path.waypoints)
             
             # 计算新路径信息
-            distance = sum(self._haversine(
-                simplified_waypoints[i].coordinates[1], simplified_waypoints[i].coordinates[0],
-                simplified_waypoints[i+1].coordinates[1], simplified_waypoints[i+1].coordinates[0]
-            ) for i in range(len(simplified_waypoints) - 1))
+            distance = path_distance([wp.coordinates for wp in simplified_waypoints])
             
             estimated_duration = distance / settings.DRONE_MAX_SPEED / 1000 * 60  # 分钟
             
@@ -575,199 +449,9 @@ class PathPlanningAgent(BaseAgent):
         
         return new_waypoints
     
-    async def _get_nearest_node(self, point: List[float]) -> Optional[Any]:
-        """获取最接近给定点的图节点"""
-        try:
-            # 提取经纬度
-            lon, lat = point  # [lon, lat]
-            
-            # 使用OSMnx在后台线程中查找最近节点
-            nearest_node = await asyncio.to_thread(
-                ox.distance.nearest_nodes,
-                self.city_graph, X=[lon], Y=[lat]
-            )
-            
-            if nearest_node:
-                return nearest_node[0]
-            return None
-        except Exception as e:
-            self.logger.error(f"获取最近节点失败: {str(e)}")
-            return None
-    
-    async def _validate_path_with_no_fly_zones(self, path_nodes: List[Any]) -> bool:
-        """验证路径是否穿过禁飞区"""
-        # 如果没有禁飞区，路径有效
-        if not self.no_fly_zones:
-            return True
-        
-        # 获取路径上的所有点
-        path_points = []
-        for node in path_nodes:
-            lat = self.city_graph.nodes[node]['y']
-            lon = self.city_graph.nodes[node]['x']
-            path_points.append((lat, lon))
-        
-        # 检查每段路径是否穿过禁飞区
-        for i in range(len(path_points) - 1):
-            lat1, lon1 = path_points[i]
-            lat2, lon2 = path_points[i + 1]
-            
-            if await self._is_path_in_no_fly_zone(lat1, lon1, lat2, lon2):
-                return False
-        
-        return True
-    
     async def _is_in_no_fly_zone(self, lat: float, lon: float) -> bool:
         """检查点是否在禁飞区内"""
-        point = Point(lon, lat)
-        
-        for zone in self.no_fly_zones:
-            try:
-                # 获取禁飞区多边形
-                polygon = Polygon(zone.geometry["coordinates"][0])
-                
-                # 检查点是否在多边形内
-                if polygon.contains(point):
-                    return True
-            except Exception as e:
-                self.logger.error(f"检查禁飞区出错: {str(e)}")
-        
-        return False
-    
-    async def _is_path_in_no_fly_zone(self, lat1: float, lon1: float, lat2: float, lon2: float) -> bool:
-        """检查路径是否穿过禁飞区"""
-        path = LineString([(lon1, lat1), (lon2, lat2)])
-        
-        for zone in self.no_fly_zones:
-            try:
-                # 获取禁飞区多边形
-                polygon = Polygon(zone.geometry["coordinates"][0])
-                
-                # 检查路径是否与多边形相交
-                if polygon.intersects(path):
-                    return True
-            except Exception as e:
-                self.logger.error(f"检查路径与禁飞区相交出错: {str(e)}")
-        
-        return False
-    
-    async def _plan_path_avoiding_no_fly_zones(self, start_node: Any, end_node: Any) -> List[Any]:
-        """规划绕过禁飞区的路径"""
-        # 这里实现一个更复杂的路径规划算法，考虑禁飞区
-        # 为简化实现，我们使用修改后的Dijkstra算法
-        
-        try:
-            # 创建一个队列
-            queue = [(0, start_node, [])]  # (cost, node, path)
-            visited = set()
-            
-            while queue:
-                # 弹出成本最低的路径
-                cost, node, path = heapq.heappop(queue)
-                
-                # 如果到达终点
-                if node == end_node:
-                    return path + [node]
-                
-                # 如果节点已访问
-                if node in visited:
-                    continue
-                
-                # 标记为已访问
-                visited.add(node)
-                
-                # 遍历所有邻居
-                for neighbor in self.city_graph.neighbors(node):
-                    if neighbor in visited:
-                        continue
-                    
-                    # 获取边的长度
-                    edge_data = self.city_graph.get_edge_data(node, neighbor)
-                    length = edge_data.get('length', 1)
-                    
-                    # 检查路径是否穿过禁飞区
-                    node_lat = self.city_graph.nodes[node]['y']
-                    node_lon = self.city_graph.nodes[node]['x']
-                    neighbor_lat = self.city_graph.nodes[neighbor]['y']
-                    neighbor_lon = self.city_graph.nodes[neighbor]['x']
-                    
-                    if await self._is_path_in_no_fly_zone(node_lat, node_lon, neighbor_lat, neighbor_lon):
-                        # 如果穿过禁飞区，增加成本惩罚
-                        length *= 10
-                    
-                    # 添加邻居到队列
-                    new_cost = cost + length
-                    new_path = path + [node]
-                    heapq.heappush(queue, (new_cost, neighbor, new_path))
-            
-            # 如果找不到路径
-            return []
-        
-        except Exception as e:
-            self.logger.error(f"规划绕过禁飞区的路径出错: {str(e)}")
-            return []
-    
-    async def _nodes_to_waypoints(self, path_nodes: List[Any]) -> List[GeoPoint]:
-        """将图节点转换为航点"""
-        waypoints = []
-        
-        for node in path_nodes:
-            lat = self.city_graph.nodes[node]['y']
-            lon = self.city_graph.nodes[node]['x']
-            
-            waypoint = GeoPoint(
-                type="Point",
-                coordinates=[lon, lat],  # [lon, lat]
-                altitude=settings.DRONE_MAX_ALTITUDE / 2  # 默认飞行高度
-            )
-            
-            waypoints.append(waypoint)
-        
-        return waypoints
-    
-    def _haversine(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """
-        计算两点之间的大圆距离（Haversine公式）
-        返回距离，单位为米
-        """
-        # 将角度转换为弧度
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-        
-        # Haversine公式
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        r = 6371  # 地球半径，单位为公里
-        
-        # 返回距离，单位为米
-        return c * r * 1000
-    
-    def _cache_path(self, path: FlightPath) -> Dict[str, Any]:
-        """将路径转换为可缓存的格式"""
-        return {
-            "waypoints": [[wp.coordinates[0], wp.coordinates[1], wp.altitude] for wp in path.waypoints],
-            "estimated_duration": path.estimated_duration,
-            "distance": path.distance,
-            "created_by": path.created_by
-        }
-    
-    def _restore_path_from_cache(self, cached_path: Dict[str, Any]) -> FlightPath:
-        """从缓存格式恢复路径"""
-        waypoints = []
-        for wp in cached_path["waypoints"]:
-            waypoints.append(GeoPoint(
-                type="Point",
-                coordinates=[wp[0], wp[1]],
-                altitude=wp[2]
-            ))
-        
-        return FlightPath(
-            waypoints=waypoints,
-            estimated_duration=cached_path["estimated_duration"],
-            distance=cached_path["distance"],
-            created_by=cached_path["created_by"]
-        )
+        return self.engine.geofences.contains(lon, lat)
     
     async def handle_query(self, query: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """处理来自其他智能体的查询"""
@@ -784,29 +468,9 @@ class PathPlanningAgent(BaseAgent):
                 not all(isinstance(x, (int, float)) for x in start_point + end_point)):
                 return {"success": False, "error": "Invalid coordinates"}
             
-            # 创建一个临时任务
-            temp_task = Task(
-                task_id=f"temp_{str(uuid.uuid4())[:8]}",
-                title="临时路径规划",
-                description="由查询触发的临时路径规划",
-                type=TaskType.OTHER,
-                created_by=self.agent_id,
-                start_location=Location(
-                    position=GeoPoint(
-                        type="Point",
-                        coordinates=start_point
-                    )
-                ),
-                end_location=Location(
-                    position=GeoPoint(
-                        type="Point",
-                        coordinates=end_point
-                    )
-                )
-            )
-            
             # 规划路径
-            path = await self._plan_path_astar(start_point, end_point, temp_task)
+            algorithm = "graph_astar" if self.engine.graph is not None else "astar"
+            path = await self._plan_with_engine(start_point, end_point, algorithm, "plan_path查询")
             
             if not path:
                 return {"success": False, "error": "Could not plan path"}
@@ -835,6 +499,13 @@ class PathPlanningAgent(BaseAgent):
                 "in_no_fly_zone": in_no_fly_zone
             }
         
+        elif query == "get_planning_metrics":
+            # 规划引擎的缓存命中率、各算法耗时等指标
+            return {
+                "success": True,
+                "metrics": self.engine.get_metrics()
+            }
+        
         return await super().handle_query(query, data)
 
 
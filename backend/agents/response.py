@@ -1,13 +1,11 @@
-from typing import Dict, List, Any, Optional, Union, Tuple, Set
+from typing import Dict, List, Any, Optional, Union, Tuple, Set, Callable
 import asyncio
 import uuid
 import time
 from datetime import datetime
 import json
 import numpy as np
-from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from langchain.chat_models import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
@@ -15,14 +13,25 @@ from pydantic import BaseModel, Field
 from config.logging_config import get_logger
 from database.models import (
     Task, Event, Drone, AgentLog, TaskStatus, TaskType,
-    EventType, EventLevel, Location, GeoPoint
+    EventType, EventLevel, Location, GeoPoint, DroneStatus
 )
 from config.settings import settings
+from services.fleet_state import fleet_state
+from services.llm_pipeline import LLMPipeline, llm_pipeline
+from services.llm_cache import llm_response_cache, signature_of
 from .base import BaseAgent
+from .scheduler import Histogram
+from .response_context import ResponseContextBuilder
+from .response_templates import (
+    build_template_plan, uses_template, severity_for, add_action, merge_plan, StreamingPlanParser
+)
 from .coordinator import register_agent, get_coordinator
 
 logger = get_logger("agents.response")
 
+# 任务分配到首个行动开始的时间分桶（秒）
+FIRST_ACTION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
 # 定义LLM输出模型
 class ResponseAction(BaseModel):
     """应急响应行动"""
@@ -44,14 +53,19 @@ class ResponseAgent(BaseAgent):
     应急响应智能体使用LLM为各种事件生成智能响应计划
     """
     
-    def __init__(self, agent_id: Optional[str] = None, name: str = "应急响应智能体"):
+    def __init__(self, agent_id: Optional[str] = None, name: str = "应急响应智能体",
+                 llm: Optional[LLMPipeline] = None):
         super().__init__(agent_id, name)
         self.agent_type = "ResponseAgent"
-        self.llm = None
-        self.response_chain = None
+        self.llm = llm or llm_pipeline
+        self._pending_plans: Dict[str, asyncio.Future] = {}  # 缓存键 -> 正在生成的计划
+        self.coalesced_plans = 0  # 复用同类事件正在生成的计划的次数
+        self.response_prompt = None
+        self.plan_parser = None
         self.active_tasks: Dict[str, Dict[str, Any]] = {}
         self.memory = {}
-        self.llm_lock = asyncio.Lock()
+        self.first_action_latency = Histogram(FIRST_ACTION_BUCKETS)
+        self.context_builder = ResponseContextBuilder()
         self.capabilities = {
             "emergency_response": 0.95,
             "situation_assessment": 0.9,
@@ -69,19 +83,20 @@ class ResponseAgent(BaseAgent):
         # 加载活动任务
         await self._load_active_tasks()
         
+        # 加载持久化的响应缓存
+        llm_response_cache.ensure_loaded()
+        
         return self
     
+    async def stop(self):
+        """停止智能体并保存响应缓存"""
+        await super().stop()
+        llm_response_cache.save()
+    
     async def _initialize_llm(self):
-        """初始化LLM和响应链"""
+        """初始化响应计划提示模板和输出解析器，请求通过并发LLM管道发送"""
         try:
-            self.logger.info("初始化LLM和响应链")
-            
-            # 创建LLM
-            self.llm = ChatOpenAI(
-                model_name=settings.OPENAI_MODEL,
-                openai_api_key=settings.OPENAI_API_KEY,
-                temperature=0.2
-            )
+            self.logger.info("初始化LLM响应计划模板")
             
             # 创建输出解析器
             parser = PydanticOutputParser(pydantic_object=ResponsePlan)
@@ -126,20 +141,91 @@ class ResponseAgent(BaseAgent):
                 partial_variables={"format_instructions": parser.get_format_instructions()}
             )
             
-            # 创建LLM链
-            self.response_chain = LLMChain(
-                llm=self.llm,
-                prompt=prompt,
-                output_parser=parser,
-                verbose=True
-            )
+            self.response_prompt = prompt
+            self.plan_parser = parser
             
-            self.logger.info("LLM和响应链初始化成功")
+            self.logger.info("LLM响应计划模板初始化成功")
         
         except Exception as e:
-            self.logger.error(f"初始化LLM和响应链失败: {str(e)}")
+            self.logger.error(f"初始化LLM响应计划模板失败: {str(e)}")
             raise
     
+    async def _request_plan(self, llm_input: Dict[str, Any], event: Optional[Event] = None,
+                            on_action: Optional[Callable[[Dict[str, Any]], None]] = None) -> ResponsePlan:
+        """
+        通过LLM管道请求响应计划，多个事件的请求并发进行
+        
+        传入事件时先按事件签名查找响应缓存，同类事件直接复用已生成的计划。
+        计划中不包含具体无人机，部署时会重新按事件位置选择，因此可以安全复用。
+        传入 on_action 且开启 RESPONSE_PLAN_STREAMING 时流式接收响应，
+        每解析出一个完整的行动就回调一次，调用方可以在完整计划到达前开始执行。
+        """
+        cache_key = None
+        future = None
+        if event is not None and llm_response_cache.enabled:
+            cache_key = llm_response_cache.make_key("response_plan", signature_of(event))
+            cached = llm_response_cache.get(cache_key)
+            if cached is not None:
+                self.logger.debug(f"事件 {event.event_id} 命中响应计划缓存")
+                return ResponsePlan.parse_obj(cached["plan"])
+            
+            # 同类事件的计划正在生成时等待其结果，不重复请求（失败时再自行请求）
+            pending = self._pending_plans.get(cache_key)
+            if pending is not None:
+                plan_data = await asyncio.shield(pending)
+                if plan_data is not None:
+                    self.coalesced_plans += 1
+                    return ResponsePlan.parse_obj(plan_data)
+            else:
+                future = asyncio.get_running_loop().create_future()
+                self._pending_plans[cache_key] = future
+        
+        try:
+            plan, tokens = await self._generate_plan(llm_input, on_action)
+        except BaseException:
+            if future is not None and not future.done():
+                future.set_result(None)
+            raise
+        finally:
+            if future is not None:
+                del self._pending_plans[cache_key]
+        
+        if cache_key is not None:
+            llm_response_cache.put(cache_key, {"plan": plan.dict(), "tokens": tokens})
+            if future is not None and not future.done():
+                future.set_result(plan.dict())
+        return plan
+    
+    async def _generate_plan(self, llm_input: Dict[str, Any],
+                             on_action: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[ResponsePlan, int]:
+        """请求LLM生成响应计划，返回计划和消耗的令牌数"""
+        messages = [{"role": "user", "content": self.response_prompt.format(**llm_input)}]
+        if on_action is not None and settings.RESPONSE_PLAN_STREAMING:
+            parser = StreamingPlanParser()
+            stats: Dict[str, Any] = {}
+            async for chunk in self.llm.stream(messages, temperature=0.2, max_tokens=1000, stats=stats):
+                for action in parser.feed(chunk):
+                    try:
+                        on_action(ResponseAction.parse_obj(action).dict())
+                    except Exception as e:
+                        self.logger.warning(f"忽略无法解析的流式行动: {str(e)}")
+            text = parser.text.strip()
+            tokens = stats.get("tokens", 0)
+        else:
+            result = await self.llm.chat(messages, temperature=0.2, max_tokens=1000)
+            if not result["success"]:
+                raise RuntimeError(f"LLM请求失败: {result['error']}")
+            text = result["text"]
+            tokens = result["tokens"]
+        
+        # 解析响应计划
+        try:
+            plan = ResponsePlan.parse_obj(json.loads(text))
+        except Exception:
+            # 使用输出解析器解析（兼容带说明文字或代码块的输出）
+            plan = self.plan_parser.parse(text)
+        return plan, tokens
+    
     async def _load_active_tasks(self):
         """加载分配给此智能体的活动任务"""
         try:
@@ -203,8 +289,8 @@ class ResponseAgent(BaseAgent):
             # 更新任务状态
             task_info["status"] = "generating_plan"
             
-            # 创建异步任务来生成响应计划
-            asyncio.create_task(self._generate_response_plan(task_id, task_info))
+            # 在后台生成响应计划，多个任务的计划并发生成
+            self.spawn(self._generate_response_plan(task_id, task_info), name=f"plan:{task_id}")
             
             # 更新任务状态
             task.status = TaskStatus.IN_PROGRESS
@@ -227,68 +313,61 @@ class ResponseAgent(BaseAgent):
                 return
             
             event_id = task.related_events[0]
-            event = await Event.find_one({"event_id": event_id})
+            # 快速派遣的任务随任务一起交接了事件，不必再查询
+            event = task_info.get("event") or await Event.find_one({"event_id": event_id})
             
             if not event:
                 self.logger.warning(f"找不到任务 {task_id} 的相关事件 {event_id}")
                 task_info["status"] = "error"
                 return
+            task_info["event"] = event
             
-            # 获取可用无人机
-            available_drones = await Drone.find({"status": "idle"}).to_list()
-            
-            # 准备LLM输入
-            llm_input = {
-                "event_id": event.event_id,
-                "event_title": event.title,
-                "event_description": event.description,
-                "event_type": event.type,
-                "event_level": event.level,
-                "event_location": json.dumps(event.location.dict() if event.location else {}),
-                "detection_data": json.dumps(event.detection_data or {}),
-                "available_drones": json.dumps([{
-                    "drone_id": drone.drone_id,
-                    "name": drone.name,
-                    "model": drone.model,
-                    "battery_level": drone.battery_level
-                } for drone in available_drones]),
-                "emergency_services": json.dumps({
-                    "police": {"available": True, "response_time": 10},
-                    "fire": {"available": True, "response_time": 15},
-                    "medical": {"available": True, "response_time": 12}
-                })
-            }
+            # 准备LLM输入：事件附近的候选无人机和汇总后的检测数据，控制在令牌预算内
+            llm_input = self._build_llm_input(event)
             
-            # 获取响应计划
-            async with self.llm_lock:
-                response = await asyncio.to_thread(
-                    self.response_chain.run,
-                    **llm_input
-                )
+            # 高级别事件先按模板计划立即行动，LLM细化计划在后台生成后合并
+            if uses_template(event.level):
+                task_info["response_plan"] = build_template_plan(event)
+                task_info["plan_source"] = "template"
+                task_info["status"] = "executing_plan"
+                self.wake("template_plan")
+                self.logger.info(f"任务 {task_id} 先按模板计划执行，等待LLM细化")
             
-            # 解析响应计划
-            if isinstance(response, str):
-                # 尝试解析JSON
-                try:
-                    plan_dict = json.loads(response)
-                    response_plan = ResponsePlan.parse_obj(plan_dict)
-                except:
-                    # 使用输出解析器解析
-                    parser = PydanticOutputParser(pydantic_object=ResponsePlan)
-                    response_plan = parser.parse(response)
-            else:
-                response_plan = response
+            # 获取响应计划，细化期间即使已有行动全部完成也不结束任务
+            task_info["refining"] = True
+            try:
+                response_plan = await self._request_plan(
+                    llm_input, event,
+                    on_action=lambda action: self._on_streamed_action(task_info, action, event.level)
+                )
+            except Exception as e:
+                task_info["refining"] = False
+                if not task_info.get("response_plan"):
+                    raise
+                # 已有模板计划或流式解析出的行动时继续执行，不中断响应
+                self.logger.warning(f"任务 {task_id} 的LLM细化计划生成失败，继续执行当前计划: {str(e)}")
+                task.task_data = task.task_data or {}
+                task.task_data["response_plan"] = task_info["response_plan"]
+                await task.save()
+                self.wake("plan_refine_failed")
+                return
             
-            # 保存响应计划
-            task_info["response_plan"] = response_plan.dict()
-            task_info["status"] = "executing_plan"
+            # 保存响应计划，已在执行的计划与细化计划合并
+            plan = response_plan.dict()
+            if task_info.get("response_plan"):
+                plan = merge_plan(task_info["response_plan"], plan, task_info["actions_taken"])
+            task_info["response_plan"] = plan
+            task_info["plan_source"] = "llm"
+            task_info["refining"] = False
+            if task_info["status"] == "generating_plan":
+                task_info["status"] = "executing_plan"
             
             # 更新任务
             task.task_data = task.task_data or {}
-            task.task_data["response_plan"] = response_plan.dict()
+            task.task_data["response_plan"] = plan
             await task.save()
             
-            self.logger.info(f"为任务 {task_id} 生成了响应计划，严重程度: {response_plan.severity_level}，行动数: {len(response_plan.actions)}")
+            self.logger.info(f"为任务 {task_id} 生成了响应计划，严重程度: {response_plan.severity_level}，行动数: {len(plan['actions'])}")
             
             # 记录到内存
             memory = self.memory.get(task_id)
@@ -297,11 +376,31 @@ class ResponseAgent(BaseAgent):
                     {"input": f"生成事件 {event_id} 的响应计划"},
                     {"output": f"已生成响应计划，严重程度: {response_plan.severity_level}，包含 {len(response_plan.actions)} 个行动"}
                 )
+            
+            # 立即开始执行计划
+            self.wake("plan_generated")
         
         except Exception as e:
             self.logger.error(f"生成响应计划失败: {str(e)}")
             task_info["status"] = "error"
     
+    def _on_streamed_action(self, task_info: Dict[str, Any], action: Dict[str, Any], level: Any):
+        """流式解析出一个行动：加入当前计划并立即唤醒执行"""
+        plan = task_info.get("response_plan")
+        if plan is None:
+            plan = {
+                "situation_assessment": "",
+                "severity_level": severity_for(level),
+                "actions": [],
+                "additional_notes": None
+            }
+            task_info["response_plan"] = plan
+            task_info["plan_source"] = "stream"
+        add_action(plan, action, task_info["actions_taken"])
+        if task_info["status"] == "generating_plan":
+            task_info["status"] = "executing_plan"
+        self.wake("plan_action")
+    
     async def _execute_plan(self, task_id: str, task_info: Dict[str, Any]):
         """执行响应计划"""
         try:
@@ -323,11 +422,12 @@ class ResponseAgent(BaseAgent):
                     all_actions_taken = False
                     # 执行行动
                     await self._take_action(task_id, task_info, action)
-                    # 每个循环只执行一个行动
+                    # 每个循环只执行一个行动，执行完立即唤醒下一个周期
+                    self.wake("plan_step")
                     break
             
-            # 如果所有行动都已执行，完成任务
-            if all_actions_taken:
+            # 如果所有行动都已执行且没有待合并的细化计划，完成任务
+            if all_actions_taken and not task_info.get("refining"):
                 await self._complete_task(task_id, task_info)
         
         except Exception as e:
@@ -343,6 +443,9 @@ class ResponseAgent(BaseAgent):
             
             # 记录行动开始
             start_time = datetime.utcnow()
+            if "first_action_at" not in task_info:
+                task_info["first_action_at"] = start_time
+                self.first_action_latency.observe((start_time - task_info["start_time"]).total_seconds())
             
             # 根据行动类型执行不同的操作
             if action_type == "deploy_drones":
@@ -399,10 +502,34 @@ class ResponseAgent(BaseAgent):
         except Exception as e:
             self.logger.error(f"执行行动失败: {str(e)}")
     
+    def _candidate_drones(self, event: Optional[Event]) -> List[Drone]:
+        """事件附近最近的若干架电量充足的空闲无人机，事件没有位置时按电量取前若干架"""
+        if event is None or not event.location:
+            return fleet_state.with_battery(
+                settings.RESPONSE_MIN_BATTERY, DroneStatus.IDLE
+            )[:settings.RESPONSE_CANDIDATE_DRONES]
+        lon, lat = event.location.position.coordinates[:2]
+        return [
+            drone for _, drone in
+            fleet_state.nearest_available(
+                lon, lat, k=settings.RESPONSE_CANDIDATE_DRONES, min_battery=settings.RESPONSE_MIN_BATTERY
+            )
+        ]
+    
+    def _build_llm_input(self, event: Event) -> Dict[str, Any]:
+        """构造响应计划提示词的输入"""
+        idle_count = fleet_state.count_by_status().get(DroneStatus.IDLE, 0)
+        return self.context_builder.build(event, self._candidate_drones(event), idle_count)
+    
     async def _action_deploy_drones(self, task_id: str, task_info: Dict[str, Any], action: Dict[str, Any]):
         """执行部署无人机行动"""
-        # 获取可用无人机
-        available_drones = await Drone.find({"status": "idle"}).to_list()
+        # 快速派遣时预留的无人机优先，其次是事件附近的可用无人机（按距离排序）
+        task = task_info["task"]
+        reserved = [drone for drone in map(fleet_state.get, task.assigned_drones) if drone is not None]
+        available_drones = reserved + [
+            drone for drone in self._candidate_drones(task_info.get("event"))
+            if drone.drone_id not in task.assigned_drones
+        ]
         
         if not available_drones:
             self.logger.warning("没有可用的无人机")
@@ -416,18 +543,18 @@ class ResponseAgent(BaseAgent):
         elif severity == "high":
             num_drones = min(3, len(available_drones))
         
-        selected_drones = available_drones[:num_drones]
-        
-        # 分配无人机
-        task = task_info["task"]
+        # 分配无人机：已为本任务预留的直接使用，其余在数据库中原子预留，被其他进程抢先的跳过
         assigned_drones = []
         
-        for drone in selected_drones:
-            # 更新无人机状态
-            drone.status = "flying"
-            drone.assigned_tasks.append(task_id)
-            await drone.save()
-            assigned_drones.append(drone.drone_id)
+        for drone in available_drones:
+            if len(assigned_drones) >= num_drones:
+                break
+            if drone.drone_id in task.assigned_drones or await fleet_state.reserve(drone.drone_id, [task_id]):
+                assigned_drones.append(drone.drone_id)
+        
+        if not assigned_drones:
+            self.logger.warning(f"任务 {task_id} 的候选无人机均已被预留")
+            return
         
         # 更新任务
         task.assigned_drones = assigned_drones
@@ -645,6 +772,28 @@ class ResponseAgent(BaseAgent):
         
         self.logger.info(f"接受了任务分配: {task_id}")
     
+    def accept_dispatched_task(self, task: Task, event: Event):
+        """
+        接手快速派遣的任务（由 EmergencyDispatcher 在本进程内直接调用）
+
+        不等待邮箱和工作周期，立即在后台开始生成响应计划。
+        """
+        self.current_task_id = task.task_id
+        self.status = "busy"
+        task.status = TaskStatus.IN_PROGRESS
+        task_info = {
+            "task": task,
+            "event": event,
+            "status": "generating_plan",
+            "response_plan": None,
+            "actions_taken": [],
+            "start_time": datetime.utcnow()
+        }
+        self.active_tasks[task.task_id] = task_info
+        self.memory[task.task_id] = ConversationBufferMemory()
+        self.spawn(self._generate_response_plan(task.task_id, task_info), name=f"plan:{task.task_id}")
+        self.logger.info(f"接手快速派遣的任务: {task.task_id}")
+    
     async def handle_task_cancelled(self, task_id: str):
         """处理取消的任务"""
         await super().handle_task_cancelled(task_id)
@@ -668,51 +817,12 @@ class ResponseAgent(BaseAgent):
             if not event:
                 return {"success": False, "error": f"Event not found: {event_id}"}
             
-            # 获取可用无人机
-            available_drones = await Drone.find({"status": "idle"}).to_list()
-            
-            # 准备LLM输入
-            llm_input = {
-                "event_id": event.event_id,
-                "event_title": event.title,
-                "event_description": event.description,
-                "event_type": event.type,
-                "event_level": event.level,
-                "event_location": json.dumps(event.location.dict() if event.location else {}),
-                "detection_data": json.dumps(event.detection_data or {}),
-                "available_drones": json.dumps([{
-                    "drone_id": drone.drone_id,
-                    "name": drone.name,
-                    "model": drone.model,
-                    "battery_level": drone.battery_level
-                } for drone in available_drones]),
-                "emergency_services": json.dumps({
-                    "police": {"available": True, "response_time": 10},
-                    "fire": {"available": True, "response_time": 15},
-                    "medical": {"available": True, "response_time": 12}
-                })
-            }
+            # 准备LLM输入：事件附近的候选无人机和汇总后的检测数据，控制在令牌预算内
+            llm_input = self._build_llm_input(event)
             
             try:
                 # 获取响应计划
-                async with self.llm_lock:
-                    response = await asyncio.to_thread(
-                        self.response_chain.run,
-                        **llm_input
-                    )
-                
-                # 解析响应计划
-                if isinstance(response, str):
-                    # 尝试解析JSON
-                    try:
-                        plan_dict = json.loads(response)
-                        response_plan = ResponsePlan.parse_obj(plan_dict)
-                    except:
-                        # 使用输出解析器解析
-                        parser = PydanticOutputParser(pydantic_object=ResponsePlan)
-                        response_plan = parser.parse(response)
-                else:
-                    response_plan = response
+                response_plan = await self._request_plan(llm_input, event)
                 
                 return {
                     "success": True,
@@ -723,6 +833,26 @@ class ResponseAgent(BaseAgent):
                 self.logger.error(f"分析事件失败: {str(e)}")
                 return {"success": False, "error": str(e)}
         
+        elif query == "get_llm_metrics":
+            return {
+                "success": True,
+                "metrics": self.llm.get_metrics(),
+                "cache": {**llm_response_cache.get_metrics(), "coalesced": self.coalesced_plans},
+                "prompt": self.context_builder.get_metrics()
+            }
+        
+        elif query == "get_plan_metrics":
+            sources: Dict[str, int] = {}
+            for task_info in self.active_tasks.values():
+                source = task_info.get("plan_source")
+                if source:
+                    sources[source] = sources.get(source, 0) + 1
+            return {
+                "success": True,
+                "first_action_latency": self.first_action_latency.to_dict(),
+                "active_plan_sources": sources
+            }
+        
         elif query == "get_task_status":
             # 获取任务状态
             task_id = data.get("task_id")
@@ -737,6 +867,7 @@ class ResponseAgent(BaseAgent):
             return {
                 "success": True,
                 "status": task_info["status"],
+                "plan_source": task_info.get("plan_source"),
                 "actions_taken": task_info["actions_taken"],
                 "response_plan": task_info["response_plan"]
             }
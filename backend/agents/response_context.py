@@ -0,0 +1,192 @@
+"""
+应急响应提示词上下文
+
+控制响应计划提示词的规模，使LLM延迟和费用不随机队规模增长：
+- 无人机：只放入事件附近最近的 k 架满足条件的空闲无人机（由调用方通过机队索引选出）
+- 检测数据：原始检测结果汇总为各类别数量和最高置信度，只保留标量字段
+- 令牌预算：事件描述先截断到 RESPONSE_DESCRIPTION_TOKEN_CAP，上下文仍超出
+  RESPONSE_PROMPT_TOKEN_BUDGET 时再减少无人机（保留最近的），最后进一步截断描述。
+  冗长的检测描述对计划帮助不大，候选无人机少了则直接影响计划质量
+
+同时估算按旧方式（全部空闲无人机 + 完整检测数据）构造提示词所需的令牌数，统计节省量。
+"""
+import json
+import math
+from typing import Dict, List, Any, Optional, Tuple
+
+from config.settings import settings
+from database.models import Event, Drone
+from services.planning_engine import haversine
+
+# 紧急服务状态（目前为固定值）
+EMERGENCY_SERVICES = {
+    "police": {"available": True, "response_time": 10},
+    "fire": {"available": True, "response_time": 15},
+    "medical": {"available": True, "response_time": 12}
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算令牌数：中日韩字符每字约1个令牌，其他字符约4个字符1个令牌"""
+    wide = sum(1 for char in text if ord(char) > 0x2E80)
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按估算令牌数截断文本，截断时末尾加省略号（计入令牌数）"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep_tokens = max(0, max_tokens - 1)
+    return text[:len(text) * keep_tokens // max(1, tokens)] + "…"
+
+
+def summarize_detection(event: Event) -> Dict[str, Any]:
+    """
+    汇总检测数据
+
+    Returns:
+        {"classes": {类别: {"count": 数量, "max_confidence": 最高置信度}}, 以及检测数据中的标量字段}
+    """
+    classes: Dict[str, Dict[str, Any]] = {}
+    for box in event.bounding_boxes or []:
+        entry = classes.setdefault(box.class_name, {"count": 0, "max_confidence": 0.0})
+        entry["count"] += 1
+        entry["max_confidence"] = round(max(entry["max_confidence"], box.confidence), 2)
+
+    summary: Dict[str, Any] = {
+        key: value for key, value in (event.detection_data or {}).items()
+        if isinstance(value, (str, int, float, bool)) and not (isinstance(value, str) and len(value) > 200)
+    }
+    if classes:
+        summary["classes"] = dict(sorted(classes.items(), key=lambda item: -item[1]["count"]))
+    return summary
+
+
+def _location_of(event: Event) -> Optional[Tuple[float, float]]:
+    if event.location is None:
+        return None
+    coordinates = event.location.position.coordinates
+    return coordinates[0], coordinates[1]
+
+
+class ResponseContextBuilder:
+    """按令牌预算构造响应计划提示词的输入"""
+
+    def __init__(self, token_budget: Optional[int] = None, description_cap: Optional[int] = None):
+        self.token_budget = token_budget or settings.RESPONSE_PROMPT_TOKEN_BUDGET
+        self.description_cap = description_cap or settings.RESPONSE_DESCRIPTION_TOKEN_CAP
+
+        self.prompts = 0
+        self.context_tokens = 0
+        self.baseline_tokens = 0
+        self.drones_dropped = 0
+        self.truncated = 0
+
+    def _drone_entry(self, drone: Drone, location: Optional[Tuple[float, float]]) -> Dict[str, Any]:
+        entry = {
+            "drone_id": drone.drone_id,
+            "model": drone.model,
+            "battery_level": round(drone.battery_level),
+        }
+        if location is not None and drone.current_location:
+            lon, lat = drone.current_location.coordinates[:2]
+            entry["distance_m"] = round(haversine(location[1], location[0], lat, lon))
+        return entry
+
+    def build(self, event: Event, drones: List[Drone], idle_count: Optional[int] = None) -> Dict[str, Any]:
+        """
+        构造提示词输入
+
+        Args:
+            event: 事件
+            drones: 候选无人机，按距离升序
+            idle_count: 机队中空闲无人机总数，用于估算节省的令牌数
+
+        Returns:
+            与响应计划提示模板变量对应的字典
+        """
+        location = _location_of(event)
+        llm_input = {
+            "event_id": event.event_id,
+            "event_title": event.title,
+            "event_description": event.description,
+            "event_type": event.type,
+            "event_level": event.level,
+            "event_location": _dumps(event.location.dict() if event.location else {}),
+            "detection_data": _dumps(summarize_detection(event)),
+            "available_drones": "",
+            "emergency_services": _dumps(EMERGENCY_SERVICES)
+        }
+        entries = [self._drone_entry(drone, location) for drone in drones]
+
+        def fixed_tokens() -> int:
+            return sum(
+                estimate_tokens(str(value)) for key, value in llm_input.items() if key != "available_drones"
+            )
+
+        # 先把事件描述截断到固定上限，超出预算时再减少无人机（保留最近的），最后进一步截断描述
+        budget = self.token_budget
+        description = truncate_to_tokens(event.description, self.description_cap)
+        if description != event.description:
+            llm_input["event_description"] = description
+            self.truncated += 1
+        entry_tokens = [estimate_tokens(_dumps(entry)) + 1 for entry in entries]
+        remaining = budget - fixed_tokens()
+        kept = 0
+        for tokens in entry_tokens:
+            if tokens > remaining and kept > 0:
+                break
+            remaining -= tokens
+            kept += 1
+        self.drones_dropped += len(entries) - kept
+        llm_input["available_drones"] = _dumps(entries[:kept])
+
+        total = fixed_tokens() + estimate_tokens(llm_input["available_drones"])
+        if total > budget:
+            description_tokens = estimate_tokens(llm_input["event_description"])
+            if description == event.description:
+                self.truncated += 1
+            llm_input["event_description"] = truncate_to_tokens(
+                llm_input["event_description"], max(0, description_tokens - (total - budget))
+            )
+            total = fixed_tokens() + estimate_tokens(llm_input["available_drones"])
+
+        # 按旧方式构造时的令牌数：全部空闲无人机和完整检测数据
+        full_drone_tokens = sum(
+            estimate_tokens(_dumps({
+                "drone_id": drone.drone_id, "name": drone.name,
+                "model": drone.model, "battery_level": drone.battery_level
+            }))
+            for drone in drones
+        )
+        if drones and idle_count and idle_count > len(drones):
+            full_drone_tokens = full_drone_tokens * idle_count / len(drones)
+        baseline = (
+            total
+            - estimate_tokens(llm_input["available_drones"])
+            - estimate_tokens(llm_input["detection_data"])
+            - estimate_tokens(llm_input["event_description"])
+            + estimate_tokens(event.description)
+            + estimate_tokens(_dumps(event.detection_data or {}))
+            + int(full_drone_tokens)
+        )
+
+        self.prompts += 1
+        self.context_tokens += total
+        self.baseline_tokens += max(baseline, total)
+        return llm_input
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "token_budget": self.token_budget,
+            "prompts": self.prompts,
+            "avg_context_tokens": self.context_tokens / self.prompts if self.prompts else 0.0,
+            "saved_tokens": self.baseline_tokens - self.context_tokens,
+            "drones_dropped": self.drones_dropped,
+            "truncated_descriptions": self.truncated
+        }
@@ -0,0 +1,199 @@
+"""
+应急响应快速计划
+
+高级别事件不必等待LLM才开始行动：
+- 模板计划：按事件类型和级别立即生成规则化的响应计划，无人机可以马上部署
+- 计划合并：LLM细化的计划到达后与正在执行的计划合并，已执行的行动保留，
+  其余行动以LLM计划为准
+- 流式解析：从LLM的流式输出中逐个解析出完整的行动对象，
+  不必等完整响应到达即可开始执行
+"""
+import json
+from typing import Dict, List, Any, Optional
+
+from config.settings import settings
+from database.models import Event, EventType, EventLevel
+
+# 级别 -> 计划严重程度
+SEVERITY_BY_LEVEL = {
+    EventLevel.LOW: "low",
+    EventLevel.MEDIUM: "medium",
+    EventLevel.HIGH: "high",
+}
+
+_LEVEL_RANK = {EventLevel.LOW: 0, EventLevel.MEDIUM: 1, EventLevel.HIGH: 2}
+
+# 事件类型 -> 模板行动，min_level 为该行动适用的最低事件级别
+TEMPLATE_ACTIONS: Dict[EventType, List[Dict[str, Any]]] = {
+    EventType.EMERGENCY: [
+        {"action_type": "deploy_drones", "priority": 10, "description": "立即派遣附近无人机前往现场侦察",
+         "resources_needed": ["无人机"], "estimated_time": 5, "min_level": EventLevel.LOW},
+        {"action_type": "notify_authorities", "priority": 9, "description": "通知公安、消防和医疗部门",
+         "resources_needed": ["紧急服务"], "estimated_time": 2, "min_level": EventLevel.MEDIUM},
+        {"action_type": "evacuate_area", "priority": 8, "description": "疏散事件周边人员",
+         "resources_needed": ["无人机", "紧急服务"], "estimated_time": 15, "min_level": EventLevel.HIGH},
+        {"action_type": "monitor_situation", "priority": 7, "description": "持续监控现场态势",
+         "resources_needed": ["无人机"], "estimated_time": 30, "min_level": EventLevel.LOW},
+    ],
+    EventType.SECURITY: [
+        {"action_type": "deploy_drones", "priority": 9, "description": "派遣附近无人机跟踪和取证",
+         "resources_needed": ["无人机"], "estimated_time": 5, "min_level": EventLevel.LOW},
+        {"action_type": "monitor_situation", "priority": 8, "description": "持续监控可疑目标",
+         "resources_needed": ["无人机"], "estimated_time": 30, "min_level": EventLevel.LOW},
+        {"action_type": "notify_authorities", "priority": 7, "description": "通知公安部门",
+         "resources_needed": ["紧急服务"], "estimated_time": 2, "min_level": EventLevel.MEDIUM},
+    ],
+    EventType.ANOMALY: [
+        {"action_type": "deploy_drones", "priority": 7, "description": "派遣无人机核实异常情况",
+         "resources_needed": ["无人机"], "estimated_time": 5, "min_level": EventLevel.MEDIUM},
+        {"action_type": "monitor_situation", "priority": 6, "description": "监控异常区域",
+         "resources_needed": ["无人机"], "estimated_time": 20, "min_level": EventLevel.LOW},
+        {"action_type": "notify_authorities", "priority": 5, "description": "向相关部门报告异常",
+         "resources_needed": ["紧急服务"], "estimated_time": 2, "min_level": EventLevel.HIGH},
+    ],
+    EventType.LOGISTICS: [
+        {"action_type": "coordinate_resources", "priority": 6, "description": "协调物流无人机调整任务",
+         "resources_needed": ["无人机"], "estimated_time": 10, "min_level": EventLevel.LOW},
+        {"action_type": "monitor_situation", "priority": 4, "description": "跟踪物流任务执行情况",
+         "resources_needed": ["无人机"], "estimated_time": 20, "min_level": EventLevel.LOW},
+    ],
+    EventType.SYSTEM: [
+        {"action_type": "coordinate_resources", "priority": 5, "description": "协调受影响的无人机和任务",
+         "resources_needed": ["无人机"], "estimated_time": 10, "min_level": EventLevel.LOW},
+        {"action_type": "monitor_situation", "priority": 4, "description": "监控系统状态",
+         "resources_needed": [], "estimated_time": 20, "min_level": EventLevel.LOW},
+    ],
+}
+
+
+def severity_for(level: Any) -> str:
+    """事件级别对应的计划严重程度"""
+    try:
+        return SEVERITY_BY_LEVEL[EventLevel(level)]
+    except ValueError:
+        return "medium"
+
+
+def uses_template(level: Any) -> bool:
+    """该级别的事件是否先按模板计划行动（RESPONSE_TEMPLATE_LEVELS）"""
+    levels = {item.strip() for item in settings.RESPONSE_TEMPLATE_LEVELS.split(",") if item.strip()}
+    return getattr(level, "value", level) in levels
+
+
+def build_template_plan(event: Event) -> Dict[str, Any]:
+    """
+    按事件类型和级别生成模板响应计划
+
+    Returns:
+        与 ResponsePlan 结构相同的字典
+    """
+    level = EventLevel(event.level)
+    actions = [
+        {key: value for key, value in action.items() if key != "min_level"}
+        for action in TEMPLATE_ACTIONS.get(EventType(event.type), TEMPLATE_ACTIONS[EventType.EMERGENCY])
+        if _LEVEL_RANK[level] >= _LEVEL_RANK[action["min_level"]]
+    ]
+    return {
+        "situation_assessment": f"{event.title}：按{level.value}级{EventType(event.type).value}事件模板先行处置，等待详细评估",
+        "severity_level": severity_for(level),
+        "actions": actions,
+        "additional_notes": "模板计划，LLM细化计划到达后自动合并"
+    }
+
+
+def add_action(plan: Dict[str, Any], action: Dict[str, Any], actions_taken: List[str]):
+    """
+    向正在执行的计划中加入一个行动
+
+    已执行的行动类型忽略；同类型的未执行行动被替换；
+    未执行的行动按优先级从高到低排列，已执行的行动保持在前面。
+    """
+    action_type = action["action_type"]
+    if action_type in actions_taken:
+        return
+    done = [item for item in plan["actions"] if item["action_type"] in actions_taken]
+    pending = [
+        item for item in plan["actions"]
+        if item["action_type"] not in actions_taken and item["action_type"] != action_type
+    ]
+    pending.append(action)
+    pending.sort(key=lambda item: -item.get("priority", 0))
+    plan["actions"] = done + pending
+
+
+def merge_plan(current: Dict[str, Any], refined: Dict[str, Any], actions_taken: List[str]) -> Dict[str, Any]:
+    """
+    合并LLM细化计划和正在执行的计划
+
+    评估和严重程度以细化计划为准；已执行的行动保留，未执行的行动替换为细化计划中的行动。
+    """
+    merged = {**refined, "actions": [item for item in current["actions"] if item["action_type"] in actions_taken]}
+    for action in refined["actions"]:
+        add_action(merged, action, actions_taken)
+    return merged
+
+
+class StreamingPlanParser:
+    """
+    从流式输出中增量解析响应计划的行动
+
+    逐段喂入文本，定位 "actions" 数组后按括号深度（忽略字符串内的括号）
+    切分出每个完整的行动对象。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0  # 下一个待扫描的位置
+        self._array_start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start: Optional[int] = None
+        self._done = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """喂入一段文本，返回本段中完成的行动"""
+        self.text += chunk
+        if self._done:
+            return []
+
+        if self._array_start is None:
+            key = self.text.find('"actions"')
+            if key < 0:
+                return []
+            bracket = self.text.find("[", key)
+            if bracket < 0:
+                return []
+            self._array_start = self._pos = bracket + 1
+
+        actions = []
+        text = self.text
+        while self._pos < len(text):
+            char = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    try:
+                        actions.append(json.loads(text[self._object_start:self._pos + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._object_start = None
+            elif char == "]" and self._depth == 0:
+                self._done = True
+                self._pos += 1
+                break
+            self._pos += 1
+        return actions
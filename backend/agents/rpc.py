@@ -0,0 +1,171 @@
+"""
+智能体间的RPC
+
+查询不再经过目标智能体的普通消息队列：
+- 调用方为每个查询创建一个 Future，按 query_id 关联响应
+- 目标智能体立即为查询启动独立的处理协程，并发数受目标端 AGENT_RPC_MAX_CONCURRENCY 限制
+- 截止时间随查询传递，处理协程通过 remaining_time() 读取剩余时间，超时后被取消
+- 调用方超时或被取消时，目标端的处理协程同步取消
+- 响应直接完成调用方的 Future（回复通道），不在任何消息队列中排队
+"""
+import asyncio
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, TYPE_CHECKING
+
+from config.logging_config import get_logger
+from config.settings import settings
+from core.metrics import agent_query_seconds
+
+if TYPE_CHECKING:
+    from .base import BaseAgent
+
+logger = get_logger("agents.rpc")
+
+# 当前查询的截止时间（单调时钟），在查询处理协程中可见
+_deadline: ContextVar[Optional[float]] = ContextVar("agent_rpc_deadline", default=None)
+
+
+def remaining_time() -> Optional[float]:
+    """当前查询剩余的处理时间（秒），不在查询处理中时返回 None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+class RpcEndpoint:
+    """智能体的RPC端点，既作为调用方也作为服务方"""
+
+    def __init__(self, agent: "BaseAgent", max_concurrency: Optional[int] = None):
+        self.agent = agent
+        self.max_concurrency = max_concurrency or settings.AGENT_RPC_MAX_CONCURRENCY
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._pending: Dict[str, asyncio.Future] = {}  # 作为调用方等待的响应
+        self._inflight: Dict[str, asyncio.Task] = {}  # 作为服务方正在处理的查询
+
+        self.calls = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.served = 0
+        self.errors = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    # ---------- 调用方 ----------
+
+    async def call(self, target: "BaseAgent", query: str, data: Dict[str, Any],
+                   timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        向目标智能体发起查询并等待响应
+
+        Args:
+            target: 目标智能体
+            query: 查询名称
+            data: 查询参数
+            timeout: 超时时间（秒），默认 AGENT_RPC_TIMEOUT
+
+        Returns:
+            目标智能体 handle_query 的返回值；超时时为 {"success": False, "error": "Query timeout"}
+        """
+        timeout = timeout or settings.AGENT_RPC_TIMEOUT
+        query_id = str(uuid.uuid4())
+        deadline = time.monotonic() + timeout
+        future = asyncio.get_running_loop().create_future()
+        self._pending[query_id] = future
+        self.calls += 1
+        start_time = time.perf_counter()
+
+        target.rpc.serve(query_id, query, data, deadline, reply_to=self)
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            target.rpc.cancel(query_id)
+            logger.warning(f"查询智能体 {target.agent_id} 超时: {query}")
+            return {"success": False, "error": "Query timeout"}
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            target.rpc.cancel(query_id)
+            raise
+        finally:
+            self._pending.pop(query_id, None)
+            latency_ms = (time.perf_counter() - start_time) * 1000
+            self.total_latency_ms += latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+
+    def resolve(self, query_id: str, response: Dict[str, Any]):
+        """回复通道：直接完成调用方等待的 Future"""
+        future = self._pending.get(query_id)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    # ---------- 服务方 ----------
+
+    def serve(self, query_id: str, query: str, data: Dict[str, Any], deadline: float,
+              reply_to: "RpcEndpoint"):
+        """为查询启动独立的处理协程"""
+        task = asyncio.get_running_loop().create_task(
+            self._handle(query_id, query, data, deadline, reply_to)
+        )
+        self._inflight[query_id] = task
+
+    async def _handle(self, query_id: str, query: str, data: Dict[str, Any], deadline: float,
+                      reply_to: "RpcEndpoint"):
+        try:
+            # 等待处理名额的时间同样计入截止时间
+            await asyncio.wait_for(self._slots.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+            try:
+                _deadline.set(deadline)
+                with agent_query_seconds.time(self.agent.agent_type, query):
+                    response = await asyncio.wait_for(
+                        self.agent.handle_query(query, data),
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )
+                self.served += 1
+            finally:
+                self._slots.release()
+        except asyncio.TimeoutError:
+            response = {"success": False, "error": "Query deadline exceeded"}
+        except asyncio.CancelledError:
+            # 调用方已放弃，不再回复
+            return
+        except Exception as e:
+            self.errors += 1
+            self.agent.logger.error(f"处理查询 {query} 出错: {str(e)}")
+            response = {"success": False, "error": str(e)}
+        finally:
+            self._inflight.pop(query_id, None)
+
+        reply_to.resolve(query_id, response)
+
+    def cancel(self, query_id: str) -> bool:
+        """取消正在处理的查询"""
+        task = self._inflight.get(query_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def close(self):
+        """取消所有处理中的查询，并让等待中的调用立即返回"""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        for future in list(self._pending.values()):
+            if not future.done():
+                future.set_result({"success": False, "error": "Agent stopped"})
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "pending": len(self._pending),
+            "inflight": len(self._inflight),
+            "served": self.served,
+            "errors": self.errors,
+            "max_concurrency": self.max_concurrency,
+            "avg_latency_ms": self.total_latency_ms / self.calls if self.calls else 0.0,
+            "max_latency_ms": self.max_latency_ms
+        }
@@ -0,0 +1,136 @@
+"""
+多进程智能体运行时
+
+AGENT_RUNTIME=multiprocess 时，主进程只运行协调智能体和消息总线hub，
+监控、路径规划、物流、应急响应智能体按 AGENT_PROCESS_GROUPS 分组在独立进程中运行，
+各自占用一个CPU核心。工作进程启动方式：
+
+    python -m agents.runtime --agents monitor,planner --socket /tmp/skymind-agents.sock
+"""
+import argparse
+import asyncio
+import importlib
+import signal
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional
+
+from config.logging_config import get_logger
+from config.settings import settings
+
+logger = get_logger("agents.runtime")
+
+# 智能体名称 -> (模块, 创建函数)，在工作进程中按需导入
+AGENT_FACTORIES: Dict[str, Tuple[str, str]] = {
+    "monitor": ("agents.monitor", "create_monitor_agent"),
+    "planner": ("agents.planner", "create_planner_agent"),
+    "logistics": ("agents.logistics", "create_logistics_agent"),
+    "response": ("agents.response", "create_response_agent"),
+}
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def parse_process_groups(spec: Optional[str] = None) -> List[List[str]]:
+    """解析进程分组配置，例如 "monitor,planner;logistics;response" """
+    spec = spec if spec is not None else settings.AGENT_PROCESS_GROUPS
+    groups = []
+    for group in spec.split(";"):
+        names = [name.strip() for name in group.split(",") if name.strip()]
+        unknown = [name for name in names if name not in AGENT_FACTORIES]
+        if unknown:
+            raise ValueError(f"未知的智能体: {', '.join(unknown)}")
+        if names:
+            groups.append(names)
+    return groups
+
+
+async def create_agents(names: List[str]):
+    """在当前进程中创建并注册智能体"""
+    agents = []
+    for name in names:
+        module_name, factory_name = AGENT_FACTORIES[name]
+        factory = getattr(importlib.import_module(module_name), factory_name)
+        agents.append(await factory())
+    return agents
+
+
+async def spawn_workers(groups: List[List[str]], socket_path: Optional[str] = None) -> List[asyncio.subprocess.Process]:
+    """为每个进程分组启动一个智能体工作进程"""
+    socket_path = socket_path or settings.AGENT_BUS_SOCKET
+    processes = []
+    for names in groups:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "agents.runtime",
+            "--agents", ",".join(names),
+            "--socket", socket_path,
+            cwd=str(BACKEND_DIR)
+        )
+        logger.info(f"启动智能体工作进程 pid={process.pid}: {', '.join(names)}")
+        processes.append(process)
+    return processes
+
+
+async def stop_workers(processes: List[asyncio.subprocess.Process], timeout: float = 10.0):
+    """通知工作进程退出，超时后强制结束"""
+    for process in processes:
+        if process.returncode is None:
+            process.terminate()
+    for process in processes:
+        try:
+            await asyncio.wait_for(process.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"智能体工作进程 pid={process.pid} 未按时退出，强制结束")
+            process.kill()
+            await process.wait()
+
+
+async def run_worker(names: List[str], socket_path: str):
+    """工作进程入口：连接消息总线，运行分配到本进程的智能体"""
+    from database.mongodb import init_db
+    from services.fleet_state import fleet_state
+    from .bus import UnixSocketBus, set_message_bus
+    from .state_store import agent_state_store
+    from .log_sink import agent_log_sink
+
+    await init_db()
+    await fleet_state.start()
+
+    bus = UnixSocketBus(socket_path, role="worker")
+    set_message_bus(bus)
+    await bus.start()
+
+    agents = await create_agents(names)
+    await bus.announce()
+    tasks = [asyncio.create_task(agent.start()) for agent in agents]
+    logger.info(f"智能体工作进程已启动: {', '.join(names)}")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+    await stop_event.wait()
+
+    logger.info(f"智能体工作进程退出: {', '.join(names)}")
+    for agent in agents:
+        await agent.stop()
+    for task in tasks:
+        task.cancel()
+    await agent_state_store.stop()
+    await agent_log_sink.stop()
+    await fleet_state.stop()
+    await bus.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SkyMind 智能体工作进程")
+    parser.add_argument("--agents", required=True, help="本进程运行的智能体，逗号分隔")
+    parser.add_argument("--socket", default=settings.AGENT_BUS_SOCKET, help="消息总线Unix socket路径")
+    args = parser.parse_args()
+
+    names = parse_process_groups(args.agents.replace(";", ","))[0]
+    asyncio.run(run_worker(names, args.socket))
+
+
+if __name__ == "__main__":
+    main()
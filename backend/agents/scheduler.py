@@ -0,0 +1,240 @@
+"""
+协调智能体的任务调度器
+
+- 全局优先队列：按（有效优先级, 截止时间, 入队时间）排序，有效优先级随等待时间提升，避免低优先级任务饿死
+- 每次唤醒取出全部就绪任务，同一类型在一轮中连续出队超过 type_burst 个后让位给其他类型
+- 分配失败的任务按指数退避（带抖动）延后重试，不阻塞其他任务
+- 统计队列深度和等待时间直方图
+"""
+import heapq
+import itertools
+import random
+import time
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from config.settings import settings
+from database.models import Task
+
+# 直方图默认分桶（上界）
+WAIT_TIME_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)  # 秒
+QUEUE_DEPTH_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)  # 任务数
+
+
+class Histogram:
+    """累积分桶直方图"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        cumulative = list(itertools.accumulate(self.counts))
+        buckets = {str(bound): cumulative[i] for i, bound in enumerate(self.buckets)}
+        buckets["+Inf"] = cumulative[-1]
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+@dataclass(eq=False)
+class ScheduledTask:
+    """调度器中的任务条目"""
+    task: Task
+    task_id: str
+    task_type: str
+    priority: int
+    deadline: float  # 截止时间戳，没有截止时间为 inf
+    enqueued_at: float  # 首次入队的单调时钟时间
+    seq: int
+    attempts: int = 0
+    not_before: float = 0.0  # 退避结束时间
+    last_error: Optional[str] = field(default=None)
+
+
+class TaskScheduler:
+    """按优先级、截止时间和等待时间调度待分配任务"""
+
+    def __init__(self, aging_interval: Optional[float] = None, type_burst: Optional[int] = None,
+                 base_backoff: Optional[float] = None, max_backoff: Optional[float] = None):
+        self.aging_interval = aging_interval or settings.SCHEDULER_AGING_INTERVAL
+        self.type_burst = type_burst or settings.SCHEDULER_TYPE_BURST
+        self.base_backoff = base_backoff or settings.SCHEDULER_BASE_BACKOFF
+        self.max_backoff = max_backoff or settings.SCHEDULER_MAX_BACKOFF
+
+        self._entries: Dict[str, ScheduledTask] = {}
+        self._ready: List[ScheduledTask] = []  # 就绪任务，出队时按有效优先级排序
+        self._delayed: List[Tuple[float, int, str]] = []  # (not_before, seq, task_id)
+        self._seq = itertools.count()
+
+        self.wait_time = Histogram(WAIT_TIME_BUCKETS)
+        self.wait_time_by_type: Dict[str, Histogram] = {}
+        self.queue_depth = Histogram(QUEUE_DEPTH_BUCKETS)
+        self.assigned = 0
+        self.retries = 0
+
+    @staticmethod
+    def _deadline(task: Task) -> float:
+        """任务截止时间：优先使用 deadline 字段，其次是时间窗口结束时间"""
+        deadline = getattr(task, "deadline", None)
+        if deadline is None:
+            time_window = getattr(task, "time_window", None)
+            deadline = getattr(time_window, "end_time", None) if time_window else None
+        if isinstance(deadline, datetime):
+            return deadline.timestamp()
+        return float("inf")
+
+    def push(self, task: Task):
+        """加入待分配任务，已在队列中的任务只更新任务对象"""
+        entry = self._entries.get(task.task_id)
+        if entry is not None:
+            entry.task = task
+            entry.priority = task.priority
+            entry.deadline = self._deadline(task)
+            return
+
+        task_type = getattr(task.type, "value", task.type)
+        entry = ScheduledTask(
+            task=task,
+            task_id=task.task_id,
+            task_type=task_type,
+            priority=task.priority,
+            deadline=self._deadline(task),
+            enqueued_at=time.monotonic(),
+            seq=next(self._seq)
+        )
+        self._entries[task.task_id] = entry
+        self._ready.append(entry)
+
+    def get(self, task_id: str) -> Optional[Task]:
+        """队列中的任务，不在队列中时返回 None"""
+        entry = self._entries.get(task_id)
+        return entry.task if entry is not None else None
+
+    def reprioritize(self, task_id: str, priority: int) -> bool:
+        """更新队列中任务的优先级，下一次 drain 时生效"""
+        entry = self._entries.get(task_id)
+        if entry is None:
+            return False
+        entry.priority = priority
+        entry.task.priority = priority
+        return True
+
+    def remove(self, task_id: str) -> bool:
+        """移除任务（例如任务已被取消）"""
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return False
+        self._ready = [other for other in self._ready if other is not entry]
+        return True
+
+    def _sort_key(self, entry: ScheduledTask, now: float) -> Tuple:
+        # 优先级数值越大越紧急；每等待 aging_interval 秒有效优先级加1
+        effective = entry.priority + (now - entry.enqueued_at) / self.aging_interval
+        return (-effective, entry.deadline, entry.enqueued_at, entry.seq)
+
+    def _release_due(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            not_before, seq, task_id = heapq.heappop(self._delayed)
+            entry = self._entries.get(task_id)
+            # 忽略已移除或重新入队的任务留下的过期记录
+            if entry is not None and entry.seq == seq and entry.not_before == not_before:
+                self._ready.append(entry)
+
+    def drain(self) -> List[ScheduledTask]:
+        """
+        取出全部就绪任务，按调度顺序返回
+
+        每个任务之后必须调用 complete 或 backoff 之一。
+        """
+        now = time.monotonic()
+        self._release_due(now)
+        self.queue_depth.observe(len(self._entries))
+        if not self._ready:
+            return []
+
+        heap = [(self._sort_key(entry, now), entry) for entry in self._ready]
+        heapq.heapify(heap)
+        self._ready = []
+
+        remaining = Counter(entry.task_type for _, entry in heap)
+        ordered: List[ScheduledTask] = []
+        deferred: List[ScheduledTask] = []
+        served: Dict[str, int] = {}
+        while heap:
+            _, entry = heapq.heappop(heap)
+            remaining[entry.task_type] -= 1
+            # 同类型任务在本轮已占用 type_burst 个名额且仍有其他类型在等待时，让位到本轮末尾
+            others_waiting = sum(remaining.values()) - remaining[entry.task_type] > 0
+            if served.get(entry.task_type, 0) >= self.type_burst and others_waiting:
+                deferred.append(entry)
+                continue
+            served[entry.task_type] = served.get(entry.task_type, 0) + 1
+            ordered.append(entry)
+        return ordered + deferred
+
+    def complete(self, entry: ScheduledTask):
+        """任务已分配，记录等待时间"""
+        self._entries.pop(entry.task_id, None)
+        wait = time.monotonic() - entry.enqueued_at
+        self.wait_time.observe(wait)
+        histogram = self.wait_time_by_type.get(entry.task_type)
+        if histogram is None:
+            histogram = self.wait_time_by_type[entry.task_type] = Histogram(WAIT_TIME_BUCKETS)
+        histogram.observe(wait)
+        self.assigned += 1
+
+    def backoff(self, entry: ScheduledTask, error: Optional[str] = None) -> float:
+        """
+        任务暂时无法分配，按指数退避延后重试
+
+        Returns:
+            延后的秒数
+        """
+        if entry.task_id not in self._entries:
+            return 0.0
+        entry.attempts += 1
+        entry.last_error = error
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (entry.attempts - 1))
+        delay *= random.uniform(0.8, 1.2)
+        entry.not_before = time.monotonic() + delay
+        heapq.heappush(self._delayed, (entry.not_before, entry.seq, entry.task_id))
+        self.retries += 1
+        return delay
+
+    def next_due_in(self) -> Optional[float]:
+        """距离下一个退避任务到期的秒数，没有退避任务时返回 None"""
+        if self._ready:
+            return 0.0
+        while self._delayed and self._delayed[0][2] not in self._entries:
+            heapq.heappop(self._delayed)
+        if not self._delayed:
+            return None
+        return max(0.0, self._delayed[0][0] - time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        depth_by_type: Dict[str, int] = {}
+        for entry in self._entries.values():
+            depth_by_type[entry.task_type] = depth_by_type.get(entry.task_type, 0) + 1
+        return {
+            "queue_depth": len(self._entries),
+            "ready": len(self._ready),
+            "backing_off": len(self._entries) - len(self._ready),
+            "depth_by_type": depth_by_type,
+            "assigned": self.assigned,
+            "retries": self.retries,
+            "queue_depth_histogram": self.queue_depth.to_dict(),
+            "wait_time_histogram": self.wait_time.to_dict(),
+            "wait_time_by_type": {name: h.to_dict() for name, h in self.wait_time_by_type.items()}
+        }
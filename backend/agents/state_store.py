@@ -0,0 +1,144 @@
+"""
+智能体状态存储（写回式）
+
+智能体状态只在内存中更新，同一智能体在一个刷新周期内的多次变更合并为一次写入；
+后台任务按 AGENT_STATE_FLUSH_INTERVAL 把所有脏状态用一次 bulk_write（$set + upsert）
+写入 agent_states 集合。智能体停止时调用 flush 保证最终状态落库。
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from beanie.odm.utils.encoder import Encoder
+from pymongo import UpdateOne
+
+from config.logging_config import get_logger
+from config.settings import settings
+from database.models import AgentState
+from database.mongodb import get_collection
+
+logger = get_logger("agents.state_store")
+
+
+class AgentStateStore:
+    """合并智能体状态变更并批量写入数据库"""
+
+    def __init__(self, flush_interval: Optional[float] = None):
+        self.flush_interval = flush_interval if flush_interval is not None else settings.AGENT_STATE_FLUSH_INTERVAL
+        self._states: Dict[str, Dict[str, Any]] = {}  # 智能体最新状态
+        self._dirty: Dict[str, Dict[str, Any]] = {}  # 待写入的字段
+        self._agent_types: Dict[str, str] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._encoder = Encoder()
+
+        self.updates = 0
+        self.flushes = 0
+        self.documents_written = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def update(self, agent_id: str, agent_type: str, **fields: Any):
+        """
+        记录智能体状态变更，不访问数据库
+
+        Args:
+            agent_id: 智能体ID
+            agent_type: 智能体类型（仅在首次写入时设置）
+            fields: AgentState 字段
+        """
+        self._agent_types[agent_id] = agent_type
+        self._states.setdefault(agent_id, {}).update(fields)
+        self._dirty.setdefault(agent_id, {}).update(fields)
+        self.updates += 1
+        self._ensure_flusher()
+
+    def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """获取智能体在内存中的最新状态"""
+        state = self._states.get(agent_id)
+        if state is None:
+            return None
+        return {"agent_id": agent_id, "agent_type": self._agent_types.get(agent_id), **state}
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and not self._flusher.done():
+            return
+        try:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        except RuntimeError:
+            # 没有运行中的事件循环（例如同步脚本），等待显式 flush
+            pass
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        把所有脏状态写入数据库
+
+        Returns:
+            写入的文档数
+        """
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+
+            dirty, self._dirty = self._dirty, {}
+            start_time = time.perf_counter()
+            operations = [
+                UpdateOne(
+                    {"agent_id": agent_id},
+                    {
+                        "$set": self._encoder.encode(fields),
+                        "$setOnInsert": {"agent_type": self._agent_types.get(agent_id, "")}
+                    },
+                    upsert=True
+                )
+                for agent_id, fields in dirty.items()
+            ]
+
+            try:
+                await get_collection(AgentState).bulk_write(operations, ordered=False)
+            except Exception as e:
+                # 写入失败时把字段放回，写入期间产生的新值优先
+                for agent_id, fields in dirty.items():
+                    self._dirty[agent_id] = {**fields, **self._dirty.get(agent_id, {})}
+                self.failed_flushes += 1
+                logger.error(f"批量写入智能体状态失败: {str(e)}")
+                return 0
+
+            self.flushes += 1
+            self.documents_written += len(operations)
+            self.last_flush_ms = (time.perf_counter() - start_time) * 1000
+            return len(operations)
+
+    async def stop(self):
+        """停止后台刷新并写入剩余状态"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "agents": len(self._states),
+            "dirty": len(self._dirty),
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "documents_written": self.documents_written,
+            "coalesced_updates": max(0, self.updates - self.documents_written - len(self._dirty)),
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "last_updated": datetime.utcnow().isoformat()
+        }
+
+
+# 创建全局智能体状态存储实例
+agent_state_store = AgentStateStore()
@@ -0,0 +1,131 @@
+"""
+任务状态跟踪
+
+协调者和路径规划智能体每个周期都要确认所跟踪任务的最新状态，逐个 Task.find_one
+意味着跟踪 N 个任务就有 N 次往返。这里集中为批量查询：
+- 缓存超过 TASK_TRACKER_MAX_AGE 秒的任务在下一次 refresh 时用一次 $in 查询刷新，
+  只投影 task_id 和 status；每次查询不超过 TASK_TRACKER_BATCH_SIZE 个任务
+- 本进程内对已跟踪任务的写入（Task 文档的 Beanie 事件钩子）直接更新缓存，不需要查询；
+  缓存只包含 refresh 过、尚未 forget 的任务
+- 多个智能体共用全局实例，同一时间窗口内的刷新共用一次查询
+
+查询不到的任务视为已删除，状态为 None。
+"""
+import asyncio
+import time
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+from pydantic import BaseModel
+
+from config.logging_config import get_logger
+from config.settings import settings
+from database.models import Task, TaskStatus, TASK_CHANGE_LISTENERS
+
+logger = get_logger("agents.task_tracker")
+
+# 已结束的任务状态
+FINISHED_STATUSES = {TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value}
+
+
+class TaskStatusView(BaseModel):
+    """任务状态投影"""
+    task_id: str
+    status: TaskStatus
+
+
+def _status_value(status: Any) -> Optional[str]:
+    return getattr(status, "value", status)
+
+
+def is_finished(status: Any) -> bool:
+    """任务是否已结束（完成、失败或取消）"""
+    return _status_value(status) in FINISHED_STATUSES
+
+
+class TaskTracker:
+    """批量刷新的任务状态缓存"""
+
+    def __init__(self, max_age: Optional[float] = None, batch_size: Optional[int] = None):
+        self.max_age = max_age if max_age is not None else settings.TASK_TRACKER_MAX_AGE
+        self.batch_size = batch_size or settings.TASK_TRACKER_BATCH_SIZE
+        self._statuses: Dict[str, Tuple[Optional[str], float]] = {}  # task_id -> (状态, 更新时的单调时钟)
+        self._refresh_lock = asyncio.Lock()
+
+        self.refreshes = 0
+        self.queries = 0
+        self.queried_tasks = 0
+        self.cached_hits = 0
+        self.hook_updates = 0
+
+        TASK_CHANGE_LISTENERS.append(self._on_task_change)
+
+    def _on_task_change(self, task: Task, deleted: bool):
+        # 只更新已跟踪的任务，其他任务的写入不进入缓存
+        if task.task_id not in self._statuses:
+            return
+        self._statuses[task.task_id] = (None if deleted else _status_value(task.status), time.monotonic())
+        self.hook_updates += 1
+
+    def note(self, task_id: str, status: Any):
+        """记录已跟踪任务的已知状态（例如通过查询更新写入、不经过文档钩子的状态变化）"""
+        if task_id in self._statuses:
+            self._statuses[task_id] = (_status_value(status), time.monotonic())
+
+    def forget(self, task_ids: Iterable[str]):
+        """移除不再跟踪的任务"""
+        for task_id in task_ids:
+            self._statuses.pop(task_id, None)
+
+    def _stale(self, task_ids: List[str]) -> List[str]:
+        now = time.monotonic()
+        return [
+            task_id for task_id in task_ids
+            if task_id not in self._statuses or now - self._statuses[task_id][1] >= self.max_age
+        ]
+
+    async def refresh(self, task_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        获取任务的最新状态
+
+        Args:
+            task_ids: 要确认的任务ID
+
+        Returns:
+            {task_id: 状态值}，已删除的任务为 None
+        """
+        task_ids = list(task_ids)
+        self.refreshes += 1
+        stale = self._stale(task_ids)
+        self.cached_hits += len(task_ids) - len(stale)
+        if stale:
+            async with self._refresh_lock:
+                # 等锁期间其他调用方可能已经刷新
+                stale = self._stale(stale)
+                for start in range(0, len(stale), self.batch_size):
+                    await self._query(stale[start:start + self.batch_size])
+        return {task_id: self._statuses.get(task_id, (None, 0.0))[0] for task_id in task_ids}
+
+    async def _query(self, task_ids: List[str]):
+        started = time.monotonic()
+        views = await Task.find(
+            {"task_id": {"$in": task_ids}}, projection_model=TaskStatusView
+        ).to_list()
+        found = {view.task_id: _status_value(view.status) for view in views}
+        for task_id in task_ids:
+            self._statuses[task_id] = (found.get(task_id), started)
+        self.queries += 1
+        self.queried_tasks += len(task_ids)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "tracked": len(self._statuses),
+            "refreshes": self.refreshes,
+            "queries": self.queries,
+            "queried_tasks": self.queried_tasks,
+            "cached_hits": self.cached_hits,
+            "hook_updates": self.hook_updates
+        }
+
+
+# 创建全局任务状态跟踪实例
+task_tracker = TaskTracker()
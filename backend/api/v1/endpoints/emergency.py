@@ -7,6 +7,7 @@ from config.logging_config import get_logger
 from database.models import User, Event, Task, TaskType, TaskStatus, EventType, EventLevel, Location, GeoPoint
 from core.security import get_current_active_user
 from agents.coordinator import get_coordinator
+from agents.emergency_dispatch import emergency_dispatcher
 from agents.response import create_response_agent
 
 logger = get_logger("api.emergency")
@@ -166,6 +167,10 @@ async def report_emergency(
     
     logger.info(f"报告了紧急事件: {event.event_id}")
     
+    # 高级别事件直接派遣，不经过协调者的轮询
+    if emergency_dispatcher.applies(event) and await emergency_dispatcher.dispatch(event):
+        return event.dict()
+    
     # 通知协调者
     coordinator = await get_coordinator()
     await coordinator.message_queue.put({
@@ -1,14 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status, Body
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
+import asyncio
 import json
 
 from config.logging_config import get_logger
+from config.settings import settings
 from database.models import (
     User, Task, TaskType, TaskStatus, Drone, Location,
     GeoPoint, TimeWindow, FlightPath
 )
+from database.mongodb import get_active_no_fly_zones
 from core.security import get_current_active_user
+from services.path_planning import path_planning_service
 from agents.coordinator import get_coordinator
 from agents.logistics import create_logistics_agent
 
@@ -286,7 +290,8 @@ async def estimate_delivery_time(
         {
             "start_point": delivery_data["start_point"],
             "end_point": delivery_data["end_point"]
-        }
+        },
+        timeout=settings.AGENT_RPC_API_TIMEOUT
     )
     
     # 检查响应
@@ -314,36 +319,44 @@ async def plan_delivery_path(
                 detail=f"缺少必需字段: {field}"
             )
     
-    # 获取路径规划智能体
-    coordinator = await get_coordinator()
-    planner_agents = coordinator._get_agents_by_type("PathPlanningAgent")
+    # 直接使用与路径规划智能体共用的规划引擎（禁飞区、路网和缓存由智能体保持加载）
+    engine = path_planning_service.engine
+    if not engine.geofences.loaded:
+        # 路径规划智能体尚未加载禁飞区时从数据库加载，避免忽略禁飞区
+        engine.set_no_fly_zones(await get_active_no_fly_zones())
+    
+    result = await asyncio.to_thread(
+        engine.plan,
+        path_data["start_point"],
+        path_data["end_point"],
+        path_data.get("algorithm"),
+        path_data.get("altitude", 100.0)
+    )
     
-    if not planner_agents:
+    # 检查结果
+    if not result.get("success"):
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="没有可用的路径规划智能体"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"规划路径失败: {result.get('error', '未知错误')}"
         )
     
-    planner_agent = planner_agents[0]
-    
-    # 查询路径规划智能体
-    response = await coordinator.query_agent(
-        planner_agent.agent_id,
-        "plan_path",
-        {
-            "start_point": path_data["start_point"],
-            "end_point": path_data["end_point"]
-        }
-    )
-    
-    # 检查响应
-    if not response["success"]:
+    # 网格/RRT算法搜索失败时会回退为直线，直线穿过禁飞区时不能作为配送路径返回
+    waypoints = result["waypoints"]
+    if result.get("algorithm") == "direct" and engine.geofences.intersects_segment(waypoints[0], waypoints[-1]):
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"规划路径失败: {response.get('error', '未知错误')}"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="未找到绕开禁飞区的路径"
         )
     
-    return response
+    return {
+        "success": True,
+        "algorithm": result["algorithm"],
+        "path": {
+            "waypoints": result["waypoints"],
+            "distance": result["distance"],
+            "duration": result["duration"]
+        }
+    }
 
 # 检查无人机可用性
 @router.get("/drone-availability", response_model=Dict[str, Any])
@@ -368,7 +381,8 @@ async def check_drone_availability(
     response = await coordinator.query_agent(
         logistics_agent.agent_id,
         "get_drone_availability",
-        {"drone_id": drone_id} if drone_id else {}
+        {"drone_id": drone_id} if drone_id else {},
+        timeout=settings.AGENT_RPC_API_TIMEOUT
     )
     
     # 检查响应
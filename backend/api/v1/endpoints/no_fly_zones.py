@@ -6,8 +6,10 @@ from shapely.geometry import Polygon, Point
 
 from config.logging_config import get_logger
 from database.models import User, NoFlyZone, Drone, Task
+from database.mongodb import get_active_no_fly_zones
 from core.security import get_current_active_user
 from config.settings import settings
+from services.path_planning import path_planning_service
 
 logger = get_logger("api.no_fly_zones")
 
@@ -170,6 +172,9 @@ async def create_no_fly_zone(
     
     logger.info(f"创建了新禁飞区: {zone.zone_id}")
     
+    # 立即刷新路径规划引擎的禁飞区索引
+    await refresh_planning_geofences()
+    
     # 检查是否有无人机在该禁飞区内
     await check_drones_in_zone(zone)
     
@@ -283,6 +288,9 @@ async def update_no_fly_zone(
     
     logger.info(f"更新了禁飞区: {zone_id}")
     
+    # 立即刷新路径规划引擎的禁飞区索引
+    await refresh_planning_geofences()
+    
     # 检查是否有无人机在该禁飞区内
     await check_drones_in_zone(zone)
     
@@ -307,6 +315,9 @@ async def delete_no_fly_zone(
     await zone.delete()
     
     logger.info(f"删除了禁飞区: {zone_id}")
+    
+    # 立即刷新路径规划引擎的禁飞区索引
+    await refresh_planning_geofences()
 
 # 检查坐标是否在禁飞区内
 @router.post("/check", response_model=Dict[str, Any])
@@ -421,6 +432,14 @@ async def get_no_fly_zones_geojson(
     
     return geojson
 
+# 刷新路径规划禁飞区（辅助函数）
+async def refresh_planning_geofences():
+    """重新加载生效的禁飞区到路径规划引擎，禁飞区变化时引擎会清空规划缓存"""
+    try:
+        path_planning_service.set_no_fly_zones(await get_active_no_fly_zones())
+    except Exception as e:
+        logger.error(f"刷新路径规划禁飞区失败: {str(e)}")
+
 # 检查禁飞区内是否有无人机（辅助函数）
 async def check_drones_in_zone(zone: NoFlyZone):
     """检查是否有无人机在禁飞区内，并发出警告"""
@@ -2,10 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException, Query, status, Body, Requ
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import uuid  # 添加uuid库，用于生成唯一ID
+import asyncio
 
 from config.logging_config import get_logger
 from database.models import User, Task, TaskType, TaskStatus, Event, EventType, UserRole
 from core.security import get_current_active_user
+from services.coverage_planning import plan_coverage
 # 暂时注释掉agent导入
 # from agents.coordinator import get_coordinator
 # from agents.security import create_security_agent
@@ -14,6 +16,27 @@ logger = get_logger("api.security")
 
 router = APIRouter()
 
+async def _plan_patrol_routes(patrol_area: Dict[str, Any], assigned_drones: List[str],
+                              altitude: float) -> List[Dict[str, Any]]:
+    """为巡逻区域生成覆盖航线，按关联无人机数量均衡分带"""
+    try:
+        coverage = await asyncio.to_thread(
+            plan_coverage, patrol_area, max(len(assigned_drones), 1), altitude
+        )
+    except Exception as e:
+        logger.error(f"巡逻覆盖规划失败: {str(e)}")
+        return []
+    
+    if not coverage["success"]:
+        logger.warning(f"巡逻覆盖规划失败: {coverage.get('error')}")
+        return []
+    
+    routes = coverage["routes"]
+    for route in routes:
+        index = route["drone_index"]
+        route["drone_id"] = assigned_drones[index] if index < len(assigned_drones) else None
+    return routes
+
 # 获取安防巡检任务列表
 @router.get("/tasks", response_model=List[Dict[str, Any]])
 async def get_security_tasks(
@@ -288,6 +311,9 @@ async def create_patrol_task(
             assigned_drones=assigned_drones,
             
             patrol_area=patrol_area,
+            patrol_routes=await _plan_patrol_routes(
+                patrol_area, assigned_drones, task_data.get("altitude", 50)
+            ),
             priority=task_data.get("priority", 1),
             rounds=task_data.get("rounds", 1),
             altitude=task_data.get("altitude", 50),
@@ -308,6 +334,45 @@ async def create_patrol_task(
             detail=f"创建巡检任务失败: {str(e)}"
         )
 
+# 预览巡逻覆盖航线
+@router.post("/patrol-coverage", response_model=Dict[str, Any])
+async def preview_patrol_coverage(
+    coverage_data: Dict[str, Any] = Body(...),
+    current_user: User = Depends(get_current_active_user)
+):
+    """为巡逻区域生成覆盖航线（不保存），用于制定巡逻任务时预览"""
+    patrol_area = coverage_data.get("patrol_area") or coverage_data.get("patrolArea")
+    if not patrol_area:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="缺少巡逻区域信息"
+        )
+    
+    try:
+        result = await asyncio.to_thread(
+            plan_coverage,
+            patrol_area,
+            coverage_data.get("drone_count", 1),
+            coverage_data.get("altitude", 50),
+            coverage_data.get("spacing"),
+            coverage_data.get("start_point"),
+            coverage_data.get("options")
+        )
+    except Exception as e:
+        logger.error(f"巡逻覆盖规划失败: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"巡逻区域无效: {str(e)}"
+        )
+    
+    if not result["success"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result.get("error", "覆盖规划失败")
+        )
+    
+    return result
+
 # 获取巡逻任务详情
 @router.get("/patrol-tasks/{task_id}", response_model=Dict[str, Any])
 async def get_patrol_task(
@@ -412,6 +477,10 @@ async def update_patrol_task(
     for field, value in update_data.items():
         setattr(task, field, value)
     
+    # 区域、无人机或高度变化时重新生成覆盖航线
+    if {"patrol_area", "assigned_drones", "altitude"} & update_data.keys():
+        task.patrol_routes = await _plan_patrol_routes(task.patrol_area, task.assigned_drones, task.altitude)
+    
     # 保存更新
     try:
         await task.save()
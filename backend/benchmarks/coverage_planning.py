@@ -0,0 +1,125 @@
+"""
+巡逻覆盖规划基准测试
+
+在一组合成巡逻区域上运行 plan_coverage，覆盖不同的无人机数量、飞行高度和扫描方向，
+记录规划延迟和覆盖率。规划出错或失败的组合计入失败数，任何失败都以退出码1结束，
+可作为覆盖规划的回归检查。其中的U形区域在扫描线横穿两臂时，同一行上的两段扫描线
+会沿同一条直线折返，曾导致转弯平滑时除零。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.coverage_planning
+    python -m benchmarks.coverage_planning --areas u_shape --output bench_coverage.json
+"""
+import os
+
+# 基准测试期间只输出警告以上日志，避免规划日志刷屏（需在导入配置前设置）
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+from config.logging_config import get_logger
+from config.settings import settings
+from services.coverage_planning import plan_coverage
+
+logger = get_logger("benchmarks.coverage_planning")
+
+DRONE_COUNTS = (1, 2, 3, 4)
+ALTITUDES = (30.0, 50.0, 80.0, 120.0)
+SWEEP_ANGLES = (None, 0.0, 45.0, 90.0)  # None 表示沿区域长轴
+
+
+def _ring(points: List[List[float]]) -> List[List[float]]:
+    """以城市中心为原点的相对坐标（度）转换为闭合坐标环"""
+    lon0 = settings.DEFAULT_CITY_CENTER["lon"]
+    lat0 = settings.DEFAULT_CITY_CENTER["lat"]
+    ring = [[lon0 + dx, lat0 + dy] for dx, dy in points]
+    return ring + [ring[0]]
+
+
+def build_areas() -> Dict[str, List[List[float]]]:
+    """合成巡逻区域：名称 -> 坐标环"""
+    return {
+        "rectangle": _ring([[0, 0], [0.006, 0], [0.006, 0.003], [0, 0.003]]),
+        "l_shape": _ring([[0, 0], [0.006, 0], [0.006, 0.002], [0.002, 0.002], [0.002, 0.006], [0, 0.006]]),
+        # 两臂宽0.001°、间隙0.0005°：沿0°扫描时同一行上有两段扫描线，航线沿同一直线折返
+        "u_shape": _ring([
+            [0, 0], [0.0025, 0], [0.0025, 0.004], [0.0015, 0.004],
+            [0.0015, 0.001], [0.001, 0.001], [0.001, 0.004], [0, 0.004]
+        ]),
+        "thin_strip": _ring([[0, 0], [0.01, 0], [0.01, 0.0004], [0, 0.0004]]),
+    }
+
+
+def run_area(name: str, area: List[List[float]]) -> Dict[str, Any]:
+    """在一个区域上运行全部参数组合，返回汇总指标"""
+    latencies, coverages = [], []
+    failures = []
+    for drone_count in DRONE_COUNTS:
+        for altitude in ALTITUDES:
+            for angle in SWEEP_ANGLES:
+                options = {} if angle is None else {"angle": angle}
+                case = {"drones": drone_count, "altitude": altitude, "angle": angle}
+                begin = time.perf_counter()
+                try:
+                    result = plan_coverage(area, drone_count, altitude, options=options)
+                except Exception as e:
+                    failures.append({**case, "error": f"{type(e).__name__}: {str(e)}"})
+                    continue
+                latencies.append((time.perf_counter() - begin) * 1000)
+                if not result["success"]:
+                    failures.append({**case, "error": result.get("error", "未知错误")})
+                    continue
+                coverages.append(result["coverage"])
+
+    runs = len(DRONE_COUNTS) * len(ALTITUDES) * len(SWEEP_ANGLES)
+    for failure in failures:
+        logger.warning(f"{name} 覆盖规划失败: {failure}")
+    return {
+        "runs": runs,
+        "failures": failures,
+        "latency_ms": {
+            "p50": float(np.percentile(latencies, 50)) if latencies else 0.0,
+            "max": max(latencies) if latencies else 0.0
+        },
+        "coverage": {
+            "mean": float(np.mean(coverages)) if coverages else 0.0,
+            "min": min(coverages) if coverages else 0.0
+        }
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    areas = build_areas()
+    parser = argparse.ArgumentParser(description="SkyMind 巡逻覆盖规划基准测试")
+    parser.add_argument("--areas", nargs="*", choices=list(areas.keys()), help="要运行的区域，默认全部")
+    parser.add_argument("--output", help="JSON报告输出路径")
+    args = parser.parse_args(argv)
+
+    report = {"areas": {}}
+    total_failures = 0
+    print(f"{'区域':<14}{'组合':>6}{'失败':>6}{'p50(ms)':>10}{'最大(ms)':>10}{'覆盖率均值':>12}{'最低':>8}")
+    for name in args.areas or list(areas.keys()):
+        metrics = run_area(name, areas[name])
+        report["areas"][name] = metrics
+        total_failures += len(metrics["failures"])
+        print(
+            f"{name:<14}{metrics['runs']:>6}{len(metrics['failures']):>6}"
+            f"{metrics['latency_ms']['p50']:>10.2f}{metrics['latency_ms']['max']:>10.2f}"
+            f"{metrics['coverage']['mean']:>12.1%}{metrics['coverage']['min']:>8.1%}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入: {args.output}")
+    return 1 if total_failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+"""
+应急响应LLM链路基准测试
+
+启动本地模拟LLM服务器（services.llm_mock_server），在合成机队上构造 N 个并发事件，
+全部通过 ResponseAgent 的提示词构造、LLM管道和计划解析生成响应计划，
+记录计划延迟和首个行动延迟的分位数、管道排队时间、令牌用量和估算费用，
+输出可在不同提交之间对比的JSON报告。与响应智能体一样传入 on_action，
+RESPONSE_PLAN_STREAMING 开启（默认）时测量的是流式路径。
+不需要数据库和OpenAI密钥。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.llm_response --incidents 200 --profile gpt4 --output bench_llm.json
+    python -m benchmarks.llm_response --incidents 200 --concurrency 20 --cache
+    python -m benchmarks.llm_response --base-url http://127.0.0.1:8765/v1   # 使用已启动的服务器
+    python -m benchmarks.llm_response --output new.json --compare old.json --threshold 0.2
+"""
+import os
+
+# 基准测试期间只输出警告以上日志（需在导入配置前设置）
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+from config.logging_config import get_logger
+from config.settings import settings
+from database.models import (
+    Event, Drone, EventType, EventLevel, Location, GeoPoint, BoundingBox, DroneStatus
+)
+from services.fleet_state import fleet_state
+from services.llm_cache import llm_response_cache
+from services.llm_mock_server import PROFILES
+from services.llm_pipeline import LLMPipeline
+from services.llm_service import LLMService
+from agents.response import ResponseAgent
+
+logger = get_logger("benchmarks.llm_response")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# 合成事件的检测类别
+DETECTION_CLASSES = ["person", "car", "bicycle", "truck", "motorcycle"]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": _percentile(values, 50),
+        "p90": _percentile(values, 90),
+        "p99": _percentile(values, 99),
+        "mean": float(np.mean(values)) if values else 0.0,
+        "max": max(values) if values else 0.0
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+async def start_mock_server(profile: str, port: int, timeout: float = 15.0) -> subprocess.Popen:
+    """在子进程中启动模拟LLM服务器，等待端口可连接"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "services.llm_mock_server", "--profile", profile, "--port", str(port)],
+        cwd=str(BACKEND_DIR)
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"模拟LLM服务器启动失败，退出码 {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return process
+        except OSError:
+            await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("等待模拟LLM服务器启动超时")
+
+
+def _fetch_json(url: str) -> Optional[Dict[str, Any]]:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except Exception:
+        return None
+
+
+def build_fleet(count: int, rng: random.Random) -> List[Drone]:
+    """在城市中心附近生成空闲无人机并写入机队状态"""
+    center = settings.DEFAULT_CITY_CENTER
+    drones = []
+    for index in range(count):
+        drone = Drone.model_construct(
+            drone_id=f"bench-drone-{index:05d}",
+            name=f"基准无人机{index}",
+            model=rng.choice(["DJI M300", "DJI M30", "Autel EVO"]),
+            status=DroneStatus.IDLE,
+            battery_level=rng.uniform(15, 100),
+            current_location=GeoPoint(coordinates=[
+                center["lon"] + rng.uniform(-0.1, 0.1),
+                center["lat"] + rng.uniform(-0.1, 0.1)
+            ]),
+            max_flight_time=30.0,
+            max_speed=15.0,
+            max_altitude=120.0,
+            camera_equipped=True,
+            payload_capacity=rng.choice([0.0, 2.0, 5.0]),
+            assigned_tasks=[]
+        )
+        fleet_state.apply(drone)
+        drones.append(drone)
+    return drones
+
+
+def build_incidents(count: int, rng: random.Random, distinct: Optional[int] = None) -> List[Event]:
+    """
+    生成合成事件
+
+    Args:
+        distinct: 不同事件特征的数量，设置后事件在这些特征中重复出现（用于测量缓存命中）
+    """
+    center = settings.DEFAULT_CITY_CENTER
+    types = [EventType.EMERGENCY, EventType.SECURITY, EventType.ANOMALY]
+    levels = [EventLevel.LOW, EventLevel.MEDIUM, EventLevel.HIGH]
+
+    def features(feature_rng: random.Random) -> Dict[str, Any]:
+        detections = feature_rng.randint(1, 40)
+        return {
+            "type": feature_rng.choice(types),
+            "level": feature_rng.choice(levels),
+            "lon": center["lon"] + feature_rng.uniform(-0.1, 0.1),
+            "lat": center["lat"] + feature_rng.uniform(-0.1, 0.1),
+            "boxes": [
+                (feature_rng.choice(DETECTION_CLASSES), feature_rng.uniform(0.5, 0.99))
+                for _ in range(detections)
+            ]
+        }
+
+    pool = [features(random.Random(rng.random())) for _ in range(distinct)] if distinct else None
+    incidents = []
+    for index in range(count):
+        item = rng.choice(pool) if pool else features(rng)
+        incidents.append(Event.model_construct(
+            event_id=f"bench-event-{index:05d}",
+            type=item["type"],
+            level=item["level"],
+            title=f"基准事件{index}",
+            description="摄像头检测到异常情况，需要评估并制定响应计划",
+            location=Location(position=GeoPoint(coordinates=[item["lon"], item["lat"]])),
+            detected_at=datetime.utcnow(),
+            detected_by="benchmark",
+            status="new",
+            detection_data={"source_id": f"camera-{index % 20}"},
+            video_source=None,
+            image_evidence=[],
+            bounding_boxes=[
+                BoundingBox(x1=0, y1=0, x2=10, y2=10, confidence=confidence,
+                            class_id=DETECTION_CLASSES.index(name), class_name=name)
+                for name, confidence in item["boxes"]
+            ]
+        ))
+    return incidents
+
+
+class _RecordingPipeline(LLMPipeline):
+    """记录每次请求结果的LLM管道"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.results: List[Dict[str, Any]] = []
+
+    async def chat(self, *args, **kwargs) -> Dict[str, Any]:
+        result = await super().chat(*args, **kwargs)
+        self.results.append(result)
+        return result
+
+    async def stream(self, *args, **kwargs):
+        # 流式请求的统计写入 stats，流结束后记为一次结果
+        stats = kwargs.setdefault("stats", {})
+        try:
+            async for chunk in super().stream(*args, **kwargs):
+                yield chunk
+        except Exception as e:
+            self.results.append({**stats, "success": False, "error": str(e) or type(e).__name__})
+            raise
+        self.results.append({**stats, "success": True})
+
+
+async def run_incidents(agent: ResponseAgent, incidents: List[Event]) -> Dict[str, Any]:
+    """所有事件同时开始生成响应计划，返回每个事件的延迟和结果"""
+    latencies: List[float] = []
+    first_actions: List[float] = []
+    failures: List[str] = []
+
+    async def handle(event: Event):
+        begin = time.perf_counter()
+        first_action: List[float] = []
+
+        def on_action(action: Dict[str, Any]):
+            # 与响应智能体一样传入 on_action，开启 RESPONSE_PLAN_STREAMING 时走流式路径
+            if not first_action:
+                first_action.append((time.perf_counter() - begin) * 1000)
+
+        try:
+            await agent._request_plan(agent._build_llm_input(event), event, on_action=on_action)
+        except Exception as e:
+            failures.append(f"{type(e).__name__}: {str(e)}")
+            return
+        latencies.append((time.perf_counter() - begin) * 1000)
+        # 非流式路径（或缓存命中）在完整计划到达时才能开始第一个行动
+        first_actions.append(first_action[0] if first_action else latencies[-1])
+
+    begin = time.perf_counter()
+    await asyncio.gather(*(handle(event) for event in incidents))
+    return {
+        "latencies": latencies,
+        "first_actions": first_actions,
+        "failures": failures,
+        "wall_s": time.perf_counter() - begin
+    }
+
+
+async def run_benchmark(incidents: int = 100, profile: str = "gpt4", concurrency: Optional[int] = None,
+                        drones: int = 1000, use_cache: bool = False, distinct: Optional[int] = None,
+                        base_url: Optional[str] = None, port: int = 8765, seed: int = 42,
+                        prompt_price: float = 0.03, completion_price: float = 0.06) -> Dict[str, Any]:
+    """运行基准测试并返回报告字典"""
+    rng = random.Random(seed)
+    server = None
+    if base_url is None:
+        server = await start_mock_server(profile, port)
+        base_url = f"http://127.0.0.1:{port}/v1"
+
+    try:
+        if not use_cache:
+            llm_response_cache.max_size = 0
+        llm_response_cache.path = None
+
+        build_fleet(drones, rng)
+        events = build_incidents(incidents, rng, distinct)
+
+        pipeline = _RecordingPipeline(LLMService(model="mock", base_url=base_url), max_concurrency=concurrency)
+        agent = ResponseAgent(llm=pipeline)
+        await agent._initialize_llm()
+
+        outcome = await run_incidents(agent, events)
+        server_metrics = _fetch_json(base_url.rsplit("/v1", 1)[0] + "/metrics")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    results = [result for result in pipeline.results if result["success"]]
+    prompt_tokens = sum(result.get("prompt_tokens", 0) for result in results)
+    completion_tokens = sum(result.get("completion_tokens", 0) for result in results)
+    requests = len(results)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": seed,
+            "incidents": incidents,
+            "distinct_incidents": distinct,
+            "drones": drones,
+            "profile": profile if server is not None else None,
+            "base_url": base_url,
+            "pipeline_concurrency": pipeline.max_concurrency,
+            "cache": use_cache,
+            "streaming": settings.RESPONSE_PLAN_STREAMING
+        },
+        "plan_latency_ms": _summary(outcome["latencies"]),
+        "first_action_ms": _summary(outcome["first_actions"]),
+        "queue_ms": _summary([result["queue_ms"] for result in pipeline.results if "queue_ms" in result]),
+        "llm_latency_ms": _summary([result["latency_ms"] for result in results]),
+        "throughput_per_s": len(outcome["latencies"]) / outcome["wall_s"] if outcome["wall_s"] else 0.0,
+        "failures": len(outcome["failures"]),
+        "failure_samples": outcome["failures"][:5],
+        "tokens": {
+            "requests": requests,
+            "prompt": prompt_tokens,
+            "completion": completion_tokens,
+            "prompt_per_request": prompt_tokens / requests if requests else 0.0,
+            "completion_per_request": completion_tokens / requests if requests else 0.0,
+            "estimated_cost_usd": prompt_tokens / 1000 * prompt_price + completion_tokens / 1000 * completion_price
+        },
+        "pipeline": pipeline.get_metrics(),
+        "prompt": agent.context_builder.get_metrics(),
+        "cache": {**llm_response_cache.get_metrics(), "coalesced": agent.coalesced_plans},
+        "server": server_metrics
+    }
+
+
+def compare_reports(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """对比两份报告，打印差异并返回超过阈值的回归列表"""
+    regressions = []
+    rows = [
+        ("plan p50 (ms)", old["plan_latency_ms"]["p50"], new["plan_latency_ms"]["p50"]),
+        ("plan p99 (ms)", old["plan_latency_ms"]["p99"], new["plan_latency_ms"]["p99"]),
+        ("first action p99 (ms)", old.get("first_action_ms", old["plan_latency_ms"])["p99"],
+         new["first_action_ms"]["p99"]),
+        ("queue p99 (ms)", old["queue_ms"]["p99"], new["queue_ms"]["p99"]),
+        ("prompt tokens/req", old["tokens"]["prompt_per_request"], new["tokens"]["prompt_per_request"]),
+    ]
+    print(f"{'指标':<24}{'旧':>14}{'新':>14}")
+    for name, old_value, new_value in rows:
+        print(f"{name:<24}{old_value:>14.1f}{new_value:>14.1f}")
+        if old_value > 0 and (new_value - old_value) / old_value > threshold:
+            regressions.append(f"{name}: {old_value:.1f} → {new_value:.1f}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="SkyMind 应急响应LLM链路基准测试")
+    parser.add_argument("--incidents", type=int, default=100, help="并发事件数")
+    parser.add_argument("--profile", default="gpt4", choices=list(PROFILES.keys()), help="模拟服务器的延迟/吞吐画像")
+    parser.add_argument("--concurrency", type=int, help="LLM管道并发上限，默认 LLM_MAX_CONCURRENCY")
+    parser.add_argument("--drones", type=int, default=1000, help="合成机队规模")
+    parser.add_argument("--cache", action="store_true", help="启用LLM响应缓存")
+    parser.add_argument("--distinct", type=int, help="不同事件特征的数量，配合 --cache 测量命中率")
+    parser.add_argument("--base-url", help="使用已启动的兼容OpenAI接口的服务，不启动模拟服务器")
+    parser.add_argument("--port", type=int, default=8765, help="模拟服务器端口")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--prompt-price", type=float, default=0.03, help="每千个提示令牌的价格（美元）")
+    parser.add_argument("--completion-price", type=float, default=0.06, help="每千个生成令牌的价格（美元）")
+    parser.add_argument("--output", default="bench_llm.json", help="JSON报告输出路径")
+    parser.add_argument("--compare", help="与之对比的旧报告路径")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回归阈值（比例）")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(
+        args.incidents, args.profile, args.concurrency, args.drones, args.cache, args.distinct,
+        args.base_url, args.port, args.seed, args.prompt_price, args.completion_price
+    ))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    latency = report["plan_latency_ms"]
+    print(
+        f"计划延迟 p50 {latency['p50']:.0f}ms / p99 {latency['p99']:.0f}ms，"
+        f"首个行动 p99 {report['first_action_ms']['p99']:.0f}ms，"
+        f"排队 p99 {report['queue_ms']['p99']:.0f}ms，失败 {report['failures']}，"
+        f"令牌 {report['tokens']['prompt'] + report['tokens']['completion']}，"
+        f"估算费用 ${report['tokens']['estimated_cost_usd']:.2f}"
+    )
+    print(f"报告已写入: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old_report = json.load(f)
+        regressions = compare_reports(old_report, report, args.threshold)
+        if regressions:
+            print("发现回归:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""
+路径规划基准测试
+
+在合成空域场景上运行 PathPlanningService 的全部算法以及路径规划智能体的图搜索规划器，
+记录延迟分位数、节点扩展数、峰值内存、路径长度和航点数，输出可在不同提交之间对比的JSON报告。
+全部离线运行，只使用CPU。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.path_planning --output bench_planning.json
+    python -m benchmarks.path_planning --scenarios dense_downtown corridor_maze --repeats 3
+    python -m benchmarks.path_planning --output new.json --compare old.json --threshold 0.2
+"""
+import os
+
+# 基准测试期间只输出警告以上日志，避免规划日志刷屏（需在导入配置前设置）
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable
+
+import numpy as np
+import networkx as nx
+from shapely.geometry import LineString, Polygon
+from shapely.ops import unary_union
+
+from config.logging_config import get_logger
+from benchmarks.scenarios import PlanningScenario, build_scenarios, SCENARIOS
+from services.path_planning import PathPlanningService
+
+logger = get_logger("benchmarks.path_planning")
+
+# 图规划器使用的合成路网最多节点数（每边）
+GRAPH_MAX_SIDE = 50
+
+
+def _haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """大圆距离（米）"""
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * math.asin(math.sqrt(a)) * 6371000
+
+
+def _path_length(coords: List[List[float]]) -> float:
+    return sum(
+        _haversine(coords[i][1], coords[i][0], coords[i + 1][1], coords[i + 1][0])
+        for i in range(len(coords) - 1)
+    )
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+class _CountingGraph(nx.Graph):
+    """统计 neighbors() 调用次数的无向图，用于度量图搜索的节点扩展数"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expansions = 0
+
+    def neighbors(self, n):
+        self.expansions += 1
+        return super().neighbors(n)
+
+
+def build_city_graph(scenario: PlanningScenario) -> _CountingGraph:
+    """为场景构建合成路网（规则网格，节点带 x/y 属性，边带 length 属性，与OSM路网结构一致）"""
+    min_lon, min_lat, max_lon, max_lat = scenario.bounds
+    side = GRAPH_MAX_SIDE
+    lons = np.linspace(min_lon, max_lon, side)
+    lats = np.linspace(min_lat, max_lat, side)
+
+    graph = _CountingGraph()
+    for i, lon in enumerate(lons):
+        for j, lat in enumerate(lats):
+            graph.add_node(i * side + j, x=float(lon), y=float(lat))
+
+    for i in range(side):
+        for j in range(side):
+            node = i * side + j
+            for di, dj in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                ni, nj = i + di, j + dj
+                if 0 <= ni < side and 0 <= nj < side:
+                    other = ni * side + nj
+                    length = _haversine(lats[j], lons[i], lats[nj], lons[ni])
+                    graph.add_edge(node, other, length=length)
+
+    graph.node_xy = np.array([[graph.nodes[n]["x"], graph.nodes[n]["y"]] for n in graph.nodes])
+    graph.node_ids = list(graph.nodes)
+    return graph
+
+
+class PlannerRunner:
+    """一个被测规划器：run(start, end) 返回标准化结果"""
+
+    def __init__(self, name: str, kind: str, run: Callable):
+        self.name = name
+        self.kind = kind
+        self.run = run
+
+
+def service_runners(service: PathPlanningService) -> List[PlannerRunner]:
+    """PathPlanningService 的全部算法"""
+    runners = []
+    for algorithm in ("astar", "dijkstra", "rrt"):
+        def run(start, end, algorithm=algorithm):
+            result = service.plan_path(start, end, algorithm=algorithm, use_cache=False)
+            return {
+                "coords": [wp[:2] for wp in result["waypoints"]],
+                "distance": result["distance"],
+                "expansions": result.get("iterations", 0),
+                "fallback": result.get("algorithm") == "direct"
+            }
+        runners.append(PlannerRunner(f"service.{algorithm}", "service", run))
+    return runners
+
+
+def agent_runners(service: PathPlanningService, graph: _CountingGraph) -> List[PlannerRunner]:
+    """路径规划智能体使用的路网规划器（引擎中的路网A* 和禁飞区绕行 Dijkstra）"""
+    engine = service.engine
+    engine.set_graph(graph)
+
+    def runner(algorithm):
+        def run(start, end):
+            graph.expansions = 0
+            result = engine.plan(start, end, algorithm=algorithm, use_cache=False)
+            coords = [wp[:2] for wp in result.get("waypoints", [])]
+            return {
+                "coords": coords,
+                "distance": result.get("distance", 0.0),
+                "expansions": result.get("iterations", 0) + graph.expansions,
+                "fallback": not result.get("success")
+            }
+        return run
+
+    return [
+        PlannerRunner("agent.graph_astar", "agent", runner("graph_astar")),
+        PlannerRunner("agent.graph_detour", "agent", runner("graph_detour")),
+    ]
+
+
+async def _call(runner: PlannerRunner, start, end) -> Dict[str, Any]:
+    result = runner.run(start, end)
+    if asyncio.iscoroutine(result):
+        result = await result
+    return result
+
+
+async def run_planner(runner: PlannerRunner, scenario: PlanningScenario,
+                      forbidden, repeats: int, seed: int) -> Dict[str, Any]:
+    """在场景的全部查询上运行一个规划器，返回汇总指标"""
+    latencies, expansions, lengths, waypoints = [], [], [], []
+    failures = fallbacks = violations = runs = 0
+    peak_memory = 0
+
+    for query_index, (start, end) in enumerate(scenario.queries):
+        # 单独一次带 tracemalloc 的运行用于测量峰值内存，避免追踪开销污染延迟数据
+        random.seed(seed + query_index)
+        np.random.seed(seed + query_index)
+        tracemalloc.start()
+        try:
+            await _call(runner, start, end)
+        except Exception:
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_memory = max(peak_memory, peak)
+
+        for repeat in range(repeats):
+            random.seed(seed + query_index)
+            np.random.seed(seed + query_index)
+            runs += 1
+            begin = time.perf_counter()
+            try:
+                result = await _call(runner, start, end)
+            except Exception as e:
+                failures += 1
+                logger.warning(f"{runner.name} 在 {scenario.name} 上出错: {str(e)}")
+                continue
+            latencies.append((time.perf_counter() - begin) * 1000)
+
+            coords = result["coords"]
+            if not coords:
+                failures += 1
+                continue
+            expansions.append(result["expansions"])
+            lengths.append(result["distance"])
+            waypoints.append(len(coords))
+            if result["fallback"]:
+                fallbacks += 1
+            if forbidden is not None and len(coords) >= 2 and LineString(coords).intersects(forbidden):
+                violations += 1
+
+    return {
+        "runs": runs,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p90": _percentile(latencies, 90),
+            "p99": _percentile(latencies, 99),
+            "mean": float(np.mean(latencies)) if latencies else 0.0,
+            "max": max(latencies) if latencies else 0.0
+        },
+        "node_expansions": {
+            "mean": float(np.mean(expansions)) if expansions else 0.0,
+            "max": int(max(expansions)) if expansions else 0
+        },
+        "peak_memory_kb": peak_memory / 1024,
+        "path_length_m": {
+            "mean": float(np.mean(lengths)) if lengths else 0.0,
+            "max": max(lengths) if lengths else 0.0
+        },
+        "waypoints": {
+            "mean": float(np.mean(waypoints)) if waypoints else 0.0,
+            "max": max(waypoints) if waypoints else 0
+        },
+        "failure_rate": failures / runs if runs else 0.0,
+        "fallback_rate": fallbacks / runs if runs else 0.0,
+        "violation_rate": violations / runs if runs else 0.0
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+async def run_benchmark(scenario_names: Optional[List[str]] = None, repeats: int = 5,
+                        seed: int = 42, include_agent: bool = True,
+                        queries: Optional[int] = None, accelerator: Optional[str] = None) -> Dict[str, Any]:
+    """运行基准测试并返回报告字典，accelerator 指定网格搜索后端（默认按配置选择）"""
+    def make_service() -> PathPlanningService:
+        service = PathPlanningService()
+        if accelerator:
+            service.accelerator = service._select_accelerator(accelerator)
+        return service
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": seed,
+            "repeats": repeats,
+            "queries": queries,
+            "accelerator": make_service().accelerator
+        },
+        "scenarios": {}
+    }
+
+    for scenario in build_scenarios(scenario_names, seed, queries):
+        logger.warning(f"运行场景: {scenario.name} ({scenario.description})")
+
+        service = make_service()
+        service.warmup()
+        service.set_no_fly_zones(scenario.no_fly_zones)
+
+        forbidden = None
+        if scenario.no_fly_zones:
+            forbidden = unary_union([Polygon(z["geometry"]["coordinates"][0]) for z in scenario.no_fly_zones])
+
+        runners = service_runners(service)
+        if include_agent:
+            runners += agent_runners(service, build_city_graph(scenario))
+
+        scenario_report = {
+            "description": scenario.description,
+            "params": scenario.params,
+            "queries": len(scenario.queries),
+            "zones": len(scenario.no_fly_zones),
+            "planners": {}
+        }
+        for runner in runners:
+            scenario_report["planners"][runner.name] = await run_planner(
+                runner, scenario, forbidden, repeats, seed
+            )
+        report["scenarios"][scenario.name] = scenario_report
+
+    return report
+
+
+def compare_reports(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """对比两份报告，打印差异并返回超过阈值的延迟回归列表"""
+    regressions = []
+    old_accelerator = old.get("meta", {}).get("accelerator")
+    new_accelerator = new.get("meta", {}).get("accelerator")
+    if old_accelerator != new_accelerator:
+        print(f"注意：两份报告的网格搜索后端不同（{old_accelerator} → {new_accelerator}），延迟不可直接对比")
+    print(f"{'场景/规划器':<40}{'p50(ms) 旧→新':>24}{'路径(m) 旧→新':>26}{'违规率 旧→新':>18}")
+    for scenario_name, scenario in new["scenarios"].items():
+        old_scenario = old.get("scenarios", {}).get(scenario_name)
+        if not old_scenario:
+            continue
+        for planner, metrics in scenario["planners"].items():
+            old_metrics = old_scenario["planners"].get(planner)
+            if not old_metrics:
+                continue
+            old_p50 = old_metrics["latency_ms"]["p50"]
+            new_p50 = metrics["latency_ms"]["p50"]
+            print(
+                f"{scenario_name + '/' + planner:<40}"
+                f"{old_p50:>11.2f} → {new_p50:<10.2f}"
+                f"{old_metrics['path_length_m']['mean']:>12.0f} → {metrics['path_length_m']['mean']:<11.0f}"
+                f"{old_metrics['violation_rate']:>8.2f} → {metrics['violation_rate']:<6.2f}"
+            )
+            if old_p50 > 0 and (new_p50 - old_p50) / old_p50 > threshold:
+                regressions.append(f"{scenario_name}/{planner}: p50 {old_p50:.2f}ms → {new_p50:.2f}ms")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="SkyMind 路径规划基准测试")
+    parser.add_argument("--scenarios", nargs="*", choices=list(SCENARIOS.keys()), help="要运行的场景，默认全部")
+    parser.add_argument("--repeats", type=int, default=5, help="每个查询的重复次数")
+    parser.add_argument("--queries", type=int, help="每个场景的查询数，默认使用场景自带数量")
+    parser.add_argument("--seed", type=int, default=42, help="场景与RRT采样的随机种子")
+    parser.add_argument("--no-agent", action="store_true", help="不运行智能体的图规划器")
+    parser.add_argument("--accelerator", choices=["numba", "python"], help="网格搜索后端，默认按配置选择")
+    parser.add_argument("--output", default="bench_planning.json", help="JSON报告输出路径")
+    parser.add_argument("--compare", help="与之对比的旧报告路径")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50延迟回归阈值（比例）")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(
+        args.scenarios, args.repeats, args.seed, not args.no_agent, args.queries, args.accelerator
+    ))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"报告已写入: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old_report = json.load(f)
+        regressions = compare_reports(old_report, report, args.threshold)
+        if regressions:
+            print("发现延迟回归:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
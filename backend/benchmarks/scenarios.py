@@ -0,0 +1,199 @@
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Tuple
+
+from config.settings import settings
+
+# 经纬度 1 度约等于的米数（纬度方向）
+METERS_PER_DEGREE = 111000.0
+
+
+@dataclass
+class PlanningScenario:
+    """路径规划基准场景：一组禁飞区加若干起终点查询"""
+    name: str
+    description: str
+    no_fly_zones: List[Dict[str, Any]]
+    queries: List[Tuple[List[float], List[float]]]
+    bounds: Tuple[float, float, float, float]  # (min_lon, min_lat, max_lon, max_lat)
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+def _rect_zone(zone_id: str, min_lon: float, min_lat: float,
+               max_lon: float, max_lat: float) -> Dict[str, Any]:
+    """生成矩形禁飞区（与 NoFlyZone.geometry 相同的 GeoJSON 结构）"""
+    ring = [
+        [min_lon, min_lat],
+        [max_lon, min_lat],
+        [max_lon, max_lat],
+        [min_lon, max_lat],
+        [min_lon, min_lat]
+    ]
+    return {
+        "zone_id": zone_id,
+        "name": zone_id,
+        "geometry": {"type": "Polygon", "coordinates": [ring]}
+    }
+
+
+def _point_in_rect(point: List[float], zone: Dict[str, Any], margin: float = 0.0) -> bool:
+    """判断点是否落在矩形禁飞区（含外扩余量）内"""
+    ring = zone["geometry"]["coordinates"][0]
+    lons = [p[0] for p in ring]
+    lats = [p[1] for p in ring]
+    return (min(lons) - margin <= point[0] <= max(lons) + margin and
+            min(lats) - margin <= point[1] <= max(lats) + margin)
+
+
+def _random_point(rng: random.Random, bounds: Tuple[float, float, float, float]) -> List[float]:
+    min_lon, min_lat, max_lon, max_lat = bounds
+    return [rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)]
+
+
+def _random_pairs(rng: random.Random, bounds: Tuple[float, float, float, float],
+                  count: int, min_dist: float, max_dist: float,
+                  zones: Optional[List[Dict[str, Any]]] = None) -> List[Tuple[List[float], List[float]]]:
+    """在范围内随机生成起终点对，距离（度）在[min_dist, max_dist]之间且不落在禁飞区内"""
+    pairs = []
+    attempts = 0
+    while len(pairs) < count and attempts < count * 1000:
+        attempts += 1
+        start = _random_point(rng, bounds)
+        angle = rng.uniform(0, 2 * math.pi)
+        dist = rng.uniform(min_dist, max_dist)
+        end = [start[0] + dist * math.cos(angle), start[1] + dist * math.sin(angle)]
+        min_lon, min_lat, max_lon, max_lat = bounds
+        if not (min_lon <= end[0] <= max_lon and min_lat <= end[1] <= max_lat):
+            continue
+        if zones and any(_point_in_rect(p, z, 0.0002) for z in zones for p in (start, end)):
+            continue
+        pairs.append((start, end))
+    return pairs
+
+
+def open_field(seed: int, queries: int = 5) -> PlanningScenario:
+    """空旷场景：没有禁飞区，1~3公里的航线"""
+    rng = random.Random(seed)
+    lon0 = settings.DEFAULT_CITY_CENTER["lon"]
+    lat0 = settings.DEFAULT_CITY_CENTER["lat"]
+    bounds = (lon0 - 0.03, lat0 - 0.03, lon0 + 0.03, lat0 + 0.03)
+    return PlanningScenario(
+        name="open_field",
+        description="无禁飞区，1~3公里直线可达航线",
+        no_fly_zones=[],
+        queries=_random_pairs(rng, bounds, queries, 0.01, 0.03),
+        bounds=bounds,
+        params={"seed": seed}
+    )
+
+
+def dense_downtown(seed: int, queries: int = 5, zone_count: int = 200) -> PlanningScenario:
+    """密集城区：约4公里见方范围内随机分布 zone_count 个小型禁飞区"""
+    rng = random.Random(seed)
+    lon0 = settings.DEFAULT_CITY_CENTER["lon"]
+    lat0 = settings.DEFAULT_CITY_CENTER["lat"]
+    bounds = (lon0 - 0.02, lat0 - 0.02, lon0 + 0.02, lat0 + 0.02)
+
+    zones = []
+    for i in range(zone_count):
+        width = rng.uniform(0.0008, 0.002)
+        height = rng.uniform(0.0008, 0.002)
+        min_lon = rng.uniform(bounds[0], bounds[2] - width)
+        min_lat = rng.uniform(bounds[1], bounds[3] - height)
+        zones.append(_rect_zone(f"downtown-{i}", min_lon, min_lat, min_lon + width, min_lat + height))
+
+    return PlanningScenario(
+        name="dense_downtown",
+        description=f"4公里见方城区内 {zone_count} 个随机禁飞区",
+        no_fly_zones=zones,
+        queries=_random_pairs(rng, bounds, queries, 0.01, 0.03, zones),
+        bounds=bounds,
+        params={"seed": seed, "zone_count": zone_count}
+    )
+
+
+def corridor_maze(seed: int, queries: int = 3, walls: int = 6) -> PlanningScenario:
+    """走廊迷宫：起终点之间横亘多道墙，缺口上下交替，需要蛇形绕行"""
+    rng = random.Random(seed)
+    lon0 = settings.DEFAULT_CITY_CENTER["lon"]
+    lat0 = settings.DEFAULT_CITY_CENTER["lat"]
+
+    span = 0.03  # 东西方向约3公里
+    half_height = 0.015  # 墙体半高约1.5公里，超出起终点附近的小范围搜索框
+    gap = 0.002
+    thickness = 0.0006
+    bounds = (lon0 - span / 2 - 0.005, lat0 - half_height - 0.005,
+              lon0 + span / 2 + 0.005, lat0 + half_height + 0.005)
+
+    zones = []
+    for i in range(walls):
+        lon = lon0 - span / 2 + span * (i + 1) / (walls + 1)
+        if i % 2 == 0:
+            # 缺口在北端
+            zones.append(_rect_zone(f"maze-{i}", lon, lat0 - half_height,
+                                    lon + thickness, lat0 + half_height - gap))
+        else:
+            # 缺口在南端
+            zones.append(_rect_zone(f"maze-{i}", lon, lat0 - half_height + gap,
+                                    lon + thickness, lat0 + half_height))
+
+    pairs = []
+    for _ in range(queries):
+        jitter = rng.uniform(-0.003, 0.003)
+        pairs.append((
+            [lon0 - span / 2 - 0.002, lat0 + jitter],
+            [lon0 + span / 2 + 0.002, lat0 - jitter]
+        ))
+
+    return PlanningScenario(
+        name="corridor_maze",
+        description=f"{walls} 道交替开口的墙体，需要远离直线绕行",
+        no_fly_zones=zones,
+        queries=pairs,
+        bounds=bounds,
+        params={"seed": seed, "walls": walls}
+    )
+
+
+def cross_city(seed: int, queries: int = 3, zone_count: int = 40) -> PlanningScenario:
+    """跨城长航线：15公里以上航线，沿途零散分布大型禁飞区"""
+    rng = random.Random(seed)
+    lon0 = settings.DEFAULT_CITY_CENTER["lon"]
+    lat0 = settings.DEFAULT_CITY_CENTER["lat"]
+    bounds = (lon0 - 0.1, lat0 - 0.1, lon0 + 0.1, lat0 + 0.1)
+
+    zones = []
+    for i in range(zone_count):
+        width = rng.uniform(0.003, 0.01)
+        height = rng.uniform(0.003, 0.01)
+        min_lon = rng.uniform(bounds[0], bounds[2] - width)
+        min_lat = rng.uniform(bounds[1], bounds[3] - height)
+        zones.append(_rect_zone(f"city-{i}", min_lon, min_lat, min_lon + width, min_lat + height))
+
+    return PlanningScenario(
+        name="cross_city",
+        description=f"15公里以上跨城航线，{zone_count} 个大型禁飞区",
+        no_fly_zones=zones,
+        queries=_random_pairs(rng, bounds, queries, 0.14, 0.18, zones),
+        bounds=bounds,
+        params={"seed": seed, "zone_count": zone_count}
+    )
+
+
+# 场景注册表：名称 -> 生成函数
+SCENARIOS = {
+    "open_field": open_field,
+    "dense_downtown": dense_downtown,
+    "corridor_maze": corridor_maze,
+    "cross_city": cross_city,
+}
+
+
+def build_scenarios(names: Optional[List[str]] = None, seed: int = 42,
+                    queries: Optional[int] = None) -> List[PlanningScenario]:
+    """按名称生成场景，默认生成全部场景；queries 指定每个场景的查询数"""
+    names = names or list(SCENARIOS.keys())
+    if queries:
+        return [SCENARIOS[name](seed, queries=queries) for name in names]
+    return [SCENARIOS[name](seed) for name in names]
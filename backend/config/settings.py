@@ -24,6 +24,17 @@ class Settings(BaseSettings):
     # LLM配置
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4")
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL")  # 兼容OpenAI接口的服务地址，为空时使用官方接口
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "openai")  # LLM后端，可选: openai, mock（本地模拟服务器，用于离线测试和基准测试）
+    LLM_MOCK_URL: str = os.getenv("LLM_MOCK_URL", "http://127.0.0.1:8765/v1")  # 本地模拟LLM服务器地址
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "10"))  # 同时进行的LLM请求数上限
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "30.0"))  # 单次LLM请求超时（秒）
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))  # LLM请求失败后的最大重试次数
+    LLM_RETRY_BACKOFF: float = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))  # LLM重试的初始退避（秒）
+    LLM_CACHE_SIZE: int = int(os.getenv("LLM_CACHE_SIZE", "500"))  # LLM响应缓存条数上限，0表示关闭缓存
+    LLM_CACHE_TTL: float = float(os.getenv("LLM_CACHE_TTL", "3600"))  # LLM响应缓存有效期（秒）
+    LLM_CACHE_CELL_SIZE: float = float(os.getenv("LLM_CACHE_CELL_SIZE", "0.005"))  # 事件签名的位置网格大小（度）
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "./data/llm_cache/responses.json")  # LLM响应缓存文件，为空时不持久化
     
     # YOLO配置
     YOLO_MODEL: str = os.getenv("YOLO_MODEL", "yolov8n.pt")
@@ -46,6 +57,21 @@ class Settings(BaseSettings):
     PATH_PLANNING_ALGORITHM: str = os.getenv("PATH_PLANNING_ALGORITHM", "astar")  # 可选: astar, rrt, rl
     DRONE_MAX_SPEED: float = float(os.getenv("DRONE_MAX_SPEED", "15.0"))  # m/s
     DRONE_MAX_ALTITUDE: float = float(os.getenv("DRONE_MAX_ALTITUDE", "120.0"))  # m
+    PATH_PLANNING_ACCELERATOR: str = os.getenv("PATH_PLANNING_ACCELERATOR", "auto")  # 网格搜索后端，可选: auto, numba, python
+    PATH_CACHE_SIZE: int = int(os.getenv("PATH_CACHE_SIZE", "1024"))  # 路径规划结果缓存条数
+    
+    # 物流调度配置
+    LOGISTICS_DISPATCH_MODE: str = os.getenv("LOGISTICS_DISPATCH_MODE", "greedy")  # 任务分配方式，可选: greedy（逐单派机）, matching（批量最小代价指派）, multi_stop（多点配送合并）
+    LOGISTICS_BATCH_MAX_STOPS: int = int(os.getenv("LOGISTICS_BATCH_MAX_STOPS", "6"))  # 单架次最多投递点数
+    LOGISTICS_BATTERY_RESERVE: float = float(os.getenv("LOGISTICS_BATTERY_RESERVE", "0.2"))  # 续航安全余量比例
+    LOGISTICS_CANDIDATE_DRONES: int = int(os.getenv("LOGISTICS_CANDIDATE_DRONES", "8"))  # 逐单派机时参与评分的最近无人机数
+    LOGISTICS_STOP_SERVICE_TIME: float = float(os.getenv("LOGISTICS_STOP_SERVICE_TIME", "2.0"))  # 每个投递点的装卸时间（分钟）
+    LOGISTICS_ROUTING_BACKOFF: float = float(os.getenv("LOGISTICS_ROUTING_BACKOFF", "30.0"))  # 无法规划回路的任务的初始重试间隔（秒），按次数加倍
+    LOGISTICS_MAX_ROUTING_ATTEMPTS: int = int(os.getenv("LOGISTICS_MAX_ROUTING_ATTEMPTS", "5"))  # 无法规划回路的最大尝试次数，超过后任务标记为失败
+    
+    # 巡逻覆盖规划配置
+    PATROL_CAMERA_FOV: float = float(os.getenv("PATROL_CAMERA_FOV", "60.0"))  # 相机横向视场角（度）
+    PATROL_SWEEP_OVERLAP: float = float(os.getenv("PATROL_SWEEP_OVERLAP", "0.2"))  # 相邻扫描带重叠比例
     
     # 北斗配置
     BEIDOU_API_URL: Optional[str] = os.getenv("BEIDOU_API_URL")
@@ -63,7 +89,43 @@ class Settings(BaseSettings):
     
     # 智能体配置
     AGENT_COMMUNICATION_INTERVAL: int = int(os.getenv("AGENT_COMMUNICATION_INTERVAL", "5"))  # 秒
+    AGENT_SWEEP_INTERVAL: float = float(os.getenv("AGENT_SWEEP_INTERVAL", "30.0"))  # 无唤醒时的兜底巡检间隔（秒）
+    AGENT_WAKEUP_DEBOUNCE: float = float(os.getenv("AGENT_WAKEUP_DEBOUNCE", "0.01"))  # 唤醒后合并突发事件的等待时间（秒）
+    AGENT_RPC_TIMEOUT: float = float(os.getenv("AGENT_RPC_TIMEOUT", "30.0"))  # 智能体查询默认超时（秒）
+    AGENT_RPC_API_TIMEOUT: float = float(os.getenv("AGENT_RPC_API_TIMEOUT", "5.0"))  # REST接口查询智能体的超时（秒）
+    AGENT_RPC_MAX_CONCURRENCY: int = int(os.getenv("AGENT_RPC_MAX_CONCURRENCY", "8"))  # 每个智能体同时处理的查询数上限
+    SCHEDULER_AGING_INTERVAL: float = float(os.getenv("SCHEDULER_AGING_INTERVAL", "60.0"))  # 任务每等待多少秒有效优先级加1
+    SCHEDULER_TYPE_BURST: int = int(os.getenv("SCHEDULER_TYPE_BURST", "8"))  # 每轮同一任务类型连续调度的上限
+    SCHEDULER_BASE_BACKOFF: float = float(os.getenv("SCHEDULER_BASE_BACKOFF", "1.0"))  # 分配失败后的初始退避（秒）
+    SCHEDULER_MAX_BACKOFF: float = float(os.getenv("SCHEDULER_MAX_BACKOFF", "60.0"))  # 最大退避（秒）
     MAX_AGENTS_PER_TASK: int = int(os.getenv("MAX_AGENTS_PER_TASK", "5"))
+    AGENT_STATE_FLUSH_INTERVAL: float = float(os.getenv("AGENT_STATE_FLUSH_INTERVAL", "2.0"))  # 智能体状态批量写入间隔（秒）
+    AGENT_LOG_BUFFER_SIZE: int = int(os.getenv("AGENT_LOG_BUFFER_SIZE", "10000"))  # 智能体日志缓冲区上限（条）
+    AGENT_LOG_BATCH_SIZE: int = int(os.getenv("AGENT_LOG_BATCH_SIZE", "200"))  # 智能体日志每批写入条数
+    AGENT_LOG_FLUSH_INTERVAL: float = float(os.getenv("AGENT_LOG_FLUSH_INTERVAL", "1.0"))  # 智能体日志刷新间隔（秒）
+    AGENT_LOG_SAMPLE_RATE: float = float(os.getenv("AGENT_LOG_SAMPLE_RATE", "0.1"))  # 缓冲区积压时 DEBUG/INFO 日志的保留比例
+    AGENT_MAILBOX_CAPACITY: int = int(os.getenv("AGENT_MAILBOX_CAPACITY", "1000"))  # 智能体邮箱应急/任务通道容量（条）
+    AGENT_MAILBOX_INFO_CAPACITY: int = int(os.getenv("AGENT_MAILBOX_INFO_CAPACITY", "500"))  # 智能体邮箱通知通道容量，满时合并或丢弃（条）
+    AGENT_MAILBOX_EMERGENCY_PRIORITY: int = int(os.getenv("AGENT_MAILBOX_EMERGENCY_PRIORITY", "10"))  # 不低于该优先级的任务消息走应急通道
+    FLEET_STATE_RESYNC_INTERVAL: float = float(os.getenv("FLEET_STATE_RESYNC_INTERVAL", "60.0"))  # 机队状态与数据库全量校准的间隔（秒）
+    FLEET_STATE_GRID_SIZE: float = float(os.getenv("FLEET_STATE_GRID_SIZE", "0.01"))  # 机队位置索引的网格大小（度，约1公里）
+    TASK_TRACKER_MAX_AGE: float = float(os.getenv("TASK_TRACKER_MAX_AGE", "1.0"))  # 任务状态缓存的有效期，超过后在下一次刷新时批量查询（秒）
+    TASK_TRACKER_BATCH_SIZE: int = int(os.getenv("TASK_TRACKER_BATCH_SIZE", "1000"))  # 每次 $in 查询的任务数上限
+    EVENT_CLUSTER_RADIUS: float = float(os.getenv("EVENT_CLUSTER_RADIUS", "200.0"))  # 新检测合并到已有同类型事件的距离（米）
+    EVENT_CLUSTER_WINDOW: float = float(os.getenv("EVENT_CLUSTER_WINDOW", "300.0"))  # 事件最近一次检测后仍可合并新检测的时间（秒）
+    EVENT_CLUSTER_MAX_EVIDENCE: int = int(os.getenv("EVENT_CLUSTER_MAX_EVIDENCE", "20"))  # 合并后事件保留的最近图像证据和边界框数
+    RESPONSE_CANDIDATE_DRONES: int = int(os.getenv("RESPONSE_CANDIDATE_DRONES", "10"))  # 应急响应计划考虑的事件附近无人机数
+    RESPONSE_MIN_BATTERY: float = float(os.getenv("RESPONSE_MIN_BATTERY", "20.0"))  # 应急响应候选无人机的最低电量（百分比）
+    RESPONSE_PROMPT_TOKEN_BUDGET: int = int(os.getenv("RESPONSE_PROMPT_TOKEN_BUDGET", "1200"))  # 响应计划提示词中事件和资源上下文的令牌预算
+    RESPONSE_DESCRIPTION_TOKEN_CAP: int = int(os.getenv("RESPONSE_DESCRIPTION_TOKEN_CAP", "200"))  # 响应计划提示词中事件描述的令牌上限，先于减少无人机截断
+    RESPONSE_TEMPLATE_LEVELS: str = os.getenv("RESPONSE_TEMPLATE_LEVELS", "high")  # 先按模板计划立即行动、再由LLM细化的事件级别，逗号分隔
+    EMERGENCY_FAST_PATH_LEVELS: str = os.getenv("EMERGENCY_FAST_PATH_LEVELS", "high")  # 跳过协调者轮询、直接派遣的事件级别，逗号分隔，为空时关闭
+    EMERGENCY_DISPATCH_SLO: float = float(os.getenv("EMERGENCY_DISPATCH_SLO", "2.0"))  # 从检测到派遣的延迟目标（秒）
+    RESPONSE_PLAN_STREAMING: bool = bool(int(os.getenv("RESPONSE_PLAN_STREAMING", "1")))  # 流式接收LLM响应计划，行动解析出来即开始执行
+    AGENT_RUNTIME: str = os.getenv("AGENT_RUNTIME", "inprocess")  # 智能体运行方式: inprocess（单进程）或 multiprocess（多进程）
+    AGENT_PROCESS_GROUPS: str = os.getenv("AGENT_PROCESS_GROUPS", "monitor;planner;logistics;response")  # 多进程模式下的进程分组，分号分隔进程，逗号分隔同进程的智能体
+    AGENT_BUS_SOCKET: str = os.getenv("AGENT_BUS_SOCKET", "/tmp/skymind-agents.sock")  # 多进程消息总线的Unix socket路径
+    AGENT_BUS_HEARTBEAT_INTERVAL: float = float(os.getenv("AGENT_BUS_HEARTBEAT_INTERVAL", "2.0"))  # 智能体状态同步间隔（秒）
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,318 @@
+"""
+进程内运行指标
+
+低开销的计数器、仪表和直方图（只做字典更新，不加锁、不分配对象），
+抓取时汇总为指标族并渲染为 Prometheus 文本格式，由 /metrics 接口导出。
+
+预定义的指标覆盖：
+- 智能体工作周期耗时、每个周期的数据库调用次数
+- 按消息类型的消息处理耗时、按查询名的查询处理耗时
+- 邮箱积压（抓取时由采集函数读取）
+- 数据库命令次数和耗时（pymongo 命令监听器）
+- 高级别事件从检测到派遣的延迟（SLO）
+- 检测新建和合并的事件数
+- LLM 请求耗时和令牌数、YOLO 推理耗时
+"""
+import math
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+
+from pymongo import monitoring
+
+from config.logging_config import get_logger
+
+logger = get_logger("core.metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 每个周期数据库调用次数的分桶
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# 指标族：{"name", "type", "help", "samples": [(样本名, {标签: 值}, 数值)]}
+Family = Dict[str, Any]
+
+
+class _Metric:
+    """指标基类，按标签值元组保存数据"""
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _labels(self, labels: Tuple[Any, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, (str(value) for value in labels)))
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        # 先复制，避免其他线程（数据库命令监听器）同时写入时迭代出错
+        return [(self.name, self._labels(labels), value) for labels, value in list(self._values.items())]
+
+    def collect(self) -> Family:
+        return {"name": self.name, "type": self.type, "help": self.help, "samples": self.samples()}
+
+    def clear(self):
+        self._values.clear()
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    type = "counter"
+
+    def inc(self, *labels: Any, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(labels, 0.0)
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+    type = "gauge"
+
+    def set(self, value: float, *labels: Any):
+        self._values[labels] = value
+
+    def inc(self, *labels: Any, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: Any, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+
+class Histogram(_Metric):
+    """分桶直方图，每组标签保存 [各桶计数, 总和, 次数]"""
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: Any):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        # 桶的上界包含在内：value <= le
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        for labels, (counts, total, count) in list(self._values.items()):
+            base = self._labels(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), list(counts)):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", {**base, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", base, total))
+            samples.append((f"{self.name}_count", base, count))
+        return samples
+
+    def time(self, *labels: Any) -> "_Timer":
+        """计时上下文：with histogram.time(标签...): ..."""
+        return _Timer(self, labels)
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Tuple[Any, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return f"{value:.1f}"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families: Iterable[Family]) -> str:
+    """
+    将指标族渲染为 Prometheus 文本格式
+
+    同名指标族（例如来自不同进程）合并为一组，HELP/TYPE 取第一个。
+    """
+    merged: Dict[str, Family] = {}
+    for family in families:
+        entry = merged.get(family["name"])
+        if entry is None:
+            merged[family["name"]] = {**family, "samples": list(family["samples"])}
+        else:
+            entry["samples"].extend(family["samples"])
+
+    lines = []
+    for family in merged.values():
+        lines.append(f"# HELP {family['name']} {_escape(family['help'])}")
+        lines.append(f"# TYPE {family['name']} {family['type']}")
+        for name, labels, value in family["samples"]:
+            if labels:
+                label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def with_labels(families: Iterable[Family], **labels: str) -> List[Family]:
+    """为指标族中的所有样本追加标签（例如区分工作进程）"""
+    return [
+        {**family, "samples": [(name, {**sample_labels, **labels}, value)
+                               for name, sample_labels, value in family["samples"]]}
+        for family in families
+    ]
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        """注册抓取时调用的采集函数，用于邮箱积压等只需在抓取时读取的值"""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def collect(self) -> List[Family]:
+        """汇总所有指标族"""
+        families = [metric.collect() for metric in self._metrics.values()]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.error(f"指标采集函数出错: {str(e)}")
+        return families
+
+    def render(self, extra: Optional[Iterable[Family]] = None) -> str:
+        families = self.collect()
+        if extra:
+            families.extend(extra)
+        return render(families)
+
+
+# 创建全局指标注册表实例
+metrics_registry = MetricsRegistry()
+
+# 智能体
+agent_cycle_seconds = metrics_registry.histogram(
+    "skymind_agent_cycle_seconds", "智能体 run_cycle 耗时", ("agent_type", "agent_id"))
+agent_cycle_db_calls = metrics_registry.histogram(
+    "skymind_agent_cycle_db_calls", "每个工作周期的数据库命令数", ("agent_type",), COUNT_BUCKETS)
+agent_message_seconds = metrics_registry.histogram(
+    "skymind_agent_message_seconds", "按消息类型的消息处理耗时", ("agent_type", "message_type"))
+agent_query_seconds = metrics_registry.histogram(
+    "skymind_agent_query_seconds", "按查询名的查询处理耗时", ("agent_type", "query"))
+
+# 数据库
+db_commands_total = metrics_registry.counter(
+    "skymind_db_commands_total", "数据库命令次数（发起方为智能体类型，其他为 api）", ("agent_type", "command"))
+db_command_seconds = metrics_registry.histogram(
+    "skymind_db_command_seconds", "数据库命令耗时", ("command",))
+db_command_errors_total = metrics_registry.counter(
+    "skymind_db_command_errors_total", "失败的数据库命令次数", ("command",))
+
+# 应急派遣
+emergency_dispatch_seconds = metrics_registry.histogram(
+    "skymind_emergency_dispatch_seconds", "高级别事件从检测到派遣的延迟", ("event_type", "path"),
+    (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0))
+emergency_dispatch_slo_violations_total = metrics_registry.counter(
+    "skymind_emergency_dispatch_slo_violations_total", "检测到派遣的延迟超过 EMERGENCY_DISPATCH_SLO 的次数", ("event_type",))
+
+# 事件聚类
+event_detections_total = metrics_registry.counter(
+    "skymind_event_detections_total", "监控检测产生的事件数（outcome 为 created 新建或 merged 合并到已有事件）",
+    ("event_type", "outcome"))
+
+# LLM / YOLO
+llm_request_seconds = metrics_registry.histogram(
+    "skymind_llm_request_seconds", "LLM请求耗时（含排队）", ("mode", "outcome"))
+llm_first_token_seconds = metrics_registry.histogram(
+    "skymind_llm_first_token_seconds", "流式LLM请求的首个分片延迟（含排队）")
+llm_tokens_total = metrics_registry.counter(
+    "skymind_llm_tokens_total", "LLM令牌数", ("kind",))
+yolo_inference_seconds = metrics_registry.histogram(
+    "skymind_yolo_inference_seconds", "YOLO推理耗时", ("source",))
+
+
+class DbCallScope:
+    """数据库调用计数范围，智能体在自己的协程上下文中设置；子范围（例如一个工作周期）的调用同时计入父范围"""
+    __slots__ = ("agent_type", "calls", "parent")
+
+    def __init__(self, agent_type: str, parent: Optional["DbCallScope"] = None):
+        self.agent_type = agent_type
+        self.calls = 0
+        self.parent = parent
+
+    def child(self) -> "DbCallScope":
+        return DbCallScope(self.agent_type, self)
+
+    def count(self):
+        scope = self
+        while scope is not None:
+            scope.calls += 1
+            scope = scope.parent
+
+
+# Motor 在线程池中执行 pymongo 调用时会复制当前上下文，监听器可以读到发起调用的智能体
+current_db_scope: ContextVar[Optional[DbCallScope]] = ContextVar("current_db_scope", default=None)
+
+
+class DbCommandListener(monitoring.CommandListener):
+    """pymongo 命令监听器：统计命令次数和耗时，并计入发起调用的智能体"""
+
+    def started(self, event):
+        scope = current_db_scope.get()
+        if scope is not None:
+            scope.count()
+            db_commands_total.inc(scope.agent_type, event.command_name)
+        else:
+            db_commands_total.inc("api", event.command_name)
+
+    def succeeded(self, event):
+        db_command_seconds.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        db_command_seconds.observe(event.duration_micros / 1e6, event.command_name)
+        db_command_errors_total.inc(event.command_name)
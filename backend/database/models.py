@@ -1,6 +1,6 @@
-from typing import List, Dict, Optional, Union, Any
+from typing import List, Dict, Optional, Union, Any, Callable
 from datetime import datetime
-from beanie import Document, Link, BackLink, Insert, Replace, SaveChanges
+from beanie import Document, Link, BackLink, Insert, Replace, Save, SaveChanges, Update, Delete, after_event
 from pydantic import BaseModel, Field, validator
 from enum import Enum
 import uuid
@@ -106,6 +106,10 @@ class User(Document):
         ]
 
 
+# 无人机文档写入后的回调 (drone, deleted)，用于维护内存中的机队状态
+DRONE_CHANGE_LISTENERS: List[Callable[["Drone", bool], None]] = []
+
+
 class Drone(Document):
     """无人机数据模型"""
     drone_id: str = Field(default_factory=lambda: str(uuid.uuid4()), unique=True, index=True)
@@ -123,6 +127,16 @@ class Drone(Document):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     assigned_tasks: List[str] = []  # 任务ID列表
     
+    @after_event(Insert, Replace, Save, SaveChanges, Update)
+    def _notify_saved(self):
+        for listener in DRONE_CHANGE_LISTENERS:
+            listener(self, False)
+    
+    @after_event(Delete)
+    def _notify_deleted(self):
+        for listener in DRONE_CHANGE_LISTENERS:
+            listener(self, True)
+    
     class Settings:
         name = "drones"
         use_revision = True
@@ -172,6 +186,10 @@ class Event(Document):
         ]
 
 
+# 任务文档写入后的回调 (task, deleted)，用于维护内存中的任务状态缓存
+TASK_CHANGE_LISTENERS: List[Callable[["Task", bool], None]] = []
+
+
 class Task(Document):
     """任务数据模型"""
     task_id: str = Field(default_factory=lambda: str(uuid.uuid4()), unique=True, index=True)
@@ -189,7 +207,27 @@ class Task(Document):
     speed: float = 5.0               # 飞行速度（m/s）
     priority: int = 1                # 优先级
     patrol_area: Dict[str, Any] = Field(default_factory=lambda: {"type": "Polygon", "coordinates": []})
+    patrol_routes: List[Dict[str, Any]] = []  # 覆盖规划生成的各无人机巡逻航线
     schedule: Dict[str, Any] = Field(default_factory=lambda: {"type": "once", "date": None, "weekdays": [], "time": None})
+    # 智能体协作字段
+    assigned_agents: List[str] = []  # 负责该任务的智能体ID
+    start_location: Optional[Location] = None
+    end_location: Optional[Location] = None
+    planned_path: Optional[FlightPath] = None  # 路径规划智能体生成的航线
+    completion_criteria: Optional[Dict[str, Any]] = None
+    task_data: Optional[Dict[str, Any]] = None  # 事件数据、响应计划、派遣记录等
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+
+    @after_event(Insert, Replace, Save, SaveChanges, Update)
+    def _notify_saved(self):
+        for listener in TASK_CHANGE_LISTENERS:
+            listener(self, False)
+
+    @after_event(Delete)
+    def _notify_deleted(self):
+        for listener in TASK_CHANGE_LISTENERS:
+            listener(self, True)
 
     class Settings:
         name = "tasks"
@@ -1,7 +1,9 @@
+from datetime import datetime
 import motor.motor_asyncio
 from beanie import init_beanie
 from config.settings import settings
 from config.logging_config import get_logger
+from core.metrics import DbCommandListener
 from .models import (
     User, Drone, Event, Task, NoFlyZone, UserRole, 
     DetectionConfig, VideoSource, AgentLog, AgentState, DroneStatus, GeoPoint,
@@ -19,7 +21,9 @@ async def init_db():
         client = motor.motor_asyncio.AsyncIOMotorClient(
             settings.MONGODB_URL,
             serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
+            connectTimeoutMS=5000,
+            # 统计数据库命令次数和耗时，并计入发起调用的智能体
+            event_listeners=[DbCommandListener()]
         )
         
         # 检查是否可以连接
@@ -238,4 +242,20 @@ async def list_documents(model, filter_dict=None, skip=0, limit=100, sort_field=
     if sort_field:
         query = query.sort(sort_field, sort_order)
     
-    return await query.to_list()
\ No newline at end of file
+    return await query.to_list()
+
+async def get_active_no_fly_zones():
+    """获取当前生效的禁飞区（永久禁飞区和处于有效期内的临时禁飞区）"""
+    now = datetime.utcnow()
+    return await NoFlyZone.find({
+        "$or": [
+            {"permanent": True},
+            {"permanent": False, "start_time": {"$lte": now}, "end_time": {"$gte": now}}
+        ]
+    }).to_list()
+
+def get_collection(model):
+    """获取文档模型对应的底层集合，用于 bulk_write、insert_many 等批量操作"""
+    if hasattr(model, "get_motor_collection"):
+        return model.get_motor_collection()
+    return model.get_pymongo_collection()
@@ -3,6 +3,7 @@ import uvicorn
 import os
 from fastapi import FastAPI, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordBearer
 from typing import Dict, List, Any, Optional, Set
@@ -14,12 +15,19 @@ from config.logging_config import get_logger
 from database.mongodb import init_db, create_initial_data
 from database.models import Task, Event, Drone
 from agents.coordinator import get_coordinator
+from agents.state_store import agent_state_store
+from agents.log_sink import agent_log_sink
+from agents.bus import create_message_bus, get_message_bus, set_message_bus
+from agents.runtime import parse_process_groups, spawn_workers, stop_workers
 from agents.monitor import create_monitor_agent
 from agents.planner import create_planner_agent
 from agents.response import create_response_agent
 from agents.logistics import create_logistics_agent
 # from agents.security import create_security_agent
 from api.v1.router import api_router
+from services.path_planning import path_planning_service
+from services.fleet_state import fleet_state
+from core.metrics import metrics_registry, CONTENT_TYPE
 
 # 设置日志
 logger = get_logger("main")
@@ -44,6 +52,14 @@ app.add_middleware(
 # 包含API路由
 app.include_router(api_router, prefix=settings.API_PREFIX)
 
+# Prometheus 指标接口（多进程模式下包含各工作进程上报的指标）
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        metrics_registry.render(get_message_bus().remote_metrics()),
+        media_type=CONTENT_TYPE
+    )
+
 # WebSocket连接管理器
 class ConnectionManager:
     def __init__(self):
@@ -176,7 +192,7 @@ async def handle_subscription(client_id: str, data: Dict[str, Any]):
     
     elif topic == "drones":
         # 发送无人机列表
-        drones = await Drone.find_all().to_list()
+        drones = fleet_state.all()
         await manager.send_message(client_id, {
             "type": "initial_data",
             "topic": "drones",
@@ -193,7 +209,7 @@ async def handle_drone_status(client_id: str, data: Dict[str, Any]):
         return
     
     # 更新无人机状态
-    drone = await Drone.find_one({"drone_id": drone_id})
+    drone = await fleet_state.get_drone(drone_id)
     if drone:
         if status:
             drone.status = status
@@ -359,6 +375,12 @@ async def startup_event():
     # 创建初始数据
     await create_initial_data()
     
+    # 加载机队状态，之后由写入钩子和变更订阅增量更新
+    await fleet_state.start()
+    
+    # 预热路径规划加速内核（优先加载磁盘缓存的编译结果），在线程中执行避免阻塞启动
+    asyncio.create_task(asyncio.to_thread(path_planning_service.warmup))
+    
     # 启动智能体系统
     asyncio.create_task(start_agent_system())
     
@@ -374,13 +396,31 @@ async def shutdown_event():
     if coordinator:
         await coordinator.stop()
     
+    # 写入智能体状态和日志缓冲中尚未落库的数据
+    await agent_state_store.stop()
+    await agent_log_sink.stop()
+    
+    await fleet_state.stop()
+    
+    # 结束智能体工作进程并关闭消息总线
+    await stop_workers(agent_workers)
+    await get_message_bus().stop()
+    
     logger.info("系统已关闭")
 
+# 多进程模式下的智能体工作进程
+agent_workers = []
+
 async def start_agent_system():
     """启动智能体系统"""
     try:
         logger.info("启动智能体系统")
         
+        # 启动消息总线（多进程模式下主进程作为hub）
+        bus = create_message_bus(role="hub")
+        set_message_bus(bus)
+        await bus.start()
+        
         # 启动协调智能体
         coordinator = await get_coordinator()
         asyncio.create_task(coordinator.start())
@@ -388,6 +428,15 @@ async def start_agent_system():
         # 等待协调智能体完全启动
         await asyncio.sleep(1)
         
+        if settings.AGENT_RUNTIME == "multiprocess":
+            # 其他智能体按分组在独立进程中运行
+            await bus.announce()
+            groups = parse_process_groups()
+            agent_workers.extend(await spawn_workers(groups))
+            asyncio.create_task(event_listener())
+            logger.info(f"已启动 {len(groups)} 个智能体工作进程")
+            return
+        
         # 启动其他智能体
         agents = []
         
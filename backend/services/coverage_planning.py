@@ -0,0 +1,335 @@
+"""
+巡逻区域覆盖路径规划
+
+对巡逻多边形生成往返（boustrophedon）扫描航线：
+1. 投影到以区域中心为原点的局部平面（米），旋转到扫描方向
+2. 用 shapely.contains_xy 一次性计算采样网格掩码，按行提取扫描线段
+3. 按扫描长度把线段均衡分配给 N 架无人机（按行连续分带）
+4. 每架无人机的线段按往返顺序串联，转弯处做圆角平滑
+"""
+import math
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon, LineString, shape
+
+from config.settings import settings
+from config.logging_config import get_logger
+
+logger = get_logger("services.coverage_planning")
+
+# 局部平面投影：每度纬度/经度（赤道）对应的米数
+METERS_PER_DEG_LAT = 110540.0
+METERS_PER_DEG_LON = 111320.0
+
+
+def sweep_spacing_for_altitude(altitude: float, fov: Optional[float] = None,
+                               overlap: Optional[float] = None) -> float:
+    """
+    根据飞行高度和相机视场角计算扫描线间距（米）
+
+    Args:
+        altitude: 飞行高度（米）
+        fov: 相机横向视场角（度），默认使用配置
+        overlap: 相邻扫描带重叠比例，默认使用配置
+    """
+    fov = settings.PATROL_CAMERA_FOV if fov is None else fov
+    overlap = settings.PATROL_SWEEP_OVERLAP if overlap is None else overlap
+    footprint = 2 * altitude * math.tan(math.radians(fov) / 2)
+    return max(footprint * (1 - overlap), 1.0)
+
+
+def parse_area(area: Any) -> Polygon:
+    """
+    解析巡逻区域
+
+    支持 GeoJSON Polygon（Task.patrol_area 格式）、带 coordinates 的区域字典
+    （[[lon, lat], ...] 单环）以及坐标列表。
+    """
+    if isinstance(area, Polygon):
+        return area
+    if isinstance(area, dict):
+        if area.get("type") == "Polygon":
+            return shape(area)
+        coordinates = area.get("coordinates", [])
+    else:
+        coordinates = area
+    if coordinates and isinstance(coordinates[0][0], (list, tuple)):
+        coordinates = coordinates[0]
+    return Polygon(coordinates)
+
+
+class _LocalFrame:
+    """经纬度与局部平面坐标（米，按扫描方向旋转）之间的转换"""
+
+    def __init__(self, lon0: float, lat0: float, angle: float):
+        self.lon0 = lon0
+        self.lat0 = lat0
+        self.kx = METERS_PER_DEG_LON * math.cos(math.radians(lat0))
+        self.ky = METERS_PER_DEG_LAT
+        self.cos = math.cos(angle)
+        self.sin = math.sin(angle)
+
+    def project(self, lons: np.ndarray, lats: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        x = (np.asarray(lons) - self.lon0) * self.kx
+        y = (np.asarray(lats) - self.lat0) * self.ky
+        # 旋转 -angle，使扫描方向与x轴平行
+        return x * self.cos + y * self.sin, -x * self.sin + y * self.cos
+
+    def unproject(self, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        x = xs * self.cos - ys * self.sin
+        y = xs * self.sin + ys * self.cos
+        return x / self.kx + self.lon0, y / self.ky + self.lat0
+
+
+def _to_local(polygon: Polygon, frame: _LocalFrame) -> Polygon:
+    """将经纬度多边形（含内环）转换到局部平面"""
+    def ring(coords):
+        coords = np.asarray(coords)
+        return np.column_stack(frame.project(coords[:, 0], coords[:, 1]))
+    return Polygon(ring(polygon.exterior.coords), [ring(interior.coords) for interior in polygon.interiors])
+
+
+def _sweep_angle(polygon: Polygon) -> float:
+    """选择扫描方向：沿最小外接矩形的长边扫描，转弯次数最少"""
+    rect = polygon.minimum_rotated_rectangle
+    if rect.geom_type != "Polygon":
+        return 0.0
+    coords = np.asarray(rect.exterior.coords)
+    edges = np.diff(coords[:3], axis=0)
+    longest = edges[int(np.argmax(np.hypot(edges[:, 0], edges[:, 1])))]
+    return math.atan2(longest[1], longest[0])
+
+
+def _sweep_segments(polygon: Polygon, spacing: float, resolution: float) -> np.ndarray:
+    """
+    计算扫描线段
+
+    在旋转后的包围盒内按 (行间距 spacing, 列步长 resolution) 采样，一次向量化
+    点面判断得到掩码，每行连续为真的区间即为一条扫描线段。凹多边形的同一行
+    可能产生多条线段。
+
+    Returns:
+        线段数组[n, 3]，每行为 (y, x_start, x_end)，按 y、x 排序
+    """
+    min_x, min_y, max_x, max_y = polygon.bounds
+    rows = max(int(math.floor((max_y - min_y) / spacing)), 0) + 1
+    # 扫描线位于各扫描带中心
+    offset = ((max_y - min_y) - (rows - 1) * spacing) / 2
+    ys = min_y + offset + np.arange(rows) * spacing
+    xs = np.arange(min_x, max_x + resolution, resolution)
+
+    shapely.prepare(polygon)
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    mask = shapely.contains_xy(polygon, grid_x, grid_y)
+
+    # 在每行两端补 False，用差分找出连续区间的起止列
+    padded = np.zeros((rows, len(xs) + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    diff = np.diff(padded, axis=1)
+    start_rows, start_cols = np.nonzero(diff == 1)
+    _, end_cols = np.nonzero(diff == -1)
+
+    segments = np.column_stack([
+        ys[start_rows],
+        xs[start_cols],
+        xs[end_cols - 1]
+    ])
+    # 太短的线段（单个采样点）按最小步长展开，保证覆盖
+    short = segments[:, 2] - segments[:, 1] < resolution
+    segments[short, 1] -= resolution / 2
+    segments[short, 2] += resolution / 2
+    return segments
+
+
+def _split_balanced(segments: np.ndarray, drone_count: int) -> List[np.ndarray]:
+    """按扫描长度把线段分成 drone_count 个连续分带，各分带扫描长度尽量相等"""
+    if drone_count <= 1 or len(segments) == 0:
+        return [segments]
+    lengths = segments[:, 2] - segments[:, 1]
+    cumulative = np.cumsum(lengths)
+    targets = cumulative[-1] * np.arange(1, drone_count) / drone_count
+    # 分界点取最接近目标长度的线段边界
+    cuts = np.searchsorted(cumulative, targets)
+    cuts = np.where(
+        (cuts > 0) & (np.abs(cumulative[np.maximum(cuts - 1, 0)] - targets) < np.abs(cumulative[cuts] - targets)),
+        cuts,
+        cuts + 1
+    )
+    return np.split(segments, np.clip(cuts, 0, len(segments)))
+
+
+def _order_segments(segments: np.ndarray, start: Optional[np.ndarray]) -> np.ndarray:
+    """
+    将线段串联为往返航线
+
+    从距离起点最近的线段端点出发，每次选择距当前位置最近的剩余线段端点，
+    凸区域下即为标准的往返扫描顺序。
+
+    Returns:
+        航点数组[m, 2]
+    """
+    n = len(segments)
+    ends = np.empty((n, 2, 2))
+    ends[:, 0, 0] = segments[:, 1]
+    ends[:, 1, 0] = segments[:, 2]
+    ends[:, :, 1] = segments[:, [0]]
+
+    if start is None:
+        start = ends[0, 0]
+    remaining = np.ones(n, dtype=bool)
+    current = np.asarray(start, dtype=np.float64)
+    route = np.empty((2 * n, 2))
+
+    for k in range(n):
+        d = np.hypot(ends[:, :, 0] - current[0], ends[:, :, 1] - current[1])
+        d[~remaining] = np.inf
+        flat = int(np.argmin(d))
+        index, side = divmod(flat, 2)
+        route[2 * k] = ends[index, side]
+        route[2 * k + 1] = ends[index, 1 - side]
+        current = route[2 * k + 1]
+        remaining[index] = False
+
+    return route
+
+
+def _smooth_route(route: np.ndarray, radius: float, arc_points: int) -> np.ndarray:
+    """转弯处插入圆角，圆角半径不超过相邻航段长度的一半"""
+    if len(route) < 3 or radius <= 0:
+        return route
+
+    smoothed = [route[0]]
+    for i in range(1, len(route) - 1):
+        a, b, c = route[i - 1], route[i], route[i + 1]
+        v1 = a - b
+        v2 = c - b
+        l1 = math.hypot(*v1)
+        l2 = math.hypot(*v2)
+        if l1 < 1e-9 or l2 < 1e-9:
+            continue
+        u1 = v1 / l1
+        u2 = v2 / l2
+        theta = math.acos(max(-1.0, min(1.0, float(np.dot(u1, u2)))))
+        if theta > math.pi - 1e-3:
+            # 近似直线，不需要圆角
+            smoothed.append(b)
+            continue
+        if theta < 1e-6:
+            # 沿同一条直线折返（例如U形区域同一行上的两段扫描线），无法做圆角，保留转折点
+            smoothed.append(b)
+            continue
+
+        tangent = min(radius / math.tan(theta / 2), l1 / 2, l2 / 2)
+        r = tangent * math.tan(theta / 2)
+        p1 = b + u1 * tangent
+        p2 = b + u2 * tangent
+        bisector = (u1 + u2) / np.linalg.norm(u1 + u2)
+        center = b + bisector * (r / math.sin(theta / 2))
+
+        start_angle = math.atan2(p1[1] - center[1], p1[0] - center[0])
+        end_angle = math.atan2(p2[1] - center[1], p2[0] - center[0])
+        sweep = (end_angle - start_angle + math.pi) % (2 * math.pi) - math.pi
+        angles = start_angle + sweep * np.linspace(0, 1, arc_points)
+        smoothed.extend(np.column_stack([
+            center[0] + r * np.cos(angles),
+            center[1] + r * np.sin(angles)
+        ]))
+    smoothed.append(route[-1])
+    return np.asarray(smoothed)
+
+
+def plan_coverage(area: Any, drone_count: int = 1, altitude: float = 50.0,
+                  spacing: Optional[float] = None, start_point: Optional[List[float]] = None,
+                  options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    为巡逻区域生成覆盖航线
+
+    Args:
+        area: 巡逻区域（GeoJSON Polygon 或坐标列表，坐标为 [lon, lat]）
+        drone_count: 参与巡逻的无人机数量
+        altitude: 飞行高度（米）
+        spacing: 扫描线间距（米），默认按高度和相机视场角计算
+        start_point: 起飞点 [lon, lat]，各航线从距其最近的端点开始
+        options: 其他选项
+            - angle: 扫描方向（度，相对正东逆时针），默认沿区域长轴
+            - resolution: 掩码采样步长（米），默认为间距的1/4
+            - turn_radius: 转弯圆角半径（米），默认为间距的一半，0表示不平滑
+            - arc_points: 每个圆角的航点数，默认5
+
+    Returns:
+        覆盖规划结果，routes 中每条航线的航点格式为 [lon, lat, altitude]
+    """
+    options = options or {}
+    started = time.perf_counter()
+    drone_count = max(int(drone_count), 1)
+
+    polygon = parse_area(area)
+    if polygon.is_empty or not polygon.is_valid or polygon.area == 0:
+        return {"success": False, "error": "巡逻区域无效", "routes": []}
+
+    spacing = spacing or sweep_spacing_for_altitude(altitude)
+    resolution = options.get("resolution", spacing / 4)
+    turn_radius = options.get("turn_radius", spacing / 2)
+    arc_points = max(int(options.get("arc_points", 5)), 2)
+
+    centroid = polygon.centroid
+    if "angle" in options:
+        angle = math.radians(options["angle"])
+    else:
+        angle = _sweep_angle(_to_local(polygon, _LocalFrame(centroid.x, centroid.y, 0.0)))
+    frame = _LocalFrame(centroid.x, centroid.y, angle)
+    local = _to_local(polygon, frame)
+
+    segments = _sweep_segments(local, spacing, resolution)
+    if len(segments) == 0:
+        return {"success": False, "error": "巡逻区域小于扫描间距", "routes": []}
+
+    start = None
+    if start_point:
+        start = np.array([float(v) for v in frame.project(start_point[0], start_point[1])])
+
+    routes = []
+    covered = []
+    for index, band in enumerate(_split_balanced(segments, drone_count)):
+        if len(band) == 0:
+            routes.append({"drone_index": index, "waypoints": [], "sweeps": 0, "sweep_length": 0.0, "length": 0.0})
+            continue
+
+        ordered = _order_segments(band, start)
+        smoothed = _smooth_route(ordered, turn_radius, arc_points)
+        lons, lats = frame.unproject(smoothed[:, 0], smoothed[:, 1])
+        line = LineString(ordered) if len(ordered) > 1 else None
+        if line is not None:
+            covered.append(line)
+
+        routes.append({
+            "drone_index": index,
+            "waypoints": [[float(lon), float(lat), altitude] for lon, lat in zip(lons, lats)],
+            "sweeps": int(len(band)),
+            "sweep_length": float(np.sum(band[:, 2] - band[:, 1])),
+            "length": float(np.sum(np.hypot(*np.diff(smoothed, axis=0).T)))
+        })
+
+    # 覆盖率：航线按扫描带宽度缓冲后与区域的面积比
+    coverage = 0.0
+    if covered:
+        swaths = shapely.union_all(shapely.buffer(covered, spacing / 2, cap_style="flat"))
+        coverage = float(swaths.intersection(local).area / local.area)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"覆盖规划完成，无人机: {drone_count}, 扫描线段: {len(segments)}, "
+                f"覆盖率: {coverage:.1%}, 耗时: {elapsed_ms:.1f}ms")
+
+    return {
+        "success": True,
+        "routes": routes,
+        "spacing": spacing,
+        "sweep_angle": math.degrees(angle),
+        "area": float(local.area),
+        "coverage": coverage,
+        "total_length": float(sum(route["length"] for route in routes)),
+        "planning_ms": elapsed_ms
+    }
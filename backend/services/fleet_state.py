@@ -0,0 +1,403 @@
+"""
+机队状态内存存储
+
+启动时从数据库加载一次全部无人机，之后由以下来源增量更新，不再每个周期全表扫描：
+- Drone 文档的 insert/save/replace/update/delete（Beanie 事件钩子，覆盖本进程内的所有写入）
+- MongoDB change stream（副本集部署时可用，覆盖其他进程和外部写入）
+- 遥测/状态事件（apply_telemetry）
+- 兜底：每 FLEET_STATE_RESYNC_INTERVAL 秒全量校准一次
+
+提供按状态、电量和位置的索引查询，空闲无人机另有独立的空间索引用于最近可用无人机查询。返回的是共享的文档对象，修改后需要 save()，
+保存后索引会自动更新；存储更新时换成新对象，不会改写调用方手里的旧对象。
+内存状态可能落后于其他进程的写入，分配无人机时用 reserve() 在数据库中原子确认。
+"""
+import asyncio
+import inspect
+from datetime import datetime
+from bisect import bisect_left, insort
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from beanie import UpdateResponse
+
+from config.logging_config import get_logger
+from config.settings import settings
+from database.models import Drone, DroneStatus, GeoPoint, DRONE_CHANGE_LISTENERS
+from database.mongodb import get_collection
+from services.spatial_index import GridIndex
+
+logger = get_logger("services.fleet_state")
+
+
+def _status_value(status: Any) -> str:
+    return getattr(status, "value", status)
+
+
+class FleetState:
+    """内存中的机队状态及其索引"""
+
+    def __init__(self, grid_size: Optional[float] = None, resync_interval: Optional[float] = None):
+        self.grid_size = grid_size or settings.FLEET_STATE_GRID_SIZE
+        self.resync_interval = resync_interval or settings.FLEET_STATE_RESYNC_INTERVAL
+
+        self._drones: Dict[str, Drone] = {}
+        self._by_status: Dict[str, Set[str]] = {}
+        self._battery: List[Tuple[float, str]] = []  # 按电量排序的 (电量, drone_id)
+        self._locations = GridIndex(self.grid_size)  # 所有有位置的无人机
+        self._idle = GridIndex(self.grid_size)  # 空闲且有位置的无人机
+        # 每架无人机当前在索引中的 (状态, 电量)，用于增量更新
+        self._keys: Dict[str, Tuple[str, float]] = {}
+
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self.change_stream_active = False
+
+        self.applied = 0
+        self.telemetry_updates = 0
+        self.resyncs = 0
+        self.lookups = 0
+        self.reservations = 0
+        self.reservation_conflicts = 0
+
+    # ---------- 加载与同步 ----------
+
+    async def ensure_loaded(self):
+        """首次使用时加载全部无人机"""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                await self.resync()
+                self._loaded = True
+
+    async def resync(self):
+        """从数据库全量校准"""
+        drones = await Drone.find_all().to_list()
+        current = {drone.drone_id for drone in drones}
+        for drone_id in list(self._drones):
+            if drone_id not in current:
+                self.remove(drone_id)
+        for drone in drones:
+            self.apply(drone)
+        self.resyncs += 1
+        logger.debug(f"机队状态已校准，共 {len(drones)} 架无人机")
+
+    async def start(self):
+        """加载数据并启动后台同步"""
+        await self.ensure_loaded()
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks.append(loop.create_task(self._watch_changes()))
+        self._tasks.append(loop.create_task(self._resync_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _resync_loop(self):
+        while True:
+            await asyncio.sleep(self.resync_interval)
+            try:
+                await self.resync()
+            except Exception as e:
+                logger.error(f"机队状态校准失败: {str(e)}")
+
+    async def _watch_changes(self):
+        """订阅 drones 集合的 change stream，单机部署不支持时只依赖事件钩子和定期校准"""
+        try:
+            stream = get_collection(Drone).watch(full_document="updateLookup")
+            if inspect.isawaitable(stream):
+                stream = await stream
+            async with stream:
+                self.change_stream_active = True
+                logger.info("机队状态已订阅 drones 集合变更")
+                async for change in stream:
+                    self._apply_change(change)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"drones 集合变更订阅不可用，使用定期校准: {str(e)}")
+        finally:
+            self.change_stream_active = False
+
+    def _apply_change(self, change: Dict[str, Any]):
+        operation = change.get("operationType")
+        if operation == "delete":
+            # 删除事件只带 _id
+            object_id = change.get("documentKey", {}).get("_id")
+            for drone_id, drone in list(self._drones.items()):
+                if drone.id == object_id:
+                    self.remove(drone_id)
+            return
+        document = change.get("fullDocument")
+        if document:
+            self.apply(Drone.model_validate(document))
+
+    # ---------- 增量更新 ----------
+
+    def _unindex(self, drone_id: str):
+        keys = self._keys.pop(drone_id, None)
+        if keys is None:
+            return
+        status, battery = keys
+        self._by_status.get(status, set()).discard(drone_id)
+        index = bisect_left(self._battery, (battery, drone_id))
+        if index < len(self._battery) and self._battery[index] == (battery, drone_id):
+            del self._battery[index]
+
+    def _index(self, drone: Drone):
+        drone_id = drone.drone_id
+        status = _status_value(drone.status)
+        battery = float(drone.battery_level)
+        self._by_status.setdefault(status, set()).add(drone_id)
+        insort(self._battery, (battery, drone_id))
+        self._keys[drone_id] = (status, battery)
+
+        # 位置索引原地移动，不需要先删除
+        location = drone.current_location
+        if location and len(location.coordinates) >= 2:
+            lon, lat = location.coordinates[:2]
+            self._locations.insert(drone_id, lon, lat)
+            if status == DroneStatus.IDLE.value:
+                self._idle.insert(drone_id, lon, lat)
+            else:
+                self._idle.remove(drone_id)
+        else:
+            self._locations.remove(drone_id)
+            self._idle.remove(drone_id)
+
+    def apply(self, drone: Drone):
+        """写入（或替换为）最新的无人机文档"""
+        # 直接换成新对象，不改写旧对象：智能体可能正持有旧对象并有未保存的修改
+        self._unindex(drone.drone_id)
+        self._drones[drone.drone_id] = drone
+        self._index(drone)
+        self.applied += 1
+
+    def apply_telemetry(self, drone_id: str, status: Any = None, battery_level: Optional[float] = None,
+                        location: Optional[List[float]] = None, altitude: Optional[float] = None) -> bool:
+        """
+        根据遥测或状态事件更新内存状态（不写数据库）
+
+        Returns:
+            无人机是否在存储中
+        """
+        drone = self._drones.get(drone_id)
+        if drone is None:
+            return False
+        update: Dict[str, Any] = {}
+        if status is not None:
+            update["status"] = status
+        if battery_level is not None:
+            update["battery_level"] = battery_level
+        if location is not None:
+            update["current_location"] = GeoPoint(coordinates=list(location[:2]), altitude=altitude)
+        # 同 apply，换成副本而不改写其他持有者手里的对象
+        drone = drone.model_copy(update=update)
+        self._unindex(drone_id)
+        self._drones[drone_id] = drone
+        self._index(drone)
+        self.telemetry_updates += 1
+        return True
+
+    async def reserve(self, drone_id: str, task_ids: Optional[List[str]] = None,
+                      status: Any = DroneStatus.FLYING) -> Optional[Drone]:
+        """
+        预留空闲无人机
+
+        内存状态可能落后于其他进程的写入（没有 change stream 时最多一个校准周期），
+        因此先在内存中标记（本进程内的并发预留不会选中同一架），再用以 status=idle
+        为条件的原子更新确认；条件不满足说明已被其他进程预留，此时重新加载该无人机。
+
+        Args:
+            drone_id: 无人机ID
+            task_ids: 同时加入无人机 assigned_tasks 的任务
+            status: 预留后的状态
+
+        Returns:
+            预留成功时为更新后的无人机，否则为 None
+        """
+        drone = self._drones.get(drone_id)
+        if drone is not None and _status_value(drone.status) != DroneStatus.IDLE.value:
+            return None
+        self.apply_telemetry(drone_id, status=status)
+
+        update: Dict[str, Any] = {"$set": {"status": status, "updated_at": datetime.utcnow()}}
+        if task_ids:
+            update["$addToSet"] = {"assigned_tasks": {"$each": list(task_ids)}}
+        try:
+            reserved = await Drone.find_one(
+                {"drone_id": drone_id, "status": DroneStatus.IDLE}
+            ).update(update, response_type=UpdateResponse.NEW_DOCUMENT)
+        except Exception as e:
+            logger.error(f"预留无人机 {drone_id} 失败: {str(e)}")
+            self.apply_telemetry(drone_id, status=DroneStatus.IDLE)
+            return None
+
+        if reserved is not None:
+            self.apply(reserved)
+            self.reservations += 1
+            return reserved
+
+        self.reservation_conflicts += 1
+        try:
+            await self._reload(drone_id)
+        except Exception as e:
+            logger.error(f"重新加载无人机 {drone_id} 失败: {str(e)}")
+        return None
+
+    async def release(self, drone_id: str, task_ids: Optional[List[str]] = None,
+                      status: Any = DroneStatus.FLYING) -> bool:
+        """撤销 reserve：仍处于预留状态时恢复为空闲"""
+        update: Dict[str, Any] = {"$set": {"status": DroneStatus.IDLE, "updated_at": datetime.utcnow()}}
+        if task_ids:
+            update["$pullAll"] = {"assigned_tasks": list(task_ids)}
+        released = await Drone.find_one(
+            {"drone_id": drone_id, "status": status}
+        ).update(update, response_type=UpdateResponse.NEW_DOCUMENT)
+        if released is not None:
+            self.apply(released)
+            return True
+        await self._reload(drone_id)
+        return False
+
+    async def _reload(self, drone_id: str):
+        drone = await Drone.find_one({"drone_id": drone_id})
+        if drone is None:
+            self.remove(drone_id)
+        else:
+            self.apply(drone)
+
+    def _on_drone_change(self, drone: Drone, deleted: bool):
+        """Drone 文档写入回调"""
+        if deleted:
+            self.remove(drone.drone_id)
+        else:
+            self.apply(drone)
+
+    def remove(self, drone_id: str) -> bool:
+        self._unindex(drone_id)
+        self._locations.remove(drone_id)
+        self._idle.remove(drone_id)
+        return self._drones.pop(drone_id, None) is not None
+
+    # ---------- 查询 ----------
+
+    def get(self, drone_id: str) -> Optional[Drone]:
+        self.lookups += 1
+        return self._drones.get(drone_id)
+
+    async def get_drone(self, drone_id: str) -> Optional[Drone]:
+        """按ID获取无人机，内存中没有时回源数据库"""
+        await self.ensure_loaded()
+        drone = self.get(drone_id)
+        if drone is None:
+            drone = await Drone.find_one({"drone_id": drone_id})
+            if drone is not None:
+                self.apply(drone)
+        return drone
+
+    def all(self) -> List[Drone]:
+        self.lookups += 1
+        return list(self._drones.values())
+
+    def by_status(self, *statuses: Any) -> List[Drone]:
+        """指定状态的无人机"""
+        self.lookups += 1
+        result = []
+        for status in statuses:
+            result.extend(self._drones[drone_id] for drone_id in self._by_status.get(_status_value(status), ()))
+        return result
+
+    def count_by_status(self) -> Dict[str, int]:
+        return {status: len(ids) for status, ids in self._by_status.items() if ids}
+
+    def with_battery(self, min_level: float, status: Any = None) -> List[Drone]:
+        """电量不低于 min_level 的无人机，按电量从高到低排列"""
+        self.lookups += 1
+        start = bisect_left(self._battery, (min_level, ""))
+        drones = [self._drones[drone_id] for _, drone_id in reversed(self._battery[start:])]
+        if status is not None:
+            drones = [drone for drone in drones if _status_value(drone.status) == _status_value(status)]
+        return drones
+
+    def nearby(self, lon: float, lat: float, radius: float, status: Any = None,
+               min_battery: float = 0.0) -> List[Tuple[float, Drone]]:
+        """
+        半径范围内的无人机
+
+        Args:
+            lon, lat: 中心点
+            radius: 半径（米）
+            status: 只返回该状态的无人机
+            min_battery: 最低电量
+
+        Returns:
+            按距离升序排列的 (距离米, 无人机)
+        """
+        self.lookups += 1
+        wanted = _status_value(status) if status is not None else None
+
+        def accept(drone_id: str) -> bool:
+            drone = self._drones[drone_id]
+            if wanted is not None and _status_value(drone.status) != wanted:
+                return False
+            return drone.battery_level >= min_battery
+
+        return [
+            (distance, self._drones[drone_id])
+            for distance, drone_id in self._locations.within(lon, lat, radius, accept)
+        ]
+
+    def nearest_available(self, lon: float, lat: float, k: int = 1, min_battery: float = 0.0,
+                          min_payload: float = 0.0, max_distance: Optional[float] = None,
+                          among: Optional[Set[str]] = None) -> List[Tuple[float, Drone]]:
+        """
+        离指定点最近的 k 架满足条件的空闲无人机
+
+        Args:
+            lon, lat: 查询点
+            k: 返回数量
+            min_battery: 最低电量（百分比）
+            min_payload: 最低载重能力（千克）
+            max_distance: 最大距离（米）
+            among: 只在这些无人机ID中查找
+
+        Returns:
+            按距离升序排列的 (距离米, 无人机)
+        """
+        self.lookups += 1
+
+        def capable(drone_id: str) -> bool:
+            if among is not None and drone_id not in among:
+                return False
+            drone = self._drones[drone_id]
+            return drone.battery_level >= min_battery and drone.payload_capacity >= min_payload
+
+        return [
+            (distance, self._drones[drone_id])
+            for distance, drone_id in self._idle.nearest(lon, lat, k, capable, max_distance)
+        ]
+
+    def __len__(self) -> int:
+        return len(self._drones)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "drones": len(self._drones),
+            "by_status": self.count_by_status(),
+            "applied": self.applied,
+            "telemetry_updates": self.telemetry_updates,
+            "resyncs": self.resyncs,
+            "lookups": self.lookups,
+            "reservations": self.reservations,
+            "reservation_conflicts": self.reservation_conflicts,
+            "change_stream_active": self.change_stream_active
+        }
+
+
+# 创建全局机队状态实例
+fleet_state = FleetState()
+DRONE_CHANGE_LISTENERS.append(fleet_state._on_drone_change)
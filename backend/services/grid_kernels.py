@@ -0,0 +1,390 @@
+"""
+路径规划网格搜索内核
+
+把搜索走廊栅格化为 int8 网格（空闲/禁飞/走廊外），在数组上运行 A*/Dijkstra。
+搜索状态保存在 GridSearchState 中，走廊加宽时平移到更大的数组上继续搜索，
+扩展顺序和迭代次数与纯Python实现相同。
+安装了 numba 时内核以 @njit(cache=True) 编译，编译结果缓存在 __pycache__ 中，
+服务启动时调用 warmup() 加载缓存，避免首次规划时的JIT延迟；未安装时由
+PathPlanningService 回退到纯Python搜索。
+"""
+import math
+from types import SimpleNamespace
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+import shapely
+
+from config.logging_config import get_logger
+
+logger = get_logger("services.grid_kernels")
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """未安装numba时保持函数原样，仅用于让模块可以正常导入"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# 网格单元状态
+CELL_FREE = 0
+CELL_BLOCKED = 1
+CELL_OUTSIDE = 2
+
+
+def rasterize_corridor(geometry: Optional[Any], corridor: Any, origin_lon: float, origin_lat: float,
+                       grid_size: float, previous: Optional[Tuple[np.ndarray, int, int]] = None
+                       ) -> Tuple[np.ndarray, int, int]:
+    """
+    将搜索走廊栅格化
+
+    Args:
+        geometry: 禁飞区合并后的几何对象，没有禁飞区时为None
+        corridor: 网格坐标下的 SearchCorridor
+        origin_lon, origin_lat: 网格原点经纬度
+        grid_size: 网格尺寸（度）
+        previous: 加宽前的栅格 (单元状态数组, x偏移, y偏移)，其中已在走廊内的单元不再重复做点面判断
+
+    Returns:
+        (单元状态数组[x, y], x偏移, y偏移)
+    """
+    semi_major = corridor.length / 2 + corridor.margin
+    cx = (corridor.start[0] + corridor.end[0]) / 2
+    cy = (corridor.start[1] + corridor.end[1]) / 2
+    # 外接矩形多留一个网格，走廊内单元的邻居都在数组范围内
+    x0, x1 = int(math.floor(cx - semi_major)) - 1, int(math.ceil(cx + semi_major)) + 1
+    y0, y1 = int(math.floor(cy - semi_major)) - 1, int(math.ceil(cy + semi_major)) + 1
+
+    gx, gy = np.meshgrid(
+        np.arange(x0, x1 + 1, dtype=np.int32),
+        np.arange(y0, y1 + 1, dtype=np.int32),
+        indexing="ij"
+    )
+    inside = (np.hypot(gx - corridor.start[0], gy - corridor.start[1]) +
+              np.hypot(gx - corridor.end[0], gy - corridor.end[1])) <= corridor.length + 2 * corridor.margin
+
+    cells = np.full(gx.shape, CELL_OUTSIDE, dtype=np.int8)
+    pending = inside
+    if previous is not None:
+        old_cells, old_x0, old_y0 = previous
+        dx, dy = old_x0 - x0, old_y0 - y0
+        width, height = old_cells.shape
+        cells[dx:dx + width, dy:dy + height] = old_cells
+        pending = inside & (cells == CELL_OUTSIDE)
+    cells[pending] = CELL_FREE
+    if geometry is not None and not geometry.is_empty and pending.any():
+        # 只对新进入走廊的单元做点面判断，一次向量化调用完成
+        lons = origin_lon + gx[pending] * grid_size
+        lats = origin_lat + gy[pending] * grid_size
+        blocked = shapely.contains_xy(geometry, lons, lats)
+        cells[pending] = np.where(blocked, CELL_BLOCKED, CELL_FREE).astype(np.int8)
+
+    return cells, x0, y0
+
+
+@njit(cache=True)
+def _heap_less(heap_f, heap_g, heap_i, a, b):
+    if heap_f[a] != heap_f[b]:
+        return heap_f[a] < heap_f[b]
+    if heap_g[a] != heap_g[b]:
+        return heap_g[a] < heap_g[b]
+    return heap_i[a] < heap_i[b]
+
+
+@njit(cache=True)
+def _heap_swap(heap_f, heap_g, heap_i, a, b):
+    heap_f[a], heap_f[b] = heap_f[b], heap_f[a]
+    heap_g[a], heap_g[b] = heap_g[b], heap_g[a]
+    heap_i[a], heap_i[b] = heap_i[b], heap_i[a]
+
+
+@njit(cache=True)
+def _heap_sift_up(heap_f, heap_g, heap_i, pos):
+    while pos > 0:
+        parent = (pos - 1) >> 1
+        if _heap_less(heap_f, heap_g, heap_i, pos, parent):
+            _heap_swap(heap_f, heap_g, heap_i, pos, parent)
+            pos = parent
+        else:
+            break
+
+
+@njit(cache=True)
+def _heap_sift_down(heap_f, heap_g, heap_i, size):
+    pos = 0
+    while True:
+        left = 2 * pos + 1
+        if left >= size:
+            break
+        child = left
+        if left + 1 < size and _heap_less(heap_f, heap_g, heap_i, left + 1, left):
+            child = left + 1
+        if _heap_less(heap_f, heap_g, heap_i, child, pos):
+            _heap_swap(heap_f, heap_g, heap_i, child, pos)
+            pos = child
+        else:
+            break
+
+
+@njit(cache=True)
+def _heap_push(heap_f, heap_g, heap_i, size, f, g, index):
+    if size == heap_f.shape[0]:
+        capacity = 2 * size
+        grown_f = np.empty(capacity, dtype=np.float64)
+        grown_g = np.empty(capacity, dtype=np.float64)
+        grown_i = np.empty(capacity, dtype=np.int32)
+        grown_f[:size] = heap_f[:size]
+        grown_g[:size] = heap_g[:size]
+        grown_i[:size] = heap_i[:size]
+        heap_f, heap_g, heap_i = grown_f, grown_g, grown_i
+    heap_f[size] = f
+    heap_g[size] = g
+    heap_i[size] = index
+    _heap_sift_up(heap_f, heap_g, heap_i, size)
+    return heap_f, heap_g, heap_i, size + 1
+
+
+@njit(cache=True)
+def grid_search_kernel(cells, g_score, parent, closed, deferred, heap_f, heap_g, heap_i, size,
+                       ex, ey, diagonal_cost, use_heuristic, max_iterations):
+    """
+    在栅格上做最佳优先搜索，代价和扩展顺序与纯Python实现一致
+
+    搜索状态由调用方持有，走廊加宽后从上次停下的位置继续搜索。
+
+    Args:
+        cells: 单元状态数组[x, y]
+        g_score, parent, closed: 按 x * height + y 展开的代价、父节点和关闭标记
+        deferred: 走廊外邻居的最优代价（父节点记在 parent 中），走廊加宽后重新加入开放集合
+        heap_f, heap_g, heap_i, size: 开放集合（二叉堆）
+        ex, ey: 终点在数组中的下标
+        diagonal_cost: 对角线移动代价
+        use_heuristic: 是否使用曼哈顿距离启发式（A*），否则为Dijkstra
+        max_iterations: 本次调用的最大迭代次数
+
+    Returns:
+        (路径下标数组[n, 2]，未找到时为空, 迭代次数, heap_f, heap_g, heap_i, size)
+    """
+    width, height = cells.shape
+    goal = ex * height + ey
+
+    dxs = (0, 1, 0, -1, 1, 1, -1, -1)
+    dys = (1, 0, -1, 0, 1, -1, 1, -1)
+    iterations = 0
+
+    while size > 0 and iterations < max_iterations:
+        iterations += 1
+
+        cost = heap_g[0]
+        current = heap_i[0]
+        size -= 1
+        if size > 0:
+            heap_f[0] = heap_f[size]
+            heap_g[0] = heap_g[size]
+            heap_i[0] = heap_i[size]
+            _heap_sift_down(heap_f, heap_g, heap_i, size)
+
+        if current == goal:
+            length = 1
+            node = current
+            while parent[node] != -1:
+                node = parent[node]
+                length += 1
+            path = np.empty((length, 2), dtype=np.int32)
+            node = current
+            for k in range(length - 1, -1, -1):
+                path[k, 0] = node // height
+                path[k, 1] = node % height
+                node = parent[node]
+            return path, iterations, heap_f, heap_g, heap_i, size
+
+        if closed[current]:
+            continue
+        closed[current] = 1
+
+        cx = current // height
+        cy = current % height
+        for k in range(8):
+            nx = cx + dxs[k]
+            ny = cy + dys[k]
+            if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                continue
+            neighbor = nx * height + ny
+            if closed[neighbor]:
+                continue
+
+            step = diagonal_cost if dxs[k] != 0 and dys[k] != 0 else 1.0
+            new_cost = cost + step
+            if new_cost >= g_score[neighbor]:
+                continue
+
+            state = cells[nx, ny]
+            if state == CELL_OUTSIDE:
+                # 走廊外的节点暂存，等走廊加宽后再加入开放集合
+                if new_cost < deferred[neighbor]:
+                    deferred[neighbor] = new_cost
+                    parent[neighbor] = current
+                continue
+            if state == CELL_BLOCKED:
+                continue
+
+            g_score[neighbor] = new_cost
+            parent[neighbor] = current
+            h = float(abs(nx - ex) + abs(ny - ey)) if use_heuristic else 0.0
+            heap_f, heap_g, heap_i, size = _heap_push(heap_f, heap_g, heap_i, size, new_cost + h, new_cost, neighbor)
+
+    return np.empty((0, 2), dtype=np.int32), iterations, heap_f, heap_g, heap_i, size
+
+
+@njit(cache=True)
+def readmit_deferred(cells, g_score, closed, deferred, heap_f, heap_g, heap_i, size, ex, ey, use_heuristic):
+    """走廊加宽后，把进入走廊的待定节点加入开放集合"""
+    width, height = cells.shape
+    for index in range(width * height):
+        cost = deferred[index]
+        if cost == np.inf:
+            continue
+        state = cells[index // height, index % height]
+        if state == CELL_OUTSIDE:
+            continue
+        deferred[index] = np.inf
+        if state == CELL_BLOCKED or closed[index] or cost >= g_score[index]:
+            continue
+        g_score[index] = cost
+        x = index // height
+        y = index % height
+        h = float(abs(x - ex) + abs(y - ey)) if use_heuristic else 0.0
+        heap_f, heap_g, heap_i, size = _heap_push(heap_f, heap_g, heap_i, size, cost + h, cost, index)
+    return heap_f, heap_g, heap_i, size
+
+
+class GridSearchState:
+    """
+    跨走廊加宽保留的网格搜索状态
+
+    数组按走廊的外接矩形分配，下标为 (x - x0) * height + (y - y0)。走廊加宽时分配更大的数组，
+    把已有的代价、父节点、关闭标记和开放集合平移过去，只对新进入走廊的单元做禁飞区判断，
+    再把进入走廊的待定节点加入开放集合，与纯Python实现的加宽方式一致。
+    """
+
+    def __init__(self, geometry: Optional[Any], corridor: Any, origin_lon: float, origin_lat: float,
+                 grid_size: float, start: Tuple[int, int], end: Tuple[int, int],
+                 diagonal_cost: float, use_heuristic: bool):
+        self.geometry = geometry
+        self.origin_lon = origin_lon
+        self.origin_lat = origin_lat
+        self.grid_size = grid_size
+        self.end = end
+        self.diagonal_cost = float(diagonal_cost)
+        self.use_heuristic = use_heuristic
+
+        self.cells, self.x0, self.y0 = rasterize_corridor(geometry, corridor, origin_lon, origin_lat, grid_size)
+        total = self.cells.size
+        self.g_score = np.full(total, np.inf)
+        self.parent = np.full(total, -1, dtype=np.int32)
+        self.closed = np.zeros(total, dtype=np.uint8)
+        self.deferred = np.full(total, np.inf)
+        self.heap_f = np.empty(1024, dtype=np.float64)
+        self.heap_g = np.empty(1024, dtype=np.float64)
+        self.heap_i = np.empty(1024, dtype=np.int32)
+
+        index = self._index(start)
+        self.g_score[index] = 0.0
+        h = float(abs(start[0] - end[0]) + abs(start[1] - end[1])) if use_heuristic else 0.0
+        self.heap_f[0] = h
+        self.heap_g[0] = 0.0
+        self.heap_i[0] = index
+        self.size = 1
+
+    def _index(self, point: Tuple[int, int]) -> int:
+        return (point[0] - self.x0) * self.cells.shape[1] + (point[1] - self.y0)
+
+    @property
+    def exhausted(self) -> bool:
+        """开放集合是否已耗尽"""
+        return self.size == 0
+
+    def has_deferred(self) -> bool:
+        """是否有走廊外的待定节点"""
+        return bool(np.isfinite(self.deferred).any())
+
+    def search(self, max_iterations: int) -> Tuple[Optional[List[Tuple[int, int]]], int]:
+        """
+        继续搜索
+
+        Returns:
+            (网格路径，未找到时为None, 本次迭代次数)
+        """
+        ex, ey = self.end[0] - self.x0, self.end[1] - self.y0
+        path, iterations, self.heap_f, self.heap_g, self.heap_i, self.size = grid_search_kernel(
+            self.cells, self.g_score, self.parent, self.closed, self.deferred,
+            self.heap_f, self.heap_g, self.heap_i, self.size,
+            ex, ey, self.diagonal_cost, self.use_heuristic, max_iterations
+        )
+        if len(path):
+            return [(int(x) + self.x0, int(y) + self.y0) for x, y in path], iterations
+        return None, iterations
+
+    def widen(self, corridor: Any):
+        """按加宽后的走廊扩大数组并平移已有状态，进入走廊的待定节点加入开放集合"""
+        old_width, old_height = self.cells.shape
+        cells, x0, y0 = rasterize_corridor(
+            self.geometry, corridor, self.origin_lon, self.origin_lat, self.grid_size,
+            previous=(self.cells, self.x0, self.y0)
+        )
+        width, height = cells.shape
+        dx, dy = self.x0 - x0, self.y0 - y0
+
+        def grow(array: np.ndarray, fill: Any) -> np.ndarray:
+            grown = np.full((width, height), fill, dtype=array.dtype)
+            grown[dx:dx + old_width, dy:dy + old_height] = array.reshape(old_width, old_height)
+            return grown.ravel()
+
+        def move(index: np.ndarray) -> np.ndarray:
+            # 平移保持 (x, y) 的字典序，堆中相同代价节点的先后顺序不变
+            return ((index // old_height + dx) * height + index % old_height + dy).astype(np.int32)
+
+        self.g_score = grow(self.g_score, np.inf)
+        self.closed = grow(self.closed, 0)
+        self.deferred = grow(self.deferred, np.inf)
+        parent = grow(self.parent, -1)
+        linked = parent >= 0
+        parent[linked] = move(parent[linked])
+        self.parent = parent
+        self.heap_i[:self.size] = move(self.heap_i[:self.size])
+        self.cells, self.x0, self.y0 = cells, x0, y0
+
+        self.heap_f, self.heap_g, self.heap_i, self.size = readmit_deferred(
+            self.cells, self.g_score, self.closed, self.deferred,
+            self.heap_f, self.heap_g, self.heap_i, self.size,
+            self.end[0] - self.x0, self.end[1] - self.y0, self.use_heuristic
+        )
+
+
+def warmup() -> bool:
+    """
+    在小网格上搜索一次（包括一次走廊加宽），触发编译或加载磁盘缓存
+
+    Returns:
+        内核是否可用
+    """
+    if not NUMBA_AVAILABLE:
+        return False
+    try:
+        corridor = SimpleNamespace(start=(0, 0), end=(7, 7), length=math.hypot(7, 7), margin=1.0)
+        for diagonal_cost, use_heuristic in ((1.0, True), (1.414, False)):
+            corridor.margin = 1.0
+            state = GridSearchState(None, corridor, 0.0, 0.0, 1.0, (0, 0), (7, 7), diagonal_cost, use_heuristic)
+            state.search(4)
+            corridor.margin = 4.0
+            state.widen(corridor)
+            state.search(1000)
+        return True
+    except Exception as e:
+        logger.error(f"路径规划加速内核编译失败: {str(e)}")
+        return False
@@ -0,0 +1,254 @@
+"""
+LLM响应缓存
+
+相同类型的事件反复出现时（例如同一摄像头前多次出现人群聚集），
+LLM生成的响应计划和分析结果基本相同。本模块按规范化的事件特征缓存LLM结果，
+命中时直接返回，不消耗令牌，延迟在毫秒级。
+
+缓存键（事件签名）由以下特征组成：
+- 事件类型和级别
+- 位置所在网格（经纬度按 LLM_CACHE_CELL_SIZE 取整）
+- 检测类别直方图（各类别数量按 1、2-3、4-7、8-15... 分档，避免人数略有变化就无法命中）
+
+条目按 LRU 淘汰，并在 LLM_CACHE_TTL 秒后过期；配置了 LLM_CACHE_PATH 时可持久化到磁盘，
+过期时间使用墙上时钟，重启后仍然有效。
+"""
+import hashlib
+import json
+import math
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Union
+
+from config.logging_config import get_logger
+from config.settings import settings
+
+logger = get_logger("services.llm_cache")
+
+
+def _enum_value(value: Any) -> Any:
+    return getattr(value, "value", value)
+
+
+def _coordinates(location: Any) -> Optional[Tuple[float, float]]:
+    """从 Location 模型、位置字典或 [经度, 纬度] 中取出坐标"""
+    if location is None:
+        return None
+    if hasattr(location, "dict"):
+        location = location.dict()
+    if isinstance(location, dict):
+        position = location.get("position", location)
+        location = position.get("coordinates") if isinstance(position, dict) else None
+    if not location or len(location) < 2:
+        return None
+    return float(location[0]), float(location[1])
+
+
+def _count_bucket(count: int) -> int:
+    """数量分档：1 -> 1，2-3 -> 2，4-7 -> 3，..."""
+    return max(0, int(count)).bit_length()
+
+
+def detection_histogram(bounding_boxes: Optional[List[Any]] = None,
+                        detection_data: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """
+    检测类别直方图（数量已分档）
+
+    优先使用边界框中的类别名称，没有边界框时使用检测数据中的
+    class_counts（类别 -> 数量）或 detections（含 class_name 的列表）。
+    """
+    counts: Counter = Counter()
+    for box in bounding_boxes or []:
+        name = box.get("class_name") if isinstance(box, dict) else getattr(box, "class_name", None)
+        if name:
+            counts[name] += 1
+
+    if not counts and detection_data:
+        class_counts = detection_data.get("class_counts")
+        if isinstance(class_counts, dict):
+            counts.update({str(name): int(count) for name, count in class_counts.items()})
+        for item in detection_data.get("detections") or []:
+            if isinstance(item, dict) and item.get("class_name"):
+                counts[item["class_name"]] += 1
+
+    return {name: _count_bucket(count) for name, count in sorted(counts.items()) if count > 0}
+
+
+def event_signature(event_type: Any, level: Any = None, location: Any = None,
+                    bounding_boxes: Optional[List[Any]] = None,
+                    detection_data: Optional[Dict[str, Any]] = None,
+                    cell_size: Optional[float] = None) -> str:
+    """
+    规范化的事件签名
+
+    Returns:
+        特征的规范JSON串（键排序），可直接作为缓存键
+    """
+    cell_size = cell_size or settings.LLM_CACHE_CELL_SIZE
+    coordinates = _coordinates(location)
+    cell = None
+    if coordinates is not None:
+        cell = [math.floor(coordinates[0] / cell_size), math.floor(coordinates[1] / cell_size)]
+
+    features = {
+        "type": _enum_value(event_type),
+        "level": _enum_value(level),
+        "cell": cell,
+        "classes": detection_histogram(bounding_boxes, detection_data)
+    }
+    return json.dumps(features, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def signature_of(event: Union[Dict[str, Any], Any], cell_size: Optional[float] = None) -> str:
+    """Event 文档或事件字典的签名"""
+    if isinstance(event, dict):
+        return event_signature(
+            event.get("type"), event.get("level"), event.get("location"),
+            event.get("bounding_boxes"), event.get("detection_data"), cell_size
+        )
+    return event_signature(
+        event.type, event.level, event.location,
+        event.bounding_boxes, event.detection_data, cell_size
+    )
+
+
+class LLMResponseCache:
+    """带TTL和LRU淘汰的LLM响应缓存"""
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None,
+                 path: Optional[str] = None):
+        self.max_size = max_size if max_size is not None else settings.LLM_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else settings.LLM_CACHE_TTL
+        path = path if path is not None else settings.LLM_CACHE_PATH
+        self.path = Path(path) if path else None  # 为空时不持久化
+        # 键 -> (过期时间戳, 值)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._loaded = False
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.saved_tokens = 0
+
+    @staticmethod
+    def make_key(namespace: str, signature: str) -> str:
+        """缓存键：命名空间 + 签名摘要"""
+        digest = hashlib.sha1(signature.encode("utf-8")).hexdigest()
+        return f"{namespace}:{digest}"
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """查找缓存，命中时返回值并刷新LRU顺序"""
+        if not self.enabled:
+            return None
+        self.ensure_loaded()
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        if isinstance(value, dict):
+            self.saved_tokens += value.get("tokens", 0) or 0
+        return value
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if not self.enabled:
+            return
+        self.ensure_loaded()
+        self._entries[key] = (time.time() + (ttl or self.ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Optional[str] = None):
+        """删除指定条目，不指定时清空缓存"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------- 持久化 ----------
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self._loaded = True
+            self.load()
+
+    def load(self) -> int:
+        """从磁盘加载未过期的条目，返回加载的条数"""
+        if self.path is None or not self.path.exists():
+            return 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"加载LLM响应缓存失败: {str(e)}")
+            return 0
+
+        now = time.time()
+        loaded = 0
+        for key, expires_at, value in data.get("entries", []):
+            if expires_at > now and key not in self._entries:
+                self._entries[key] = (expires_at, value)
+                loaded += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        logger.info(f"加载了 {loaded} 条LLM响应缓存")
+        return loaded
+
+    def save(self) -> int:
+        """把未过期的条目按LRU顺序写入磁盘，返回保存的条数"""
+        if self.path is None or not self._loaded:
+            return 0
+        now = time.time()
+        entries = [
+            [key, expires_at, value]
+            for key, (expires_at, value) in self._entries.items()
+            if expires_at > now
+        ]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": entries}, f, ensure_ascii=False)
+            tmp_path.replace(self.path)
+        except Exception as e:
+            logger.error(f"保存LLM响应缓存失败: {str(e)}")
+            return 0
+        logger.info(f"保存了 {len(entries)} 条LLM响应缓存")
+        return len(entries)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "saved_tokens": self.saved_tokens
+        }
+
+
+# 创建全局LLM响应缓存实例
+llm_response_cache = LLMResponseCache()
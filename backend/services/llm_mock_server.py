@@ -0,0 +1,268 @@
+"""
+本地模拟LLM服务器
+
+实现OpenAI聊天补全接口（/v1/chat/completions，支持 stream=true），
+按延迟/吞吐画像模拟首令牌延迟、生成速度、服务端并发上限和限流错误，
+返回可以解析为 ResponsePlan 的固定JSON，用于离线测试和基准测试应急响应链路。
+流式请求带 stream_options.include_usage 时在最后一个分片中返回令牌用量。
+
+用法（在 backend 目录下）:
+    python -m services.llm_mock_server --profile gpt4 --port 8765
+    LLM_BACKEND=mock LLM_MOCK_URL=http://127.0.0.1:8765/v1 python main.py
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Any, Optional
+
+import uvicorn
+from fastapi import FastAPI, Body
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from config.logging_config import get_logger
+
+logger = get_logger("services.llm_mock_server")
+
+
+@dataclass
+class MockProfile:
+    """延迟/吞吐画像"""
+    first_token_latency: float  # 首令牌延迟（秒）
+    tokens_per_second: float  # 生成速度（令牌/秒）
+    jitter: float = 0.1  # 延迟随机波动比例
+    max_concurrency: int = 64  # 服务端同时处理的请求数，超出的请求排队
+    error_rate: float = 0.0  # 返回429限流错误的概率
+
+
+PROFILES: Dict[str, MockProfile] = {
+    "instant": MockProfile(first_token_latency=0.0, tokens_per_second=1e9, jitter=0.0, max_concurrency=1024),
+    "fast": MockProfile(first_token_latency=0.2, tokens_per_second=200.0),
+    "gpt4": MockProfile(first_token_latency=0.8, tokens_per_second=40.0, jitter=0.3, max_concurrency=32),
+    "overloaded": MockProfile(first_token_latency=1.5, tokens_per_second=20.0, jitter=0.5,
+                              max_concurrency=8, error_rate=0.05),
+}
+
+_FIELD_PATTERN = r"-\s*{label}:\s*(\S+)"
+
+# 计划严重程度 -> 模拟计划的行动（不依赖智能体模块，保持服务层不反向引用 agents）
+_CANNED_ACTIONS = [
+    {"action_type": "deploy_drones", "priority": 10, "description": "派遣附近无人机前往现场侦察",
+     "resources_needed": ["无人机"], "estimated_time": 5, "min_severity": "low"},
+    {"action_type": "notify_authorities", "priority": 9, "description": "通知相关部门",
+     "resources_needed": ["紧急服务"], "estimated_time": 2, "min_severity": "medium"},
+    {"action_type": "evacuate_area", "priority": 8, "description": "疏散事件周边人员",
+     "resources_needed": ["无人机", "紧急服务"], "estimated_time": 15, "min_severity": "high"},
+    {"action_type": "monitor_situation", "priority": 7, "description": "持续监控现场态势",
+     "resources_needed": ["无人机"], "estimated_time": 30, "min_severity": "low"},
+]
+_SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2}
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算令牌数：中日韩字符每字约1个令牌，其他字符约4个字符1个令牌"""
+    wide = sum(1 for char in text if ord(char) > 0x2E80)
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def _prompt_field(prompt: str, label: str) -> Optional[str]:
+    match = re.search(_FIELD_PATTERN.format(label=label), prompt)
+    return match.group(1) if match else None
+
+
+def _enum_name(value: Optional[str], choices, default: str) -> str:
+    # 提示词中可能是 "EventType.SECURITY" 或 "security"
+    value = (value or "").split(".")[-1].lower()
+    return value if value in choices else default
+
+
+def canned_response(messages: List[Dict[str, str]]) -> str:
+    """
+    根据提示词返回固定的响应内容
+
+    响应计划请求按提示词中的事件级别返回固定计划，
+    安全事件分析请求返回固定的分析结果，其他请求返回简短文本。
+    """
+    prompt = "\n".join(str(message.get("content", "")) for message in messages)
+    if "响应计划" in prompt:
+        severity = _enum_name(_prompt_field(prompt, "级别"), _SEVERITY_RANK, "medium")
+        event_type = _prompt_field(prompt, "类型") or "emergency"
+        title = _prompt_field(prompt, "标题") or "事件"
+        plan = {
+            "situation_assessment": f"{title}：模拟评估的{severity}级{event_type.split('.')[-1].lower()}事件",
+            "severity_level": severity,
+            "actions": [
+                {key: value for key, value in action.items() if key != "min_severity"}
+                for action in _CANNED_ACTIONS
+                if _SEVERITY_RANK[severity] >= _SEVERITY_RANK[action["min_severity"]]
+            ],
+            "additional_notes": "模拟LLM生成的响应计划"
+        }
+        return json.dumps(plan, ensure_ascii=False)
+    if "安全事件" in prompt:
+        return json.dumps({
+            "event_nature": "模拟分析：可疑人员聚集",
+            "risk_assessment": {"level": "medium", "impact": "可能影响周边交通和公共秩序"},
+            "probable_causes": ["临时活动", "突发事件围观"],
+            "recommended_actions": ["派遣无人机持续监控", "通知辖区警力"],
+            "correlation_with_history": "与近期同区域事件类型一致"
+        }, ensure_ascii=False)
+    return "模拟LLM响应"
+
+
+class MockLLMServer:
+    """模拟服务器状态：并发槽位和统计"""
+
+    def __init__(self, profile: MockProfile):
+        self.profile = profile
+        self.slots = asyncio.Semaphore(profile.max_concurrency)
+        self.requests = 0
+        self.inflight = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def jittered(self, seconds: float) -> float:
+        return max(0.0, seconds * (1 + random.uniform(-self.profile.jitter, self.profile.jitter)))
+
+    def generation_time(self, tokens: int) -> float:
+        return self.jittered(tokens / self.profile.tokens_per_second)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "profile": asdict(self.profile),
+            "requests": self.requests,
+            "inflight": self.inflight,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens
+        }
+
+
+def create_app(profile: MockProfile) -> FastAPI:
+    """创建模拟服务器应用"""
+    app = FastAPI(title="SkyMind Mock LLM")
+    server = MockLLMServer(profile)
+    app.state.server = server
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "skymind"}]}
+
+    @app.get("/metrics")
+    async def metrics():
+        return server.get_metrics()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: Dict[str, Any] = Body(...)):
+        server.requests += 1
+        if random.random() < profile.error_rate:
+            server.errors += 1
+            return JSONResponse(status_code=429, content={
+                "error": {"message": "模拟限流", "type": "rate_limit_error", "code": "rate_limit_exceeded"}
+            })
+
+        messages = body.get("messages", [])
+        model = body.get("model", "mock")
+        text = canned_response(messages)
+        prompt_tokens = sum(estimate_tokens(str(message.get("content", ""))) for message in messages)
+        completion_tokens = estimate_tokens(text)
+        server.prompt_tokens += prompt_tokens
+        server.completion_tokens += completion_tokens
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+        if not body.get("stream"):
+            async with server.slots:
+                server.inflight += 1
+                try:
+                    await asyncio.sleep(
+                        server.jittered(profile.first_token_latency) + server.generation_time(completion_tokens)
+                    )
+                finally:
+                    server.inflight -= 1
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            }
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def events():
+            def chunk(delta: Optional[Dict[str, Any]], finish_reason: Optional[str] = None,
+                      chunk_usage: Optional[Dict[str, int]] = None) -> str:
+                data = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                }
+                if include_usage:
+                    data["usage"] = chunk_usage
+                return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+            async with server.slots:
+                server.inflight += 1
+                try:
+                    await asyncio.sleep(server.jittered(profile.first_token_latency))
+                    yield chunk({"role": "assistant", "content": ""})
+                    # 每个分片约16个字符
+                    pieces = [text[i:i + 16] for i in range(0, len(text), 16)]
+                    for piece in pieces:
+                        await asyncio.sleep(server.generation_time(estimate_tokens(piece)))
+                        yield chunk({"content": piece})
+                    yield chunk({}, "stop")
+                    if include_usage:
+                        # 与 OpenAI 一致：用量在最后一个没有 choices 的分片中返回
+                        yield chunk(None, chunk_usage=usage)
+                    yield "data: [DONE]\n\n"
+                finally:
+                    server.inflight -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="SkyMind 本地模拟LLM服务器")
+    parser.add_argument("--profile", default="fast", choices=list(PROFILES.keys()), help="延迟/吞吐画像")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-latency", type=float, help="覆盖画像的首令牌延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, help="覆盖画像的生成速度")
+    parser.add_argument("--max-concurrency", type=int, help="覆盖画像的服务端并发上限")
+    parser.add_argument("--error-rate", type=float, help="覆盖画像的限流错误概率")
+    args = parser.parse_args(argv)
+
+    profile = MockProfile(**asdict(PROFILES[args.profile]))
+    for field_name in ("first_token_latency", "tokens_per_second", "max_concurrency", "error_rate"):
+        value = getattr(args, field_name)
+        if value is not None:
+            setattr(profile, field_name, value)
+
+    logger.info(f"启动模拟LLM服务器 {args.host}:{args.port}，画像: {asdict(profile)}")
+    uvicorn.run(create_app(profile), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+并发LLM请求管道
+
+在 LLMService 的 AsyncOpenAI 客户端之上提供：
+- 并发上限：同时进行的请求数由 LLM_MAX_CONCURRENCY 控制，多余请求排队等待
+- 单次请求超时：每次尝试独立计时（LLM_REQUEST_TIMEOUT）
+- 重试：超时、限流、连接错误和服务端错误按指数退避重试，退避时间加全抖动，
+  避免多个并发请求同时重试；SDK 自带的重试关闭，重试次数只由 LLM_MAX_RETRIES 决定
+- 流式请求：逐段产出生成的文本，调用方可以在完整结果到达前开始处理
+- 排队、进行中、重试、超时、延迟和首个分片延迟统计
+"""
+import asyncio
+import random
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional, AsyncIterator
+
+import openai
+
+from config.logging_config import get_logger
+from config.settings import settings
+from core.metrics import llm_request_seconds, llm_first_token_seconds, llm_tokens_total
+from services.llm_service import LLMService, llm_service
+
+logger = get_logger("services.llm_pipeline")
+
+# 可以重试的错误
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LLMPipeline:
+    """带并发上限、超时和重试的LLM请求管道"""
+
+    def __init__(self, service: Optional[LLMService] = None, max_concurrency: Optional[int] = None,
+                 timeout: Optional[float] = None, max_retries: Optional[int] = None,
+                 base_backoff: Optional[float] = None):
+        self.service = service or llm_service
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.timeout = timeout or settings.LLM_REQUEST_TIMEOUT
+        self.max_retries = max_retries if max_retries is not None else settings.LLM_MAX_RETRIES
+        self.base_backoff = base_backoff or settings.LLM_RETRY_BACKOFF
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._client = None
+        self._client_source = None
+
+        self.queued = 0
+        self.inflight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.total_tokens = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.streams = 0
+        self.total_first_token_ms = 0.0
+        self.total_queue_ms = 0.0
+
+    @property
+    def client(self):
+        """关闭 SDK 自带重试的客户端（与 LLMService 的客户端共用连接池）"""
+        if self._client is None or self._client_source is not self.service.client:
+            self._client_source = self.service.client
+            self._client = self.service.client.with_options(max_retries=0)
+        return self._client
+
+    def _backoff(self, attempt: int) -> float:
+        # 全抖动：在 [0, base * 2^attempt] 内均匀取值
+        return random.uniform(0, self.base_backoff * 2 ** attempt)
+
+    async def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                   max_tokens: int = 500, timeout: Optional[float] = None,
+                   **options) -> Dict[str, Any]:
+        """
+        发送聊天补全请求
+
+        Args:
+            messages: 消息列表
+            temperature: 采样温度
+            max_tokens: 最大令牌数
+            timeout: 单次尝试的超时（秒），默认 LLM_REQUEST_TIMEOUT
+            **options: 透传给 chat.completions.create 的其他参数
+
+        Returns:
+            与 LLMService.generate_chat_completion 相同格式的结果，
+            另含 attempts、queue_ms（等待并发槽位的时间）和 latency_ms
+        """
+        if not self.service.is_initialized:
+            await self.service.initialize()
+        timeout = timeout or self.timeout
+
+        start_time = time.perf_counter()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        queue_ms = (time.perf_counter() - start_time) * 1000
+        self.total_queue_ms += queue_ms
+        self.inflight += 1
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=self.service.model,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            **options
+                        ),
+                        timeout=timeout
+                    )
+                    break
+                except RETRYABLE_ERRORS as e:
+                    if isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)):
+                        self.timeouts += 1
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+                    attempt += 1
+                    self.retries += 1
+                    logger.warning(f"LLM请求失败（{type(e).__name__}），{delay:.2f} 秒后第 {attempt} 次重试")
+                    await asyncio.sleep(delay)
+        except Exception as e:
+            self.failed += 1
+            llm_request_seconds.observe(time.perf_counter() - start_time, "chat", "error")
+            logger.error(f"LLM请求失败: {type(e).__name__}: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e) or type(e).__name__,
+                "attempts": attempt + 1,
+                "queue_ms": queue_ms,
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        finally:
+            self.inflight -= 1
+            self._slots.release()
+
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        tokens = response.usage.total_tokens if response.usage else 0
+        llm_request_seconds.observe(latency_ms / 1000, "chat", "success")
+        if response.usage:
+            llm_tokens_total.inc("prompt", amount=response.usage.prompt_tokens)
+            llm_tokens_total.inc("completion", amount=response.usage.completion_tokens)
+        self.completed += 1
+        self.total_tokens += tokens
+        self.total_latency_ms += latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self.service.request_count += 1
+        self.service.last_request_time = datetime.utcnow()
+
+        return {
+            "success": True,
+            "text": (response.choices[0].message.content or "").strip(),
+            "tokens": tokens,
+            "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+            "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+            "finish_reason": response.choices[0].finish_reason,
+            "attempts": attempt + 1,
+            "queue_ms": queue_ms,
+            "latency_ms": latency_ms,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+    async def stream(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                     max_tokens: int = 500, timeout: Optional[float] = None,
+                     stats: Optional[Dict[str, Any]] = None, **options) -> AsyncIterator[str]:
+        """
+        流式聊天补全，逐段产出生成的文本
+
+        并发槽位在整个流期间占用。只有建立流（收到响应头）之前的失败会重试，
+        流开始后中断直接抛出异常；每个分片的等待时间不超过 timeout。
+        默认请求服务端在最后一个分片中返回令牌用量（stream_options.include_usage）。
+
+        Args:
+            stats: 传入时写入本次请求的统计：attempts、queue_ms、first_token_ms、latency_ms
+                   以及 tokens、prompt_tokens、completion_tokens
+        """
+        stats = stats if stats is not None else {}
+        options.setdefault("stream_options", {"include_usage": True})
+        if not self.service.is_initialized:
+            await self.service.initialize()
+        timeout = timeout or self.timeout
+
+        start_time = time.perf_counter()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        queue_ms = (time.perf_counter() - start_time) * 1000
+        self.total_queue_ms += queue_ms
+        stats.update({"queue_ms": queue_ms, "tokens": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        self.inflight += 1
+        attempt = 0
+        response = None
+        finished = False
+        try:
+            while True:
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=self.service.model,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            stream=True,
+                            **options
+                        ),
+                        timeout=timeout
+                    )
+                    break
+                except RETRYABLE_ERRORS as e:
+                    if isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)):
+                        self.timeouts += 1
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(attempt)
+                    attempt += 1
+                    self.retries += 1
+                    logger.warning(f"LLM流式请求失败（{type(e).__name__}），{delay:.2f} 秒后第 {attempt} 次重试")
+                    await asyncio.sleep(delay)
+
+            chunks = response.__aiter__()
+            first = True
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    finished = True
+                    break
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    raise
+                if first:
+                    first = False
+                    first_token_ms = (time.perf_counter() - start_time) * 1000
+                    self.streams += 1
+                    self.total_first_token_ms += first_token_ms
+                    stats["first_token_ms"] = first_token_ms
+                    llm_first_token_seconds.observe(first_token_ms / 1000)
+                usage = getattr(chunk, "usage", None)
+                if usage:
+                    stats.update({
+                        "tokens": usage.total_tokens,
+                        "prompt_tokens": usage.prompt_tokens,
+                        "completion_tokens": usage.completion_tokens
+                    })
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            self.failed += 1
+            llm_request_seconds.observe(time.perf_counter() - start_time, "stream", "error")
+            logger.error(f"LLM流式请求失败: {type(e).__name__}: {str(e)}")
+            raise
+        finally:
+            stats["attempts"] = attempt + 1
+            # 超时、出错或调用方提前结束迭代时关闭响应流，释放HTTP连接
+            if response is not None and not finished:
+                try:
+                    await response.close()
+                except Exception as e:
+                    logger.debug(f"关闭LLM响应流出错: {str(e)}")
+            self.inflight -= 1
+            self._slots.release()
+
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        stats["latency_ms"] = latency_ms
+        llm_request_seconds.observe(latency_ms / 1000, "stream", "success")
+        if stats["tokens"]:
+            llm_tokens_total.inc("prompt", amount=stats["prompt_tokens"])
+            llm_tokens_total.inc("completion", amount=stats["completion_tokens"])
+        self.total_tokens += stats["tokens"]
+        self.completed += 1
+        self.total_latency_ms += latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self.service.request_count += 1
+        self.service.last_request_time = datetime.utcnow()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "inflight": self.inflight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "total_tokens": self.total_tokens,
+            "avg_latency_ms": self.total_latency_ms / self.completed if self.completed else 0.0,
+            "avg_queue_ms": self.total_queue_ms / (self.completed + self.failed) if self.completed + self.failed else 0.0,
+            "max_latency_ms": self.max_latency_ms,
+            "streams": self.streams,
+            "avg_first_token_ms": self.total_first_token_ms / self.streams if self.streams else 0.0
+        }
+
+
+# 创建全局LLM请求管道实例
+llm_pipeline = LLMPipeline()
@@ -1,6 +1,7 @@
 import os
 import json
 import asyncio
+import time
 from typing import Dict, List, Any, Optional, Union
 from datetime import datetime
 from pydantic import BaseModel, Field
@@ -15,15 +16,22 @@ from langchain.callbacks.base import AsyncCallbackHandler
 
 from config.settings import settings
 from config.logging_config import get_logger
+from services.llm_cache import llm_response_cache, signature_of
+from core.metrics import llm_request_seconds, llm_tokens_total
 
 logger = get_logger("services.llm")
 
 class LLMService:
     """LLM服务，封装与OpenAI API的交互"""
     
-    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None,
+                 base_url: Optional[str] = None):
         self.api_key = api_key or settings.OPENAI_API_KEY
         self.model = model or settings.OPENAI_MODEL
+        # LLM后端：openai 使用 OPENAI_BASE_URL（为空时为官方接口），mock 使用本地模拟服务器
+        if base_url is None:
+            base_url = settings.LLM_MOCK_URL if settings.LLM_BACKEND == "mock" else settings.OPENAI_BASE_URL
+        self.base_url = base_url or None
         self.client = None
         self.is_initialized = False
         self.request_count = 0
@@ -35,13 +43,14 @@ class LLMService:
             return
         
         try:
-            logger.info(f"初始化LLM服务，模型: {self.model}")
+            logger.info(f"初始化LLM服务，模型: {self.model}，接口: {self.base_url or 'OpenAI'}")
             
-            # 设置API密钥
-            os.environ["OPENAI_API_KEY"] = self.api_key
+            # 设置API密钥（模拟服务器不校验密钥）
+            api_key = self.api_key or ("mock" if self.base_url else "")
+            os.environ["OPENAI_API_KEY"] = api_key
             
             # 创建异步客户端
-            self.client = AsyncOpenAI(api_key=self.api_key)
+            self.client = AsyncOpenAI(api_key=api_key, base_url=self.base_url)
             
             self.is_initialized = True
             logger.info("LLM服务初始化成功")
@@ -68,6 +77,7 @@ class LLMService:
         if not self.is_initialized:
             await self.initialize()
         
+        start_time = time.perf_counter()
         try:
             response = await self.client.completions.create(
                 model=self.model,
@@ -79,6 +89,9 @@ class LLMService:
             # 更新统计信息
             self.request_count += 1
             self.last_request_time = datetime.utcnow()
+            llm_request_seconds.observe(time.perf_counter() - start_time, "completion", "success")
+            llm_tokens_total.inc("prompt", amount=response.usage.prompt_tokens)
+            llm_tokens_total.inc("completion", amount=response.usage.completion_tokens)
             
             return {
                 "success": True,
@@ -88,6 +101,7 @@ class LLMService:
                 "timestamp": datetime.utcnow().isoformat()
             }
         except Exception as e:
+            llm_request_seconds.observe(time.perf_counter() - start_time, "completion", "error")
             logger.error(f"生成文本补全失败: {str(e)}")
             return {
                 "success": False,
@@ -113,6 +127,7 @@ class LLMService:
         if not self.is_initialized:
             await self.initialize()
         
+        start_time = time.perf_counter()
         try:
             response = await self.client.chat.completions.create(
                 model=self.model,
@@ -124,6 +139,9 @@ class LLMService:
             # 更新统计信息
             self.request_count += 1
             self.last_request_time = datetime.utcnow()
+            llm_request_seconds.observe(time.perf_counter() - start_time, "direct", "success")
+            llm_tokens_total.inc("prompt", amount=response.usage.prompt_tokens)
+            llm_tokens_total.inc("completion", amount=response.usage.completion_tokens)
             
             return {
                 "success": True,
@@ -133,6 +151,7 @@ class LLMService:
                 "timestamp": datetime.utcnow().isoformat()
             }
         except Exception as e:
+            llm_request_seconds.observe(time.perf_counter() - start_time, "direct", "error")
             logger.error(f"生成聊天补全失败: {str(e)}")
             return {
                 "success": False,
@@ -153,6 +172,12 @@ class LLMService:
         Returns:
             响应计划字典
         """
+        # 相同特征的事件直接使用缓存的计划
+        cache_key = llm_response_cache.make_key("emergency_plan", signature_of(event_data))
+        cached = llm_response_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True, "timestamp": datetime.utcnow().isoformat()}
+        
         if not self.is_initialized:
             await self.initialize()
         
@@ -210,6 +235,7 @@ class LLMService:
             try:
                 plan = json.loads(response["text"])
                 logger.info(f"成功生成应急响应计划，严重程度: {plan.get('severity_level')}")
+                llm_response_cache.put(cache_key, {"success": True, "plan": plan, "tokens": response["tokens"]})
                 
                 return {
                     "success": True,
@@ -247,6 +273,15 @@ class LLMService:
         Returns:
             分析结果字典
         """
+        # 分析结果与历史事件相关，签名中附加参与分析的历史事件类型
+        history_types = sorted(str(hist.get('type', 'unknown')) for hist in (historical_data or [])[:5])
+        cache_key = llm_response_cache.make_key(
+            "security_analysis", signature_of(event_data) + json.dumps(history_types)
+        )
+        cached = llm_response_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True, "timestamp": datetime.utcnow().isoformat()}
+        
         if not self.is_initialized:
             await self.initialize()
         
@@ -306,6 +341,7 @@ class LLMService:
             try:
                 analysis = json.loads(response["text"])
                 logger.info(f"成功生成安全事件分析")
+                llm_response_cache.put(cache_key, {"success": True, "analysis": analysis, "tokens": response["tokens"]})
                 
                 return {
                     "success": True,
@@ -2,32 +2,129 @@ import math
 import numpy as np
 import heapq
 from typing import Dict, List, Any, Optional, Tuple, Set, Callable
-from shapely.geometry import Point, Polygon, LineString
 import random
 from datetime import datetime
 
 from config.settings import settings
 from config.logging_config import get_logger
+from services import grid_kernels
+from services.planning_engine import PlanningEngine, planning_engine, haversine, path_distance
 
 logger = get_logger("services.path_planning")
 
+class SearchCorridor:
+    """
+    椭圆搜索走廊
+    
+    以起终点为焦点、沿两点连线展开的椭圆区域：点到两焦点距离之和不超过
+    连线长度加两倍走廊半宽时视为在走廊内。当前宽度下搜索失败或迭代次数用尽时按倍数加宽，
+    直到最大半宽。
+    坐标单位与调用方一致（网格坐标或经纬度）。
+    """
+    
+    def __init__(self, start: Tuple[float, float], end: Tuple[float, float],
+                 margin: float, max_margin: float, growth: float = 2.0):
+        self.start = start
+        self.end = end
+        self.length = math.hypot(end[0] - start[0], end[1] - start[1])
+        self.margin = margin
+        self.max_margin = max_margin
+        self.growth = growth
+        self.expansions = 0  # 加宽次数
+    
+    def contains(self, point: Tuple[float, float]) -> bool:
+        """检查点是否在走廊内"""
+        return (math.hypot(point[0] - self.start[0], point[1] - self.start[1]) +
+                math.hypot(point[0] - self.end[0], point[1] - self.end[1])) <= self.length + 2 * self.margin
+    
+    def can_widen(self) -> bool:
+        """是否还能继续加宽"""
+        return self.margin < self.max_margin
+    
+    def widen(self) -> float:
+        """按倍数加宽走廊，返回新的半宽"""
+        self.margin = min(self.margin * self.growth, self.max_margin)
+        self.expansions += 1
+        return self.margin
+    
+    def area(self) -> float:
+        """走廊面积（坐标单位的平方），网格搜索时即走廊内的网格数"""
+        semi_major = self.length / 2 + self.margin
+        semi_minor = math.sqrt(max(semi_major ** 2 - (self.length / 2) ** 2, 0))
+        return math.pi * semi_major * semi_minor
+    
+    def sample(self) -> Tuple[float, float]:
+        """在走廊内均匀随机采样一个点"""
+        semi_major = self.length / 2 + self.margin
+        semi_minor = math.sqrt(max(semi_major ** 2 - (self.length / 2) ** 2, 0))
+        r = math.sqrt(random.random())
+        theta = random.random() * 2 * math.pi
+        x = semi_major * r * math.cos(theta)
+        y = semi_minor * r * math.sin(theta)
+        
+        # 旋转到起终点连线方向并平移到椭圆中心
+        angle = math.atan2(self.end[1] - self.start[1], self.end[0] - self.start[0])
+        cx = (self.start[0] + self.end[0]) / 2
+        cy = (self.start[1] + self.end[1]) / 2
+        return (cx + x * math.cos(angle) - y * math.sin(angle),
+                cy + x * math.sin(angle) + y * math.cos(angle))
+
+
 class PathPlanningService:
-    """路径规划服务，实现多种路径规划算法"""
+    """
+    路径规划服务，实现网格A*、Dijkstra和RRT算法
     
-    def __init__(self):
+    算法注册到规划引擎中，禁飞区索引、结果缓存和指标由引擎统一维护，
+    与路径规划智能体共用同一个引擎实例。
+    """
+    
+    def __init__(self, engine: Optional[PlanningEngine] = None):
         self.default_algorithm = settings.PATH_PLANNING_ALGORITHM
-        self.no_fly_zones: List[Dict[str, Any]] = []
-        self.last_updated = datetime.utcnow()
+        self.engine = engine or PlanningEngine()
+        self.accelerator = self._select_accelerator(settings.PATH_PLANNING_ACCELERATOR)
+        
+        self.engine.register_algorithm("astar", self._plan_path_astar)
+        self.engine.register_algorithm("dijkstra", self._plan_path_dijkstra)
+        self.engine.register_algorithm("rrt", self._plan_path_rrt)
+    
+    @property
+    def no_fly_zones(self) -> List[Any]:
+        """当前禁飞区"""
+        return self.engine.geofences.zones
+    
+    @property
+    def last_updated(self) -> datetime:
+        """禁飞区最后更新时间"""
+        return self.engine.geofences.last_updated
+    
+    def _select_accelerator(self, accelerator: str) -> str:
+        """选择网格搜索后端：numba 或 python"""
+        if accelerator == "python":
+            return "python"
+        if grid_kernels.NUMBA_AVAILABLE:
+            return "numba"
+        if accelerator == "numba":
+            logger.warning("未安装numba，路径规划回退到纯Python网格搜索")
+        return "python"
+    
+    def warmup(self) -> None:
+        """预热加速内核，首次运行编译并写入缓存，之后从缓存加载"""
+        if self.accelerator != "numba":
+            return
+        start_time = datetime.utcnow()
+        if grid_kernels.warmup():
+            elapsed = (datetime.utcnow() - start_time).total_seconds()
+            logger.info(f"路径规划加速内核就绪，耗时: {elapsed:.2f}秒")
+        else:
+            self.accelerator = "python"
     
     def set_no_fly_zones(self, zones: List[Dict[str, Any]]):
         """设置禁飞区"""
-        self.no_fly_zones = zones
-        self.last_updated = datetime.utcnow()
-        logger.info(f"更新了 {len(zones)} 个禁飞区")
+        self.engine.set_no_fly_zones(zones)
     
     def plan_path(self, start_point: List[float], end_point: List[float], 
                   algorithm: Optional[str] = None, altitude: float = 100.0,
-                  options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                  options: Optional[Dict[str, Any]] = None, use_cache: bool = True) -> Dict[str, Any]:
         """
         规划路径
         
@@ -37,111 +134,102 @@ class PathPlanningService:
             algorithm: 路径规划算法，默认使用配置中的算法
             altitude: 飞行高度，默认100米
             options: 算法选项
+            use_cache: 是否使用引擎的结果缓存
         
         Returns:
             路径规划结果
         """
-        if options is None:
-            options = {}
-        
-        # 确定使用的算法
+        # 确定使用的算法，未注册的算法由引擎回退到A*
         algo = algorithm or self.default_algorithm
+        return self.engine.plan(start_point, end_point, algo, altitude, options, use_cache=use_cache)
+    
+    def _corridor_options(self, options: Dict[str, Any], unit: float) -> Tuple[float, float, float]:
+        """
+        解析搜索走廊选项并换算到搜索坐标单位
         
-        # 根据算法选择规划方法
-        if algo == "astar":
-            return self._plan_path_astar(start_point, end_point, altitude, options)
-        elif algo == "rrt":
-            return self._plan_path_rrt(start_point, end_point, altitude, options)
-        elif algo == "dijkstra":
-            return self._plan_path_dijkstra(start_point, end_point, altitude, options)
-        else:
-            # 默认使用A*算法
-            return self._plan_path_astar(start_point, end_point, altitude, options)
+        Args:
+            options: 算法选项（走廊宽度以经纬度为单位）
+            unit: 一个搜索坐标单位对应的经纬度（网格搜索为网格尺寸，RRT为1）
+        
+        Returns:
+            (初始走廊半宽, 最大走廊半宽, 加宽倍数)
+        """
+        margin = options.get("corridor_margin", 0.002) / unit  # 约200米
+        max_margin = options.get("max_corridor_margin", 0.05) / unit  # 约5公里
+        growth = max(options.get("corridor_growth", 2.0), 1.1)
+        if unit != 1:
+            # 网格搜索时走廊至少保留几个网格的宽度，保证有绕行空间
+            margin = max(margin, 4)
+            max_margin = max(max_margin, margin)
+        return margin, max_margin, growth
+    
+    def _grid_budget(self, options: Dict[str, Any], corridor: SearchCorridor) -> Tuple[Optional[int], int]:
+        """
+        网格搜索的迭代预算
+        
+        每个走廊宽度下的迭代次数用尽后，即使开放集合未耗尽也加宽走廊；未指定时按当前走廊的
+        网格数计算（见 _stage_budget）。总迭代上限默认随初始走廊增大，长航线不会在初始走廊内
+        就耗尽全部迭代次数。
+        
+        Returns:
+            (每个走廊宽度下的迭代次数，None 表示按走廊网格数计算, 最大迭代次数)
+        """
+        stage_iterations = options.get("corridor_stage_iterations")
+        max_iterations = options.get("max_iterations", max(10000, 4 * self._stage_budget(corridor, None)))
+        return stage_iterations, max_iterations
+    
+    def _stage_budget(self, corridor: SearchCorridor, stage_iterations: Optional[int]) -> int:
+        """当前走廊宽度下的迭代次数，默认为走廊网格数的两倍"""
+        return stage_iterations or int(2 * corridor.area()) + 1
     
     def _plan_path_astar(self, start_point: List[float], end_point: List[float],
                         altitude: float, options: Dict[str, Any]) -> Dict[str, Any]:
         """使用A*算法规划路径"""
         # 解析选项
         grid_size = options.get("grid_size", 0.0005)  # 约50米网格
-        max_iterations = options.get("max_iterations", 10000)
-        
-        # 创建网格范围
-        min_lon = min(start_point[0], end_point[0]) - 0.01
-        max_lon = max(start_point[0], end_point[0]) + 0.01
-        min_lat = min(start_point[1], end_point[1]) - 0.01
-        max_lat = max(start_point[1], end_point[1]) + 0.01
         
-        # 将经纬度坐标转换为网格坐标
-        start_grid = self._point_to_grid(start_point, min_lon, min_lat, grid_size)
-        end_grid = self._point_to_grid(end_point, min_lon, min_lat, grid_size)
-        
-        # A*搜索
-        open_set = [(0, start_grid, [])]  # (f_score, position, path)
-        closed_set = set()
+        # 以起点为网格原点，将经纬度坐标转换为网格坐标
+        origin_lon, origin_lat = start_point[0], start_point[1]
+        start_grid = self._point_to_grid(start_point[:2], origin_lon, origin_lat, grid_size)
+        end_grid = self._point_to_grid(end_point[:2], origin_lon, origin_lat, grid_size)
+        
+        margin, max_margin, growth = self._corridor_options(options, grid_size)
+        corridor = SearchCorridor(start_grid, end_grid, margin, max_margin, growth)
+        stage_iterations, max_iterations = self._grid_budget(options, corridor)
+        
+        # A*搜索：单位步长代价，曼哈顿距离启发式
+        path, iterations = self._grid_search(
+            start_grid, end_grid, origin_lon, origin_lat, grid_size, corridor, max_iterations,
+            stage_iterations,
+            use_heuristic=True,
+            diagonal_cost=1
+        )
         
-        iterations = 0
-        while open_set and iterations < max_iterations:
-            iterations += 1
+        if path:
+            waypoints = [
+                self._grid_to_point(grid, origin_lon, origin_lat, grid_size, altitude)
+                for grid in path
+            ]
             
-            # 获取f_score最小的节点
-            f_score, current, path = heapq.heappop(open_set)
+            # 计算距离和时间
+            distance = self._calculate_path_distance(waypoints)
+            duration = distance / settings.DRONE_MAX_SPEED / 1000 * 60  # 分钟
             
-            # 如果到达终点
-            if current == end_grid:
-                # 构建路径
-                final_path = path + [current]
-                waypoints = [
-                    self._grid_to_point(grid, min_lon, min_lat, grid_size, altitude)
-                    for grid in final_path
-                ]
-                
-                # 计算距离和时间
-                distance = self._calculate_path_distance(waypoints)
-                duration = distance / settings.DRONE_MAX_SPEED / 1000 * 60  # 分钟
-                
-                logger.info(f"A*算法找到路径，航点数: {len(waypoints)}, 距离: {distance:.2f}米")
-                
-                return {
-                    "success": True,
-                    "algorithm": "astar",
-                    "waypoints": waypoints,
-                    "distance": distance,
-                    "duration": duration,
-                    "iterations": iterations
-                }
+            logger.info(f"A*算法找到路径，航点数: {len(waypoints)}, 距离: {distance:.2f}米, "
+                        f"走廊加宽次数: {corridor.expansions}")
             
-            # 将当前节点添加到已访问集合
-            if current in closed_set:
-                continue
-            closed_set.add(current)
-            
-            # 扩展相邻节点
-            for dx, dy in [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
-                neighbor = (current[0] + dx, current[1] + dy)
-                
-                # 检查是否越界
-                if not self._is_valid_grid(neighbor, min_lon, max_lon, min_lat, max_lat, grid_size):
-                    continue
-                
-                # 检查是否已访问
-                if neighbor in closed_set:
-                    continue
-                
-                # 检查是否在禁飞区内
-                neighbor_point = self._grid_to_point(neighbor, min_lon, min_lat, grid_size, altitude)
-                if self._is_in_no_fly_zone(neighbor_point[:2]):
-                    continue
-                
-                # 计算路径代价
-                g_score = len(path) + 1
-                h_score = self._heuristic(neighbor, end_grid)
-                f_score = g_score + h_score
-                
-                # 添加到开放集合
-                new_path = path + [current]
-                heapq.heappush(open_set, (f_score, neighbor, new_path))
-        
-        logger.warning(f"A*算法未找到路径，已达到最大迭代次数: {max_iterations}")
+            return {
+                "success": True,
+                "algorithm": "astar",
+                "waypoints": waypoints,
+                "distance": distance,
+                "duration": duration,
+                "iterations": iterations,
+                "corridor_margin": corridor.margin * grid_size,
+                "corridor_expansions": corridor.expansions
+            }
+        
+        logger.warning(f"A*算法未找到路径，迭代次数: {iterations}, 走廊半宽: {corridor.margin * grid_size:.4f}度")
         
         # 如果未找到路径，返回直线路径
         return self._generate_direct_path(start_point, end_point, altitude)
@@ -153,12 +241,14 @@ class PathPlanningService:
         max_iterations = options.get("max_iterations", 5000)
         step_size = options.get("step_size", 0.0005)  # 约50米
         goal_sample_rate = options.get("goal_sample_rate", 0.1)  # 10%的概率直接采样目标点
+        stage_iterations = options.get("corridor_stage_iterations", 1000)  # 每个走廊宽度下的迭代次数
         
-        # 计算区域边界
-        min_lon = min(start_point[0], end_point[0]) - 0.01
-        max_lon = max(start_point[0], end_point[0]) + 0.01
-        min_lat = min(start_point[1], end_point[1]) - 0.01
-        max_lat = max(start_point[1], end_point[1]) + 0.01
+        # 在起终点连线周围的椭圆走廊内采样，未连通时逐步加宽并保留已生长的树
+        margin, max_margin, growth = self._corridor_options(options, 1)
+        corridor = SearchCorridor(
+            (start_point[0], start_point[1]), (end_point[0], end_point[1]),
+            margin, max_margin, growth
+        )
         
         # 初始化节点列表
         class RRTNode:
@@ -176,14 +266,17 @@ class PathPlanningService:
         
         # RRT主循环
         for i in range(max_iterations):
+            # 当前走廊宽度下迭代次数用尽，加宽走廊继续生长
+            if i > 0 and i % stage_iterations == 0 and corridor.can_widen():
+                corridor.widen()
+            
             # 随机采样
             if random.random() < goal_sample_rate:
                 # 直接使用目标点
                 random_node = RRTNode(end_node.x, end_node.y)
             else:
-                # 随机采样
-                random_lon = min_lon + random.random() * (max_lon - min_lon)
-                random_lat = min_lat + random.random() * (max_lat - min_lat)
+                # 在走廊内随机采样
+                random_lon, random_lat = corridor.sample()
                 random_node = RRTNode(random_lon, random_lat)
             
             # 找到最近的节点
@@ -221,7 +314,8 @@ class PathPlanningService:
                         distance = self._calculate_path_distance(waypoints)
                         duration = distance / settings.DRONE_MAX_SPEED / 1000 * 60  # 分钟
                         
-                        logger.info(f"RRT算法找到路径，航点数: {len(waypoints)}, 距离: {distance:.2f}米")
+                        logger.info(f"RRT算法找到路径，航点数: {len(waypoints)}, 距离: {distance:.2f}米, "
+                                    f"走廊加宽次数: {corridor.expansions}")
                         
                         return {
                             "success": True,
@@ -229,7 +323,9 @@ class PathPlanningService:
                             "waypoints": waypoints,
                             "distance": distance,
                             "duration": duration,
-                            "iterations": i + 1
+                            "iterations": i + 1,
+                            "corridor_margin": corridor.margin,
+                            "corridor_expansions": corridor.expansions
                         }
         
         logger.warning(f"RRT算法未找到路径，已达到最大迭代次数: {max_iterations}")
@@ -242,53 +338,173 @@ class PathPlanningService:
         """使用Dijkstra算法规划路径"""
         # 解析选项
         grid_size = options.get("grid_size", 0.0005)  # 约50米网格
-        max_iterations = options.get("max_iterations", 10000)
         
-        # 创建网格范围
-        min_lon = min(start_point[0], end_point[0]) - 0.01
-        max_lon = max(start_point[0], end_point[0]) + 0.01
-        min_lat = min(start_point[1], end_point[1]) - 0.01
-        max_lat = max(start_point[1], end_point[1]) + 0.01
+        # 以起点为网格原点，将经纬度坐标转换为网格坐标
+        origin_lon, origin_lat = start_point[0], start_point[1]
+        start_grid = self._point_to_grid(start_point[:2], origin_lon, origin_lat, grid_size)
+        end_grid = self._point_to_grid(end_point[:2], origin_lon, origin_lat, grid_size)
+        
+        margin, max_margin, growth = self._corridor_options(options, grid_size)
+        corridor = SearchCorridor(start_grid, end_grid, margin, max_margin, growth)
+        stage_iterations, max_iterations = self._grid_budget(options, corridor)
+        
+        # Dijkstra搜索：对角线移动代价1.414，无启发式
+        path, iterations = self._grid_search(
+            start_grid, end_grid, origin_lon, origin_lat, grid_size, corridor, max_iterations,
+            stage_iterations,
+            use_heuristic=False,
+            diagonal_cost=1.414
+        )
+        
+        if path:
+            waypoints = [
+                self._grid_to_point(grid, origin_lon, origin_lat, grid_size, altitude)
+                for grid in path
+            ]
+            
+            # 计算距离和时间
+            total_distance = self._calculate_path_distance(waypoints)
+            duration = total_distance / settings.DRONE_MAX_SPEED / 1000 * 60  # 分钟
+            
+            logger.info(f"Dijkstra算法找到路径，航点数: {len(waypoints)}, 距离: {total_distance:.2f}米, "
+                        f"走廊加宽次数: {corridor.expansions}")
+            
+            return {
+                "success": True,
+                "algorithm": "dijkstra",
+                "waypoints": waypoints,
+                "distance": total_distance,
+                "duration": duration,
+                "iterations": iterations,
+                "corridor_margin": corridor.margin * grid_size,
+                "corridor_expansions": corridor.expansions
+            }
+        
+        logger.warning(f"Dijkstra算法未找到路径，迭代次数: {iterations}, 走廊半宽: {corridor.margin * grid_size:.4f}度")
+        
+        # 如果未找到路径，返回直线路径
+        return self._generate_direct_path(start_point, end_point, altitude)
+    
+    def _grid_search(self, start_grid: Tuple[int, int], end_grid: Tuple[int, int],
+                     origin_lon: float, origin_lat: float, grid_size: float,
+                     corridor: "SearchCorridor", max_iterations: int, stage_iterations: Optional[int],
+                     use_heuristic: bool, diagonal_cost: float) -> Tuple[Optional[List[Tuple[int, int]]], int]:
+        """
+        在走廊内进行网格最佳优先搜索（A*/Dijkstra共用），按配置选择加速内核或纯Python实现
+        
+        Returns:
+            (网格路径，未找到时为None, 迭代次数)
+        """
+        if self.accelerator == "numba":
+            return self._grid_search_numba(
+                start_grid, end_grid, origin_lon, origin_lat, grid_size,
+                corridor, max_iterations, stage_iterations, use_heuristic, diagonal_cost
+            )
+        return self._grid_search_python(
+            start_grid, end_grid, origin_lon, origin_lat, grid_size,
+            corridor, max_iterations, stage_iterations, use_heuristic, diagonal_cost
+        )
+    
+    def _grid_search_numba(self, start_grid: Tuple[int, int], end_grid: Tuple[int, int],
+                           origin_lon: float, origin_lat: float, grid_size: float,
+                           corridor: "SearchCorridor", max_iterations: int, stage_iterations: Optional[int],
+                           use_heuristic: bool, diagonal_cost: float) -> Tuple[Optional[List[Tuple[int, int]]], int]:
+        """
+        使用numba内核搜索
+        
+        走廊栅格化后在数组上搜索；开放集合耗尽或本阶段迭代次数用尽时加宽走廊，搜索状态平移到
+        新栅格上继续搜索，与纯Python实现一样保留已关闭的节点和代价，扩展顺序和迭代次数相同。
+        """
+        state = grid_kernels.GridSearchState(
+            self.engine.geofences.union, corridor, origin_lon, origin_lat, grid_size,
+            start_grid, end_grid, diagonal_cost, use_heuristic
+        )
+        iterations = 0
+        stage_left = self._stage_budget(corridor, stage_iterations)
+        while iterations < max_iterations:
+            if state.exhausted or stage_left <= 0:
+                if corridor.can_widen() and state.has_deferred():
+                    corridor.widen()
+                    logger.debug(f"搜索走廊加宽至 {corridor.margin * grid_size:.4f}度")
+                    state.widen(corridor)
+                    stage_left = self._stage_budget(corridor, stage_iterations)
+                    continue
+                # 当前走廊已搜索完毕，没有可延伸的走廊外节点说明起终点不连通
+                if state.exhausted:
+                    break
+                # 走廊不能再加宽，剩余迭代次数都用于当前走廊
+                stage_left = max_iterations
+            path, used = state.search(min(stage_left, max_iterations - iterations))
+            iterations += used
+            stage_left -= used
+            if path:
+                return path, iterations
+        return None, iterations
+    
+    def _grid_search_python(self, start_grid: Tuple[int, int], end_grid: Tuple[int, int],
+                            origin_lon: float, origin_lat: float, grid_size: float,
+                            corridor: "SearchCorridor", max_iterations: int, stage_iterations: Optional[int],
+                            use_heuristic: bool, diagonal_cost: float) -> Tuple[Optional[List[Tuple[int, int]]], int]:
+        """
+        纯Python搜索
         
-        # 将经纬度坐标转换为网格坐标
-        start_grid = self._point_to_grid(start_point, min_lon, min_lat, grid_size)
-        end_grid = self._point_to_grid(end_point, min_lon, min_lat, grid_size)
+        落在走廊外的邻居不丢弃，而是记录其最优代价和父节点；开放集合耗尽或本阶段迭代次数
+        用尽时加宽走廊，把新走廊内的待定节点重新加入开放集合，已关闭的节点和代价全部保留，
+        不重新搜索。
+        """
+        if use_heuristic:
+            heuristic = lambda node: self._heuristic(node, end_grid)
+        else:
+            heuristic = lambda node: 0
         
-        # Dijkstra搜索
-        # 距离，节点位置，路径
-        open_set = [(0, start_grid, [])]
+        g_score = {start_grid: 0}
+        came_from: Dict[Tuple[int, int], Optional[Tuple[int, int]]] = {start_grid: None}
+        open_set = [(heuristic(start_grid), 0, start_grid)]  # (f_score, g_score, position)
         closed_set = set()
+        deferred: Dict[Tuple[int, int], Tuple[float, Tuple[int, int]]] = {}  # 走廊外节点 -> (代价, 父节点)
         
         iterations = 0
-        while open_set and iterations < max_iterations:
+        stage_left = self._stage_budget(corridor, stage_iterations)
+        while iterations < max_iterations:
+            if not open_set or stage_left <= 0:
+                if not deferred or not corridor.can_widen():
+                    # 当前走廊已搜索完毕，没有可延伸的走廊外节点说明起终点不连通
+                    if not open_set:
+                        break
+                    # 走廊不能再加宽，剩余迭代次数都用于当前走廊
+                    stage_left = max_iterations
+                    continue
+                corridor.widen()
+                stage_left = self._stage_budget(corridor, stage_iterations)
+                logger.debug(f"搜索走廊加宽至 {corridor.margin * grid_size:.4f}度，待定节点: {len(deferred)}")
+                for node, (cost, parent) in list(deferred.items()):
+                    if not corridor.contains(node):
+                        continue
+                    del deferred[node]
+                    if node in closed_set or cost >= g_score.get(node, float('inf')):
+                        continue
+                    node_point = self._grid_to_point(node, origin_lon, origin_lat, grid_size, 0)
+                    if self._is_in_no_fly_zone(node_point[:2]):
+                        continue
+                    g_score[node] = cost
+                    came_from[node] = parent
+                    heapq.heappush(open_set, (cost + heuristic(node), cost, node))
+                continue
+            
             iterations += 1
+            stage_left -= 1
             
-            # 获取距离最小的节点
-            distance, current, path = heapq.heappop(open_set)
+            # 获取f_score最小的节点
+            _, cost, current = heapq.heappop(open_set)
             
-            # 如果到达终点
+            # 如果到达终点，回溯构建路径
             if current == end_grid:
-                # 构建路径
-                final_path = path + [current]
-                waypoints = [
-                    self._grid_to_point(grid, min_lon, min_lat, grid_size, altitude)
-                    for grid in final_path
-                ]
-                
-                # 计算距离和时间
-                total_distance = self._calculate_path_distance(waypoints)
-                duration = total_distance / settings.DRONE_MAX_SPEED / 1000 * 60  # 分钟
-                
-                logger.info(f"Dijkstra算法找到路径，航点数: {len(waypoints)}, 距离: {total_distance:.2f}米")
-                
-                return {
-                    "success": True,
-                    "algorithm": "dijkstra",
-                    "waypoints": waypoints,
-                    "distance": total_distance,
-                    "duration": duration,
-                    "iterations": iterations
-                }
+                path = []
+                node = current
+                while node is not None:
+                    path.append(node)
+                    node = came_from[node]
+                return path[::-1], iterations
             
             # 将当前节点添加到已访问集合
             if current in closed_set:
@@ -299,35 +515,32 @@ class PathPlanningService:
             for dx, dy in [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
                 neighbor = (current[0] + dx, current[1] + dy)
                 
-                # 检查是否越界
-                if not self._is_valid_grid(neighbor, min_lon, max_lon, min_lat, max_lat, grid_size):
-                    continue
-                
                 # 检查是否已访问
                 if neighbor in closed_set:
                     continue
                 
-                # 检查是否在禁飞区内
-                neighbor_point = self._grid_to_point(neighbor, min_lon, min_lat, grid_size, altitude)
-                if self._is_in_no_fly_zone(neighbor_point[:2]):
+                # 计算移动代价
+                new_cost = cost + (diagonal_cost if dx != 0 and dy != 0 else 1)
+                if new_cost >= g_score.get(neighbor, float('inf')):
                     continue
                 
-                # 计算移动代价
-                move_cost = 1
-                if dx != 0 and dy != 0:
-                    move_cost = 1.414  # 对角线移动的代价
+                # 走廊外的节点暂存，等走廊加宽后再检查禁飞区
+                if not corridor.contains(neighbor):
+                    if new_cost < deferred.get(neighbor, (float('inf'), None))[0]:
+                        deferred[neighbor] = (new_cost, current)
+                    continue
                 
-                # 计算新的距离
-                new_distance = distance + move_cost
+                # 检查是否在禁飞区内
+                neighbor_point = self._grid_to_point(neighbor, origin_lon, origin_lat, grid_size, 0)
+                if self._is_in_no_fly_zone(neighbor_point[:2]):
+                    continue
                 
                 # 添加到开放集合
-                new_path = path + [current]
-                heapq.heappush(open_set, (new_distance, neighbor, new_path))
+                g_score[neighbor] = new_cost
+                came_from[neighbor] = current
+                heapq.heappush(open_set, (new_cost + heuristic(neighbor), new_cost, neighbor))
         
-        logger.warning(f"Dijkstra算法未找到路径，已达到最大迭代次数: {max_iterations}")
-        
-        # 如果未找到路径，返回直线路径
-        return self._generate_direct_path(start_point, end_point, altitude)
+        return None, iterations
     
     def _generate_direct_path(self, start_point: List[float], end_point: List[float],
                              altitude: float) -> Dict[str, Any]:
@@ -374,88 +587,25 @@ class PathPlanningService:
         lat = min_lat + grid_y * grid_size
         return [lon, lat, altitude]
     
-    def _is_valid_grid(self, grid: Tuple[int, int], min_lon: float, max_lon: float,
-                      min_lat: float, max_lat: float, grid_size: float) -> bool:
-        """检查网格坐标是否在范围内"""
-        grid_x, grid_y = grid
-        lon = min_lon + grid_x * grid_size
-        lat = min_lat + grid_y * grid_size
-        
-        return min_lon <= lon <= max_lon and min_lat <= lat <= max_lat
-    
     def _heuristic(self, a: Tuple[int, int], b: Tuple[int, int]) -> float:
         """曼哈顿距离启发式函数"""
         return abs(a[0] - b[0]) + abs(a[1] - b[1])
     
     def _is_in_no_fly_zone(self, point: List[float]) -> bool:
         """检查点是否在禁飞区内"""
-        lon, lat = point
-        point_obj = Point(lon, lat)
-        
-        for zone in self.no_fly_zones:
-            # 获取禁飞区几何形状
-            if "geometry" in zone and "coordinates" in zone["geometry"]:
-                coordinates = zone["geometry"]["coordinates"][0]
-                polygon = Polygon(coordinates)
-                
-                if polygon.contains(point_obj):
-                    return True
-        
-        return False
+        return self.engine.geofences.contains(point[0], point[1])
     
     def _path_intersects_no_fly_zone(self, point1: List[float], point2: List[float]) -> bool:
         """检查路径是否与禁飞区相交"""
-        line = LineString([(point1[0], point1[1]), (point2[0], point2[1])])
-        
-        for zone in self.no_fly_zones:
-            # 获取禁飞区几何形状
-            if "geometry" in zone and "coordinates" in zone["geometry"]:
-                coordinates = zone["geometry"]["coordinates"][0]
-                polygon = Polygon(coordinates)
-                
-                if polygon.intersects(line):
-                    return True
-        
-        return False
+        return self.engine.geofences.intersects_segment(point1, point2)
     
     def _haversine(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """
-        计算两点之间的大圆距离（Haversine公式）
-        
-        Args:
-            lat1, lon1: 第一个点的纬度和经度
-            lat2, lon2: 第二个点的纬度和经度
-            
-        Returns:
-            距离（米）
-        """
-        # 将角度转换为弧度
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-        
-        # Haversine公式
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        r = 6371  # 地球半径，单位为公里
-        
-        # 返回距离，单位为米
-        return c * r * 1000
+        """计算两点之间的大圆距离（米）"""
+        return haversine(lat1, lon1, lat2, lon2)
     
     def _calculate_path_distance(self, waypoints: List[List[float]]) -> float:
         """计算路径总距离"""
-        if len(waypoints) < 2:
-            return 0
-        
-        total_distance = 0
-        for i in range(len(waypoints) - 1):
-            lon1, lat1 = waypoints[i][0], waypoints[i][1]
-            lon2, lat2 = waypoints[i+1][0], waypoints[i+1][1]
-            
-            distance = self._haversine(lat1, lon1, lat2, lon2)
-            total_distance += distance
-        
-        return total_distance
+        return path_distance(waypoints)
     
     def _find_nearest_node(self, nodes: List[Any], target: Any) -> Any:
         """找到最近的节点"""
@@ -503,4 +653,4 @@ class PathPlanningService:
         return path[::-1]  # 反转路径
 
 # 创建全局路径规划服务实例
-path_planning_service = PathPlanningService()
\ No newline at end of file
+path_planning_service = PathPlanningService(planning_engine)
\ No newline at end of file
@@ -0,0 +1,463 @@
+"""
+统一路径规划引擎
+
+PathPlanningService（REST接口使用）和路径规划智能体共用同一个引擎实例：
+禁飞区空间索引、路网数组、规划结果缓存和性能指标都只维护一份。
+规划算法通过注册表接入，按名称（或别名）调用。
+"""
+import copy
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple, Callable
+
+import heapq
+import numpy as np
+import networkx as nx
+import shapely
+from shapely.geometry import Point, Polygon, LineString
+from shapely.ops import unary_union
+from shapely.strtree import STRtree
+
+from config.settings import settings
+from config.logging_config import get_logger
+
+logger = get_logger("services.planning_engine")
+
+# 规划算法签名: (起点[lon, lat], 终点[lon, lat], 飞行高度, 选项) -> 规划结果
+PlanningAlgorithmFunc = Callable[[List[float], List[float], float, Dict[str, Any]], Dict[str, Any]]
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    计算两点之间的大圆距离（Haversine公式）
+
+    Returns:
+        距离（米）
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    return 2 * math.asin(math.sqrt(a)) * 6371 * 1000
+
+
+def path_distance(waypoints: List[List[float]]) -> float:
+    """计算航点序列的总距离（米），航点格式 [lon, lat, ...]"""
+    return sum(
+        haversine(waypoints[i][1], waypoints[i][0], waypoints[i + 1][1], waypoints[i + 1][0])
+        for i in range(len(waypoints) - 1)
+    )
+
+
+class GeofenceIndex:
+    """
+    禁飞区空间索引
+
+    禁飞区多边形只构建一次，点和线段检查通过 STRtree 先按包围盒筛选；
+    合并几何用于栅格化时的向量化判断。禁飞区内容变化时 version 递增，
+    依赖禁飞区的缓存据此失效。
+    """
+
+    def __init__(self):
+        self.zones: List[Any] = []
+        self.polygons: List[Polygon] = []
+        self.union = None
+        self.tree: Optional[STRtree] = None
+        self.version = 0
+        self.loaded = False
+        self.last_updated = datetime.utcnow()
+        self.signature: Optional[str] = None  # 禁飞区几何内容的摘要，用于判断是否变化
+
+    @staticmethod
+    def _zone_geometry(zone: Any) -> Optional[Dict[str, Any]]:
+        """兼容字典和 NoFlyZone 文档两种禁飞区表示"""
+        if isinstance(zone, dict):
+            return zone.get("geometry")
+        return getattr(zone, "geometry", None)
+
+    def update(self, zones: List[Any]) -> bool:
+        """
+        更新禁飞区
+
+        Returns:
+            禁飞区内容是否发生变化
+        """
+        geometries = []
+        for zone in zones:
+            geometry = self._zone_geometry(zone)
+            if geometry and "coordinates" in geometry:
+                geometries.append(geometry["coordinates"][0])
+
+        self.zones = zones
+        self.loaded = True
+        signature = hashlib.sha1(json.dumps(geometries).encode()).hexdigest()
+        if signature == self.signature:
+            return False
+
+        polygons = []
+        for coordinates in geometries:
+            try:
+                polygons.append(Polygon(coordinates))
+            except Exception as e:
+                logger.error(f"解析禁飞区几何失败: {str(e)}")
+
+        self.polygons = polygons
+        self.union = unary_union(polygons) if polygons else None
+        self.tree = STRtree(polygons) if polygons else None
+        self.signature = signature
+        self.version += 1
+        self.last_updated = datetime.utcnow()
+        return True
+
+    def contains(self, lon: float, lat: float) -> bool:
+        """检查点是否在禁飞区内"""
+        if self.tree is None:
+            return False
+        return len(self.tree.query(Point(lon, lat), predicate="within")) > 0
+
+    def intersects_segment(self, point1: List[float], point2: List[float]) -> bool:
+        """检查线段是否与禁飞区相交"""
+        if self.tree is None:
+            return False
+        line = LineString([(point1[0], point1[1]), (point2[0], point2[1])])
+        return len(self.tree.query(line, predicate="intersects")) > 0
+
+    def contains_xy(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """向量化检查一批点是否在禁飞区内"""
+        if self.union is None:
+            return np.zeros(np.shape(lons), dtype=bool)
+        return shapely.contains_xy(self.union, lons, lats)
+
+    def __len__(self) -> int:
+        return len(self.polygons)
+
+
+class PlanningEngine:
+    """
+    统一路径规划引擎
+
+    - 算法注册表：register_algorithm 注册规划函数，plan 按名称或别名调用
+    - 禁飞区：GeofenceIndex，所有算法共用
+    - 路网：节点坐标数组（最近节点查询）和按禁飞区版本缓存的边穿越标记
+    - 缓存：LRU缓存规划结果，禁飞区或路网变化时清空
+    - 指标：按算法统计调用次数、缓存命中、回退和耗时
+    """
+
+    def __init__(self, cache_size: Optional[int] = None):
+        self.geofences = GeofenceIndex()
+        self.algorithms: Dict[str, PlanningAlgorithmFunc] = {}
+        self.aliases: Dict[str, str] = {}
+
+        self.graph = None
+        self.graph_version = 0
+        self._node_ids: List[Any] = []
+        self._node_xy: Optional[np.ndarray] = None
+        self._node_coords: Dict[Any, Tuple[float, float]] = {}
+        self._edge_blocked: Dict[Tuple[Any, Any], bool] = {}
+
+        self.cache_size = cache_size if cache_size is not None else settings.PATH_CACHE_SIZE
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.metrics: Dict[str, Dict[str, float]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.register_algorithm("graph_astar", self._plan_path_graph_astar, aliases=["a_star"])
+        self.register_algorithm("graph_detour", self._plan_path_graph_detour)
+
+    # ---------- 注册表 ----------
+
+    def register_algorithm(self, name: str, func: PlanningAlgorithmFunc,
+                           aliases: Optional[List[str]] = None):
+        """注册规划算法"""
+        self.algorithms[name] = func
+        for alias in aliases or []:
+            self.aliases[alias] = name
+
+    def resolve_algorithm(self, algorithm: Optional[str]) -> str:
+        """
+        解析算法名称
+
+        未指定算法时，加载了路网则使用路网A*，否则使用配置中的默认算法。
+        """
+        if not algorithm:
+            if self.graph is not None:
+                return "graph_astar"
+            algorithm = settings.PATH_PLANNING_ALGORITHM
+        algorithm = self.aliases.get(algorithm, algorithm)
+        if algorithm not in self.algorithms:
+            logger.warning(f"未注册的路径规划算法: {algorithm}，使用A*算法")
+            algorithm = "astar" if "astar" in self.algorithms else next(iter(self.algorithms))
+        return algorithm
+
+    # ---------- 共享状态 ----------
+
+    def set_no_fly_zones(self, zones: List[Any]):
+        """更新禁飞区，内容变化时清空依赖禁飞区的缓存"""
+        if self.geofences.update(zones):
+            with self._lock:
+                self._cache.clear()
+                self._edge_blocked.clear()
+            logger.info(f"更新了 {len(self.geofences)} 个禁飞区")
+
+    def set_graph(self, graph: Any):
+        """设置路网图，节点需带 x（经度）/y（纬度）属性"""
+        node_coords = {}
+        for node, data in graph.nodes(data=True):
+            if "x" not in data or "y" not in data:
+                logger.warning("路网节点缺少经纬度属性，路网规划不可用")
+                return
+            node_coords[node] = (float(data["x"]), float(data["y"]))
+
+        with self._lock:
+            self.graph = graph
+            self.graph_version += 1
+            self._node_coords = node_coords
+            self._node_ids = list(node_coords.keys())
+            self._node_xy = np.array(list(node_coords.values()), dtype=np.float64)
+            self._edge_blocked.clear()
+            self._cache.clear()
+        logger.info(f"路网已加载，节点数: {len(self._node_ids)}")
+
+    def nearest_node(self, point: List[float]) -> Optional[Any]:
+        """查找距离给定点 [lon, lat] 最近的路网节点"""
+        if self._node_xy is None or not len(self._node_ids):
+            return None
+        # 经度方向按纬度余弦缩放，近似平面距离
+        scale = math.cos(math.radians(point[1]))
+        d = ((self._node_xy[:, 0] - point[0]) * scale) ** 2 + (self._node_xy[:, 1] - point[1]) ** 2
+        return self._node_ids[int(np.argmin(d))]
+
+    def node_coords(self, node: Any) -> Tuple[float, float]:
+        """路网节点坐标 (lon, lat)"""
+        return self._node_coords[node]
+
+    def edge_blocked(self, u: Any, v: Any) -> bool:
+        """检查路网边是否穿过禁飞区，结果按禁飞区版本缓存"""
+        blocked = self._edge_blocked.get((u, v))
+        if blocked is None:
+            blocked = self.geofences.intersects_segment(self._node_coords[u], self._node_coords[v])
+            self._edge_blocked[(u, v)] = blocked
+            self._edge_blocked[(v, u)] = blocked
+        return blocked
+
+    def edge_length(self, u: Any, v: Any) -> float:
+        """路网边长度（米），多重图取最短的平行边"""
+        data = self.graph.get_edge_data(u, v)
+        if self.graph.is_multigraph():
+            return min(edge.get("length", 1) for edge in data.values())
+        return data.get("length", 1)
+
+    # ---------- 规划 ----------
+
+    def _cache_key(self, algorithm: str, start_point: List[float], end_point: List[float],
+                   altitude: float, options: Dict[str, Any]) -> str:
+        return (f"{algorithm}|{start_point[0]:.5f},{start_point[1]:.5f}|"
+                f"{end_point[0]:.5f},{end_point[1]:.5f}|{altitude:.1f}|"
+                f"{json.dumps(options, sort_keys=True, default=str)}")
+
+    def plan(self, start_point: List[float], end_point: List[float],
+             algorithm: Optional[str] = None, altitude: float = 100.0,
+             options: Optional[Dict[str, Any]] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        规划路径
+
+        Args:
+            start_point: 起点坐标 [lon, lat]
+            end_point: 终点坐标 [lon, lat]
+            algorithm: 算法名称或别名，默认见 resolve_algorithm
+            altitude: 飞行高度，默认100米
+            options: 算法选项
+            use_cache: 是否使用结果缓存
+
+        Returns:
+            路径规划结果
+        """
+        options = options or {}
+        name = self.resolve_algorithm(algorithm)
+        stats = self._algorithm_stats(name)
+
+        key = None
+        if use_cache and self.cache_size > 0:
+            key = self._cache_key(name, start_point, end_point, altitude, options)
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+                    stats["cache_hits"] += 1
+                    return copy.deepcopy(cached)
+                self.cache_misses += 1
+
+        start_time = time.perf_counter()
+        try:
+            result = self.algorithms[name](start_point[:2], end_point[:2], altitude, options)
+        except Exception as e:
+            logger.error(f"路径规划算法 {name} 出错: {str(e)}")
+            result = {"success": False, "algorithm": name, "error": str(e)}
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+        stats["calls"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if not result.get("success"):
+            stats["failures"] += 1
+        elif result.get("algorithm") == "direct":
+            stats["fallbacks"] += 1
+        elif key is not None:
+            with self._lock:
+                self._cache[key] = copy.deepcopy(result)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return result
+
+    def _algorithm_stats(self, name: str) -> Dict[str, float]:
+        stats = self.metrics.get(name)
+        if stats is None:
+            stats = {"calls": 0, "cache_hits": 0, "failures": 0, "fallbacks": 0, "total_ms": 0.0, "max_ms": 0.0}
+            self.metrics[name] = stats
+        return stats
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取引擎指标"""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "algorithms": {
+                name: {
+                    **stats,
+                    "avg_ms": stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0
+                }
+                for name, stats in self.metrics.items()
+            },
+            "cache": {
+                "size": len(self._cache),
+                "capacity": self.cache_size,
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": self.cache_hits / lookups if lookups else 0.0
+            },
+            "no_fly_zones": len(self.geofences),
+            "geofence_version": self.geofences.version,
+            "graph_nodes": len(self._node_ids),
+            "registered_algorithms": sorted(self.algorithms.keys())
+        }
+
+    def export_cache(self) -> Dict[str, Any]:
+        """导出结果缓存（用于持久化），附带生成缓存时的禁飞区签名"""
+        with self._lock:
+            return {
+                "geofence_signature": self.geofences.signature,
+                "entries": {key: copy.deepcopy(value) for key, value in self._cache.items()}
+            }
+
+    def load_cache(self, data: Dict[str, Any]) -> int:
+        """
+        导入持久化的结果缓存，禁飞区已变化时丢弃
+
+        Returns:
+            导入的条数
+        """
+        if data.get("geofence_signature") != self.geofences.signature:
+            return 0
+        entries = data.get("entries", {})
+        with self._lock:
+            for key, value in entries.items():
+                self._cache[key] = value
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return len(entries)
+
+    # ---------- 路网算法 ----------
+
+    def _graph_result(self, algorithm: str, nodes: List[Any], altitude: float,
+                      expansions: int) -> Dict[str, Any]:
+        waypoints = [[*self._node_coords[node], altitude] for node in nodes]
+        distance = path_distance(waypoints)
+        duration = distance / settings.DRONE_MAX_SPEED / 1000 * 60  # 分钟
+        return {
+            "success": True,
+            "algorithm": algorithm,
+            "waypoints": waypoints,
+            "distance": distance,
+            "duration": duration,
+            "iterations": expansions
+        }
+
+    def _graph_endpoints(self, start_point: List[float], end_point: List[float]) -> Tuple[Any, Any]:
+        if self.graph is None:
+            raise ValueError("未加载路网图")
+        return self.nearest_node(start_point), self.nearest_node(end_point)
+
+    def _plan_path_graph_astar(self, start_point: List[float], end_point: List[float],
+                               altitude: float, options: Dict[str, Any]) -> Dict[str, Any]:
+        """路网A*：先按道路长度求最短路，穿过禁飞区时改用绕行Dijkstra"""
+        start_node, end_node = self._graph_endpoints(start_point, end_point)
+        coords = self._node_coords
+
+        # 使用大圆距离作为启发式
+        def heuristic(n1, n2):
+            return haversine(coords[n1][1], coords[n1][0], coords[n2][1], coords[n2][0])
+
+        try:
+            nodes = nx.astar_path(self.graph, start_node, end_node, heuristic=heuristic, weight="length")
+        except nx.NetworkXNoPath:
+            return {"success": False, "algorithm": "graph_astar", "error": "路网中不存在可达路径"}
+
+        if any(self.edge_blocked(nodes[i], nodes[i + 1]) for i in range(len(nodes) - 1)):
+            logger.info("路网最短路穿过禁飞区，改用绕行规划")
+            return self._plan_path_graph_detour(start_point, end_point, altitude, options)
+
+        return self._graph_result("graph_astar", nodes, altitude, len(nodes))
+
+    def _plan_path_graph_detour(self, start_point: List[float], end_point: List[float],
+                                altitude: float, options: Dict[str, Any]) -> Dict[str, Any]:
+        """路网绕行Dijkstra：穿过禁飞区的边代价乘以惩罚系数"""
+        start_node, end_node = self._graph_endpoints(start_point, end_point)
+        penalty = options.get("no_fly_penalty", 10)
+
+        queue = [(0.0, 0, start_node)]  # (cost, 序号, node)
+        counter = 1
+        best = {start_node: 0.0}
+        came_from = {start_node: None}
+        visited = set()
+
+        while queue:
+            cost, _, node = heapq.heappop(queue)
+
+            if node == end_node:
+                nodes = []
+                while node is not None:
+                    nodes.append(node)
+                    node = came_from[node]
+                return self._graph_result("graph_detour", nodes[::-1], altitude, len(visited))
+
+            if node in visited:
+                continue
+            visited.add(node)
+
+            for neighbor in self.graph.neighbors(node):
+                if neighbor in visited:
+                    continue
+                length = self.edge_length(node, neighbor)
+                if self.edge_blocked(node, neighbor):
+                    # 穿过禁飞区，增加成本惩罚
+                    length *= penalty
+                new_cost = cost + length
+                if new_cost < best.get(neighbor, float("inf")):
+                    best[neighbor] = new_cost
+                    came_from[neighbor] = node
+                    heapq.heappush(queue, (new_cost, counter, neighbor))
+                    counter += 1
+
+        return {"success": False, "algorithm": "graph_detour", "error": "路网中不存在可达路径"}
+
+
+# 创建全局路径规划引擎实例
+planning_engine = PlanningEngine()
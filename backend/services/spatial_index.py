@@ -0,0 +1,160 @@
+"""
+无人机空间索引
+
+按经纬度网格分桶的动态索引，位置更新只需把对象从旧网格移到新网格（O(1)），
+不需要像KD树那样周期性重建。最近邻查询从查询点所在网格按环向外扩展，
+已找到的第 k 个候选比下一环可能出现的最近距离更近时即停止，
+因此通常只访问查询点附近的少数网格。
+"""
+import math
+from typing import Dict, List, Optional, Set, Tuple, Callable, Any
+
+from services.planning_engine import haversine
+
+METERS_PER_DEGREE = 111_320.0  # 每度纬度约对应的米数
+
+Cell = Tuple[int, int]
+
+
+class GridIndex:
+    """经纬度网格索引，存放 key -> (lon, lat)"""
+
+    def __init__(self, cell_size: float = 0.01):
+        self.cell_size = cell_size  # 度
+        self._points: Dict[Any, Tuple[float, float, Cell]] = {}
+        self._cells: Dict[Cell, Set[Any]] = {}
+        self._bounds: Optional[Tuple[int, int, int, int]] = None  # 非空网格的范围缓存
+
+    def _cell_of(self, lon: float, lat: float) -> Cell:
+        return (math.floor(lon / self.cell_size), math.floor(lat / self.cell_size))
+
+    def insert(self, key: Any, lon: float, lat: float):
+        """插入或移动对象"""
+        cell = self._cell_of(lon, lat)
+        current = self._points.get(key)
+        if current is not None and current[2] != cell:
+            self._discard(key, current[2])
+        self._points[key] = (lon, lat, cell)
+        if cell not in self._cells:
+            self._cells[cell] = set()
+            self._bounds = None
+        self._cells[cell].add(key)
+
+    def remove(self, key: Any) -> bool:
+        current = self._points.pop(key, None)
+        if current is None:
+            return False
+        self._discard(key, current[2])
+        return True
+
+    def _discard(self, key: Any, cell: Cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._cells[cell]
+                self._bounds = None
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._points
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def position(self, key: Any) -> Optional[Tuple[float, float]]:
+        point = self._points.get(key)
+        return (point[0], point[1]) if point else None
+
+    def _ring(self, center: Cell, radius: int):
+        """与中心网格切比雪夫距离恰为 radius 的网格"""
+        cx, cy = center
+        if radius == 0:
+            yield center
+            return
+        for x in range(cx - radius, cx + radius + 1):
+            yield (x, cy - radius)
+            yield (x, cy + radius)
+        for y in range(cy - radius + 1, cy + radius):
+            yield (cx - radius, y)
+            yield (cx + radius, y)
+
+    def _max_ring(self, center: Cell) -> int:
+        """覆盖所有非空网格所需的最大环数"""
+        if self._bounds is None:
+            xs = [x for x, _ in self._cells]
+            ys = [y for _, y in self._cells]
+            self._bounds = (min(xs), min(ys), max(xs), max(ys))
+        x0, y0, x1, y1 = self._bounds
+        return max(abs(x0 - center[0]), abs(x1 - center[0]), abs(y0 - center[1]), abs(y1 - center[1]))
+
+    def nearest(self, lon: float, lat: float, k: int = 1,
+                predicate: Optional[Callable[[Any], bool]] = None,
+                max_distance: Optional[float] = None) -> List[Tuple[float, Any]]:
+        """
+        k 个最近的对象
+
+        Args:
+            lon, lat: 查询点
+            k: 返回数量
+            predicate: 过滤条件，对 key 返回 True 的对象才参与排序
+            max_distance: 最大距离（米）
+
+        Returns:
+            按距离升序排列的 (距离米, key)
+        """
+        if k <= 0 or not self._points:
+            return []
+        center = self._cell_of(lon, lat)
+        max_ring = self._max_ring(center)
+
+        found: List[Tuple[float, Any]] = []
+        radius = 0
+        while True:
+            for cell in self._ring(center, radius):
+                for key in self._cells.get(cell, ()):
+                    if predicate is not None and not predicate(key):
+                        continue
+                    p_lon, p_lat, _ = self._points[key]
+                    distance = haversine(lat, lon, p_lat, p_lon)
+                    if max_distance is None or distance <= max_distance:
+                        found.append((distance, key))
+            found.sort(key=lambda item: item[0])
+            # 下一环中的对象距离查询点至少 radius 个网格宽度（按该范围内最窄的经度方向估计）
+            widest_lat = min(89.0, abs(lat) + (radius + 1) * self.cell_size)
+            bound = radius * self.cell_size * METERS_PER_DEGREE * math.cos(math.radians(widest_lat))
+            if len(found) >= k and found[k - 1][0] <= bound:
+                break
+            if max_distance is not None and bound > max_distance:
+                break
+            if radius >= max_ring:
+                break
+            radius += 1
+        return found[:k]
+
+    def within(self, lon: float, lat: float, radius: float,
+               predicate: Optional[Callable[[Any], bool]] = None) -> List[Tuple[float, Any]]:
+        """半径（米）范围内的对象，按距离升序排列"""
+        lat_span = radius / METERS_PER_DEGREE
+        lon_span = radius / (METERS_PER_DEGREE * max(0.01, math.cos(math.radians(lat))))
+        x0, y0 = self._cell_of(lon - lon_span, lat - lat_span)
+        x1, y1 = self._cell_of(lon + lon_span, lat + lat_span)
+
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            candidates = (key for members in self._cells.values() for key in members)
+        else:
+            candidates = (
+                key
+                for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)
+                for key in self._cells.get((x, y), ())
+            )
+
+        result = []
+        for key in candidates:
+            if predicate is not None and not predicate(key):
+                continue
+            p_lon, p_lat, _ = self._points[key]
+            distance = haversine(lat, lon, p_lat, p_lon)
+            if distance <= radius:
+                result.append((distance, key))
+        result.sort(key=lambda item: item[0])
+        return result
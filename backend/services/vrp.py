@@ -0,0 +1,316 @@
+"""
+多点配送路径优化（带容量和续航约束的车辆路径问题）
+
+1. DistanceMatrixCache：仓库与投递点之间的距离矩阵。直线不穿越禁飞区的点对
+   直接用向量化Haversine计算；穿越禁飞区的点对调用统一规划引擎求绕行距离，
+   结果按坐标对缓存，禁飞区变化时失效
+2. solve_routes：Clarke-Wright 节约算法构造初始回路，满足载重、续航和
+   单趟投递数约束；再对每条回路做 2-opt 和 or-opt 局部搜索
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from config.logging_config import get_logger
+from services.path_planning import path_planning_service
+from services.planning_engine import PlanningEngine, path_distance
+
+logger = get_logger("services.vrp")
+
+EARTH_RADIUS = 6371 * 1000  # 米
+
+
+@dataclass
+class DeliveryStop:
+    """一个投递点"""
+    stop_id: str
+    location: Tuple[float, float]  # [lon, lat]
+    demand: float = 0.0  # 载重（千克）
+
+
+@dataclass
+class DeliveryRoute:
+    """一架次的多点配送回路：仓库 -> 投递点... -> 仓库"""
+    stops: List[DeliveryStop] = field(default_factory=list)
+    distance: float = 0.0  # 回路总距离（米）
+    load: float = 0.0  # 总载重（千克）
+    legs: List[float] = field(default_factory=list)  # 每段距离（米），最后一段为返回仓库
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stops": [stop.stop_id for stop in self.stops],
+            "distance": self.distance,
+            "load": self.load,
+            "legs": self.legs
+        }
+
+
+def haversine_matrix(points: np.ndarray) -> np.ndarray:
+    """向量化计算点集两两之间的大圆距离（米），points 为 [n, 2] 的 [lon, lat]"""
+    lon = np.radians(points[:, 0])
+    lat = np.radians(points[:, 1])
+    dlon = lon[None, :] - lon[:, None]
+    dlat = lat[None, :] - lat[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class DistanceMatrixCache:
+    """
+    距离矩阵缓存
+
+    只有直线穿越禁飞区的点对才需要路径规划，其余点对的飞行距离就是直线距离。
+    规划得到的绕行距离按（起点, 终点）缓存，禁飞区版本变化时清空。
+    """
+
+    def __init__(self, engine: Optional[PlanningEngine] = None, cache_size: int = 4096,
+                 algorithm: Optional[str] = None):
+        self.engine = engine or path_planning_service.engine
+        self.cache_size = cache_size
+        self.algorithm = algorithm
+        self._cache: "OrderedDict[Tuple, float]" = OrderedDict()
+        self._geofence_version = self.engine.geofences.version
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.planner_calls = 0
+
+    @staticmethod
+    def _key(start: Tuple[float, float], end: Tuple[float, float]) -> Tuple:
+        return (round(start[0], 6), round(start[1], 6), round(end[0], 6), round(end[1], 6))
+
+    def _check_version(self):
+        version = self.engine.geofences.version
+        if version != self._geofence_version:
+            self._cache.clear()
+            self._geofence_version = version
+
+    def _detour_distance(self, start: Tuple[float, float], end: Tuple[float, float]) -> float:
+        """通过规划引擎求绕开禁飞区的距离，规划失败时返回 inf（该点对不可达）"""
+        key = self._key(start, end)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        self.planner_calls += 1
+        result = self.engine.plan(list(start), list(end), algorithm=self.algorithm)
+        if result.get("success") and result.get("algorithm") != "direct":
+            distance = result.get("distance") or path_distance(result.get("waypoints", []))
+        else:
+            distance = math.inf
+
+        with self._lock:
+            # 绕行距离近似对称，反向点对共用结果
+            self._cache[key] = distance
+            self._cache[self._key(end, start)] = distance
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return distance
+
+    def matrix(self, points: List[Tuple[float, float]]) -> np.ndarray:
+        """
+        计算点集的距离矩阵（米）
+
+        Args:
+            points: [lon, lat] 坐标列表
+
+        Returns:
+            [n, n] 距离矩阵，不可达的点对为 inf
+        """
+        coords = np.asarray(points, dtype=float).reshape(-1, 2)
+        distances = haversine_matrix(coords)
+        geofences = self.engine.geofences
+        if geofences.tree is None or len(coords) < 2:
+            return distances
+
+        self._check_version()
+        n = len(coords)
+        rows, cols = np.triu_indices(n, k=1)
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            start, end = tuple(coords[i]), tuple(coords[j])
+            if geofences.intersects_segment(start, end):
+                distance = self._detour_distance(start, end)
+                distances[i, j] = distances[j, i] = distance
+        return distances
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "cached_pairs": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "planner_calls": self.planner_calls
+        }
+
+
+def _route_distance(route: List[int], dist: np.ndarray) -> float:
+    """回路距离，route 为投递点下标（不含仓库0）"""
+    if not route:
+        return 0.0
+    total = dist[0, route[0]] + dist[route[-1], 0]
+    for a, b in zip(route, route[1:]):
+        total += dist[a, b]
+    return float(total)
+
+
+def _two_opt(route: List[int], dist: np.ndarray) -> List[int]:
+    """2-opt：反转回路中的一段，直到没有改进"""
+    tour = [0] + route + [0]
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(tour) - 2):
+            for j in range(i + 1, len(tour) - 1):
+                a, b, c, d = tour[i - 1], tour[i], tour[j], tour[j + 1]
+                delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+                if delta < -1e-6:
+                    tour[i:j + 1] = reversed(tour[i:j + 1])
+                    improved = True
+    return tour[1:-1]
+
+
+def _or_opt(route: List[int], dist: np.ndarray, max_segment: int = 3) -> List[int]:
+    """or-opt：把长度1~3的连续片段（可反向）移到回路中更好的位置"""
+    best = list(route)
+    best_distance = _route_distance(best, dist)
+    improved = True
+    while improved:
+        improved = False
+        for length in range(1, min(max_segment, len(best) - 1) + 1):
+            for i in range(len(best) - length + 1):
+                segment = best[i:i + length]
+                rest = best[:i] + best[i + length:]
+                for candidate_segment in (segment, segment[::-1]):
+                    for j in range(len(rest) + 1):
+                        if j == i and candidate_segment is segment:
+                            continue
+                        candidate = rest[:j] + candidate_segment + rest[j:]
+                        candidate_distance = _route_distance(candidate, dist)
+                        if candidate_distance < best_distance - 1e-6:
+                            best, best_distance = candidate, candidate_distance
+                            improved = True
+                            break
+                    if improved:
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+    return best
+
+
+def solve_routes(depot: Tuple[float, float], stops: List[DeliveryStop], capacity: float,
+                 max_distance: float, max_stops: Optional[int] = None,
+                 distance_matrix: Optional[np.ndarray] = None,
+                 matrix_cache: Optional[DistanceMatrixCache] = None) -> Dict[str, Any]:
+    """
+    求解带容量和续航约束的多点配送回路
+
+    Args:
+        depot: 仓库（取货点）坐标 [lon, lat]
+        stops: 投递点列表
+        capacity: 单架次最大载重（千克），<=0 表示不限制
+        max_distance: 单架次最大飞行距离（米），已扣除安全余量
+        max_stops: 单架次最多投递点数
+        distance_matrix: 预先计算的距离矩阵（下标0为仓库），默认由 matrix_cache 计算
+        matrix_cache: 距离矩阵缓存
+
+    Returns:
+        {"routes": [DeliveryRoute], "unserved": [DeliveryStop], "total_distance", "solve_ms"}
+    """
+    start_time = time.perf_counter()
+    max_stops = max_stops or settings.LOGISTICS_BATCH_MAX_STOPS
+
+    if distance_matrix is None:
+        matrix_cache = matrix_cache or DistanceMatrixCache()
+        distance_matrix = matrix_cache.matrix([depot] + [stop.location for stop in stops])
+    dist = distance_matrix
+
+    def fits(load: float, count: int, distance: float) -> bool:
+        return ((capacity <= 0 or load <= capacity + 1e-9) and count <= max_stops
+                and distance <= max_distance)
+
+    # 单独一个点都无法满足约束的投递点不参与求解
+    routes: Dict[int, List[int]] = {}
+    route_of: Dict[int, int] = {}
+    loads: Dict[int, float] = {}
+    unserved = []
+    for index, stop in enumerate(stops, start=1):
+        if fits(stop.demand, 1, _route_distance([index], dist)):
+            routes[index] = [index]
+            route_of[index] = index
+            loads[index] = stop.demand
+        else:
+            unserved.append(stop)
+
+    # 节约值 s(i, j) = d(0, i) + d(0, j) - d(i, j)
+    served = np.array(sorted(routes), dtype=int)
+    if len(served) > 1:
+        sub = dist[np.ix_(served, served)]
+        savings = dist[0, served][:, None] + dist[0, served][None, :] - sub
+        rows, cols = np.triu_indices(len(served), k=1)
+        values = savings[rows, cols]
+        order = np.argsort(-values, kind="stable")
+        for k in order.tolist():
+            if not np.isfinite(values[k]) or values[k] <= 0:
+                break
+            i, j = int(served[rows[k]]), int(served[cols[k]])
+            ri, rj = route_of[i], route_of[j]
+            if ri == rj:
+                continue
+            route_i, route_j = routes[ri], routes[rj]
+            # i 和 j 必须分别位于各自回路的端点，必要时反转回路使 i 在尾、j 在头
+            if route_i[-1] != i:
+                if route_i[0] != i:
+                    continue
+                route_i = route_i[::-1]
+            if route_j[0] != j:
+                if route_j[-1] != j:
+                    continue
+                route_j = route_j[::-1]
+            merged = route_i + route_j
+            load = loads[ri] + loads[rj]
+            if not fits(load, len(merged), _route_distance(merged, dist)):
+                continue
+            routes[ri] = merged
+            loads[ri] = load
+            del routes[rj], loads[rj]
+            for node in route_j:
+                route_of[node] = ri
+
+    result_routes = []
+    for key, route in routes.items():
+        if len(route) > 2:
+            route = _two_opt(route, dist)
+        if len(route) > 1:
+            route = _or_opt(route, dist)
+        tour = [0] + route + [0]
+        legs = [float(dist[a, b]) for a, b in zip(tour, tour[1:])]
+        result_routes.append(DeliveryRoute(
+            stops=[stops[index - 1] for index in route],
+            distance=float(sum(legs)),
+            load=loads[key],
+            legs=legs
+        ))
+
+    # 载重大的回路优先分配
+    result_routes.sort(key=lambda r: (-r.load, -len(r.stops)))
+    return {
+        "routes": result_routes,
+        "unserved": unserved,
+        "total_distance": sum(route.distance for route in result_routes),
+        "solve_ms": (time.perf_counter() - start_time) * 1000
+    }
+
+
+# 创建全局距离矩阵缓存实例
+distance_matrix_cache = DistanceMatrixCache()
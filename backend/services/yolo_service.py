@@ -10,6 +10,7 @@ from ultralytics import YOLO
 
 from config.settings import settings
 from config.logging_config import get_logger
+from core.metrics import yolo_inference_seconds
 
 logger = get_logger("services.yolo")
 
@@ -88,13 +89,14 @@ class YOLOService:
                 raise ValueError("无法解码图像数据")
             
             # 运行YOLOv8检测
-            results = await asyncio.to_thread(
-                self.model, 
-                image, 
-                conf=conf_threshold,
-                classes=classes,
-                verbose=False
-            )
+            with yolo_inference_seconds.time("image"):
+                results = await asyncio.to_thread(
+                    self.model, 
+                    image, 
+                    conf=conf_threshold,
+                    classes=classes,
+                    verbose=False
+                )
             
             # 解析检测结果
             detections = self._parse_detections(results, image.shape)
@@ -13,6 +13,7 @@ from database.models import (
     Location, GeoPoint, NoFlyZone
 )
 from core.events import event_manager, EventTypes
+from services.fleet_state import fleet_state
 
 logger = get_logger("utils.simulation")
 
@@ -118,8 +119,9 @@ class DroneSimulator:
     
     async def _update_drones(self):
         """更新所有无人机状态"""
-        # 加载所有无人机
-        drones = await Drone.find_all().to_list()
+        # 从内存中的机队状态获取所有无人机
+        await fleet_state.ensure_loaded()
+        drones = fleet_state.all()
         
         for drone in drones:
             drone_id = drone.drone_id